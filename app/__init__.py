@@ -7,6 +7,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from .celery_utils import init_celery
+from .db_routing import RoutingSQLAlchemy
+from . import instrumentation
 from kombu.utils.url import safequote
 from flask_mail import Mail
 # from flask_bootstrap import Bootstrap
@@ -43,7 +45,8 @@ def make_celery(app_name=__name__):
 celery = make_celery()
 celery.conf['broker_transport_options']=broker_transport_options
 #db = SQLAlchemy() # altering this to use the engine_options parameter to set pool_recycle and pool_pre_ping to ensure connection 
-db = SQLAlchemy(engine_options={"pool_recycle": 3600, "pool_pre_ping": True})
+# queries are routed to the read replica or the worker pool by app.db_routing
+db = RoutingSQLAlchemy(engine_options={"pool_recycle": 3600, "pool_pre_ping": True})
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
@@ -80,6 +83,7 @@ def create_app(config_class=Config, celery=celery):
     login.init_app(app)
     # configure_logging(app)
     mail.init_app(app) # adding mail to app 
+    instrumentation.init_app(app)
     # bootstrap.init_app(app)
     # moment.init_app(app)
     # babel.init_app(app)
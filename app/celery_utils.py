@@ -1,4 +1,5 @@
 from celery.schedules import crontab
+from app import db_routing, instrumentation
 
 def init_celery(celery, app):
     celery.conf.update(app.config)
@@ -34,10 +35,14 @@ def init_celery(celery, app):
     #     }
     # }
 
+    # every task runs in its own app context, so it gets its own db session
+    # (removed when the context is torn down) on the worker connection pool
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
             with app.app_context():
+                db_routing.use_route(db_routing.WORKER)
                 return self.run(*args, **kwargs)
 
     celery.Task = ContextTask
+    instrumentation.init_celery()
     return celery
@@ -39,10 +39,23 @@ motif_script_path = os.path.join('scripts', 'motif')
 email_regex = r"^[a-zA-Z0-9\.\-\_]+@([a-zA-Z0-9\.\-\_]+\.[a-z]+)$"
 
 DISABLE_PFAM = False
+# annotate domains from the Pfam web service ('remote') or from the Pfam-A
+# release loaded by scripts/maintenance/load_pfam_release.py plus a local
+# hmmscan search for sequences it does not cover ('local'). Where hmmscan or
+# its database is not available, 'local' falls back to the web service.
+PFAM_MODE = 'local'
+PFAM_RELEASE = '35.0'
+# arguments to proteomescout_worker.helpers.hmmscan.HmmscanRunner; the
+# database is relative to ptmscout_path and must be prepared with hmmpress
+PFAM_HMMSCAN = {'database': 'data/pfam/Pfam-A.hmm', 'command': 'hmmscan', 'cpu': 2, 'workers': 4,
+                'batch_size': 50, 'cut_ga': True, 'timeout': 3600}
 DISABLE_SCANSITE = False
 DISABLE_QUICKGO = False
 DISABLE_PICR = False
 DISABLE_UNIPROT_QUERY = False
+# resolve UniProt accessions from a locally loaded Swiss-Prot release:
+# 'off', 'first' (query UniProt only for accessions not found) or 'only'
+UNIPROT_LOCAL_MODE = 'off'
 DISABLE_DBSNP = False
 
 JOB_AGE_LIMIT = 7 * 86400
@@ -51,6 +64,21 @@ REVIEWER_ACCOUNT_EXPIRATION_DAYS = 365
 # rate limits in queries per second
 SCANSITE_RATE_LIMIT = 3
 
+# limits for the shared external fetch scheduler (app.utils.fetch_scheduler):
+# requests per second, burst, concurrent requests, per-request timeout (s),
+# retries and base backoff (s). NCBI allows 3 requests/s without an API key.
+FETCH_MAX_WORKERS = 8
+FETCH_SERVICE_LIMITS = {
+    'ncbi': {'rate': 3, 'burst': 1, 'concurrency': 2, 'timeout': 30, 'retries': 3, 'backoff': 1.0},
+    'uniprot': {'rate': 10, 'burst': 5, 'concurrency': 4, 'timeout': 60, 'retries': 4, 'backoff': 2.0},
+    'pfam': {'rate': 3, 'burst': 1, 'concurrency': 2, 'timeout': 30, 'retries': 3, 'backoff': 1.0},
+}
+
+# address of a stand-in server replaying recorded UniProt, NCBI and Pfam
+# responses (benchmarks/standin_server.py), e.g. 'http://127.0.0.1:8770'.
+# When set, requests to those services are sent to it instead.
+EXTERNAL_SERVICE_STANDIN = None
+
 # email valid domains
 valid_domain_suffixes = set([r'.+\.edu',r'.+\.gov', r'icr\.ac\.uk', r'gov\.br', r'.+\.ac\.at'])
 
@@ -71,3 +99,40 @@ mcam_file_path = "data/mcam"
 
 cache_expiration_time = 7 * 86400
 cache_storage_directory = "data/cache"
+# seconds before an unfinished upload review job is assumed lost and resubmitted
+upload_review_timeout = 3600
+# rows sent per INSERT by the bulk writer used to load experiment data
+bulk_write_batch_size = 5000
+
+# fraction of requests and Celery tasks whose SQL statements and timings are
+# measured (see app/instrumentation.py)
+metrics_sample_rate = 0.1
+# slowest statements of a sampled request or task written to its log line
+metrics_slow_statements = 5
+# when set, every web and worker process writes its metrics to this directory
+# at most every metrics_write_interval seconds and /metrics reports them all
+metrics_directory = None
+metrics_write_interval = 15
+# metrics files not rewritten for this long belong to processes that exited
+# (or have been idle) and are deleted by /metrics
+metrics_file_expiration = 4 * metrics_write_interval
+# client addresses /metrics answers; everyone else gets a 404. A reverse
+# proxy on the same host forwards requests from localhost, so it must not
+# route /metrics. An empty list turns the endpoint off.
+metrics_allowed_addresses = ['127.0.0.1', '::1']
+# seconds between resident memory samples while an import stage is measured
+# (see proteomescout_worker/helpers/stage_metrics.py)
+stage_memory_sample_interval = 0.5
+
+# persistent on-disk cache of raw UniProt/NCBI records shared by all workers
+DISABLE_RECORD_CACHE = False
+record_cache_file = "records.sqlite"
+record_cache_expiration_time = 30 * 86400
+record_cache_max_bytes = 2 * 1024 ** 3
+# seconds between the size checks (and evictions) each worker runs after writing
+record_cache_evict_interval = 300
+# bump a source's label (e.g. to the new UniProt release) to invalidate its records
+record_cache_releases = {'uniprot': '', 'ncbi': ''}
+
+# seconds a process keeps the PTM -> taxon table before reading it again
+ptm_taxonomy_cache_ttl = 3600
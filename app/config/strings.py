@@ -155,6 +155,7 @@ experiment_upload_error_no_column_assignment = "Error: Column assignment for '%s
 experiment_upload_error_must_have_no_more_column_among = "Error: You must have at most one column from the following: %s"
 experiment_upload_error_must_have_one_column_among = "Error: You must have at most one column from the following: %s"
 experiment_upload_error_no_annotations = "You must specify at least one column containing annotation data"
+experiment_upload_error_more_errors = "... and %d more errors"
 
 experiment_upload_warning_columns_values_should_be = "Expected column value to be of type '%s'"
 experiment_upload_warning_missing_column = "Warning: Row missing expected columns"
@@ -1,4 +1,5 @@
-from app.database.uniprot import SwissprotRecord
+from app.database.uniprot import SwissprotRecord, SwissprotAccession, SwissprotAnnotation, SwissprotIsoform
+from app.database.pfam import PfamFamily, PfamRegion
 from app.database.taxonomies import Taxonomy, Species
 from app.database.mutations import Mutation
 
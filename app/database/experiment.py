@@ -71,7 +71,7 @@ class ExperimentData(db.Model):
     priority = db.Column(db.Integer, default=0)
     value = db.Column(db.Float)
     
-    MS_id = db.Column(db.Integer, db.ForeignKey('MS.id'))
+    MS_id = db.Column(db.Integer, db.ForeignKey('MS.id'), index=True)
     MS = db.relationship("MeasuredPeptide")
         
     def __format_name(self):
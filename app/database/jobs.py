@@ -4,7 +4,7 @@
 # from sqlalchemy.orm import relationship
 from app import db
 import os
-# from app.config import settings
+from app.config import settings
 from app.utils import crypto
 import pickle
 import enum
@@ -26,7 +26,7 @@ class CachedResult(db.Model):
     def __init__(self, fn, args):
         self.function = "%s.%s" % (fn.__module__, fn.__name__)
         repr_args = canonicalize_arguments(args)
-        self.hash_args = crypto.md5(repr_args)
+        self.hash_args = crypto.md5(repr_args.encode('utf-8'))
         self.started = datetime.datetime.now()
         self.finished = None
 
@@ -34,23 +34,25 @@ class CachedResult(db.Model):
         self.started = datetime.datetime.now()
         self.finished = None
 
-    # def delete(self):
-    #     DBSession.delete(self)
+    def save(self):
+        db.session.add(self)
+        db.session.commit()
 
-    #     fn = self.get_location()
-    #     if(os.path.exists(fn)):
-    #         os.remove(fn)
+    def delete(self):
+        db.session.delete(self)
 
+        fn = self.get_location()
+        if(os.path.exists(fn)):
+            os.remove(fn)
 
-    # def is_expired(self):
-    #     delta = datetime.datetime.now() - self.finished
-    #     return delta.total_seconds() > settings.cache_expiration_time
+    def is_expired(self):
+        delta = datetime.datetime.now() - self.finished
+        return delta.total_seconds() > settings.cache_expiration_time
 
-    # def get_location(self):
-    #     dirpath = os.sep.join([settings.ptmscout_path, settings.cache_storage_directory, self.function])
-    #     if not os.path.exists(dirpath):
-    #         os.mkdir(dirpath)
-    #     return os.sep.join([dirpath, self.hash_args + ".pyp"])
+    def get_location(self):
+        dirpath = os.path.join(settings.ptmscout_path, settings.cache_storage_directory, self.function)
+        os.makedirs(dirpath, exist_ok=True)
+        return os.path.join(dirpath, self.hash_args + ".pyp")
 
     def load_result(self):
         fn = self.get_location()
@@ -77,7 +79,7 @@ def canonicalize_arguments(args):
 def getCachedResult(fn, args):
     function_np = "%s.%s" % (fn.__module__, fn.__name__)
     search_args = canonicalize_arguments(args)
-    md5_args = crypto.md5(search_args)
+    md5_args = crypto.md5(search_args.encode('utf-8'))
     result = CachedResult.query.filter_by(function=function_np, hash_args=md5_args).first()
     return result
 
@@ -96,6 +98,44 @@ class JobTypeEnum(enum.Enum):
     batch_annotate = 'batch_annotate'
 
 
+class JobStageMetric(db.Model):
+    """
+    Timing and counters of one stage of a job, recorded by
+    proteomescout_worker.helpers.stage_metrics when the stage's task ends.
+    """
+    __tablename__ = 'job_stage_metrics'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), index=True)
+    stage = db.Column(db.String(20))
+    status = db.Column(Enum('finished', 'error', name='stagestatusenum'))
+
+    started = db.Column(db.DateTime, index=True)
+    seconds = db.Column(db.Float)
+    # accessions, rows or peptides processed, as counted by the stage
+    items = db.Column(db.Integer)
+
+    db_queries = db.Column(db.Integer)
+    db_seconds = db.Column(db.Float)
+    # requests to each external service, with the time spent waiting for them
+    uniprot_calls = db.Column(db.Integer)
+    uniprot_seconds = db.Column(db.Float)
+    ncbi_calls = db.Column(db.Integer)
+    ncbi_seconds = db.Column(db.Float)
+    pfam_calls = db.Column(db.Integer)
+    pfam_seconds = db.Column(db.Float)
+
+    # highest resident memory of the worker process during the stage
+    peak_memory_mb = db.Column(db.Float)
+
+    def rows_per_second(self):
+        if not self.items or not self.seconds:
+            return None
+        return self.items / self.seconds
+
+    def external_calls(self):
+        return (self.uniprot_calls or 0) + (self.ncbi_calls or 0) + (self.pfam_calls or 0)
+
+
 class Job(db.Model):
     __tablename__ = 'jobs'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -121,6 +161,8 @@ class Job(db.Model):
     restarted = db.Column(db.DateTime, nullable=True)
     finished = db.Column(db.DateTime, nullable=True)
 
+    stage_metrics = db.relationship("JobStageMetric", order_by=JobStageMetric.started, backref="job")
+
     def __init__(self):
         self.created = datetime.datetime.now()
         
@@ -193,3 +235,31 @@ def get_job_by_id(jid):
     if job is None:
         raise NoSuchJob(jid)
     return job
+
+
+def get_stage_metrics_by_job(job_ids):
+    """
+    Returns:
+        dict mapping each job id to the JobStageMetrics of its stages, in the
+        order they started
+    """
+    metrics = dict( (jid, []) for jid in job_ids )
+    if not job_ids:
+        return metrics
+    query = JobStageMetric.query.filter(JobStageMetric.job_id.in_(list(job_ids))) \
+                .order_by(JobStageMetric.started, JobStageMetric.id)
+    for metric in query:
+        metrics[metric.job_id].append(metric)
+    return metrics
+
+def get_recent_stage_metrics(since, job_type=None):
+    """
+    Returns:
+        list of (JobStageMetric, job type) for stages started since the given
+        datetime, optionally only those of jobs of one type
+    """
+    query = db.session.query(JobStageMetric, Job.type).join(Job, Job.id == JobStageMetric.job_id) \
+                .filter(JobStageMetric.started >= since)
+    if job_type is not None:
+        query = query.filter(Job.type == job_type)
+    return query.order_by(JobStageMetric.started).all()
@@ -1,12 +1,15 @@
 # from app.database import Base, DBSession
 from app.database import protein as protein_mod
+from app.database import taxonomies
 # from sqlalchemy.schema import db.Column, db.ForeignKey, Table, UniqueConstraint
 # from sqlalchemy.types import db.Integer, db.String, CHAR, Float, Enum, DateTime
 # from sqlalchemy.orm import db.relationship
 from sqlalchemy.sql.expression import and_, or_
 from sqlalchemy import Enum
 from app import db
+from app.config import settings
 from functools import reduce
+import time
 import enum
 
 PTM_taxon = db.Table('PTM_taxonomy',
@@ -65,9 +68,14 @@ class PTM(db.Model):
         return my_taxons
 
     def has_taxon(self, search_taxons):
+        # names are read from the in-memory taxonomy tree rather than loading
+        # self.taxons for every candidate modification
         search_taxons = set([t.lower() for t in search_taxons])
-        my_taxons = set([t.formatted_name.lower() for t in self.taxons])
-        return len(my_taxons & search_taxons) > 0
+        tree = taxonomies.get_taxonomy_tree()
+        return any( tree.formatted_name(txid).lower() in search_taxons for txid in get_ptm_taxon_ids().get(self.id, []) )
+
+    def has_taxons(self):
+        return len(get_ptm_taxon_ids().get(self.id, [])) > 0
 
     def is_parent(self, node):
         A = reduce(bool.__or__, [ c.id == node.id for c in self.children ], False)
@@ -112,6 +120,9 @@ class PTM(db.Model):
 
 class Peptide(db.Model):
     __tablename__ = 'peptide'
+    __table_args__ = (
+        db.Index('ix_peptide_protein_id_site_pos_site_type', 'protein_id', 'site_pos', 'site_type'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     pep_aligned = db.Column(db.String(15))
     
@@ -139,6 +150,9 @@ class Peptide(db.Model):
 
 class PeptideModification(db.Model):
     __tablename__ = 'MS_modifications'
+    __table_args__ = (
+        db.Index('ix_MS_modifications_peptide_id_modification_id', 'peptide_id', 'modification_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     MS_id = db.Column(db.Integer, db.ForeignKey('MS.id'))
@@ -165,6 +179,9 @@ class PeptideAmbiguity(db.Model):
 
 class MeasuredPeptide(db.Model):
     __tablename__ = 'MS'
+    __table_args__ = (
+        db.Index('ix_MS_experiment_id_protein_id', 'experiment_id', 'protein_id'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     query_accession = db.Column(db.String(45))
     experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'))
@@ -268,6 +285,27 @@ def get_peptide_by_site(pep_site, pep_type, prot_id):
 def get_modification_by_id(ptm_id):
     return db.session.query(PTM).filter_by(id=ptm_id).first()
 
+# PTM id -> taxon node ids, read again every settings.ptm_taxonomy_cache_ttl
+# seconds; the PTM_taxonomy table only changes when the modification ontology
+# is reloaded, which should call clear_ptm_taxon_ids
+_ptm_taxon_ids = None
+_ptm_taxon_ids_loaded = 0.0
+
+def get_ptm_taxon_ids():
+    global _ptm_taxon_ids, _ptm_taxon_ids_loaded
+    now = time.monotonic()
+    if _ptm_taxon_ids is None or now - _ptm_taxon_ids_loaded > settings.ptm_taxonomy_cache_ttl:
+        taxon_ids = {}
+        for ptm_id, taxon_id in db.session.query(PTM_taxon.c.PTM_id, PTM_taxon.c.taxon_id):
+            taxon_ids.setdefault(ptm_id, []).append(taxon_id)
+        _ptm_taxon_ids = taxon_ids
+        _ptm_taxon_ids_loaded = now
+    return _ptm_taxon_ids
+
+def clear_ptm_taxon_ids():
+    global _ptm_taxon_ids
+    _ptm_taxon_ids = None
+
 def get_modification_by_name(ptm_name):
     return db.session.query(PTM).filter_by(name=ptm_name).first()
 
@@ -285,10 +323,53 @@ def find_matching_ptm(mod_type, residue=None, taxons=None):
     mods_match_residue = len(mods) > 0
 
     if taxons:
-        mods = [mod for mod in mods if mod.has_taxon(taxons) or len(mod.taxons) == 0]
+        mods = [mod for mod in mods if not mod.has_taxons() or mod.has_taxon(taxons)]
     
     return mods, mods_exist, mods_match_residue
 
+class PTMIndex(object):
+    """
+    In-memory lookup of modification types by accession, name or keyword,
+    for checking many data rows without a query per row.
+
+    Every PTM is loaded with its children and keywords through a separate
+    session that is removed afterwards, leaving them detached, so the index
+    can be used without touching the database connection.
+    """
+    def __init__(self):
+        session = db.create_scoped_session()
+        try:
+            mods = session.query(PTM).options(db.selectinload(PTM.children), db.selectinload(PTM.keywords)).all()
+        finally:
+            session.remove()
+
+        # the database comparison is case insensitive
+        self.by_key = {}
+        for mod in mods:
+            keys = set([mod.accession, mod.name] + [kw.keyword for kw in mod.keywords])
+            for key in keys:
+                if key is not None:
+                    self.by_key.setdefault(key.lower(), []).append(mod)
+
+    def find_matching_ptm(self, mod_type, residue=None, taxons=None):
+        """Same as modifications.find_matching_ptm"""
+        if mod_type == "None":
+            return [], False, False
+
+        mods = self.by_key.get(mod_type.lower(), [])
+
+        mods_exist = len(mods) > 0
+
+        if residue:
+            mods = [mod for mod in mods if mod.has_target(residue)]
+
+        mods_match_residue = len(mods) > 0
+
+        if taxons:
+            mods = [mod for mod in mods if not mod.has_taxons() or mod.has_taxon(taxons)]
+
+        return mods, mods_exist, mods_match_residue
+
 def get_peptide_by_id(pep_id):
     return db.session.query(Peptide).filter(Peptide.id==pep_id).first()
 
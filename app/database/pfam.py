@@ -0,0 +1,76 @@
+from app import db
+
+# upper bound on the number of accessions in one IN (...) clause
+MAX_ACCESSIONS_PER_QUERY = 500
+
+# Local copy of the Pfam-A annotation, filled by the offline loader
+# (proteomescout_worker.helpers.pfam_release) and used by pfam_tools when
+# settings.PFAM_MODE is 'local'
+
+class PfamFamily(db.Model):
+    __tablename__ = 'pfam_family'
+    accession = db.Column(db.VARCHAR(10), primary_key=True)
+    label = db.Column(db.VARCHAR(45))
+    class_ = db.Column('class', db.VARCHAR(20))
+    release = db.Column(db.VARCHAR(20))
+
+    def __init__(self, accession, label, class_, release):
+        self.accession = accession
+        self.label = label
+        self.class_ = class_
+        self.release = release
+
+class PfamRegion(db.Model):
+    __tablename__ = 'pfam_region'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # UniProt accession and the md5 of the sequence the region was computed on
+    accession = db.Column(db.VARCHAR(20), index=True)
+    seq_version = db.Column(db.Integer)
+    md5 = db.Column(db.CHAR(32))
+    family_accession = db.Column(db.VARCHAR(10))
+    start = db.Column(db.Integer)
+    stop = db.Column(db.Integer)
+    release = db.Column(db.VARCHAR(20))
+
+
+def get_regions_by_accessions(accessions):
+    """
+    Look up the Pfam-A regions of UniProt accessions.
+
+    Parameters:
+        accessions: iterable of UniProt accessions
+
+    Returns:
+        dict mapping each requested accession with regions to a list of
+        (PfamRegion, PfamFamily or None) tuples
+    """
+    requested = {}
+    for acc in accessions:
+        requested.setdefault(acc.upper(), []).append(acc)
+
+    upper = list(requested.keys())
+    found = {}
+    for i in range(0, len(upper), MAX_ACCESSIONS_PER_QUERY):
+        chunk = upper[i:i+MAX_ACCESSIONS_PER_QUERY]
+        rows = db.session.query(PfamRegion, PfamFamily) \
+                    .outerjoin(PfamFamily, PfamFamily.accession == PfamRegion.family_accession) \
+                    .filter(PfamRegion.accession.in_(chunk)).all()
+
+        for region, family in rows:
+            for requested_acc in requested.get(region.accession.upper(), []):
+                found.setdefault(requested_acc, []).append((region, family))
+
+    return found
+
+def get_families(accessions):
+    """Return a dict mapping each known family accession (e.g. PF00069) to its PfamFamily"""
+    accessions = list(set(accessions))
+    found = {}
+    for i in range(0, len(accessions), MAX_ACCESSIONS_PER_QUERY):
+        chunk = accessions[i:i+MAX_ACCESSIONS_PER_QUERY]
+        for family in db.session.query(PfamFamily).filter(PfamFamily.accession.in_(chunk)):
+            found[family.accession] = family
+    return found
+
+def get_loaded_releases():
+    return [ r for r, in db.session.query(PfamRegion.release).distinct() ]
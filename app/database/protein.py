@@ -3,15 +3,31 @@
 # from sqlalchemy.types import db.Integer, TEXT, db.String, Enum, Text, db.Float, DateTime
 # from sqlalchemy.orm import relationship
 from sqlalchemy.sql import null, or_, and_
+from sqlalchemy.orm import validates, joinedload
+from sqlalchemy import func
 from app.config import strings, settings
 from app.database import taxonomies
 from app import db
 from functools import reduce
 import datetime
+import hashlib
 import enum
 
 from app.database import Species,  ExpressionProbeset, Mutation
 
+# upper bound on the number of accessions in one IN (...) clause
+MAX_ACCESSIONS_PER_QUERY = 500
+# upper bound on the number of sequence hashes in one IN (...) clause; lower,
+# since every protein it finds is loaded with its whole sequence
+MAX_SEQUENCES_PER_QUERY = 200
+
+# MySQL cannot index the TEXT sequence column, so proteins are looked up by
+# the SHA-1 of their sequence (the same value as MySQL's SHA1(sequence))
+def hash_sequence(seq):
+    if seq is None:
+        return None
+    return hashlib.sha1(seq.encode('utf-8')).hexdigest()
+
 go_hierarchy_table = db.Table('GO_hierarchy',
     db.Column('parent_id', db.Integer, db.ForeignKey('GO.id')),
     db.Column('child_id', db.Integer, db.ForeignKey('GO.id')))
@@ -76,6 +92,9 @@ class GeneOntologyEntry(db.Model):
 
 class ProteinScansite(db.Model):
     __tablename__ = 'protein_scansite'
+    __table_args__ = (
+        db.Index('ix_protein_scansite_protein_id_site_pos', 'protein_id', 'site_pos'),
+    )
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     
     source = db.Column(db.String(40), default='scansite')
@@ -93,7 +112,7 @@ class ProteinAccession(db.Model):
     __tablename__='protein_acc'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     type = db.Column(db.String(30))
-    value = db.Column(db.String(45))
+    value = db.Column(db.String(45), index=True)
     protein_id = db.Column(db.Integer, db.ForeignKey('protein.id'))
     primary_acc = db.Column(db.Boolean, default=0)
     date = db.Column(db.DateTime)
@@ -183,8 +202,12 @@ class ProteinRegion(db.Model):
 
 class Protein(db.Model):
     __tablename__='protein'
+    __table_args__ = (
+        db.Index('ix_protein_species_id_sequence_sha1', 'species_id', 'sequence_sha1'),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     sequence = db.Column(db.Text)
+    sequence_sha1 = db.Column(db.CHAR(40))
     acc_gene = db.Column(db.String(30))
     locus = db.Column(db.String(30))
     name = db.Column(db.String(100))
@@ -204,6 +227,11 @@ class Protein(db.Model):
 
     def __init__(self):
         self.date = datetime.datetime.now()
+
+    @validates('sequence')
+    def update_sequence_sha1(self, key, seq):
+        self.sequence_sha1 = hash_sequence(seq)
+        return seq
     
     def has_prediction(self, source, value, site_pos):
         for pred in self.scansite:
@@ -370,7 +398,39 @@ def get_protein_domain(prot_id, site_pos):
 
 
 def get_protein_by_sequence(seq, species):
-    return db.session.query(Protein).join(Protein.species).filter(Protein.sequence == seq, taxonomies.Species.name == species).first()
+    # the sequence itself is still compared, but only for the indexed candidates
+    return db.session.query(Protein).join(Protein.species).\
+        filter(Protein.sequence_sha1 == hash_sequence(seq), taxonomies.Species.name == species, Protein.sequence == seq).first()
+
+
+def get_proteins_by_sequences(sequences):
+    """
+    Look up the proteins of many (sequence, species name) pairs with one query
+    per MAX_SEQUENCES_PER_QUERY sequences, instead of one query each with
+    get_protein_by_sequence.
+
+    Returns:
+        dict mapping each (sequence, species) pair found to its protein
+    """
+    # species names compare case-insensitively, as they do in MySQL
+    requested = {}
+    for seq, species in sequences:
+        requested.setdefault(hash_sequence(seq), {}).setdefault((seq, species.lower()), set()).add((seq, species))
+
+    found = {}
+    hashes = list(requested.keys())
+    for i in range(0, len(hashes), MAX_SEQUENCES_PER_QUERY):
+        chunk = hashes[i:i+MAX_SEQUENCES_PER_QUERY]
+        species_names = set( species for h in chunk for pairs in requested[h].values() for _, species in pairs )
+        rows = db.session.query(Protein).join(Protein.species).\
+            filter(Protein.sequence_sha1.in_(chunk), taxonomies.Species.name.in_(species_names)).\
+            order_by(Protein.id).all()
+
+        for prot in rows:
+            pairs = requested[prot.sequence_sha1].get((prot.sequence, prot.species.name.lower()), ())
+            for key in pairs:
+                found.setdefault(key, prot)
+    return found
 
 
 def get_proteins_by_accession(accession):
@@ -378,6 +438,37 @@ def get_proteins_by_accession(accession):
         filter(ProteinAccession.value == accession).all()
 
 
+def get_proteins_by_accessions(accessions):
+    """
+    Look up the proteins of many accessions with one IN query per
+    MAX_ACCESSIONS_PER_QUERY accessions, instead of one query each with
+    get_proteins_by_accession.
+
+    Accessions are compared case-insensitively.
+
+    Returns:
+        dict mapping each accession to its list of proteins (empty if unknown)
+    """
+    requested = {}
+    for acc in accessions:
+        requested.setdefault(acc.upper(), set()).add(acc)
+
+    found = dict( (acc, []) for acc in accessions )
+    upper = list(requested.keys())
+    for i in range(0, len(upper), MAX_ACCESSIONS_PER_QUERY):
+        chunk = upper[i:i+MAX_ACCESSIONS_PER_QUERY]
+        rows = db.session.query(ProteinAccession.value, Protein).\
+            join(Protein, Protein.id == ProteinAccession.protein_id).\
+            options(joinedload(Protein.species)).\
+            filter(func.upper(ProteinAccession.value).in_(chunk)).all()
+
+        for value, prot in rows:
+            for acc in requested.get(value.upper(), []):
+                if prot not in found[acc]:
+                    found[acc].append(prot)
+    return found
+
+
 def get_all_proteins():
     return db.session.query(Protein).all()
 
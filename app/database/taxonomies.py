@@ -3,6 +3,11 @@
 # from app.database import Base, DBSession
 # from sqlalchemy.orm import db.relationship
 from app import db
+from array import array
+import threading
+
+# upper bound on the number of node ids in one IN (...) clause
+MAX_NODES_PER_QUERY = 500
 
 class Taxonomy(db.Model):
     __tablename__='taxonomy'
@@ -52,3 +57,171 @@ def get_taxonomy_by_id(txid):
 
 def get_taxon_by_name(taxon, strain=None):
     return db.session.query(Taxonomy).filter_by(name=taxon, strain=strain).first()
+
+def get_species_by_names(names):
+    """Return a dict mapping each name with a Species row to that Species"""
+    names = list(set(names))
+    if not names:
+        return {}
+    return dict( (sp.name, sp) for sp in db.session.query(Species).filter(Species.name.in_(names)) )
+
+
+
+class TaxonomyTree(object):
+    """
+    In-memory copy of the taxonomy table for lineage walks without queries.
+
+    Nodes are stored in parallel arrays indexed by position, with the parent
+    of each node held as the position of its parent (-1 for roots). Nodes
+    missing from the tree, e.g. inserted by another process since it was
+    loaded, are read from the database on demand along with any missing
+    ancestors.
+    """
+    def __init__(self):
+        self.node_ids = array('l')
+        self.parents = array('l')
+        self.names = []
+        self.strains = []
+        self.kingdoms = []
+        self.index = {}
+        self.by_name = {}
+        self.orphans = {}
+        self.lock = threading.RLock()
+
+    def load(self):
+        rows = db.session.query(Taxonomy.node_id, Taxonomy.parent_id, Taxonomy.name, Taxonomy.strain, Taxonomy.kingdom).all()
+        self.add_rows(rows)
+        return self
+
+    def add_rows(self, rows):
+        """Add (node_id, parent_id, name, strain, kingdom) tuples in any order"""
+        with self.lock:
+            parent_ids = []
+            for node_id, parent_id, name, strain, kingdom in rows:
+                if node_id in self.index:
+                    continue
+                i = len(self.node_ids)
+                self.index[node_id] = i
+                self.node_ids.append(node_id)
+                self.parents.append(-1)
+                self.names.append(name)
+                self.strains.append(strain)
+                self.kingdoms.append(kingdom)
+                self.by_name[self.__name_key(name, strain)] = i
+                parent_ids.append((i, parent_id))
+
+            for i, parent_id in parent_ids:
+                if parent_id is None:
+                    continue
+                if parent_id in self.index:
+                    self.parents[i] = self.index[parent_id]
+                else:
+                    self.orphans.setdefault(parent_id, []).append(i)
+
+            # children added before their parents are linked now
+            for node_id in [ n for n in self.orphans if n in self.index ]:
+                for i in self.orphans.pop(node_id):
+                    self.parents[i] = self.index[node_id]
+
+    def __name_key(self, name, strain):
+        return (name.strip().lower() if name else None, strain.strip().lower() if strain else None)
+
+    def __load_missing(self, node_ids):
+        # reads the nodes and every ancestor not yet in the tree, one query
+        # per level of ancestors (per MAX_NODES_PER_QUERY nodes)
+        missing = set( n for n in node_ids if n is not None and n not in self.index )
+        seen = set()
+        while missing:
+            seen |= missing
+            missing = list(missing)
+            rows = []
+            for i in range(0, len(missing), MAX_NODES_PER_QUERY):
+                chunk = missing[i:i+MAX_NODES_PER_QUERY]
+                rows.extend( tuple(r) for r in db.session.query(Taxonomy.node_id, Taxonomy.parent_id, Taxonomy.name, Taxonomy.strain, Taxonomy.kingdom) \
+                                                    .filter(Taxonomy.node_id.in_(chunk)) )
+            self.add_rows(rows)
+            missing = set( parent_id for _, parent_id, _, _, _ in rows
+                           if parent_id is not None and parent_id not in self.index and parent_id not in seen )
+
+    def preload(self, node_ids):
+        """Read any of $node_ids not yet in the tree, with their ancestors"""
+        self.__load_missing(node_ids)
+
+    def is_loaded(self, node_id):
+        """True if the node is in the tree, without consulting the database"""
+        return node_id in self.index
+
+    def __position(self, node_id):
+        if node_id not in self.index:
+            self.__load_missing([node_id])
+        return self.index.get(node_id)
+
+    def __contains__(self, node_id):
+        return self.__position(node_id) is not None
+
+    def find(self, name, strain=None):
+        """Return the node id of the taxon with this name and strain, or None"""
+        i = self.by_name.get(self.__name_key(name, strain))
+        if i is not None:
+            return self.node_ids[i]
+
+        tx = get_taxon_by_name(name, strain=strain)
+        if tx is None:
+            return None
+        self.__load_missing([tx.node_id])
+        return tx.node_id
+
+    def kingdom(self, node_id):
+        i = self.__position(node_id)
+        return self.kingdoms[i] if i is not None else None
+
+    def formatted_name(self, node_id):
+        i = self.__position(node_id)
+        if i is None:
+            return None
+        if self.strains[i]:
+            return "%s (%s)" % (self.names[i].strip(), self.strains[i].strip())
+        return self.names[i].strip()
+
+    def ancestors(self, node_id):
+        """Return the positions of a node and its ancestors, node first"""
+        path = []
+        i = self.__position(node_id)
+        while i is not None and i != -1:
+            path.append(i)
+            i = self.parents[i]
+        return path
+
+    def lineage(self, node_id):
+        """
+        Return the lower case names from the root to the node, ending with the
+        node's formatted name (including any strain)
+        """
+        path = self.ancestors(node_id)
+        if not path:
+            return []
+        names = [ self.names[i].lower() for i in reversed(path[1:]) ]
+        return names + [ self.formatted_name(node_id).lower() ]
+
+    def has_ancestor(self, node_id, name):
+        """True if the node or any of its ancestors is named $name (case insensitive)"""
+        name = name.strip().lower()
+        for i in self.ancestors(node_id):
+            if self.names[i].strip().lower() == name:
+                return True
+        return False
+
+    def add(self, node_id, parent_id, name, strain, kingdom):
+        self.add_rows([(node_id, parent_id, name, strain, kingdom)])
+
+
+_taxonomy_tree = None
+_taxonomy_tree_lock = threading.Lock()
+
+def get_taxonomy_tree():
+    """Return the process wide taxonomy tree, loading it on first use"""
+    global _taxonomy_tree
+    with _taxonomy_tree_lock:
+        if _taxonomy_tree is None:
+            _taxonomy_tree = TaxonomyTree().load()
+    return _taxonomy_tree
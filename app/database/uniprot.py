@@ -5,15 +5,21 @@
 from sqlalchemy.sql.expression import and_
 from app import db
 
+# upper bound on the number of accessions in one IN (...) clause
+MAX_ACCESSIONS_PER_QUERY = 500
+
 class SwissprotRecord(db.Model):
     __tablename__ = 'uniprot_swissprot'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    accession = db.Column(db.VARCHAR(20))
+    accession = db.Column(db.VARCHAR(20), index=True)
     locus = db.Column(db.VARCHAR(30))
     name = db.Column(db.VARCHAR(150))
     species = db.Column(db.VARCHAR(100))
     sequence = db.Column(db.Text)
 
+    annotation = db.relationship('SwissprotAnnotation', uselist=False, cascade="all, delete-orphan")
+    isoforms = db.relationship('SwissprotIsoform', cascade="all, delete-orphan")
+
     def __init__(self, name, accession, locus, species, sequence):
         self.name = name
         self.accession = accession
@@ -21,6 +27,31 @@ class SwissprotRecord(db.Model):
         self.species = species
         self.sequence = sequence.upper()
 
+# Sidecar tables filled by the offline release loader
+# (proteomescout_worker.helpers.uniprot_release)
+
+class SwissprotAccession(db.Model):
+    __tablename__ = 'uniprot_swissprot_acc'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    record_id = db.Column(db.Integer, db.ForeignKey('uniprot_swissprot.id', ondelete="CASCADE"), index=True)
+    accession = db.Column(db.VARCHAR(20), index=True)
+
+class SwissprotAnnotation(db.Model):
+    __tablename__ = 'uniprot_swissprot_annotation'
+    record_id = db.Column(db.Integer, db.ForeignKey('uniprot_swissprot.id', ondelete="CASCADE"), primary_key=True)
+    release = db.Column(db.VARCHAR(20))
+    # JSON document with gene, taxonomy, other accessions, features, variants and host
+    data = db.Column(db.Text(length=2**24))
+
+class SwissprotIsoform(db.Model):
+    __tablename__ = 'uniprot_swissprot_isoform'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    record_id = db.Column(db.Integer, db.ForeignKey('uniprot_swissprot.id', ondelete="CASCADE"), index=True)
+    accession = db.Column(db.VARCHAR(20), index=True)
+    name = db.Column(db.VARCHAR(150))
+    number = db.Column(db.Integer)
+    sequence = db.Column(db.Text)
+
 def find_peptide(seq, species=None):
     filter_clause = SwissprotRecord.sequence.like('%' + seq + '%')
 
@@ -28,3 +59,35 @@ def find_peptide(seq, species=None):
         filter_clause = and_(filter_clause, SwissprotRecord.species==species)
 
     return db.session.query(SwissprotRecord).filter(filter_clause).all()
+
+def get_records_by_accessions(accessions):
+    """
+    Look up locally loaded Swiss-Prot records by primary or secondary accession.
+
+    Parameters:
+        accessions: iterable of root (non-isoform) accessions
+
+    Returns:
+        dict mapping each requested accession that was found to its SwissprotRecord,
+        with annotation and isoforms loaded
+    """
+    requested = {}
+    for acc in accessions:
+        requested.setdefault(acc.upper(), []).append(acc)
+
+    upper = list(requested.keys())
+    found = {}
+    for i in range(0, len(upper), MAX_ACCESSIONS_PER_QUERY):
+        chunk = upper[i:i+MAX_ACCESSIONS_PER_QUERY]
+        rows = db.session.query(SwissprotAccession.accession, SwissprotRecord) \
+                    .join(SwissprotRecord, SwissprotRecord.id == SwissprotAccession.record_id) \
+                    .options(db.joinedload(SwissprotRecord.annotation), db.selectinload(SwissprotRecord.isoforms)) \
+                    .filter(SwissprotAccession.accession.in_(chunk)).all()
+        for acc, record in rows:
+            for requested_acc in requested.get(acc.upper(), []):
+                found[requested_acc] = record
+
+    return found
+
+def get_loaded_releases():
+    return [ r for r, in db.session.query(SwissprotAnnotation.release).distinct() ]
@@ -0,0 +1,130 @@
+import os
+import threading
+import sqlalchemy
+from flask import g, has_app_context
+from flask.globals import app_ctx
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+
+# Engine routing for the shared db session.
+#
+# Code running in an application context can pick the engine its queries are
+# sent to with use_route(): READ_REPLICA sends reads to the replica configured
+# in SQLALCHEMY_REPLICA_URI (views that only read, e.g. search, browse and the
+# protein pages), WORKER sends everything to a separate pool on the primary
+# sized by SQLALCHEMY_WORKER_ENGINE_OPTIONS (Celery tasks and maintenance
+# scripts), so long imports cannot take every connection web requests need.
+# Without a route, or for models with a __bind_key__, the default engine and
+# binds are used as before.
+#
+# Once a session on the replica route has flushed, it keeps reading from the
+# primary so it sees its own writes.
+#
+# Sessions are scoped to the application context rather than the thread:
+# every request and every Celery task (see celery_utils.ContextTask) pushes
+# its own context, and Flask-SQLAlchemy removes the context's session when it
+# is torn down.
+
+READ_REPLICA = 'replica'
+WORKER = 'worker'
+
+# pool options that do not apply to sqlite's single-connection pools
+POOL_SIZE_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+def app_context_scope():
+    if has_app_context():
+        return ('app context', id(app_ctx._get_current_object()))
+    return ('thread', threading.get_ident())
+
+def use_route(route):
+    """
+    Route the queries of the current application context's session.
+
+    Parameters:
+        route: READ_REPLICA, WORKER or None for the default engine
+    """
+    g.db_route = route
+
+def get_route():
+    if not has_app_context():
+        return None
+    return g.get('db_route')
+
+def read_replica_request():
+    # before_request handler for blueprints whose views only read
+    use_route(READ_REPLICA)
+
+def get_route_config(app, route):
+    """
+    Returns:
+        (database uri, engine options) for a route, uri is None when the
+        route is not configured and the default engine should be used
+    """
+    if route == READ_REPLICA:
+        return app.config.get('SQLALCHEMY_REPLICA_URI'), app.config.get('SQLALCHEMY_REPLICA_ENGINE_OPTIONS') or {}
+    if route == WORKER:
+        uri = app.config.get('SQLALCHEMY_WORKER_URI') or app.config.get('SQLALCHEMY_DATABASE_URI')
+        return uri, app.config.get('SQLALCHEMY_WORKER_ENGINE_OPTIONS') or {}
+    return None, {}
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        route = get_route()
+        if route is None or has_bind_key(mapper):
+            return SignallingSession.get_bind(self, mapper, clause)
+
+        if self._flushing:
+            self.info['flushed'] = True
+        if route == READ_REPLICA and self.info.get('flushed'):
+            return SignallingSession.get_bind(self, mapper, clause)
+
+        engine = self.db.get_routed_engine(self.app, route)
+        if engine is None:
+            return SignallingSession.get_bind(self, mapper, clause)
+        return engine
+
+def has_bind_key(mapper):
+    if mapper is None:
+        return False
+    return getattr(mapper.persist_selectable, 'info', {}).get('bind_key') is not None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy extension whose session routes queries by use_route().
+    Routed engines are created on first use in each process, so Celery's
+    forked workers do not share the parent's connections.
+    """
+    def __init__(self, *args, **kwargs):
+        session_options = kwargs.setdefault('session_options', {})
+        session_options.setdefault('scopefunc', app_context_scope)
+        self._routed_engines = {}
+        self._routed_engines_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_routed_engine(self, app, route):
+        key = (os.getpid(), id(app), route)
+        with self._routed_engines_lock:
+            if key not in self._routed_engines:
+                self._routed_engines[key] = self.create_routed_engine(app, route)
+            return self._routed_engines[key]
+
+    def create_routed_engine(self, app, route):
+        uri, route_options = get_route_config(app, route)
+        if uri is None:
+            return None
+
+        options = dict(self._engine_options)
+        options.update(route_options)
+        if sqlalchemy.engine.url.make_url(uri).drivername.startswith('sqlite'):
+            for name in POOL_SIZE_OPTIONS:
+                options.pop(name, None)
+        return sqlalchemy.create_engine(uri, **options)
@@ -0,0 +1,349 @@
+import contextvars
+import glob
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from flask import Response, abort, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+
+log = logging.getLogger('ptmscout')
+
+# Query count and latency instrumentation for Flask views and Celery tasks.
+#
+# A sample of requests and tasks (settings.metrics_sample_rate) is measured:
+# every SQL statement they execute is counted and timed through SQLAlchemy's
+# cursor events, along with their wall time. Each measurement is written as
+# one structured log line ("metrics {...}", with its slowest statements) and
+# added to per-endpoint / per-task totals served by /metrics in the
+# Prometheus text format. Requests and tasks that are not sampled only cost a
+# random number and a context variable lookup per statement.
+#
+# Totals are kept per process. When settings.metrics_directory is set, web
+# and Celery worker processes also write their totals there and /metrics adds
+# up the files of every process. Each process writes its own file, named
+# after its pid and a random id, so a recycled pid never overwrites the file
+# of an earlier process; files not rewritten within
+# settings.metrics_file_expiration seconds belong to processes that have
+# exited (or stayed idle) and are removed by the reader. /metrics only
+# answers requests from settings.metrics_allowed_addresses.
+#
+# The same cursor events feed a process-wide StatementCounter, which the
+# import stage metrics (proteomescout_worker.helpers.stage_metrics) read.
+
+current_measurement = contextvars.ContextVar('current_measurement', default=None)
+
+class Measurement(object):
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+
+    def add_statement(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        # min-heap of the slowest statements seen so far
+        entry = (elapsed, self.queries, statement)
+        if len(self.slowest) < settings.metrics_slow_statements:
+            heapq.heappush(self.slowest, entry)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def get_slowest(self):
+        return [ (elapsed, statement) for elapsed, _, statement in sorted(self.slowest, reverse=True) ]
+
+class Totals(object):
+    FIELDS = ['samples', 'wall_seconds', 'db_queries', 'db_seconds', 'max_db_queries', 'max_statement_seconds']
+
+    def __init__(self, values=None):
+        values = values or {}
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field, 0))
+
+    def add(self, wall, measurement):
+        self.samples += 1
+        self.wall_seconds += wall
+        self.db_queries += measurement.queries
+        self.db_seconds += measurement.db_time
+        self.max_db_queries = max(self.max_db_queries, measurement.queries)
+        if measurement.slowest:
+            self.max_statement_seconds = max(self.max_statement_seconds, max(measurement.slowest)[0])
+
+    def merge(self, other):
+        for field in self.FIELDS:
+            if field.startswith('max_'):
+                setattr(self, field, max(getattr(self, field), getattr(other, field)))
+            else:
+                setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def to_dict(self):
+        return dict( (field, getattr(self, field)) for field in self.FIELDS )
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.last_written = 0
+        self.pid = None
+        self.filename = None
+
+    def get_filename(self):
+        """
+        Returns:
+            name of this process' metrics file, chosen again after a fork
+        """
+        pid = os.getpid()
+        if pid != self.pid:
+            self.pid = pid
+            self.filename = "%d-%s.json" % (pid, uuid.uuid4().hex[:12])
+        return self.filename
+
+    def record(self, measurement, wall):
+        with self.lock:
+            key = (measurement.kind, measurement.name)
+            if key not in self.totals:
+                self.totals[key] = Totals()
+            self.totals[key].add(wall, measurement)
+
+    def snapshot(self):
+        with self.lock:
+            return dict( (key, Totals(totals.to_dict())) for key, totals in self.totals.items() )
+
+    def write(self, directory):
+        """
+        Write this process' totals to <directory>/<pid>-<id>.json, at most
+        once every settings.metrics_write_interval seconds.
+        """
+        now = time.time()
+        if now - self.last_written < settings.metrics_write_interval:
+            return
+        self.last_written = now
+
+        rows = [ [kind, name, totals.to_dict()] for (kind, name), totals in self.snapshot().items() ]
+        path = os.path.join(directory, self.get_filename())
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path + '.tmp', 'w') as handle:
+                json.dump(rows, handle)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            log.warning("Unable to write metrics to %s: %s", path, str(e))
+
+registry = MetricsRegistry()
+
+def read_all_totals(directory):
+    """
+    Returns:
+        dict mapping (kind, name) to the Totals of every process that wrote
+        to directory within settings.metrics_file_expiration seconds, with
+        this process' current totals in place of its file. Older files are
+        deleted.
+    """
+    combined = registry.snapshot()
+    own = os.path.join(directory, registry.get_filename())
+    expired = time.time() - settings.metrics_file_expiration
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        if path == own:
+            continue
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+                continue
+            with open(path) as handle:
+                rows = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        for kind, name, values in rows:
+            key = (kind, name)
+            if key not in combined:
+                combined[key] = Totals()
+            combined[key].merge(Totals(values))
+    return combined
+
+
+# long SELECT column lists are cut from the middle so the FROM and WHERE
+# clauses stay in the log line
+def shorten_statement(statement, length=400):
+    statement = " ".join(statement.split())
+    if len(statement) <= length:
+        return statement
+    return statement[:length//4] + " ... " + statement[-(length*3//4):]
+
+def start_measurement(kind, name):
+    """
+    Start measuring the current request or task, if it is sampled.
+
+    Returns:
+        context variable token for finish_measurement, or None
+    """
+    if random.random() >= settings.metrics_sample_rate:
+        return None
+    return current_measurement.set(Measurement(kind, name))
+
+def finish_measurement(token, **fields):
+    measurement = current_measurement.get()
+    try:
+        current_measurement.reset(token)
+    except ValueError:
+        # finished from a different context than it was started in
+        current_measurement.set(None)
+    if measurement is None:
+        return
+
+    wall = time.perf_counter() - measurement.started
+    registry.record(measurement, wall)
+
+    line = {'kind': measurement.kind, 'name': measurement.name, 'wall_ms': round(wall * 1000, 1),
+            'db_queries': measurement.queries, 'db_ms': round(measurement.db_time * 1000, 1),
+            'slowest': [ {'ms': round(elapsed * 1000, 1), 'sql': shorten_statement(statement)} for elapsed, statement in measurement.get_slowest() ]}
+    line.update(fields)
+    log.info("metrics %s", json.dumps(line))
+
+    if settings.metrics_directory:
+        registry.write(settings.metrics_directory)
+
+
+class StatementCounter(object):
+    """
+    Count and time of the SQL statements executed by every thread of this
+    process, kept while at least one caller has started it (import stage
+    metrics, whose statements also run on the fetch scheduler's threads
+    rather than in the measured context).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queries = 0
+        self.seconds = 0.0
+
+    def start(self):
+        with self.lock:
+            self.active += 1
+
+    def stop(self):
+        with self.lock:
+            self.active -= 1
+
+    def add(self, elapsed):
+        with self.lock:
+            self.queries += 1
+            self.seconds += elapsed
+
+    def snapshot(self):
+        """Returns: (statements, seconds) counted so far"""
+        with self.lock:
+            return self.queries, self.seconds
+
+statements = StatementCounter()
+
+# cursor events are registered on the Engine class, so the default, replica
+# and worker engines (see db_routing) are all measured
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_measurement.get() is not None or statements.active:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    measurement = current_measurement.get()
+    if measurement is not None:
+        measurement.add_statement(statement, elapsed)
+    if statements.active:
+        statements.add(elapsed)
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+    starts = context.connection.info.get('metrics_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+METRICS = [
+    ('ptmscout_sampled_total', 'counter', 'samples', "Measured requests or tasks"),
+    ('ptmscout_wall_seconds_total', 'counter', 'wall_seconds', "Wall time of measured requests or tasks"),
+    ('ptmscout_db_queries_total', 'counter', 'db_queries', "SQL statements executed by measured requests or tasks"),
+    ('ptmscout_db_seconds_total', 'counter', 'db_seconds', "Time spent executing SQL statements"),
+    ('ptmscout_db_queries_max', 'gauge', 'max_db_queries', "Most SQL statements executed by one measured request or task"),
+    ('ptmscout_db_statement_seconds_max', 'gauge', 'max_statement_seconds', "Slowest single SQL statement"),
+]
+
+def format_metrics(totals):
+    """
+    Returns:
+        the totals in the Prometheus text exposition format
+    """
+    lines = ["# HELP ptmscout_metrics_sample_rate Fraction of requests and tasks measured",
+             "# TYPE ptmscout_metrics_sample_rate gauge",
+             "ptmscout_metrics_sample_rate %s" % (repr(float(settings.metrics_sample_rate)))]
+    keys = sorted(totals.keys())
+    for metric, tp, field, description in METRICS:
+        lines.append("# HELP %s %s" % (metric, description))
+        lines.append("# TYPE %s %s" % (metric, tp))
+        for kind, name in keys:
+            lines.append('%s{kind="%s",name="%s"} %s' % (metric, escape_label(kind), escape_label(name), repr(float(getattr(totals[(kind, name)], field)))))
+    return "\n".join(lines) + "\n"
+
+def metrics():
+    if request.remote_addr not in settings.metrics_allowed_addresses:
+        abort(404)
+    if settings.metrics_directory:
+        totals = read_all_totals(settings.metrics_directory)
+    else:
+        totals = registry.snapshot()
+    return Response(format_metrics(totals), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """
+    Measure a sample of the app's requests and serve /metrics to
+    settings.metrics_allowed_addresses.
+    """
+    from flask import g
+
+    @app.before_request
+    def start_request_measurement():
+        g.metrics_token = start_measurement('request', request.endpoint or 'unknown')
+
+    @app.teardown_request
+    def finish_request_measurement(exc):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            finish_measurement(token, method=request.method, error=exc is not None)
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+def init_celery():
+    """
+    Measure a sample of the tasks run by this worker.
+    """
+    from celery.signals import task_prerun, task_postrun
+
+    tokens = {}
+
+    @task_prerun.connect(weak=False)
+    def start_task_measurement(task_id=None, task=None, **kwargs):
+        token = start_measurement('task', task.name)
+        if token is not None:
+            tokens[task_id] = token
+
+    @task_postrun.connect(weak=False)
+    def finish_task_measurement(task_id=None, task=None, state=None, **kwargs):
+        token = tokens.pop(task_id, None)
+        if token is not None:
+            finish_measurement(token, state=state)
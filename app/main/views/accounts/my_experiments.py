@@ -1,6 +1,7 @@
 from app.main.views.accounts import bp
 from flask import render_template, redirect, url_for, request
 from flask_login import current_user
+from app.database import jobs as jobs_db
 
 @bp.route('/experiments', methods=['GET', 'POST'])
 def manage_experiments():
@@ -8,10 +9,12 @@ def manage_experiments():
         user = current_user
 
         jobs = user.jobs
+        stage_metrics = jobs_db.get_stage_metrics_by_job([job.id for job in jobs])
 
         return render_template(
             'proteomescout/accounts/my_experiments.html',
             jobs = jobs,
+            stage_metrics = stage_metrics,
         )
 
     else:
@@ -1,7 +1,11 @@
 from flask import Blueprint
+from app.db_routing import read_replica_request
 
 bp = Blueprint('experiment', __name__,
     template_folder='templates',
     static_folder='static')
 
+# these views only read, so their queries go to the read replica if configured
+bp.before_request(read_replica_request)
+
 from app.main.views.experiments import landing, home, summary, go, pfam, scansite, browse, subset, download_experiment
@@ -1,7 +1,11 @@
 from flask import Blueprint
+from app.db_routing import read_replica_request
 
 bp = Blueprint('compendia', __name__,
     template_folder='templates',
     static_folder='static')
 
+# these views only read, so their queries go to the read replica if configured
+bp.before_request(read_replica_request)
+
 import app.main.views.files.compendia  # Import the module where your routes are defined
\ No newline at end of file
@@ -1,6 +1,10 @@
 from flask import Blueprint
+from app.db_routing import read_replica_request
 
 bp = Blueprint('info', __name__)
 
+# these views only read, so their queries go to the read replica if configured
+bp.before_request(read_replica_request)
+
 from app.main.views.info import home
 
@@ -12,10 +12,13 @@ from app.main.views.kstar import (
     data_routes,
     plot_routes,
     export_data_routes,
+    batch_export_routes,
     plotting,
     clustering,
     data_processing,
-    utils
+    utils,
+    matrix_io,
+    session_cache
 )
 
 
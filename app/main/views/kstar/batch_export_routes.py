@@ -0,0 +1,277 @@
+"""
+KSTAR Batch Export Routes Module
+
+This module provides a Flask route that renders many KSTAR figures from one
+cached upload and returns them as a single ZIP archive. Each figure is
+described by a parameter set using the same field names as the interactive
+plot form; request-level form fields act as defaults for every set.
+
+Parameter sets that share filtering, sorting and clustering settings share one
+prepared data frame (and linkage), and each distinct figure is drawn once and
+saved in every requested format. Figures are rendered one after another in the
+request's worker, closing each before the next, as /plot does.
+
+Routes:
+    /plot/batch_export: Render a list of parameter sets into one ZIP file
+"""
+
+from flask import request, jsonify, send_file
+from io import BytesIO
+import json
+import logging
+import zipfile
+
+import matplotlib.pyplot as plt
+
+from app.main.views.kstar import bp
+from app.main.views.kstar.plotting import create_integrated_plot, create_dot_plot
+from app.main.views.kstar.matrix_io import frame_from_json
+from app.main.views.kstar.session_cache import get_session
+from app.main.views.kstar.utils import (
+    parse_bool,
+    safe_json_loads,
+    sanitize_filename,
+    create_error_response,
+    BATCH_EXPORT_FORMATS,
+    BATCH_EXPORT_MAX_FIGURES,
+    BATCH_EXPORT_MIN_DPI,
+    BATCH_EXPORT_MAX_DPI
+)
+from app.main.views.kstar.modules import (
+    prepare_plot_data,
+    check_plot_parameters,
+    extract_plot_params,
+    extract_plot_settings,
+    extract_dendrogram_settings,
+    extract_custom_labels
+)
+
+logger = logging.getLogger(__name__)
+
+# Form fields that change the data behind a figure; sets that agree on all of
+# them reuse the same filtered/sorted/clustered frames.
+DATA_FIELDS = (
+    'restrictKinases', 'kinases_to_drop', 'kinaseEditMode', 'kinaseSelect',
+    'manualSampleSelect', 'sortKinases', 'sortSamples', 'manualKinaseOrder',
+    'sample_sort_ref_kinase', 'showKinasesDendrogramInside', 'showSamplesDendrogram'
+)
+
+def _data_key(params: dict) -> str:
+    """Return a hashable key describing the data preparation for a set."""
+    return json.dumps({field: params.get(field) for field in DATA_FIELDS}, sort_keys=True)
+
+def _form_value(value) -> str:
+    """Convert JSON values to the string form the plot helpers expect."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+def build_parameter_sets(form, raw_sets: list) -> list:
+    """
+    Merge each requested parameter set over the request-level defaults.
+
+    Parameters:
+        form: Request form whose fields are shared defaults
+        raw_sets: List of dictionaries of per-figure overrides
+
+    Returns:
+        List of parameter dictionaries with 'name' and 'formats' resolved
+    """
+    defaults = {key: value for key, value in form.items() if key not in ('dataToken', 'parameterSets')}
+    default_formats = [defaults.get('download_format', 'png')]
+    parameter_sets = []
+    seen_names = set()
+    for i, raw in enumerate(raw_sets):
+        if not isinstance(raw, dict):
+            raise ValueError(f"Parameter set {i} must be an object")
+        params = dict(defaults)
+        params.update({key: _form_value(value) for key, value in raw.items() if key != 'formats'})
+        params['dpi'] = parse_dpi(params.get('dpi', 300), i)
+        formats = raw.get('formats') or default_formats
+        if isinstance(formats, str):
+            formats = [formats]
+        invalid = [fmt for fmt in formats if fmt not in BATCH_EXPORT_FORMATS]
+        if invalid:
+            raise ValueError(f"Unsupported format(s) {', '.join(invalid)} in parameter set {i}")
+        name = sanitize_filename(params.get('name') or f'figure_{i + 1}')
+        if name in seen_names:
+            name = f'{name}_{i + 1}'
+        seen_names.add(name)
+        params['name'] = name
+        params['formats'] = list(dict.fromkeys(formats))
+        parameter_sets.append(params)
+    return parameter_sets
+
+def parse_dpi(value, index: int) -> int:
+    """
+    Validate the resolution of a parameter set, clamping it to the supported
+    range so a single request cannot ask for arbitrarily large rasters.
+
+    Raises:
+        ValueError: if the value is not a number
+    """
+    try:
+        dpi = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid dpi '{value}' in parameter set {index}")
+    return max(BATCH_EXPORT_MIN_DPI, min(BATCH_EXPORT_MAX_DPI, dpi))
+
+def render_figure(task: dict) -> list:
+    """
+    Draw one figure and save it in each requested format.
+
+    Parameters:
+        task: Dictionary with frames, linkages, plot kwargs, formats and dpi
+
+    Returns:
+        List of (filename, bytes) tuples
+    """
+    plot_kwargs = dict(task['plot_kwargs'], download=True)
+    if task['integrated']:
+        fig = create_integrated_plot(
+            task['log_results'], task['fpr_df'],
+            row_linkage=task['row_linkage'], col_linkage=task['col_linkage'],
+            **plot_kwargs
+        )
+    else:
+        fig = create_dot_plot(task['log_results'], task['fpr_df'], **plot_kwargs)
+    outputs = []
+    try:
+        for fmt in task['formats']:
+            buf = BytesIO()
+            fig.savefig(buf, format=fmt, dpi=task['dpi'], bbox_inches='tight',
+                        facecolor=plot_kwargs.get('background_color', '#ffffff'))
+            outputs.append((f"{task['name']}.{fmt}", buf.getvalue()))
+    finally:
+        plt.close(fig)
+    return outputs
+
+def build_render_tasks(log_results, fpr_df, parameter_sets: list) -> list:
+    """
+    Prepare the data for each parameter set, sharing work between sets with
+    identical data settings.
+
+    Parameters:
+        log_results: Original -log10 transformed activities
+        fpr_df: Original FPR values
+        parameter_sets: Output of build_parameter_sets
+
+    Returns:
+        List of render tasks for render_figure
+    """
+    prepared = {}
+    tasks = []
+    for params in parameter_sets:
+        key = _data_key(params)
+        if key not in prepared:
+            prepared[key] = prepare_plot_data(log_results, fpr_df, params)
+        plot_log, plot_fpr, row_linkage, col_linkage = prepared[key]
+        integrated = parse_bool(params.get('useIntegratedPlot', 'true')) and \
+            (row_linkage is not None or col_linkage is not None)
+        plot_kwargs = dict(
+            binary_sig=(params.get('significantActivity', 'binary') == 'binary'),
+            custom_xlabels=extract_custom_labels(plot_log, params),
+            **extract_plot_params(params), **extract_plot_settings(params)
+        )
+        if integrated:
+            plot_kwargs.update(extract_dendrogram_settings(params))
+        tasks.append({
+            'name': params['name'],
+            'formats': params['formats'],
+            'dpi': params['dpi'],
+            'integrated': integrated,
+            'log_results': plot_log,
+            'fpr_df': plot_fpr,
+            'row_linkage': row_linkage,
+            'col_linkage': col_linkage,
+            'plot_kwargs': plot_kwargs
+        })
+    logger.info("Batch export: %d figures from %d prepared datasets", len(tasks), len(prepared))
+    return tasks
+
+def load_original_frames():
+    """
+    Return the original (log_results, fpr_df) the figures are prepared from.
+
+    The cached session named by 'dataToken' is preferred; otherwise the
+    'original_log_results' and 'original_fpr_df' JSON fields the plotting page
+    keeps are parsed, as for /plot/update.
+
+    Returns:
+        Tuple of frames, or None if neither source is available
+    """
+    session = get_session(request.form.get('dataToken', ''))
+    if session is not None:
+        return session.get_log_results(), session.fpr
+
+    orig_log_json = request.form.get('original_log_results')
+    orig_fpr_json = request.form.get('original_fpr_df')
+    if not orig_log_json or not orig_fpr_json:
+        return None
+    return frame_from_json(orig_log_json), frame_from_json(orig_fpr_json)
+
+@bp.route('/plot/batch_export', methods=['POST'])
+def batch_export():
+    """
+    Render several KSTAR figures from one cached upload into a ZIP archive.
+
+    Request Parameters:
+        dataToken: Token returned by /plot identifying the cached upload
+        original_log_results, original_fpr_df: JSON of the original data,
+            used when the token is missing or expired
+        parameterSets: JSON list of objects, one per figure. Keys are the same
+            form fields accepted by /plot (sample selection, sorting, colors,
+            sizes, ...) plus 'name' and 'formats' (e.g. ["png", "pdf", "svg"])
+        file_name: Optional name for the ZIP archive
+        Any other /plot form field is used as a default for every set
+
+    Returns:
+        ZIP file attachment with one file per figure and format, plus a
+        parameters.json manifest. Invalid requests return status 400.
+    """
+    try:
+        frames = load_original_frames()
+        if frames is None:
+            return jsonify({"error": "Original data missing. Please generate the plot again.",
+                            "token_expired": bool(request.form.get('dataToken'))}), 400
+
+        raw_sets = safe_json_loads(request.form.get('parameterSets', ''), None)
+        if not isinstance(raw_sets, list) or not raw_sets:
+            return jsonify({"error": "parameterSets must be a non-empty JSON list."}), 400
+        if len(raw_sets) > BATCH_EXPORT_MAX_FIGURES:
+            return jsonify({"error": f"At most {BATCH_EXPORT_MAX_FIGURES} figures can be exported at once."}), 400
+
+        try:
+            parameter_sets = build_parameter_sets(request.form, raw_sets)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        for params in parameter_sets:
+            error = check_plot_parameters(params)
+            if error:
+                return jsonify({"error": f"{params['name']}: {error}"}), 400
+
+        tasks = build_render_tasks(*frames, parameter_sets)
+        rendered = [render_figure(task) for task in tasks]
+
+        zip_buffer = BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for outputs in rendered:
+                for filename, data in outputs:
+                    # PNG and JPEG are already compressed
+                    compression = zipfile.ZIP_STORED if filename.endswith(('.png', '.jpg')) else zipfile.ZIP_DEFLATED
+                    zip_file.writestr(filename, data, compress_type=compression)
+            zip_file.writestr('parameters.json', json.dumps(parameter_sets, indent=2))
+        zip_buffer.seek(0)
+
+        custom_filename = sanitize_filename(request.form.get('file_name', '').strip())
+        return send_file(
+            zip_buffer,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=f'{custom_filename or "KSTAR_figures"}.zip'
+        )
+    except Exception as e:
+        logger.error("Error in batch_export: %s", e, exc_info=True)
+        return jsonify(create_error_response(e)), 500
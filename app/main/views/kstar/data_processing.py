@@ -54,18 +54,24 @@ def validate_dataframe_compatibility(
 def process_activities_data(activities_df: pd.DataFrame) -> pd.DataFrame:
     """
     Prepare activities data by replacing zeros with NaN and computing -log10.
+    The transform runs on a single float32 array and the result shares the
+    index and column objects of the input frame.
     Parameters:
         activities_df: DataFrame with raw kinase activity data
     Returns:
-        Processed DataFrame with -log10 transformed values
+        Processed float32 DataFrame with -log10 transformed values
     """
     if activities_df.empty:
         raise ValueError("Empty activities DataFrame provided")
     try:
-        activities_df = activities_df.replace(0, np.nan)
-        if (activities_df < 0).any().any():
+        values = activities_df.to_numpy(dtype=np.float32, copy=True)
+        if (values < 0).any():
             raise ValueError("Activities DataFrame contains negative values")
-        return -np.log10(activities_df)
+        zeros = values == 0
+        values[zeros] = np.nan
+        np.log10(values, out=values)
+        np.negative(values, out=values)
+        return pd.DataFrame(values, index=activities_df.index, columns=activities_df.columns, copy=False)
     except Exception as e:
         logger.error("Error processing activities data: %s", e)
         raise
@@ -87,7 +93,7 @@ def filter_significant_kinases(
         Tuple of filtered DataFrames (log_results, fpr_df, binary_evidence_df)
     """
     try:
-        sig_mask = (fpr_df < threshold).any(axis=1)
+        sig_mask = (fpr_df.to_numpy() < threshold).any(axis=1)
         filtered_binary = binary_evidence_df[sig_mask] if binary_evidence_df is not None else None
         return log_results[sig_mask], fpr_df[sig_mask], filtered_binary
     except Exception as e:
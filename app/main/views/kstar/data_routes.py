@@ -15,7 +15,8 @@ import logging
 
 from app.main.views.kstar import bp
 from app.main.views.kstar.utils import create_error_response
-from app.main.views.kstar.modules import read_csv_file, validate_files, validate_dataframe_compatibility
+from app.main.views.kstar.matrix_io import read_upload_bytes, read_matrix_header
+from app.main.views.kstar.modules import validate_files, validate_dataframe_compatibility
 
 logger = logging.getLogger(__name__)
 
@@ -28,11 +29,12 @@ def get_columns():
     This endpoint serves as the initial data validation step, ensuring that
     the uploaded files are properly formatted and compatible with each other.
     It returns metadata needed for UI configuration including available samples
-    and kinases.
+    and kinases. Only the header row and kinase column of each file are parsed;
+    the values are parsed once, later, by /plot.
     
     Request Parameters:
-        activitiesFile: CSV file containing kinase activity data
-        fprFile: CSV file containing false positive rate (FPR) data
+        activitiesFile: CSV/TSV (optionally gzipped), Parquet or Feather activity data
+        fprFile: False positive rate (FPR) data in any of the same formats
     
     Returns:
         JSON response containing:
@@ -48,8 +50,14 @@ def get_columns():
         fpr_file = request.files.get('fprFile')
         logger.info("Processing files: %s, %s", activities_file.filename, fpr_file.filename)
         
-        activities_df = read_csv_file(activities_file)
-        fpr_df = read_csv_file(fpr_file)
+        activity_columns, activity_kinases = read_matrix_header(
+            read_upload_bytes(activities_file), activities_file.filename
+        )
+        fpr_columns, fpr_kinases = read_matrix_header(read_upload_bytes(fpr_file), fpr_file.filename)
+        
+        # Empty frames carry just the labels the compatibility check needs
+        activities_df = pd.DataFrame(index=activity_kinases, columns=activity_columns)
+        fpr_df = pd.DataFrame(index=fpr_kinases, columns=fpr_columns)
         
         compatibility_error = validate_dataframe_compatibility(activities_df, fpr_df)
         if compatibility_error:
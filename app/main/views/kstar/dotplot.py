@@ -32,6 +32,9 @@ class DotPlot:
     The visualization represents kinase activity as dots where:
     - Size corresponds to the magnitude of activity
     - Color indicates significance (binary or continuous based on FPR values)
+    Values, FPR and the significance mask are held as float32/boolean NumPy
+    arrays sharing the index and columns of the input frame; no DataFrame
+    copies are kept.
     Parameters:
         values: DataFrame with kinase activity values
         fpr: DataFrame with false positive rate (FPR) values
@@ -59,15 +62,18 @@ class DotPlot:
                  legend_distance = 1.0, figsize = (20,4), title = None,
                  xlabel = True, ylabel = True, x_label_dict = None, kinase_dict = None):
 
-        self.values = values.copy()
-        self.fpr = fpr.copy()
+        self.index = values.index
+        self.columns = values.columns
+        self.values = values.to_numpy(dtype=np.float32)
         # ensure fpr has same index and columns as values
-        self.fpr = self.fpr.loc[self.values.index, self.values.columns]
+        if not (fpr.index.equals(self.index) and fpr.columns.equals(self.columns)):
+            fpr = fpr.loc[self.index, self.columns]
+        self.fpr = fpr.to_numpy(dtype=np.float32)
         self.alpha = alpha
         if inclusive_alpha:
-            self.significance = (self.fpr <= alpha).astype(int)
+            self.significance = self.fpr <= alpha
         else:
-            self.significance = (self.fpr < alpha).astype(int)
+            self.significance = self.fpr < alpha
 
         # Assign either fpr or significance as colors
         self.binary_sig = binary_sig
@@ -115,7 +121,7 @@ class DotPlot:
             x_label_dict: Dictionary mapping column names to display labels or
                           list of labels in column order
         """
-        self.column_labels = list(self.values.columns)
+        self.column_labels = list(self.columns)
 
         if x_label_dict is None:
             # build a default x_label_dict stripping 'data:' prefix
@@ -134,7 +140,7 @@ class DotPlot:
             # Handle list case
             if len(x_label_dict) != len(self.column_labels):
                 raise ValueError("The x_label_list must have same length as value columns")
-            self.x_label_dict = {col: label for col, label in zip(self.values.columns, x_label_dict)}
+            self.x_label_dict = {col: label for col, label in zip(self.columns, x_label_dict)}
             self.column_labels = x_label_dict
         else:
             raise TypeError("x_label_dict must be either None, a dictionary, or a list")
@@ -146,7 +152,7 @@ class DotPlot:
             values: DataFrame whose indices need labels
             kinase_dict: Dictionary mapping kinase IDs to display names
         """
-        self.index_labels = list(self.values.index)
+        self.index_labels = list(self.index)
         if kinase_dict is None:
             self.kinase_dict = kinase_dict
         elif isinstance(kinase_dict, dict):
@@ -178,7 +184,7 @@ class DotPlot:
         ax.set_facecolor(self.facecolor)
 
         values = self.values
-        num_sites = values.values.flatten()
+        num_sites = values.ravel()
         # size mapping
         dot_size = self.dotsize
         sizes = num_sites * dot_size
@@ -186,15 +192,15 @@ class DotPlot:
         # color mapping
         if self.binary_sig:
             # Binary case: keep original colors
-            flat_values = self.colors.values.flatten()
-            colors = np.array([self.colormap[int(v)] for v in flat_values])
+            palette = np.array([self.colormap[0], self.colormap[1]])
+            colors = palette[self.colors.ravel().astype(np.intp)]
         else:
             # Continuous case: create a colormap and transform FPR values with -log10
             cmap = LinearSegmentedColormap.from_list("sig_cmap", [self.colormap[0], self.colormap[1]])
             norm = Normalize(vmin=0, vmax=2, clip=True)
             
             # Get FPR values and transform them
-            fpr_values = self.colors.values.flatten()
+            fpr_values = self.colors.ravel()
             fpr_values = np.where(fpr_values == 0, 0.01, fpr_values)  # Replace 0 with 0.01 to avoid log errors
             log_values = -np.log10(fpr_values)
             
@@ -6,38 +6,152 @@ in various formats. It supports exporting both activity and FPR data either
 individually or together as a ZIP archive.
 The exported data reflects the current state of the visualization, including
 any filtering, sorting, and custom labeling that has been applied.
+
+When the request carries a valid data token the exported frames are rebuilt
+server-side from the cached session using the same settings as the plot, so
+the browser does not have to post the data back. CSV/TSV output is written
+in chunks straight into the response file, which spools to disk once it grows
+large instead of being buffered twice in memory.
 Routes:
     /plot/export: Export both activities and FPR data as a ZIP file
     /plot/export/<data_type>: Export a specific data type (activities or fpr)
 """
 
 from flask import request, jsonify, send_file
-from werkzeug.utils import secure_filename   
+from werkzeug.utils import secure_filename
 import pandas as pd
 import logging
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 import zipfile
 import json
 
 from app.main.views.kstar import bp
+from app.main.views.kstar.matrix_io import frame_from_json
+from app.main.views.kstar.session_cache import get_session
 from app.main.views.kstar.utils import create_error_response
-from app.main.views.kstar.modules import validate_plot_parameters
+from app.main.views.kstar.modules import validate_plot_parameters, prepare_update_data
 
 logger = logging.getLogger(__name__)
 
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+class ExportDataMissing(ValueError):
+    """Raised when neither a live data token nor posted data is available."""
+
+class InvalidExportFormat(ValueError):
+    """Raised when the requested export format is not one of EXPORT_FORMATS."""
+
+def get_export_format() -> str:
+    """
+    Return the requested export format, defaulting to CSV.
+
+    Raises:
+        InvalidExportFormat: if another format was requested
+    """
+    export_format = request.form.get('export_format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise InvalidExportFormat(
+            f"Invalid export format: {export_format}. Allowed formats: {', '.join(EXPORT_FORMATS)}"
+        )
+    return export_format
+
+def get_custom_labels() -> dict:
+    """Return the custom column labels to apply, if any were requested."""
+    if request.form.get('changeXLabel') != 'true':
+        return {}
+    try:
+        return json.loads(request.form.get('customXLabels', '{}')) or {}
+    except Exception as e:
+        logger.error("Error parsing custom labels: %s", e)
+        return {}
+
+def load_export_frames():
+    """
+    Return the (log_results, fpr_df) currently displayed.
+
+    The cached session named by 'dataToken' is preferred; the view settings
+    sent with the request are re-applied to it. Otherwise the 'log_results'
+    and 'fpr_df' JSON fields posted by older clients are parsed.
+
+    Raises:
+        ExportDataMissing: if neither source is available
+    """
+    session = get_session(request.form.get('dataToken', ''))
+    if session is not None:
+        log_results, fpr_df, _, _ = prepare_update_data(session.get_log_results(), session.fpr)
+        return log_results, fpr_df
+
+    current_log_json = request.form.get('log_results')
+    current_fpr_json = request.form.get('fpr_df')
+    if not current_log_json or not current_fpr_json:
+        raise ExportDataMissing("Current data missing. Please generate plot first.")
+    return frame_from_json(current_log_json), frame_from_json(current_fpr_json)
+
+def to_activities(log_results: pd.DataFrame) -> pd.DataFrame:
+    """Convert -log10 activities back to their original scale."""
+    return 10 ** (-log_results)
+
+def write_frame(df: pd.DataFrame, fileobj, export_format: str) -> None:
+    """
+    Write a frame to a binary file object in the requested format.
+
+    CSV/TSV rows are encoded and written in chunks; Parquet and Excel are
+    columnar/zip based formats that pandas writes in one pass.
+    """
+    if export_format in ('csv', 'tsv'):
+        df.to_csv(fileobj, sep=',' if export_format == 'csv' else '\t', chunksize=EXPORT_CHUNK_ROWS)
+    elif export_format == 'parquet':
+        try:
+            df.to_parquet(fileobj)
+        except ImportError as e:
+            raise ValueError("Parquet export requires pyarrow to be installed") from e
+    elif export_format == 'xlsx':
+        try:
+            df.to_excel(fileobj, engine='openpyxl')
+        except ImportError as e:
+            raise ValueError("Excel export requires openpyxl to be installed") from e
+    else:
+        raise ValueError(f"Invalid export format: {export_format}")
+
+def write_zip_entry(zip_file: zipfile.ZipFile, name: str, df: pd.DataFrame, export_format: str) -> None:
+    """Write a frame into a ZIP archive entry, streaming text formats directly."""
+    if export_format in ('csv', 'tsv'):
+        with zip_file.open(name, 'w') as entry:
+            write_frame(df, entry, export_format)
+    else:
+        # pyarrow and openpyxl need a seekable target
+        buffer = BytesIO()
+        write_frame(df, buffer, export_format)
+        zip_file.writestr(name, buffer.getvalue())
+
+def missing_data_response(error: ExportDataMissing):
+    """Tell the client to resend the data when its token has expired."""
+    return jsonify({"error": str(error), "token_expired": bool(request.form.get('dataToken'))}), 400
+
 @bp.route('/plot/export', methods=['POST'])
 @validate_plot_parameters
 def export_data():
     """
     Export both activities and FPR data as a ZIP file.
-    
+
     Processes the current visualization data (already filtered and sorted),
     applies custom column labels if specified, and packages both datasets
     into a ZIP archive.
     Request Parameters:
+        dataToken: Token of the cached session; the view settings (filters,
+            sorting) sent alongside it are re-applied server-side
         log_results: JSON string of current log-transformed activity data
-        fpr_df: JSON string of current FPR data
-        export_format: File format ('csv' or 'tsv')
+            (only needed without a valid token)
+        fpr_df: JSON string of current FPR data (only needed without a valid token)
+        export_format: File format ('csv', 'tsv', 'parquet' or 'xlsx')
         file_name: Optional custom filename prefix
         changeXLabel: Whether to use custom column labels
         customXLabels: JSON dictionary of column name mappings
@@ -45,60 +159,38 @@ def export_data():
         ZIP file attachment containing both datasets in the requested format
     """
     try:
-        current_log_json = request.form.get('log_results')
-        current_fpr_json = request.form.get('fpr_df')
-        
-        if not current_log_json or not current_fpr_json:
-            raise ValueError("Current data missing. Please generate plot first.")
-        
-        # Load the current data
-        log_results = pd.read_json(current_log_json)
-        fpr_df = pd.read_json(current_fpr_json)
-        
-        export_format = request.form.get('export_format', 'csv').lower()
-        if export_format not in ['csv', 'tsv']:
-            export_format = 'csv'
-            
+        try:
+            export_format = get_export_format()
+        except InvalidExportFormat as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            log_results, fpr_df = load_export_frames()
+        except ExportDataMissing as e:
+            return missing_data_response(e)
+
         custom_filename = request.form.get('file_name', '').strip()
         zip_filename = f'{custom_filename}.zip' if custom_filename else 'KSTAR_data_export.zip'
-        
-        delimiter = ',' if export_format == 'csv' else '\t'
-        
+
         # Apply custom column labels if provided
-        change_x_label = request.form.get('changeXLabel') == 'true'
-        if change_x_label:
-            try:
-                custom_labels = json.loads(request.form.get('customXLabels', '{}'))
-                if custom_labels:
-                    log_results = log_results.rename(columns=custom_labels)
-                    fpr_df = fpr_df.rename(columns=custom_labels)
-                    logger.info("Applied custom column labels for export")
-            except Exception as e:
-                logger.error("Error applying custom labels: %s", e)
-        
-        # Prepare data for export
-        activities_buffer = BytesIO()
-        fpr_buffer = BytesIO()
-        
-        activities_df = 10 ** (-log_results)  # Convert back from -log10
-        activities_df.to_csv(activities_buffer, sep=delimiter)
-        fpr_df.to_csv(fpr_buffer, sep=delimiter)
-        
-        # Create ZIP archive
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as zip_file:
-            activities_buffer.seek(0)
+        custom_labels = get_custom_labels()
+        if custom_labels:
+            log_results = log_results.rename(columns=custom_labels)
+            fpr_df = fpr_df.rename(columns=custom_labels)
+            logger.info("Applied custom column labels for export")
+
+        # Create ZIP archive, spooling to disk once it grows large
+        output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
             activities_filename = 'activities' if not custom_filename else f'{custom_filename}_activities'
-            zip_file.writestr(f'{activities_filename}.{export_format}', activities_buffer.getvalue())
-            
-            fpr_buffer.seek(0)
+            write_zip_entry(zip_file, f'{activities_filename}.{export_format}', to_activities(log_results), export_format)
+
             fpr_filename = 'fpr' if not custom_filename else f'{custom_filename}_fpr'
-            zip_file.writestr(f'{fpr_filename}.{export_format}', fpr_buffer.getvalue())
-        
-        zip_buffer.seek(0)
-        
+            write_zip_entry(zip_file, f'{fpr_filename}.{export_format}', fpr_df, export_format)
+
+        output.seek(0)
+
         return send_file(
-            zip_buffer,
+            output,
             mimetype='application/zip',
             as_attachment=True,
             download_name=zip_filename
@@ -111,83 +203,63 @@ def export_data():
 @validate_plot_parameters
 def export_specific_data(data_type):
     """
-    Export a specific data type (activities or fpr) as CSV or TSV.
-    
+    Export a specific data type (activities or fpr) as CSV, TSV, Parquet or Excel.
+
     Processes the current visualization data for the specified data type,
     applies custom column labels if provided, and delivers the file for download.
     For activity data, values are converted back from -log10 to original scale.
-    
+
     Parameters:
-        data_type: Type of data to export ('activities' or 'fpr') 
+        data_type: Type of data to export ('activities' or 'fpr')
     Request Parameters:
+        dataToken: Token of the cached session; the view settings (filters,
+            sorting) sent alongside it are re-applied server-side
         log_results: JSON string of current log-transformed activity data
-        fpr_df: JSON string of current FPR data
-        export_format: File format ('csv' or 'tsv')
+            (only needed without a valid token)
+        fpr_df: JSON string of current FPR data (only needed without a valid token)
+        export_format: File format ('csv', 'tsv', 'parquet' or 'xlsx')
         file_name: Optional custom filename prefix
         changeXLabel: Whether to use custom column labels
         customXLabels: JSON dictionary of column name mappings
     Returns:
-        CSV or TSV file attachment with the requested data
+        File attachment with the requested data
     """
     try:
-        current_log_json = request.form.get('log_results')
-        current_fpr_json = request.form.get('fpr_df')
-        
-        if not current_log_json or not current_fpr_json:
-            raise ValueError("Current data missing. Please generate plot first.")
-        
-        export_format = request.form.get('export_format', 'csv').lower()
-        if export_format not in ['csv', 'tsv']:
-            export_format = 'csv'
-            
+        if data_type not in ('activities', 'fpr'):
+            raise ValueError(f"Invalid data type: {data_type}")
+        try:
+            export_format = get_export_format()
+        except InvalidExportFormat as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            log_results, fpr_df = load_export_frames()
+        except ExportDataMissing as e:
+            return missing_data_response(e)
+
         custom_filename = request.form.get('file_name', '').strip()
-        delimiter = ',' if export_format == 'csv' else '\t'
-        
-        # Process custom column labels
-        change_x_label = request.form.get('changeXLabel') == 'true'
-        custom_labels = {}
-        if change_x_label:
-            try:
-                custom_labels = json.loads(request.form.get('customXLabels', '{}'))
-                logger.info("Processing custom labels for export")
-            except Exception as e:
-                logger.error("Error parsing custom labels: %s", e)
-        
-        output = BytesIO()
-        
+
         if data_type == 'activities':
-            log_results = pd.read_json(current_log_json)
-            
-            if custom_labels:
-                log_results = log_results.rename(columns=custom_labels)
-                
-            activities_df = 10 ** (-log_results)  # Convert back from -log10
-            activities_df.to_csv(output, sep=delimiter)
-            
-            filename = f'{custom_filename}_{data_type}.{export_format}' if custom_filename else f'KSTAR_{data_type}.{export_format}'
-                
-        elif data_type == 'fpr':
-            fpr_df = pd.read_json(current_fpr_json)
-            
-            if custom_labels:
-                fpr_df = fpr_df.rename(columns=custom_labels)
-                
-            fpr_df.to_csv(output, sep=delimiter)
-            
-            filename = f'{custom_filename}_{data_type}.{export_format}' if custom_filename else f'KSTAR_{data_type}.{export_format}'
+            df = to_activities(log_results)  # Convert back from -log10
         else:
-            raise ValueError(f"Invalid data type: {data_type}")
-        
+            df = fpr_df
+
+        # Process custom column labels
+        custom_labels = get_custom_labels()
+        if custom_labels:
+            df = df.rename(columns=custom_labels)
+
+        output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+        write_frame(df, output, export_format)
         output.seek(0)
-        
-        mime_type = 'text/csv' if export_format == 'csv' else 'text/tab-separated-values'
-        
+
+        filename = f'{custom_filename}_{data_type}.{export_format}' if custom_filename else f'KSTAR_{data_type}.{export_format}'
+
         return send_file(
             output,
-            mimetype=mime_type,
+            mimetype=EXPORT_FORMATS[export_format],
             as_attachment=True,
             download_name=filename
         )
     except Exception as e:
         logger.error(f"Error in export_{data_type}: %s", e, exc_info=True)
-        return jsonify(create_error_response(e)), 500
\ No newline at end of file
+        return jsonify(create_error_response(e)), 500
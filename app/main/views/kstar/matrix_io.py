@@ -0,0 +1,175 @@
+"""
+KSTAR Matrix I/O Module
+
+This module parses uploaded KSTAR activity and FPR matrices. Each upload is
+read into memory exactly once, its format is detected from the leading bytes
+(plain or gzip-compressed CSV/TSV, Parquet, Feather) and it is parsed directly
+into a float32 matrix indexed by kinase name.
+
+Functions:
+    read_upload_bytes: Read the raw bytes of an uploaded file once
+    detect_format: Identify the serialization format of a raw upload
+    parse_matrix: Parse raw bytes into a float32 kinase x sample DataFrame
+    read_matrix_header: Return sample and kinase names without parsing values
+    frame_from_json: Rebuild a float32 frame from the JSON sent by the browser
+"""
+
+import gzip
+import logging
+from io import BytesIO, StringIO
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .utils import get_sep
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+PARQUET_MAGIC = b'PAR1'
+FEATHER_MAGIC = b'ARROW1'
+
+MATRIX_DTYPE = np.float32
+
+
+def read_upload_bytes(file) -> bytes:
+    """
+    Read the full contents of an uploaded file and rewind it.
+
+    Parameters:
+        file: File object from request.files
+    Returns:
+        Raw bytes of the upload
+    """
+    file.seek(0)
+    data = file.read()
+    file.seek(0)
+    return data
+
+
+def detect_format(data: bytes, filename: str = '') -> str:
+    """
+    Identify the format of a raw upload from its magic bytes.
+
+    Parameters:
+        data: Raw bytes of the upload
+        filename: Original filename, used to pick the text separator
+    Returns:
+        One of 'parquet', 'feather', 'csv' or 'tsv'
+    """
+    if data[:4] == PARQUET_MAGIC:
+        return 'parquet'
+    if data[:6] == FEATHER_MAGIC:
+        return 'feather'
+    return 'tsv' if get_sep(filename) == '\t' else 'csv'
+
+
+def _text_buffer(data: bytes) -> bytes:
+    """Return decompressed bytes for gzip uploads, the input otherwise."""
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    return data
+
+
+def _sniff_sep(text: bytes, filename: str) -> str:
+    """
+    Choose the separator from the header line, falling back to the extension.
+    Files named .txt or mislabelled .csv exports from KSTAR are tab separated.
+    """
+    header = text.split(b'\n', 1)[0]
+    if b'\t' in header:
+        return '\t'
+    if b',' in header:
+        return ','
+    return get_sep(filename)
+
+
+def _set_kinase_index(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Binary formats written with a default index keep kinase names in the first
+    column; promote it to the index so every format yields the same layout.
+    """
+    if isinstance(df.index, pd.RangeIndex) and len(df.columns) and not pd.api.types.is_numeric_dtype(df[df.columns[0]]):
+        df = df.set_index(df.columns[0])
+    df.index.name = None
+    return df
+
+
+def _read_binary(data: bytes, fmt: str) -> pd.DataFrame:
+    """Read a Parquet or Feather payload, reporting a missing pyarrow clearly."""
+    try:
+        if fmt == 'parquet':
+            return pd.read_parquet(BytesIO(data))
+        return pd.read_feather(BytesIO(data))
+    except ImportError as e:
+        raise ValueError(f"Reading {fmt} files requires pyarrow to be installed") from e
+
+
+def parse_matrix(data: bytes, filename: str = '') -> pd.DataFrame:
+    """
+    Parse an uploaded KSTAR matrix into a float32 DataFrame.
+
+    The header is read first so the value columns can be given an explicit
+    float32 dtype, letting the C parser produce the final matrix in a single
+    pass without an intermediate float64 copy.
+
+    Parameters:
+        data: Raw bytes of the upload
+        filename: Original filename
+    Returns:
+        DataFrame indexed by kinase with one float32 column per sample
+    """
+    fmt = detect_format(data, filename)
+    if fmt in ('parquet', 'feather'):
+        df = _set_kinase_index(_read_binary(data, fmt))
+        return df.astype(MATRIX_DTYPE, copy=False)
+
+    text = _text_buffer(data)
+    sep = _sniff_sep(text, filename)
+    names = pd.read_csv(BytesIO(text), sep=sep, nrows=0).columns
+    if len(names) < 2:
+        raise ValueError(f"Could not find any sample columns in {filename or 'upload'}")
+    dtypes = {name: MATRIX_DTYPE for name in names[1:]}
+    df = pd.read_csv(BytesIO(text), sep=sep, index_col=0, dtype=dtypes, engine='c')
+    df.index.name = None
+    return df
+
+
+def read_matrix_header(data: bytes, filename: str = '') -> Tuple[List[str], List[str]]:
+    """
+    Return the sample (column) and kinase (index) names of an upload.
+
+    For text formats only the header row and the first column are parsed, so
+    this is cheap even for very large matrices.
+
+    Parameters:
+        data: Raw bytes of the upload
+        filename: Original filename
+    Returns:
+        Tuple of (columns, kinases)
+    """
+    fmt = detect_format(data, filename)
+    if fmt in ('parquet', 'feather'):
+        # columnar formats decode without text parsing, so a full read is cheap
+        df = parse_matrix(data, filename)
+        return df.columns.tolist(), df.index.tolist()
+
+    text = _text_buffer(data)
+    sep = _sniff_sep(text, filename)
+    names = pd.read_csv(BytesIO(text), sep=sep, nrows=0).columns.tolist()
+    kinases = pd.read_csv(BytesIO(text), sep=sep, usecols=[0], dtype=str).iloc[:, 0].tolist()
+    return names[1:], kinases
+
+
+def frame_from_json(json_str: str) -> pd.DataFrame:
+    """
+    Rebuild a float32 DataFrame from the JSON representation posted back by
+    the plotting page.
+
+    Parameters:
+        json_str: DataFrame serialized with DataFrame.to_json
+    Returns:
+        float32 DataFrame
+    """
+    return pd.read_json(StringIO(json_str)).astype(MATRIX_DTYPE, copy=False)
@@ -6,19 +6,23 @@ It centralizes common configuration extraction, data transformation, and validat
 logic used across the plotting workflow.
 
 Functions:
-    read_csv_file: Reads and parses CSV/TSV data files with appropriate separators
+    read_csv_file: Reads and parses an uploaded data file into a float32 matrix
+    get_request_session: Resolves the cached KSTAR session for the current request
     extract_plot_params: Extracts figure dimensions and font size from request
     extract_plot_settings: Extracts color settings for plot elements
     extract_dendrogram_settings: Extracts dendrogram display preferences
     extract_custom_labels: Processes custom column labels if provided
     apply_sorting: Applies requested sorting strategies to data frames
+    prepare_plot_data: Runs the filter, sort and clustering pipeline for a plot
+    prepare_update_data: Runs the pipeline used by interactive plot updates
+    check_plot_parameters: Validates numeric and color plot parameters
     
 Decorators:
-    validate_files: Ensures required files are present with valid extensions
+    validate_files: Ensures required files (or a cached data token) are present
     validate_plot_parameters: Validates numeric and color parameters
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from flask import request, jsonify
 import pandas as pd
 import numpy as np
@@ -38,6 +42,8 @@ from app.main.views.kstar.data_processing import (
     handle_sample_filtering,
     validate_dataframe_compatibility
 )
+from app.main.views.kstar.matrix_io import read_upload_bytes, parse_matrix
+from app.main.views.kstar.session_cache import KstarSession, get_session, load_session
 from app.main.views.kstar.utils import (
     parse_bool,
     get_sep,
@@ -56,7 +62,10 @@ logger = logging.getLogger(__name__)
 # --- Helper functions ---
 def read_csv_file(file) -> pd.DataFrame:
     """
-    Read a CSV/TSV file using the appropriate separator and index column.
+    Read an uploaded CSV/TSV (optionally gzipped), Parquet or Feather file.
+    
+    The upload is read once and parsed straight into float32 values; the
+    separator is sniffed from the header line rather than retried on failure.
     
     Parameters:
         file: File object from request.files
@@ -64,87 +73,109 @@ def read_csv_file(file) -> pd.DataFrame:
     Returns:
         Pandas DataFrame with data and proper index
     """
-    sep = get_sep(file.filename)
-    try:
-        return pd.read_csv(file, sep=sep, index_col=0)
-    except Exception:
-        file.seek(0)
-        df = pd.read_csv(file, nrows=5)
-        if df.columns[0] == 'Unnamed: 0':
-            file.seek(0)
-            return pd.read_csv(file, index_col=0)
-        return df
+    return parse_matrix(read_upload_bytes(file), file.filename)
+
+def get_request_session() -> Tuple[KstarSession, bool]:
+    """
+    Resolve the KSTAR session for the current request.
+    
+    A valid 'dataToken' form value is used directly; otherwise the uploaded
+    activities and FPR files are loaded through the session cache.
+    
+    Returns:
+        Tuple of (session, cache_hit)
+    """
+    session = get_session(request.form.get('dataToken', ''))
+    if session is not None:
+        return session, True
+    return load_session(request.files.get('activitiesFile'), request.files.get('fprFile'))
 
-def extract_plot_params() -> Dict[str, Any]:
+def extract_plot_params(form=None) -> Dict[str, Any]:
     """
     Extract figure dimensions and font size from request form.
     
+    Parameters:
+        form: Optional mapping to read instead of request.form
+        
     Returns:
         Dictionary with fig_width, fig_height, and fontsize parameters
     """
+    form = request.form if form is None else form
     return {
-        'fig_width': parse_form_data(request.form, 'figureWidth', DEFAULT_PLOT_PARAMS['fig_width'], float),
-        'fig_height': parse_form_data(request.form, 'figureHeight', DEFAULT_PLOT_PARAMS['fig_height'], float),
-        'fontsize': parse_form_data(request.form, 'fontSize', DEFAULT_PLOT_PARAMS['fontsize'], float)
+        'fig_width': parse_form_data(form, 'figureWidth', DEFAULT_PLOT_PARAMS['fig_width'], float),
+        'fig_height': parse_form_data(form, 'figureHeight', DEFAULT_PLOT_PARAMS['fig_height'], float),
+        'fontsize': parse_form_data(form, 'fontSize', DEFAULT_PLOT_PARAMS['fontsize'], float)
     }
 
-def extract_plot_settings() -> Dict[str, Any]:
+def extract_plot_settings(form=None) -> Dict[str, Any]:
     """
     Extract color settings for plot elements from request form.
     
+    Parameters:
+        form: Optional mapping to read instead of request.form
+        
     Returns:
         Dictionary with background_color, activity_color, and other color settings
     """
+    form = request.form if form is None else form
     return {
-        'background_color': request.form.get('backgroundColor', DEFAULT_COLORS['background']),
-        'activity_color': request.form.get('activityColor', DEFAULT_COLORS['activity']),
-        'noactivity_color': request.form.get('lackActivityColor', DEFAULT_COLORS['no_activity']),
-        'kinases_dendrogram_color': request.form.get('kinases_dendrogram_color', '#000000'),
-        'samples_dendrogram_color': request.form.get('samples_dendrogram_color', '#000000')  
+        'background_color': form.get('backgroundColor', DEFAULT_COLORS['background']),
+        'activity_color': form.get('activityColor', DEFAULT_COLORS['activity']),
+        'noactivity_color': form.get('lackActivityColor', DEFAULT_COLORS['no_activity']),
+        'kinases_dendrogram_color': form.get('kinases_dendrogram_color', '#000000'),
+        'samples_dendrogram_color': form.get('samples_dendrogram_color', '#000000')  
     }
 
-def extract_dendrogram_settings() -> Dict[str, bool]:
+def extract_dendrogram_settings(form=None) -> Dict[str, bool]:
     """
     Extract dendrogram display preferences from request form.
     
+    Parameters:
+        form: Optional mapping to read instead of request.form
+        
     Returns:
         Dictionary with boolean flags for dendrogram display options
     """
+    form = request.form if form is None else form
     return {
-        'show_kinases_dendrogram_inside': parse_bool(request.form.get('showKinasesDendrogramInside', 'false')),
-        'show_samples_dendrogram': parse_bool(request.form.get('showSamplesDendrogram', 'true')),
+        'show_kinases_dendrogram_inside': parse_bool(form.get('showKinasesDendrogramInside', 'false')),
+        'show_samples_dendrogram': parse_bool(form.get('showSamplesDendrogram', 'true')),
     }
 
-def extract_custom_labels(log_results: pd.DataFrame):
+def extract_custom_labels(log_results: pd.DataFrame, form=None):
     """
     Process custom column labels if provided in the request.
     
     Parameters:
         log_results: DataFrame whose columns may need custom labels
+        form: Optional mapping to read instead of request.form
         
     Returns:
         List of labels or None if no custom labels requested
     """
-    if parse_bool(request.form.get('changeXLabel', 'false')):
+    form = request.form if form is None else form
+    if parse_bool(form.get('changeXLabel', 'false')):
         try:
-            custom_labels = safe_json_loads(request.form.get('customXLabels', '{}'), {})
+            custom_labels = safe_json_loads(form.get('customXLabels', '{}'), {})
             return [custom_labels.get(col, col) for col in log_results.columns]
         except Exception as e:
             logger.warning("Error parsing custom labels: %s", e)
     return None
 
-def apply_sorting(log_results: pd.DataFrame, fpr_df: pd.DataFrame, binary_evidence_df, sort_settings: Dict[str, str]):
+def apply_sorting(log_results: pd.DataFrame, fpr_df: pd.DataFrame, binary_evidence_df, sort_settings: Dict[str, str], form=None):
     """
     Apply manual or activity-based sorting to the provided data frames.
     Samples can be sorted by a user-selected reference kinase.
+    Manual orders and the reference kinase are read from form (default: request.form).
     """
+    form = request.form if form is None else form
     
     # --- Step 1: Apply Kinase Sorting ---
     kinase_sort_mode = sort_settings.get('kinases_mode', 'none')
     logger.debug(f"Applying kinase sort mode: {kinase_sort_mode}")
     
     if kinase_sort_mode == 'manual':
-        manual_order_json = request.form.get('manualKinaseOrder')
+        manual_order_json = form.get('manualKinaseOrder')
         if manual_order_json:
             try:
                 manual_order = json.loads(manual_order_json)
@@ -172,7 +203,7 @@ def apply_sorting(log_results: pd.DataFrame, fpr_df: pd.DataFrame, binary_eviden
     if sample_sort_mode.startswith('by_selected_kinase_'): # e.g., 'by_selected_kinase_asc' or 'by_selected_kinase_desc'
         # Get the kinase name selected by the user from the form
         # We'll need to ensure the frontend sends this parameter.
-        selected_ref_kinase = request.form.get('sample_sort_ref_kinase') 
+        selected_ref_kinase = form.get('sample_sort_ref_kinase') 
         
         if not selected_ref_kinase:
             logger.warning("Sample sort mode is 'by_selected_kinase' but 'sample_sort_ref_kinase' parameter is missing. Skipping sample sort.")
@@ -207,18 +238,151 @@ def apply_sorting(log_results: pd.DataFrame, fpr_df: pd.DataFrame, binary_eviden
             
     return log_results, fpr_df, binary_evidence_df
 
+def prepare_plot_data(log_results: pd.DataFrame, fpr_df: pd.DataFrame, form=None):
+    """
+    Run the filtering, sorting and clustering steps shared by plot generation
+    and batch export.
+    
+    Parameters:
+        log_results: DataFrame with -log10 transformed activities
+        fpr_df: DataFrame with FPR values
+        form: Optional mapping to read instead of request.form
+        
+    Returns:
+        Tuple of (log_results, fpr_df, row_linkage, col_linkage)
+    """
+    form = request.form if form is None else form
+    binary_evidence_df = None  # Evidence functionality removed
+    plot_params = extract_plot_params(form)
+    dendrogram_settings = extract_dendrogram_settings(form)
+    sort_settings = {
+        'kinases_mode': form.get('sortKinases', 'none'),
+        'samples_mode': form.get('sortSamples', 'none')
+    }
+    
+    # Apply significance-based filtering if requested
+    if parse_bool(form.get('restrictKinases', 'false')):
+        log_results, fpr_df, binary_evidence_df = filter_significant_kinases(
+            log_results, fpr_df, binary_evidence_df
+        )
+    
+    # Apply manual kinase filtering if specified
+    kinases_to_drop = parse_comma_separated_list(form.get('kinases_to_drop', ''))
+    if kinases_to_drop:
+        log_results = log_results.drop(index=kinases_to_drop, errors='ignore')
+        fpr_df = fpr_df.drop(index=kinases_to_drop, errors='ignore')
+    
+    # Apply interactive kinase and sample filtering
+    log_results, fpr_df, binary_evidence_df = handle_kinase_filtering(
+        log_results, fpr_df, binary_evidence_df, form
+    )
+    log_results, fpr_df, binary_evidence_df = handle_sample_filtering(
+        log_results, fpr_df, binary_evidence_df, form.get('manualSampleSelect', '')
+    )
+    
+    # Apply sorting based on settings (alphabetical, activity level, etc.)
+    log_results, fpr_df, binary_evidence_df = apply_sorting(
+        log_results, fpr_df, binary_evidence_df, sort_settings, form
+    )
+    
+    # Apply hierarchical clustering if requested, and get linkage matrices
+    log_results, fpr_df, _, row_linkage, col_linkage = handle_clustering_for_plot(
+        log_results, fpr_df, binary_evidence_df, sort_settings, plot_params, dendrogram_settings
+    )
+    return log_results, fpr_df, row_linkage, col_linkage
+
+def prepare_update_data(log_results: pd.DataFrame, fpr_df: pd.DataFrame, form=None):
+    """
+    Run the filtering, sorting and clustering steps used when the interactive
+    controls update an existing plot, reproducing the data currently displayed.
+    
+    Parameters:
+        log_results: DataFrame with the original -log10 transformed activities
+        fpr_df: DataFrame with the original FPR values
+        form: Optional mapping to read instead of request.form
+        
+    Returns:
+        Tuple of (log_results, fpr_df, row_linkage, col_linkage)
+    """
+    form = request.form if form is None else form
+    binary_evidence_df = None
+    plot_params = extract_plot_params(form)
+    dendrogram_settings = extract_dendrogram_settings(form)
+    
+    # Apply significance-based filtering if requested
+    if parse_bool(form.get('restrictKinases', 'false')):
+        log_results, fpr_df, binary_evidence_df = filter_significant_kinases(
+            log_results, fpr_df, binary_evidence_df
+        )
+    
+    # Apply kinase filtering (select or remove mode)
+    kinase_edit_mode = form.get('manualKinaseEdit', 'none')
+    selected_kinases = safe_json_loads(form.get('kinaseSelect', '[]'), [])
+    if kinase_edit_mode == 'select' and selected_kinases:
+        # Keep only the selected kinases
+        log_results = log_results.loc[selected_kinases]
+        fpr_df = fpr_df.loc[selected_kinases]
+    elif kinase_edit_mode == 'remove' and selected_kinases:
+        # Remove the selected kinases
+        log_results = log_results.drop(selected_kinases, errors='ignore')
+        fpr_df = fpr_df.drop(selected_kinases, errors='ignore')
+    
+    # Apply sample filtering
+    selected_samples = safe_json_loads(form.get('sampleSelect', '[]'), [])
+    if selected_samples:
+        log_results = log_results[selected_samples]
+        fpr_df = fpr_df[selected_samples]
+    
+    # Configure sorting settings
+    sort_settings = {
+        'kinases_mode': form.get('sortKinases', 'none'),
+        'samples_mode': form.get('sortSamples', 'none')
+    }
+    
+    # Apply non-hierarchical sorting using the common function
+    log_results, fpr_df, _ = apply_sorting(log_results, fpr_df, None, sort_settings, form)
+
+    # Apply hierarchical clustering if requested
+    log_results, fpr_df, _, row_linkage, col_linkage = handle_clustering_for_plot(
+        log_results, fpr_df, None, sort_settings, plot_params, dendrogram_settings
+    )
+    return log_results, fpr_df, row_linkage, col_linkage
+
+def check_plot_parameters(form) -> Optional[str]:
+    """
+    Validate numeric and color values in a set of plot parameters.
+    
+    Parameters:
+        form: Mapping of form field names to values
+        
+    Returns:
+        None if valid, otherwise an error message
+    """
+    for param in ['figureWidth', 'figureHeight', 'fontSize']:
+        value = form.get(param)
+        if value and not FormDataValidator.validate_numeric(value, min_val=0):
+            return f"Invalid {param}: must be a positive number"
+    for param in ['backgroundColor', 'activityColor', 'lackActivityColor']:
+        color = form.get(param)
+        if color and not FormDataValidator.validate_color_hex(color):
+            return f"Invalid color format for {param}: {color}"
+    return None
+
 # --- Decorators ---
 def validate_files(func):
     """
     Decorator to validate the presence and format of required uploaded files.
     
     Checks that both activities and FPR files are provided and have allowed extensions.
+    A 'dataToken' referring to a cached session may be sent instead of the files.
     
     Returns:
         Decorated function or error response
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
+        if get_session(request.form.get('dataToken', '')) is not None:
+            return func(*args, **kwargs)
         activities_file = request.files.get('activitiesFile')
         fpr_file = request.files.get('fprFile')
         if not activities_file or not fpr_file:
@@ -242,13 +406,8 @@ def validate_plot_parameters(func):
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        for param in ['figureWidth', 'figureHeight', 'fontSize']:
-            value = request.form.get(param)
-            if value and not FormDataValidator.validate_numeric(value, min_val=0):
-                return jsonify({"error": f"Invalid {param}: must be a positive number"}), 400
-        for param in ['backgroundColor', 'activityColor', 'lackActivityColor']:
-            color = request.form.get(param)
-            if color and not FormDataValidator.validate_color_hex(color):
-                return jsonify({"error": f"Invalid color format for {param}: {color}"}), 400
+        error = check_plot_parameters(request.form)
+        if error:
+            return jsonify({"error": error}), 400
         return func(*args, **kwargs)
-    return wrapper
\ No newline at end of file
+    return wrapper
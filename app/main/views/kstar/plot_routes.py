@@ -7,7 +7,7 @@ applies filtering, sorting, and clustering based on user parameters, and renders
 visualizations using Matplotlib.
 
 Key features:
-- Processing uploaded KSTAR activity and FPR CSV files
+- Processing uploaded KSTAR activity and FPR files (parsed once per upload and cached)
 - Filtering kinases based on significance or manual selection
 - Sorting kinases and samples (alphabetical, by activity, hierarchical clustering)
 - Rendering dot plots with optional dendrograms for hierarchical clustering
@@ -25,6 +25,8 @@ import matplotlib.pyplot as plt
 from io import BytesIO
 
 from app.main.views.kstar import bp
+from app.main.views.kstar.matrix_io import frame_from_json
+from app.main.views.kstar.session_cache import get_session
 from app.main.views.kstar.utils import parse_bool, safe_json_loads, create_error_response, parse_comma_separated_list
 from app.main.views.kstar.plotting import create_integrated_plot, create_dot_plot
 from app.main.views.kstar.clustering import handle_clustering_for_plot
@@ -36,7 +38,9 @@ from app.main.views.kstar.data_processing import (
 )
 
 from app.main.views.kstar.modules import (
-    read_csv_file,
+    get_request_session,
+    prepare_plot_data,
+    prepare_update_data,
     extract_plot_params,
     extract_plot_settings,
     extract_dendrogram_settings,
@@ -62,11 +66,13 @@ def generate_plot():
     Request Parameters:
     - activitiesFile: CSV file containing kinase activity data
     - fprFile: CSV file containing FPR data
+    - dataToken: Optional token of a cached session, used instead of the files
     - Various plot settings (colors, sizes, sorting options, etc.)
     
     Returns:
         JSON response containing:
         - plot: Base64-encoded plot image
+        - data_token: Token identifying the cached parsed upload
         - log_results: JSON representation of the processed activity data
         - fpr_df: JSON representation of the processed FPR data
         - original_log_results: JSON of the unmodified activity data (for reset)
@@ -78,57 +84,21 @@ def generate_plot():
         # Extract configuration parameters from the request
         plot_params = extract_plot_params()
         plot_settings = extract_plot_settings()
-        sort_settings = {
-            'kinases_mode': request.form.get('sortKinases', 'none'),
-            'samples_mode': request.form.get('sortSamples', 'none')
-        }
         
         # Extract dendrogram toggle settings
         dendrogram_settings = extract_dendrogram_settings()
         
-        # Get the uploaded files
-        activities_file = request.files.get('activitiesFile')
-        fpr_file = request.files.get('fprFile')
-        binary_evidence_file = request.files.get('binary_evidence')
-        
-        # Read the CSV data into dataframes
-        activities_df = read_csv_file(activities_file)
-        fpr_df = read_csv_file(fpr_file)
+        # Get the parsed data from the session cache (parsing the uploads on a miss)
+        session, cache_hit = get_request_session()
+        logger.debug("Using KSTAR session %s (cache hit: %s)", session.token, cache_hit)
         binary_evidence_df = None  # Evidence functionality removed
         
-        # Process the raw activities data (log transform, etc.)
-        log_results = process_activities_data(activities_df)
-        original_log_results = log_results.copy()
-        original_fpr_df = fpr_df.copy()
-        
-        # Apply significance-based filtering if requested
-        if parse_bool(request.form.get('restrictKinases', 'false')):
-            log_results, fpr_df, binary_evidence_df = filter_significant_kinases(
-                log_results, fpr_df, binary_evidence_df
-            )
-        
-        # Apply manual kinase filtering if specified
-        kinases_to_drop = parse_comma_separated_list(request.form.get('kinases_to_drop', ''))
-        if kinases_to_drop:
-            log_results = log_results.drop(index=kinases_to_drop, errors='ignore')
-            fpr_df = fpr_df.drop(index=kinases_to_drop, errors='ignore')
-            # Evidence filtering removed
-        
-        # Apply interactive kinase and sample filtering
-        log_results, fpr_df, binary_evidence_df = handle_kinase_filtering(
-            log_results, fpr_df, binary_evidence_df, request.form
-        )
-        log_results, fpr_df, binary_evidence_df = handle_sample_filtering(
-            log_results, fpr_df, binary_evidence_df, request.form.get('manualSampleSelect', '')
-        )
+        # Process the raw activities data (log transform, etc.), cached per session
+        original_log_results = session.get_log_results()
+        original_fpr_df = session.fpr
         
-        # Apply sorting based on settings (alphabetical, activity level, etc.)
-        log_results, fpr_df, binary_evidence_df = apply_sorting(log_results, fpr_df, binary_evidence_df, sort_settings)
-        
-        # Apply hierarchical clustering if requested, and get linkage matrices
-        log_results, fpr_df, binary_evidence_df, row_linkage, col_linkage = handle_clustering_for_plot(
-            log_results, fpr_df, binary_evidence_df, sort_settings, plot_params, dendrogram_settings
-        )
+        # Apply filtering, sorting and clustering, and get linkage matrices
+        log_results, fpr_df, row_linkage, col_linkage = prepare_plot_data(original_log_results, original_fpr_df)
         
         # Extract custom column labels if provided
         custom_xlabels = extract_custom_labels(log_results)
@@ -153,6 +123,7 @@ def generate_plot():
         # Return the plot and data as JSON
         return jsonify({
             "plot": plot_img,
+            "data_token": session.token,
             "log_results": log_results.to_json(),
             "fpr_df": fpr_df.to_json(),
             "original_log_results": original_log_results.to_json(),
@@ -173,7 +144,9 @@ def update_plot():
     modifications, and returns an updated visualization without requiring new file uploads.
     
     Request Parameters:
-    - original_log_results: JSON string of the original activity data
+    - dataToken: Token of the cached session holding the original data
+    - original_log_results: JSON string of the original activity data (used
+      when the token is missing or expired)
     - original_fpr_df: JSON string of the original FPR data
     - Various filtering and sorting parameters
     
@@ -186,17 +159,21 @@ def update_plot():
         If an error occurs, returns an error JSON response with status code 500.
     """
     try:
-        # Get the original data from the frontend form
-        orig_log_json = request.form.get('original_log_results')
-        orig_fpr_json = request.form.get('original_fpr_df')
-        if not orig_log_json or not orig_fpr_json:
-            raise ValueError("Original data missing. Please generate plot first.")
-        
-        # Parse JSON data back to DataFrames
-        log_results = pd.read_json(orig_log_json)
-        fpr_df = pd.read_json(orig_fpr_json)
-
-        binary_evidence_df = None 
+        # Use the cached originals when the session is still available,
+        # otherwise the original data stored in the frontend form
+        session = get_session(request.form.get('dataToken', ''))
+        if session is not None:
+            log_results = session.get_log_results()
+            fpr_df = session.fpr
+        else:
+            orig_log_json = request.form.get('original_log_results')
+            orig_fpr_json = request.form.get('original_fpr_df')
+            if not orig_log_json or not orig_fpr_json:
+                raise ValueError("Original data missing. Please generate plot first.")
+            
+            # Parse JSON data back to DataFrames
+            log_results = frame_from_json(orig_log_json)
+            fpr_df = frame_from_json(orig_fpr_json)
         
         # Extract plot configuration parameters
         plot_params = extract_plot_params()
@@ -204,43 +181,8 @@ def update_plot():
         binary_sig = (request.form.get('significantActivity', 'binary') == 'binary')
         dendrogram_settings = extract_dendrogram_settings()
 
-        # Apply significance-based filtering if requested
-        if parse_bool(request.form.get('restrictKinases', 'false')):
-            log_results, fpr_df, binary_evidence_df = filter_significant_kinases(
-                log_results, fpr_df, binary_evidence_df
-            )
-        
-        # Apply kinase filtering (select or remove mode)
-        kinase_edit_mode = request.form.get('manualKinaseEdit', 'none')
-        selected_kinases = safe_json_loads(request.form.get('kinaseSelect', '[]'), [])
-        if kinase_edit_mode == 'select' and selected_kinases:
-            # Keep only the selected kinases
-            log_results = log_results.loc[selected_kinases]
-            fpr_df = fpr_df.loc[selected_kinases]
-        elif kinase_edit_mode == 'remove' and selected_kinases:
-            # Remove the selected kinases
-            log_results = log_results.drop(selected_kinases, errors='ignore')
-            fpr_df = fpr_df.drop(selected_kinases, errors='ignore')
-        
-        # Apply sample filtering
-        selected_samples = safe_json_loads(request.form.get('sampleSelect', '[]'), [])
-        if selected_samples:
-            log_results = log_results[selected_samples]
-            fpr_df = fpr_df[selected_samples]
-        
-        # Configure sorting settings
-        sort_settings = {
-            'kinases_mode': request.form.get('sortKinases', 'none'),
-            'samples_mode': request.form.get('sortSamples', 'none')
-        }
-        
-        # Apply non-hierarchical sorting using the common function
-        log_results, fpr_df, _ = apply_sorting(log_results, fpr_df, None, sort_settings) # Pass None for binary_evidence_df if not modified by this sort
-
-        # Apply hierarchical clustering if requested
-        log_results, fpr_df, _, row_linkage, col_linkage = handle_clustering_for_plot(
-            log_results, fpr_df, None, sort_settings, plot_params, dendrogram_settings # Pass None for binary_evidence_df
-        )
+        # Apply filtering, sorting and hierarchical clustering
+        log_results, fpr_df, row_linkage, col_linkage = prepare_update_data(log_results, fpr_df)
 
         # Get custom column labels
         custom_xlabels = extract_custom_labels(log_results)
@@ -290,8 +232,8 @@ def download_plot():
             raise ValueError("Current plot data missing. Please generate plot first.")
 
         # Parse the EXACT data that's currently displayed
-        log_results = pd.read_json(current_log_json)
-        fpr_df = pd.read_json(current_fpr_json)
+        log_results = frame_from_json(current_log_json)
+        fpr_df = frame_from_json(current_fpr_json)
 
         # Extract plot configuration parameters
         plot_params = extract_plot_params()
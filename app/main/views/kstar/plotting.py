@@ -226,8 +226,8 @@ def create_integrated_plot(
     samples_dendrogram_color = kwargs.get('samples_dendrogram_color', '#000000')
 
     dp = DotPlot(
-        values=log_results.copy(),
-        fpr=fpr_df.copy(),
+        values=log_results,
+        fpr=fpr_df,
         binary_sig=bool(kwargs.get('binary_sig', True)),
         colormap={0: kwargs.get('noactivity_color', '#377eb8'),
                   1: kwargs.get('activity_color', '#e41a1c')},
@@ -274,7 +274,7 @@ def create_integrated_plot(
     if sort_samples:
         ax_s = axes[0, -1]
         # Use provided linkage if available (should always be available if clustering was selected)
-        link = col_linkage if col_linkage is not None else linkage(dp.values.values.T, method=method, metric=metric)
+        link = col_linkage if col_linkage is not None else linkage(dp.values.T, method=method, metric=metric)
         # Draw the dendrogram
         den = draw_dendrogram(ax_s, link, orientation='top', dendrogram_color=samples_dendrogram_color)
         ax_s.set_yticks([])
@@ -286,7 +286,7 @@ def create_integrated_plot(
         r = 1 if sort_samples else 0
         ax_d = axes[r, 0]
         # Use provided linkage if available, otherwise calculate it
-        link = row_linkage if row_linkage is not None else linkage(dp.values.values, method=method, metric=metric)
+        link = row_linkage if row_linkage is not None else linkage(dp.values, method=method, metric=metric)
         den = draw_dendrogram(ax_d, link, orientation='left', dendrogram_color=kinases_dendrogram_color)
 
         ax_d.tick_params(axis='both', which='both', length=0)
@@ -0,0 +1,315 @@
+"""
+KSTAR Session Cache Module
+
+This module keeps parsed KSTAR uploads in memory so that repeated requests for
+the same activity/FPR pair do not re-parse the files. Entries are keyed by a
+content hash of both uploads, so re-uploading identical files (the common case
+while iterating on a figure) is a cache hit even across page reloads. The
+returned token can also be sent back by the client in place of the files.
+
+Parsed sessions are kept in an LRU cache per worker process, bounded by
+entry count and matrix memory. The raw uploads are also stored on disk under
+the cache storage directory, keyed by the token, so a token issued by one
+worker process is understood by the others: a worker that has not seen it
+parses the stored files once and keeps the result in its own cache. Both
+levels expire entries left unused for SESSION_CACHE_TTL_SECONDS.
+
+Classes:
+    KstarSession: Transformed activity and FPR matrices for one upload pair
+    KstarSessionCache: Thread-safe LRU cache of KstarSession objects
+
+Functions:
+    make_token: Compute the content-addressed token for an upload pair
+    load_session: Return the cached session for uploaded files, parsing on miss
+    get_session: Look up a session by token
+    store_uploads: Save an upload pair on disk under its token
+    load_stored_session: Parse the uploads stored on disk for a token
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from app.config import settings
+from .data_processing import process_activities_data
+from .matrix_io import read_upload_bytes, parse_matrix
+from .utils import (
+    SESSION_CACHE_MAX_ENTRIES, SESSION_CACHE_MAX_BYTES, SESSION_CACHE_TTL_SECONDS, SESSION_CACHE_DIRECTORY,
+    sanitize_filename
+)
+
+logger = logging.getLogger(__name__)
+
+
+class KstarSession:
+    """
+    Parsed KSTAR inputs for one activity/FPR upload pair.
+    Only the -log10 transformed activities and the FPR matrix are kept, both
+    as float32 frames sharing one index object where the kinases agree.
+    Parameters:
+        token: Content-addressed cache key
+        activities: float32 DataFrame of raw kinase activities
+        fpr: float32 DataFrame of FPR values
+    """
+
+    def __init__(self, token: str, activities: pd.DataFrame, fpr: pd.DataFrame):
+        self.token = token
+        self.log_results = process_activities_data(activities)
+        if fpr.index.equals(self.log_results.index):
+            fpr.index = self.log_results.index
+        if fpr.columns.equals(self.log_results.columns):
+            fpr.columns = self.log_results.columns
+        self.fpr = fpr
+        self.last_access = time.time()
+
+    def get_log_results(self) -> pd.DataFrame:
+        """Return the -log10 transformed activities."""
+        return self.log_results
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the matrices."""
+        return int(self.log_results.memory_usage(deep=False).sum() + self.fpr.memory_usage(deep=False).sum())
+
+
+class KstarSessionCache:
+    """
+    Thread-safe LRU cache of parsed KSTAR sessions with idle expiry.
+    Parameters:
+        max_entries: Maximum number of sessions kept before evicting the oldest
+        max_bytes: Maximum total matrix memory kept before evicting the oldest
+        ttl: Seconds an entry may stay unused before it expires
+    """
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+                 max_bytes: int = SESSION_CACHE_MAX_BYTES,
+                 ttl: float = SESSION_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[KstarSession]:
+        """Return the session for a token, or None if missing or expired."""
+        if not token:
+            return None
+        with self._lock:
+            session = self._entries.get(token)
+            if session is None:
+                return None
+            now = time.time()
+            if now - session.last_access > self.ttl:
+                self._remove(token)
+                return None
+            session.last_access = now
+            self._entries.move_to_end(token)
+            return session
+
+    def put(self, session: KstarSession) -> None:
+        """Insert or refresh a session, evicting least recently used entries."""
+        with self._lock:
+            self._entries[session.token] = session
+            self._sizes[session.token] = session.nbytes()
+            self._entries.move_to_end(session.token)
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self.total_bytes() > self.max_bytes
+            ):
+                evicted = next(iter(self._entries))
+                self._remove(evicted)
+                logger.debug("Evicted KSTAR session %s", evicted)
+
+    def total_bytes(self) -> int:
+        """Approximate memory held by all cached sessions."""
+        return sum(self._sizes.values())
+
+    def _remove(self, token: str) -> None:
+        del self._entries[token]
+        del self._sizes[token]
+
+    def clear(self) -> None:
+        """Drop every cached session."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+session_cache = KstarSessionCache()
+
+
+def make_token(activities_bytes: bytes, fpr_bytes: bytes) -> str:
+    """
+    Compute the cache token for an upload pair from the file contents.
+    Parameters:
+        activities_bytes: Raw bytes of the activities upload
+        fpr_bytes: Raw bytes of the FPR upload
+    Returns:
+        Hex digest identifying the pair
+    """
+    digest = hashlib.sha1()
+    digest.update(hashlib.sha1(activities_bytes).digest())
+    digest.update(hashlib.sha1(fpr_bytes).digest())
+    return digest.hexdigest()
+
+
+TOKEN_PATTERN = re.compile(r'[0-9a-f]{40}')
+UPLOAD_NAMES = ('activities', 'fpr')
+
+
+def storage_directory() -> str:
+    """Directory holding the stored uploads, shared by all worker processes."""
+    return os.path.join(settings.ptmscout_path, settings.cache_storage_directory, SESSION_CACHE_DIRECTORY)
+
+
+def _token_directory(token: str) -> Optional[str]:
+    """Directory of a token's uploads, or None for anything but a sha1 digest."""
+    if not token or not TOKEN_PATTERN.fullmatch(token):
+        return None
+    return os.path.join(storage_directory(), token)
+
+
+def _touch(token: str) -> None:
+    """Mark a token's stored uploads as used, postponing their expiry."""
+    try:
+        os.utime(_token_directory(token))
+    except (OSError, TypeError):
+        pass
+
+
+def _remove_expired(now: float) -> None:
+    """Delete stored uploads that were not used within the TTL."""
+    try:
+        entries = os.listdir(storage_directory())
+    except OSError:
+        return
+    for entry in entries:
+        path = os.path.join(storage_directory(), entry)
+        try:
+            if now - os.path.getmtime(path) > SESSION_CACHE_TTL_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def store_uploads(token: str, activities_bytes: bytes, activities_name: str,
+                  fpr_bytes: bytes, fpr_name: str) -> None:
+    """
+    Save an upload pair under its token so other worker processes can load it.
+    The files are written to a temporary directory that is then renamed, so
+    readers never see a partial entry. Failures are logged and ignored: the
+    token then only works in this process.
+    Parameters:
+        token: Content-addressed key of the pair
+        activities_bytes, fpr_bytes: Raw bytes of the uploads
+        activities_name, fpr_name: Original filenames, needed to parse them
+    """
+    directory = _token_directory(token)
+    if directory is None or os.path.isdir(directory):
+        return
+    try:
+        os.makedirs(storage_directory(), exist_ok=True)
+        _remove_expired(time.time())
+        staging = tempfile.mkdtemp(prefix='.' + token, dir=storage_directory())
+        for name, data, filename in zip(UPLOAD_NAMES, (activities_bytes, fpr_bytes), (activities_name, fpr_name)):
+            with open(os.path.join(staging, f'{name}-{sanitize_filename(filename or "")}'), 'wb') as f:
+                f.write(data)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # stored concurrently by another process
+            shutil.rmtree(staging, ignore_errors=True)
+    except OSError as e:
+        logger.warning("Could not store KSTAR session %s: %s", token, e)
+
+
+def load_stored_session(token: str) -> Optional[KstarSession]:
+    """
+    Parse the uploads stored on disk for a token.
+    Parameters:
+        token: Content-addressed key of the pair
+    Returns:
+        The session, or None if nothing (unexpired) is stored for the token
+    """
+    directory = _token_directory(token)
+    if directory is None:
+        return None
+    try:
+        if time.time() - os.path.getmtime(directory) > SESSION_CACHE_TTL_SECONDS:
+            shutil.rmtree(directory, ignore_errors=True)
+            return None
+        uploads = {}
+        for filename in os.listdir(directory):
+            name, _, original = filename.partition('-')
+            with open(os.path.join(directory, filename), 'rb') as f:
+                uploads[name] = (f.read(), original)
+        _touch(token)
+    except OSError:
+        return None
+    if set(uploads) != set(UPLOAD_NAMES):
+        return None
+    return KstarSession(
+        token,
+        parse_matrix(*uploads['activities']),
+        parse_matrix(*uploads['fpr'])
+    )
+
+
+def get_session(token: str) -> Optional[KstarSession]:
+    """
+    Look up a session by token, in this process's cache first and then in the
+    uploads stored by any worker process.
+    """
+    session = session_cache.get(token)
+    if session is not None:
+        _touch(token)
+        return session
+    session = load_stored_session(token)
+    if session is not None:
+        session_cache.put(session)
+        logger.info("Loaded stored KSTAR session %s", token)
+    return session
+
+
+def load_session(activities_file, fpr_file) -> Tuple[KstarSession, bool]:
+    """
+    Return the session for an uploaded activity/FPR pair, parsing each file
+    once on a cache miss.
+    Parameters:
+        activities_file: File object for the activities upload
+        fpr_file: File object for the FPR upload
+    Returns:
+        Tuple of (session, cache_hit)
+    """
+    activities_bytes = read_upload_bytes(activities_file)
+    fpr_bytes = read_upload_bytes(fpr_file)
+    token = make_token(activities_bytes, fpr_bytes)
+
+    session = session_cache.get(token)
+    if session is not None:
+        logger.info("KSTAR session cache hit for %s", token)
+        # restores the stored copy if it expired while this process kept the session
+        store_uploads(token, activities_bytes, activities_file.filename, fpr_bytes, fpr_file.filename)
+        _touch(token)
+        return session, True
+
+    session = KstarSession(
+        token,
+        parse_matrix(activities_bytes, activities_file.filename),
+        parse_matrix(fpr_bytes, fpr_file.filename)
+    )
+    session_cache.put(session)
+    store_uploads(token, activities_bytes, activities_file.filename, fpr_bytes, fpr_file.filename)
+    logger.info("Cached KSTAR session %s (%d bytes)", token, session.nbytes())
+    return session, False
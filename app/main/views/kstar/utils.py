@@ -30,8 +30,11 @@ def parse_bool(val: Union[str, bool]) -> bool:
     return val if isinstance(val, bool) else str(val).lower() == 'true'
 
 def get_sep(filename: str) -> str:
-    """Return '\t' if the file is a TSV, otherwise ','."""
-    return '\t' if filename.lower().endswith('.tsv') else ','
+    """Return '\t' if the file is a (possibly gzipped) TSV or TXT, otherwise ','."""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return '\t' if name.endswith(('.tsv', '.txt')) else ','
 
 def safe_json_loads(json_str: str, default: Any = None) -> Any:
     """Safely load a JSON string, returning default if parsing fails."""
@@ -121,7 +124,7 @@ class FormDataValidator:
             return False
 
 # Constants used across the application
-ALLOWED_FILE_EXTENSIONS = ['.csv', '.tsv']
+ALLOWED_FILE_EXTENSIONS = ['.csv', '.tsv', '.txt', '.csv.gz', '.tsv.gz', '.txt.gz', '.parquet', '.feather']
 DEFAULT_COLORS = {
     'background': '#FFFFFF',
     'activity': '#FF3300',
@@ -133,3 +136,14 @@ DEFAULT_PLOT_PARAMS = {
     'fontsize': 10,
     'use_integrated_plot': True
 }
+# Parsed uploads kept per worker process, see session_cache.py
+SESSION_CACHE_MAX_ENTRIES = 32
+SESSION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SESSION_CACHE_TTL_SECONDS = 3600
+# Raw uploads shared by all worker processes, under settings.cache_storage_directory
+SESSION_CACHE_DIRECTORY = 'kstar'
+# Batch figure export limits, see batch_export_routes.py
+BATCH_EXPORT_FORMATS = ['png', 'jpg', 'pdf', 'svg', 'eps', 'tif']
+BATCH_EXPORT_MAX_FIGURES = 100
+BATCH_EXPORT_MIN_DPI = 50
+BATCH_EXPORT_MAX_DPI = 600
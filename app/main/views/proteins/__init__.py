@@ -1,8 +1,12 @@
 from flask import Blueprint
+from app.db_routing import read_replica_request
 
 bp = Blueprint('protein', __name__,
     template_folder='templates',
     static_folder='static')
 
+# these views only read, so their queries go to the read replica if configured
+bp.before_request(read_replica_request)
+
 from app.main.views.proteins import search, structure, data, summary, expression, go, modification
 # from app.main.views.proteins import data, summary, expression, go, modification
@@ -7,6 +7,8 @@ from app.database import upload
 import pandas as pd
 import os
 
+# errors beyond this many are summarized in a single message
+MAX_FLASHED_ERRORS = 50
 
 # def parse_user_input(session, request):
     
@@ -149,8 +151,10 @@ def configure(session_id):
             db_session.save()
             return redirect(url_for('upload.metadata', session_id = db_session.id))
         else:
-            for error in errors:
+            for error in errors[:MAX_FLASHED_ERRORS]:
                 flash(error)
+            if len(errors) > MAX_FLASHED_ERRORS:
+                flash(strings.experiment_upload_error_more_errors % (len(errors) - MAX_FLASHED_ERRORS))
 
     return render_template(
         'proteomescout/upload/configure.html',
@@ -1,37 +1,155 @@
 from flask_login import current_user
-from flask import render_template, request, redirect, url_for, flash, session, current_app
+from flask import render_template, request, redirect, url_for, flash, session, current_app, jsonify
+from celery.result import AsyncResult
 from app.main.views.upload import bp
 
+from app import celery
+from app.config import settings
 from app.utils import uploadutils
-from app.database import upload, experiment, protein
+from app.database import upload, experiment, protein, jobs
 from proteomescout_worker.helpers import upload_helpers
+import datetime
+
+# rows parsed between progress updates of the review task
+REVIEW_PROGRESS_INTERVAL = 500
+# key of the user's session holding the digest of the data file last reviewed
+REVIEW_HASH_KEY = 'upload_review_hash'
 
 
 def get_proteomescout_accesssions(accessions):
     pscout_accessions = {}
-    for accession in accessions.keys():
-        pscout_accessions[accession] = protein.get_proteins_by_accession(accession)
+    for accession, proteins in protein.get_proteins_by_accessions(accessions.keys()).items():
+        pscout_accessions[accession] = [ (p.id, p.name, p.species.name if p.species else None) for p in proteins ]
     return pscout_accessions
 
 
+def summarize_datafile(db_session, progress=None):
+    """
+    Parse and validate an upload session's data file for the review page.
+
+    Returns:
+        dict of plain values (safe to pickle into the result cache) with the
+        accession -> lines map, sites, site type, line mapping, the row
+        errors and the known ProteomeScout proteins of each accession
+    """
+    accessions, sites, site_type, mod_map, data_runs, errors, line_mapping = upload_helpers.parse_datafile(db_session, False, progress)
+
+    return {
+        'accessions': accessions,
+        'sites': sites,
+        'site_type': site_type,
+        'line_mapping': line_mapping,
+        'errors': [ (e.row, e.message) for e in errors ],
+        'pscout_accessions': get_proteomescout_accesssions(accessions),
+    }
+
+
+# uploaded files get unique names and are never rewritten, so a file is
+# hashed once, when its review is first requested, and the digest is kept in
+# the user's session for later page loads and status polls
+def get_data_file_hash(db_session):
+    stored = session.get(REVIEW_HASH_KEY)
+    if stored and stored.get('data_file') == db_session.data_file:
+        return stored['hash']
+
+    digest = uploadutils.hash_data_file(db_session.data_file)
+    session[REVIEW_HASH_KEY] = {'data_file': db_session.data_file, 'hash': digest}
+    return digest
+
+# cached reviews are keyed by session, data file contents and column
+# configuration, so reconfiguring or replacing the file invalidates them
+def get_review_arguments(db_session):
+    columns = [ "%d:%s" % (c.column_number, c.type) for c in db_session.columns ]
+    return [db_session.id, get_data_file_hash(db_session), columns]
+
+def get_review_task_id(cached):
+    return "upload-review-%s" % (cached.hash_args)
+
+
+@celery.task(bind=True)
+def review_datafile(self, session_id, review_args):
+    db_session = upload.get_session_by_id(session_id, secure=False)
+    cached = jobs.getCachedResult(summarize_datafile, review_args)
+
+    def progress(line, total):
+        if line % REVIEW_PROGRESS_INTERVAL == 0 or line == total:
+            self.update_state(state='PROGRESS', meta={'progress': line, 'max_progress': total})
+
+    summary = summarize_datafile(db_session, progress)
+    cached.store_result(summary)
+    cached.save()
+
+
+def is_lost(cached):
+    if cached.finished is not None:
+        return False
+    if AsyncResult(get_review_task_id(cached), app=celery).state == 'FAILURE':
+        return True
+    age = datetime.datetime.now() - cached.started
+    return age.total_seconds() > settings.upload_review_timeout
+
+def get_review(db_session):
+    """
+    Return the CachedResult for a session's review, submitting a review
+    task when there is no current result and none is running.
+    """
+    review_args = get_review_arguments(db_session)
+    cached = jobs.getCachedResult(summarize_datafile, review_args)
+
+    if cached is not None and cached.finished is not None and not cached.is_expired():
+        return cached
+
+    if cached is None:
+        cached = jobs.CachedResult(summarize_datafile, review_args)
+    elif cached.finished is not None or is_lost(cached):
+        cached.restart()
+    else:
+        return cached
+
+    cached.save()
+    review_datafile.apply_async((db_session.id, review_args), task_id=get_review_task_id(cached))
+    current_app.logger.info('Review task for upload session %d sent to queue', db_session.id)
+    return cached
+
+
 @bp.route('/<session_id>/review', strict_slashes=False, methods=['GET', 'POST'])
 def review(session_id):
     user = current_user if current_user.is_authenticated else None
 
     db_session = upload.get_session_by_id(session_id, user=user)
 
-    
-    accessions, sites, site_type, mod_map, data_runs, errors, line_mapping = upload_helpers.parse_datafile(db_session, False)
-    pscout_accessions = get_proteomescout_accesssions(accessions)
+    cached = get_review(db_session)
+    if cached.finished is None:
+        return render_template(
+            'proteomescout/upload/review.html',
+            pending=True,
+            session_id=session_id
+        )
 
+    summary = cached.load_result()
     return render_template(
         'proteomescout/upload/review.html',
-        accessions=accessions,
-        sites=sites,
-        site_type=site_type,
-        line_mapping=line_mapping,
-        pscout_accessions=pscout_accessions
+        pending=False,
+        session_id=session_id,
+        **summary
     )
 
 
+@bp.route('/<session_id>/review/status', methods=['GET'])
+def review_status(session_id):
+    user = current_user if current_user.is_authenticated else None
+
+    db_session = upload.get_session_by_id(session_id, user=user)
+    cached = jobs.getCachedResult(summarize_datafile, get_review_arguments(db_session))
+
+    if cached is None or is_lost(cached):
+        # reloading the review page resubmits the task
+        return jsonify({'state': 'FAILURE'})
+    if cached.finished is not None:
+        return jsonify({'state': 'SUCCESS'})
 
+    task = AsyncResult(get_review_task_id(cached), app=celery)
+    response = {'state': task.state}
+    if task.state == 'PROGRESS':
+        response.update(task.info)
+    return jsonify(response)
@@ -5,31 +5,6 @@
       KSTAR.config.routes.export = KSTAR.config.routes.plot + '/export';
     }
     
-    // Format selection handling
-    const exportCsvCheckbox = document.getElementById('exportCsv');
-    const exportTsvCheckbox = document.getElementById('exportTsv');
-    
-    if (exportCsvCheckbox && exportTsvCheckbox) {
-      // Make sure only one format is selected at a time
-      exportCsvCheckbox.addEventListener('change', function() {
-        if (this.checked) {
-          exportTsvCheckbox.checked = false;
-        } else if (!exportTsvCheckbox.checked) {
-          // Ensure at least one is checked
-          this.checked = true;
-        }
-      });
-      
-      exportTsvCheckbox.addEventListener('change', function() {
-        if (this.checked) {
-          exportCsvCheckbox.checked = false;
-        } else if (!exportCsvCheckbox.checked) {
-          // Ensure at least one is checked
-          this.checked = true;
-        }
-      });
-    }
-    
     // Function to enable/disable export buttons
     const toggleExportButtons = function() {
       const exportDataBtn = document.getElementById('exportDataBtn');
@@ -28,6 +28,7 @@ function getUpdateFormData() {
   formData.append('original_fpr_df', originalFprData);
   formData.append('log_results', document.getElementById('logResultsJSON').value);
   formData.append('fpr_df', document.getElementById('fprDataJSON').value);
+  formData.append('dataToken', document.getElementById('dataToken').value);
 
   // Selections and parameters
   formData.append('kinaseSelect', JSON.stringify($('#kinaseSelect').val() || []));
@@ -103,6 +104,10 @@ function displayPlotResults(data) {
   document.getElementById('logResultsJSON').value = data.log_results;
   document.getElementById('fprDataJSON').value = data.fpr_df;
 
+  if (data.data_token) {
+    document.getElementById('dataToken').value = data.data_token;
+  }
+
   if (data.original_log_results) {
     document.getElementById('originalLogResultsJSON').value = data.original_log_results;
     document.getElementById('originalFprDataJSON').value = data.original_fpr_df;
@@ -242,13 +247,19 @@ function setupDownloadHandler() {
   });
 }
 
-function exportSpecificData(dataType, userFileNameParam) {
+function exportSpecificData(dataType, userFileNameParam, sendData) {
   const logJSON = document.getElementById('logResultsJSON').value;
   const fprJSON = document.getElementById('fprDataJSON').value;
   if (!logJSON || !fprJSON) return alert('No data available to export. Please generate a plot first.');
 
-  const formData = new FormData();
-  const exportFormat = document.getElementById('exportTsv').checked ? 'tsv' : 'csv';
+  // The server rebuilds the displayed data from its cached copy using the
+  // current view settings; the data itself is only sent if that copy expired.
+  const dataToken = document.getElementById('dataToken').value;
+  const formData = getUpdateFormData();
+  if (!formData) return;
+  ['original_log_results', 'original_fpr_df', 'log_results', 'fpr_df', 'changeXLabel', 'customXLabels']
+    .forEach(key => formData.delete(key));
+  const exportFormat = document.getElementById('exportFormat').value;
   formData.append('export_format', exportFormat);
   
   //Check and send custom labels ***
@@ -279,9 +290,11 @@ function exportSpecificData(dataType, userFileNameParam) {
   const userFileName = userFileNameParam || document.getElementById('exportFileName')?.value.trim() || 'KSTAR';
   formData.append('file_name', userFileName); 
 
-  
-  formData.append('log_results', logJSON);
-  formData.append('fpr_df', fprJSON);
+  if (sendData || !dataToken) {
+    formData.delete('dataToken');
+    formData.append('log_results', logJSON);
+    formData.append('fpr_df', fprJSON);
+  }
 
   const endpoint = dataType === 'both'
     ? KSTAR.config.routes.export
@@ -308,7 +321,13 @@ function exportSpecificData(dataType, userFileNameParam) {
       URL.revokeObjectURL(url);
       document.body.removeChild(a);
     })
-    .catch(err => alert('Error exporting data: ' + (err.error || err.message)));
+    .catch(err => {
+      if (err.token_expired && !sendData) {
+        console.log('Server copy of the data expired, resending data for export.');
+        return exportSpecificData(dataType, userFileNameParam, true);
+      }
+      alert('Error exporting data: ' + (err.error || err.message));
+    });
 }
 
 // Select2 and UI setup
@@ -388,6 +407,8 @@ function handleFileInputs() {
   console.log('File input changed');
   const activitiesFile = document.getElementById('kstarActivitiesFile').files[0];
   const fprFile = document.getElementById('kstarFPRFile').files[0];
+  // New files invalidate any cached server-side session
+  document.getElementById('dataToken').value = '';
   if (!activitiesFile || !fprFile) return;
 
   const formData = new FormData();
@@ -450,20 +471,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
   setupDownloadHandler();
 
-  // Export CSV/TSV toggles
-  const csvCheckbox = document.getElementById('exportCsv');
-  const tsvCheckbox = document.getElementById('exportTsv');
-  if (csvCheckbox && tsvCheckbox) {
-    csvCheckbox.addEventListener('change', () => {
-      if (csvCheckbox.checked) tsvCheckbox.checked = false;
-      else if (!tsvCheckbox.checked) csvCheckbox.checked = true;
-    });
-    tsvCheckbox.addEventListener('change', () => {
-      if (tsvCheckbox.checked) csvCheckbox.checked = false;
-      else if (!csvCheckbox.checked) tsvCheckbox.checked = true;
-    });
-  }
-
   // Export data button
   document.getElementById('exportDataBtn')?.addEventListener('click', () => {
     exportSpecificData(document.getElementById('exportDataType').value);
@@ -3,7 +3,7 @@ import time
 def rate_limit(rate=None):
     def wrap(fn):
         def rate_limited_task(*args, **kwargs):
-            now = time.clock()
+            now = time.monotonic()
             diff = now - rate_limited_task.last_call_time
 
             if diff < rate_limited_task.seconds_per_task:
@@ -3,8 +3,9 @@ from app.utils import protein_utils
 from app.config import settings
 
 def format_protein_accessions(accessions, query_accessions):
-    accessions = [ acc.value for acc in sorted(accessions, key=lambda acc: acc.value) if protein_utils.get_accession_type( acc.value ) in protein_utils.get_valid_accession_types() ]
-    accessions = sorted(accessions, key=lambda item: (0 if item in query_accessions else 1, item))
+    valid_types = protein_utils.get_valid_accession_types()
+    accessions = [ acc.value for acc in accessions if protein_utils.get_accession_type( acc.value ) in valid_types ]
+    accessions.sort(key=lambda item: (0 if item in query_accessions else 1, item))
     return "; ".join(accessions)
 
 def check_modtype_filter(mod, modtype_filter):
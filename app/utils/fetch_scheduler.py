@@ -0,0 +1,319 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+
+log = logging.getLogger('ptmscout')
+
+# Shared scheduler for calls to external services (UniProt, NCBI, Pfam).
+#
+# Each service has its own token bucket (requests per second with a small
+# burst), a cap on concurrent requests, a pooled requests.Session and a
+# per-request timeout. Failed requests (connection errors, timeouts, 429 and
+# 5xx responses) are retried with exponential backoff and full jitter,
+# honouring Retry-After when the service sends one. Services are limited
+# independently, so work queued for different services overlaps while each
+# stays within its own limits.
+#
+# Setting settings.EXTERNAL_SERVICE_STANDIN sends every request to a local
+# stand-in server instead (see service_url).
+#
+# Every attempt is counted per service, with the time spent waiting for the
+# response, for stage_metrics (FetchScheduler.stats).
+
+RETRY_STATUS_CODES = set([429, 500, 502, 503, 504])
+
+class FetchError(Exception):
+    def __init__(self, service, msg):
+        self.service = service
+        self.msg = msg
+
+    def __str__(self):
+        return "%s: %s" % (self.service, self.msg)
+
+    def __repr__(self):
+        return "FetchError(%s, %s)" % (self.service, self.msg)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket allowing `rate` acquisitions per second on
+    average and bursts of up to `capacity`.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                self.__refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ServiceLimits(object):
+    """
+    Limits for one external service.
+
+    Parameters:
+        rate: average requests per second
+        burst: requests allowed back to back before the rate applies
+        concurrency: maximum requests in flight at once
+        timeout: seconds allowed for each request (connect and read)
+        retries: attempts after the first before giving up
+        backoff: base delay in seconds, doubled on each retry
+        max_backoff: upper bound on a single retry delay
+    """
+    def __init__(self, rate, burst=1, concurrency=2, timeout=30, retries=3, backoff=1.0, max_backoff=30.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+
+class Service(object):
+    def __init__(self, name, limits):
+        self.name = name
+        self.limits = limits
+        self.bucket = TokenBucket(limits.rate, limits.burst)
+        self.slots = threading.BoundedSemaphore(limits.concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limits.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.seconds = 0.0
+
+    def record(self, elapsed):
+        with self.stats_lock:
+            self.calls += 1
+            self.seconds += elapsed
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter."""
+        ceiling = min(self.limits.max_backoff, self.limits.backoff * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+
+def release_on_close(service, response, started):
+    """
+    Keep a streamed response's concurrency slot until the caller closes it,
+    so bodies read after request() returns still count against the cap.
+    """
+    close = response.close
+    lock = threading.Lock()
+    released = []
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            with lock:
+                if not released:
+                    released.append(True)
+                    service.record(time.perf_counter() - started)
+                    service.slots.release()
+    response.close = close_and_release
+
+
+def retry_after(response):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def service_url(name, url):
+    """
+    Return url, or its address on the stand-in server when
+    settings.EXTERNAL_SERVICE_STANDIN is set. The stand-in serves
+    <scheme>://<host>/<path> for a service at /<service>/<host>/<path>.
+    """
+    standin = settings.EXTERNAL_SERVICE_STANDIN
+    if not standin:
+        return url
+
+    standin = standin.rstrip('/')
+    if url.startswith(standin + '/'):
+        return url
+
+    parts = urlsplit(url)
+    standin_url = "%s/%s/%s%s" % (standin, name, parts.netloc, parts.path or '/')
+    if parts.query:
+        standin_url += '?' + parts.query
+    return standin_url
+
+
+class FetchScheduler(object):
+    """
+    Rate limited, concurrency capped and retrying access to external services.
+
+    Parameters:
+        limits: dict mapping service name to ServiceLimits
+        max_workers: threads available to submit()
+    """
+    def __init__(self, limits, max_workers=8):
+        self.services = dict( (name, Service(name, l)) for name, l in limits.items() )
+        self.max_workers = max_workers
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def service(self, name):
+        if name not in self.services:
+            raise FetchError(name, "Unknown service")
+        return self.services[name]
+
+    def call(self, name, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) as one request to a service: waits for a rate
+        limit token and a concurrency slot. No retries are attempted; use
+        call_with_retry for idempotent calls.
+        """
+        service = self.service(name)
+        service.bucket.acquire()
+        with service.slots:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                service.record(time.perf_counter() - started)
+
+    def call_with_retry(self, name, fn, *args, **kwargs):
+        """
+        Like call(), retrying with jittered exponential backoff when fn raises
+        requests.RequestException, IOError or FetchError.
+        """
+        service = self.service(name)
+        attempt = 0
+        while True:
+            try:
+                return self.call(name, fn, *args, **kwargs)
+            except (requests.RequestException, IOError, FetchError) as e:
+                if attempt >= service.limits.retries:
+                    raise
+                delay = service.backoff_delay(attempt)
+                log.info("%s request failed (%s), retrying in %.1fs (%d / %d)", name, e, delay, attempt+1, service.limits.retries)
+                time.sleep(delay)
+                attempt += 1
+
+    def request(self, name, method, url, **kwargs):
+        """
+        Make an HTTP request through the service's pooled session.
+
+        Retries connection errors, timeouts, 429 and 5xx responses. Other
+        responses are returned as is; callers check the status as usual.
+        With stream=True only the request and headers are retried; the
+        response keeps its concurrency slot until the caller closes it, so it
+        must be used as a context manager (or closed explicitly).
+
+        Raises:
+            FetchError: if every attempt failed
+        """
+        service = self.service(name)
+        kwargs.setdefault('timeout', service.limits.timeout)
+        url = service_url(name, url)
+
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            service.bucket.acquire()
+            service.slots.acquire()
+            started = time.perf_counter()
+            try:
+                response = service.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            except BaseException:
+                service.slots.release()
+                raise
+
+            if error is None and response.status_code not in RETRY_STATUS_CODES and kwargs.get('stream'):
+                release_on_close(service, response, started)
+                return response
+
+            service.record(time.perf_counter() - started)
+            service.slots.release()
+            if error is None and response.status_code not in RETRY_STATUS_CODES:
+                return response
+
+            if attempt >= service.limits.retries:
+                if error is not None:
+                    raise FetchError(name, "%s %s failed: %s" % (method, url, error))
+                return response
+
+            delay = service.backoff_delay(attempt)
+            if response is not None:
+                delay = max(delay, retry_after(response) or 0)
+                # returns a streamed response's connection to the pool
+                response.close()
+            log.info("%s request %s %s failed (%s), retrying in %.1fs (%d / %d)", name, method, url,
+                     error if error is not None else response.status_code, delay, attempt+1, service.limits.retries)
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, name, url, **kwargs):
+        return self.request(name, 'GET', url, **kwargs)
+
+    def post(self, name, url, **kwargs):
+        return self.request(name, 'POST', url, **kwargs)
+
+    def stats(self):
+        """
+        Returns:
+            dict mapping service name to (requests made, seconds spent in
+            them) since the scheduler was created, for every thread
+        """
+        stats = {}
+        for name, service in self.services.items():
+            with service.stats_lock:
+                stats[name] = (service.calls, service.seconds)
+        return stats
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn in the scheduler's thread pool, returning a Future."""
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fetch')
+        return self.__executor.submit(fn, *args, **kwargs)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process wide scheduler configured by settings.FETCH_SERVICE_LIMITS."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            limits = dict( (name, ServiceLimits(**l)) for name, l in settings.FETCH_SERVICE_LIMITS.items() )
+            _scheduler = FetchScheduler(limits, settings.FETCH_MAX_WORKERS)
+    return _scheduler
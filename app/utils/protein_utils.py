@@ -1,5 +1,8 @@
+import functools
 import re
 import math
+import numpy as np
+import pandas as pd
 
 def create_sequence_profile(measurements):
     peptides = [p.peptide for m in measurements for p in m.peptides]
@@ -47,28 +50,47 @@ def create_sequence_profile(measurements):
     
     return seqlogo
 
+# Accession classes, in the order they are tried. All patterns are anchored
+# at the start, so one alternation tried left to right classifies the same
+# way as testing each pattern in turn. Group names map to accession types.
+ACCESSION_PATTERNS = [
+    ('gi', r'gi'),
+    ('refseq', r'[NXZ]P_\d+'),
+    ('swissprot', r'[O|P|Q]\d...\d([\.\-]\d+)?$'),
+    ('swissprot_2', r'[A-N|R-Z]\d[A-Z]..\d([\.\-]\d+)?$'),
+    ('genbank', r'[A-Z]{3}\d{5}$'),
+    ('ipi', r'IPI\d+(\.\d+)?$'),
+    ('ensembl', r'ENS'),
+]
+ACCESSION_GROUP_TYPES = {'swissprot_2': 'swissprot'}
+
+ACCESSION_RE = re.compile('|'.join( '(?P<%s>%s)' % (group, pattern) for group, pattern in ACCESSION_PATTERNS ))
+
+VALID_ACCESSION_TYPES = frozenset(['gi','refseq','swissprot','genbank','uniprot'])
+
+# accessions repeat across the rows of an upload and the proteins of an export
+@functools.lru_cache(maxsize=1 << 16)
 def get_accession_type(acc):
-    acc_type = None
-    
-    if(re.search('^gi', acc) is not None):
-        acc_type = 'gi'
-    elif(re.search('^[NXZ]P_\d+', acc) is not None):
-        acc_type = 'refseq'
-    elif(re.search('^[O|P|Q]\d...\d([\.\-]\d+)?$', acc) is not None):
-        acc_type = 'swissprot'
-    elif(re.search('^[A-N|R-Z]\d[A-Z]..\d([\.\-]\d+)?$', acc) is not None):
-        acc_type = 'swissprot'
-    elif(re.search('^[A-Z]{3}\d{5}$', acc) is not None):
-        acc_type = 'genbank'
-    elif(re.search('^IPI\d+(\.\d+)?$', acc) is not None):
-        acc_type = 'ipi'
-    elif re.search('^ENS', acc) is not None:
-        acc_type = 'ensembl'
-
-#    elif(re.search('^[A-Z]{4}_[A-Z]+$', acc) != None):
-#        acc_type = 'swissprot_'
-
-    return acc_type
+    m = ACCESSION_RE.match(acc)
+    if m is None:
+        return None
+    return ACCESSION_GROUP_TYPES.get(m.lastgroup, m.lastgroup)
+
+def get_accession_types(accessions):
+    """
+    Classify a column of accessions at once.
+
+    Parameters:
+        accessions: sequence, NumPy array or pandas Series of accessions
+
+    Returns:
+        NumPy object array of accession types (None where unknown or
+        missing), in the same order as accessions
+    """
+    # each distinct accession is classified once
+    codes, uniques = pd.factorize(pd.Series(accessions, dtype=object))
+    types = np.array([ get_accession_type(acc) for acc in uniques ] + [None], dtype=object)
+    return types[codes]
 
 def normalize_site_list(sites):
     amino_acids = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
@@ -92,7 +114,7 @@ def check_peptide_alphabet(pep):
     return True
 
 def get_valid_accession_types():
-    return set(['gi','refseq','swissprot','genbank','uniprot'])
+    return VALID_ACCESSION_TYPES
 
 
 
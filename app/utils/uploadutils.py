@@ -1,5 +1,7 @@
 # from ptmscout.config import strings, settings
 import csv
+import hashlib
+import itertools
 import os
 from app.utils.webutils import call_catch
 import re
@@ -12,6 +14,8 @@ from flask import current_app
 from app.config import strings, settings
 
 MAX_ROW_CHECK=100
+# rows of a data file validated together
+VALIDATION_BLOCK_ROWS = 10000
 
 
 class ErrorList(Exception):
@@ -122,13 +126,17 @@ def find_root(row, parents):
     raise ParseError(row, None, "Unexpected error: parser encountered multiple possible parent modification type assignments without any root node")
 
 def find_most_specific_parent(p, target):
-    valid = [c for c in p.children if c.hasTarget(target) ]
+    valid = [c for c in p.children if c.has_target(target) ]
     if len(valid) != 1:
         return p
 
     return find_most_specific_parent(valid[0], target)
 
-def check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes):
+# ptm_index, if given, is a modifications.PTMIndex used instead of querying
+# the database for each modification
+def check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes, ptm_index=None):
+    find_matching_ptm = ptm_index.find_matching_ptm if ptm_index else modifications.find_matching_ptm
+
     mod_list = [ m.strip() for m in modification.split(settings.mod_separator_character) ]
 
     if len(mod_list) > 1 and len(modified_residues) != len(mod_list):
@@ -143,7 +151,7 @@ def check_modification_type_matches_residues(row, modified_residues, modificatio
     for i, (r, residue) in enumerate(modified_residues):
         residue = residue.upper()
         mod_type = mod_list[i]
-        mods, found_type, match_residue = modifications.find_matching_ptm(mod_type, residue, taxon_nodes)
+        mods, found_type, match_residue = find_matching_ptm(mod_type, residue, taxon_nodes)
         
         if len(mods) == 0:
             msg = ""
@@ -178,20 +186,22 @@ def check_modification_type_matches_residues(row, modified_residues, modificatio
         
     return mod_indices, mod_object
 
-def check_modification_type_matches_sites(row, sites, modification, taxon_nodes=None):
+def check_modification_type_matches_sites(row, sites, modification, taxon_nodes=None, ptm_index=None):
     modified_residues = [ (int(s[1:]), s[0]) for s in sites.split(';') ]
-    return check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes)
+    return check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes, ptm_index)
 
-def check_modification_type_matches_peptide(row, peptide, modification, taxon_nodes=None):
+def check_modification_type_matches_peptide(row, peptide, modification, taxon_nodes=None, ptm_index=None):
     modified_alphabet = set("abcdefghijklmnopqrstuvwxyz")
     modified_residues = [ (i, r) for i, r in enumerate(peptide) if r in modified_alphabet ]
 
     if len(modified_residues) == 0:
         raise ParseError(row, None, strings.experiment_upload_warning_no_mods_found % (peptide))
 
-    return check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes)
+    return check_modification_type_matches_residues(row, modified_residues, modification, taxon_nodes, ptm_index)
    
-def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, keys, mod_col_required=True):
+# accession_types, if given, maps each accession in the rows being checked
+# to its type (see protein_utils.get_accession_types)
+def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, keys, mod_col_required=True, ptm_index=None, accession_types=None):
     errors = []
     
     try:
@@ -201,7 +211,10 @@ def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_co
         if mod_col_required:
             modification = row[mod_col.column_number].strip()
 
-        acc_type = protein_utils.get_accession_type(accession)
+        if accession_types is not None:
+            acc_type = accession_types[accession]
+        else:
+            acc_type = protein_utils.get_accession_type(accession)
         if acc_type not in protein_utils.get_valid_accession_types():
             errors.append(ParseError(r, acc_col.column_number+1, strings.experiment_upload_warning_acc_column_contains_bad_accessions))
 
@@ -214,7 +227,7 @@ def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_co
                 errors.append(ParseError(r, pep_col.column_number+1, strings.experiment_upload_warning_peptide_column_contains_bad_peptide_strings))
             
             if mod_col_required:
-                call_catch(ParseError, errors, check_modification_type_matches_peptide, r, peptide, modification)
+                call_catch(ParseError, errors, check_modification_type_matches_peptide, r, peptide, modification, ptm_index=ptm_index)
 
             site_index = peptide
         else:
@@ -222,7 +235,7 @@ def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_co
             try:
                 normed_sites = protein_utils.normalize_site_list(sites)
                 if mod_col_required:
-                    call_catch(ParseError, errors, check_modification_type_matches_sites, r, normed_sites, modification)
+                    call_catch(ParseError, errors, check_modification_type_matches_sites, r, normed_sites, modification, ptm_index=ptm_index)
                 sites = normed_sites
             except:
                 errors.append( ParseError(r, None, "Invalid formatting for sites: %s" % (sites) ) )
@@ -257,17 +270,55 @@ def check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_co
 
     return errors
     
-def check_data_rows(session, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, mod_col_required=True, N=MAX_ROW_CHECK):
+# Full file validation.
+#
+# The data file is streamed through one csv reader (so quoted fields may span
+# lines) and checked in blocks of VALIDATION_BLOCK_ROWS rows: the accessions
+# of each block are classified in one pass, and modification types are looked
+# up in a PTMIndex loaded once per file, so memory stays at one block
+# whatever the size of the upload.
+
+def get_header_layout(header):
+    """Return the first and last+1 columns of header that hold data"""
+    width = len(header)
+    while(width > 0 and header[width-1].strip() == ''):
+        width-=1
+
+    start_index = 0
+    if header[0].strip().lower() == strings.experiment_upload_error_reasons_column_title.strip().lower():
+        start_index = 1
+
+    return start_index, width
+
+def check_data_file(session, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, mod_col_required=True):
+    """
+    Check every row of a session's data file.
+
+    Returns:
+        list of ParseError ordered by line
+    """
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], session.data_file)
+    ptm_index = modifications.PTMIndex()
+
     errors = []
-    _, data = load_header_and_data_rows(session.data_file, N)
-    
-    keys = set([])
-    
+    keys = set()
     r = 0
-    for row in data:
-        r+=1
-        errors.extend( check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, keys, mod_col_required) )
-    
+    with open(path, newline='', encoding='utf-8') as ifile:
+        reader = csv.reader(ifile, delimiter='\t')
+        start_index, width = get_header_layout(next(reader))
+
+        for block in iter(lambda: list(itertools.islice(reader, VALIDATION_BLOCK_ROWS)), []):
+            rows = [ row[start_index:width] for row in block ]
+
+            # the accession column is classified in one pass
+            accessions = [ row[acc_col.column_number].strip() for row in rows if len(row) > acc_col.column_number ]
+            accession_types = dict(zip(accessions, protein_utils.get_accession_types(accessions)))
+
+            for row in rows:
+                r+=1
+                errors.extend( check_data_row(r, row, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, keys, mod_col_required, ptm_index, accession_types) )
+
+    errors.sort(key=lambda e: e.row)
     return errors
 
 
@@ -293,7 +344,7 @@ def check_data_column_assignments(session, mod_col_required=True):
         critical = False
         data_cols   = get_columns_of_type(session, 'data')
         stddev_cols = get_columns_of_type(session, 'stddev')
-        errors.extend( check_data_rows(session, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, mod_col_required) )
+        errors.extend( check_data_file(session, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, mod_col_required) )
         
     if len(errors) > 0:
         raise ErrorList( errors, critical)
@@ -388,20 +439,21 @@ def assign_column_defaults(session):
     return columns
 
 
+def hash_data_file(data_file):
+    """Return the SHA-256 hex digest of an uploaded data file's contents"""
+    digest = hashlib.sha256()
+    with open(os.path.join(current_app.config['UPLOAD_FOLDER'], data_file), 'rb') as ifile:
+        for block in iter(lambda: ifile.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 def load_header_and_data_rows(data_file, N=-1, truncate=0):
     ifile = csv.reader(codecs.open(os.path.join(current_app.config['UPLOAD_FOLDER'], data_file), 'rb', encoding='utf-8'), delimiter='\t')
     i = 0
     
     header = next(ifile)
     
-    width = len(header)
-    while(width > 0 and header[width-1].strip() == ''):
-        width-=1
-    
-    start_index = 0
-
-    if header[0].strip().lower() == strings.experiment_upload_error_reasons_column_title.strip().lower():
-        start_index = 1
+    start_index, width = get_header_layout(header)
 
     header = header[start_index:width]
     
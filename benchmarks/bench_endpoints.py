@@ -0,0 +1,192 @@
+"""
+Benchmarks for the protein and experiment pages, search and the export tasks.
+
+Requests go through the Flask test client of the full app, against the
+synthetic database built by the synthetic_db fixture (see --synthetic-scale
+and --bench-db). Celery tasks run eagerly in process and mail is suppressed.
+
+Every page is requested for a typical and for the busiest protein or the
+largest experiment. Besides pytest-benchmark's timings, each benchmark
+records in its extra_info:
+
+* db_queries / db_ms: SQL statements executed by one call, and their time
+* p50_ms / p90_ms / p99_ms: latency percentiles over the timed rounds
+  (raise --bench-rounds for meaningful tails)
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from conftest import percentile
+from app import app as flask_app, celery, instrumentation
+from app.config import settings
+from app.database import jobs
+from app.main.views.proteins.search import perform_queries, generate_metadata
+from proteomescout_worker import export_tasks
+
+PROTEIN_PAGES = ['structure', 'modifications', 'data', 'expression']
+EXPERIMENT_PAGES = ['summary', 'browse', 'GO', 'pfam', 'scansite']
+BATCH_SIZE = 25
+
+
+@pytest.fixture(scope='module')
+def app(synthetic_db):
+    """
+    The app configured for benchmarking: eager Celery tasks on an in-memory
+    broker, no CSRF checks, no mail, no sampled metrics, and exports written
+    to a temporary directory.
+    """
+    export_dir = tempfile.mkdtemp(prefix='ptmscout-bench-export-')
+    previous_config = dict((key, flask_app.config.get(key)) for key in ('WTF_CSRF_ENABLED', 'TESTING'))
+    previous_celery = dict((key, celery.conf.get(key)) for key in ('task_always_eager', 'task_eager_propagates', 'broker_url'))
+    previous_settings = (settings.metrics_sample_rate, settings.ptmscout_path)
+    mail_state = flask_app.extensions['mail']
+    previous_suppress = mail_state.suppress
+
+    flask_app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    # eager tasks still acquire a producer, which must not connect to SQS
+    celery.conf.update(task_always_eager=True, task_eager_propagates=True, broker_url='memory://')
+    # requests and tasks are measured by the benchmarks themselves
+    settings.metrics_sample_rate = 0
+    settings.ptmscout_path = export_dir
+    mail_state.suppress = True
+
+    yield flask_app
+
+    mail_state.suppress = previous_suppress
+    settings.metrics_sample_rate, settings.ptmscout_path = previous_settings
+    celery.conf.update(previous_celery)
+    flask_app.config.update(previous_config)
+    shutil.rmtree(export_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    return app.test_client()
+
+
+def count_queries(func, *args):
+    """Run func once, returning the instrumentation.Measurement of its SQL."""
+    measurement = instrumentation.Measurement('benchmark', func.__name__)
+    token = instrumentation.current_measurement.set(measurement)
+    try:
+        func(*args)
+    finally:
+        instrumentation.current_measurement.reset(token)
+    return measurement
+
+
+@pytest.fixture
+def run_endpoint(benchmark, request):
+    """
+    Time func with pytest-benchmark after counting the SQL statements of one
+    call, which also warms the caches the timed rounds would otherwise pay
+    for in their first round.
+    """
+    rounds = request.config.getoption('bench_rounds')
+
+    def run(func, *args):
+        measurement = count_queries(func, *args)
+        result = benchmark.pedantic(func, args=args, rounds=rounds, iterations=1)
+
+        benchmark.extra_info['db_queries'] = measurement.queries
+        benchmark.extra_info['db_ms'] = round(measurement.db_time * 1000, 1)
+        if benchmark.stats is not None:
+            timings = benchmark.stats.stats.data
+            for pct in (50, 90, 99):
+                benchmark.extra_info[f'p{pct}_ms'] = round(percentile(timings, pct) * 1000, 2)
+        return result
+    return run
+
+
+def get_page(client, url):
+    def request_page():
+        response = client.get(url)
+        assert response.status_code == 200, f'GET {url} returned {response.status_code}'
+        return response
+    request_page.__name__ = url
+    return request_page
+
+
+@pytest.mark.parametrize('which', ['typical', 'busiest'])
+@pytest.mark.parametrize('page', PROTEIN_PAGES)
+def bench_protein_page(client, synthetic_db, run_endpoint, page, which):
+    protein_id = getattr(synthetic_db, f'{which}_protein_id')
+    run_endpoint(get_page(client, f'/proteins/{protein_id}/{page}'))
+
+
+@pytest.mark.parametrize('which', ['typical', 'largest'])
+@pytest.mark.parametrize('page', EXPERIMENT_PAGES)
+def bench_experiment_page(client, synthetic_db, run_endpoint, page, which):
+    experiment_id = getattr(synthetic_db, f'{which}_experiment_id')
+    run_endpoint(get_page(client, f'/experiments/{experiment_id}/{page}'))
+
+
+@pytest.fixture(scope='module')
+def search_term(synthetic_db):
+    # the gene of the busiest protein, which also matches GENE<n>0... prefixes
+    return synthetic_db.genes[-1]
+
+
+def bench_search_request(client, search_term, run_endpoint):
+    # the view runs perform_queries, eagerly, before responding
+    def search():
+        response = client.post('/proteins/', data={'protein': search_term, 'peptide': '', 'species': '',
+                                                   'protein_names': ''})
+        assert response.status_code == 200 and 'task_id' in response.get_json()
+        return response
+    run_endpoint(search)
+
+
+def bench_search_results(app, search_term, run_endpoint):
+    # the worker's queries and the metadata search_status builds from them
+    def search_results():
+        with app.app_context():
+            return generate_metadata(perform_queries.run(search_term, '', '', False))
+    metadata = run_endpoint(search_results)
+    assert metadata
+
+
+def create_job(synthetic_db, tp, name):
+    with flask_app.app_context():
+        job = jobs.Job()
+        job.status = 'in queue'
+        job.stage = 'initializing'
+        job.progress = 0
+        job.max_progress = 0
+        job.name = name
+        job.type = tp
+        job.user_id = synthetic_db.user_id
+        job.save()
+        return job.id
+
+
+@pytest.mark.parametrize('annotate', [False, True], ids=['plain', 'annotated'])
+def bench_experiment_export(app, synthetic_db, run_endpoint, annotate):
+    experiment_id = synthetic_db.typical_experiment_id
+    job_id = create_job(synthetic_db, 'load_dataset', f'Export experiment {experiment_id}')
+    exp_filename = f'experiment_{experiment_id}_bench.tsv'
+
+    def export():
+        export_tasks.run_experiment_export_job.apply(
+            args=(annotate, 'bench', experiment_id, synthetic_db.user_id, exp_filename,
+                  'http://localhost/download', 'benchmark@example.com', job_id))
+    run_endpoint(export)
+    assert os.path.exists(os.path.join(settings.ptmscout_path, settings.annotation_export_file_path, exp_filename))
+
+
+def bench_batch_annotate(app, synthetic_db, run_endpoint):
+    # accessions spread over the range of protein popularity
+    step = max(1, len(synthetic_db.accessions) // BATCH_SIZE)
+    accessions = synthetic_db.accessions[::step][-BATCH_SIZE:]
+    job_id = create_job(synthetic_db, 'batch_annotate', f'Batch annotate {len(accessions)} proteins')
+    exp_filename = 'batch_bench'
+
+    def batch_annotate():
+        export_tasks.batch_annotate_proteins.apply(
+            args=(accessions, 'bench', synthetic_db.user_id, job_id, exp_filename))
+    run_endpoint(batch_annotate)
+    assert os.path.exists(os.path.join(settings.ptmscout_path, settings.annotation_export_file_path, exp_filename + '.zip'))
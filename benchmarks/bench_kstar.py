@@ -0,0 +1,208 @@
+"""
+Benchmarks for the KSTAR plotting blueprint.
+
+Each stage of the /plot pipeline is timed on its own for every matrix size
+given by --kstar-sizes, followed by end-to-end requests through the Flask
+test client. Sizes are KINASESxSAMPLES, from 50x10 up to 1000x500 by default.
+"""
+
+from io import BytesIO
+import json
+import shutil
+import tempfile
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pytest
+from flask import Flask
+
+from conftest import make_kstar_matrices
+from app.config import settings
+from app.main.views.kstar import bp
+from app.main.views.kstar.clustering import perform_clustering, handle_clustering_for_plot
+from app.main.views.kstar.data_processing import (
+    process_activities_data,
+    filter_significant_kinases,
+    handle_kinase_filtering,
+    handle_sample_filtering
+)
+from app.main.views.kstar.dotplot import DotPlot
+from app.main.views.kstar.plotting import create_integrated_plot, figure_to_base64
+from app.main.views.kstar.session_cache import session_cache
+
+CLUSTER_BOTH = {'kinases_mode': 'by_clustering', 'samples_mode': 'by_clustering'}
+SHOW_DENDROGRAMS = {'show_kinases_dendrogram_inside': True, 'show_samples_dendrogram': True}
+CLUSTER_FORM = {
+    'sortKinases': 'by_clustering',
+    'sortSamples': 'by_clustering',
+    'showKinasesDendrogramInside': 'true',
+    'showSamplesDendrogram': 'true'
+}
+
+
+@pytest.fixture(scope='module')
+def matrices(kstar_size):
+    return make_kstar_matrices(*kstar_size)
+
+
+@pytest.fixture(scope='module')
+def log_results(matrices):
+    return process_activities_data(matrices[0])
+
+
+@pytest.fixture(scope='module')
+def clustered(log_results, matrices):
+    log_df, fpr_df, _, row_linkage, col_linkage = handle_clustering_for_plot(
+        log_results, matrices[1], None, CLUSTER_BOTH, {}, SHOW_DENDROGRAMS
+    )
+    return log_df, fpr_df, row_linkage, col_linkage
+
+
+@pytest.fixture(scope='module')
+def client():
+    """
+    A test client with only the KSTAR blueprint mounted; it does not use the
+    database. Uploads are stored under a temporary directory instead of the
+    app's KSTAR session cache.
+    """
+    storage_dir = tempfile.mkdtemp(prefix='ptmscout-bench-kstar-')
+    previous_path = settings.ptmscout_path
+    settings.ptmscout_path = storage_dir
+    session_cache.clear()
+
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp, url_prefix='/kstar')
+    yield flask_app.test_client()
+
+    session_cache.clear()
+    settings.ptmscout_path = previous_path
+    shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+@pytest.fixture(scope='module')
+def upload_bytes(matrices):
+    activities, fpr = matrices
+    return activities.to_csv(sep='\t').encode(), fpr.to_csv(sep='\t').encode()
+
+
+def _files(upload_bytes):
+    return {
+        'activitiesFile': (BytesIO(upload_bytes[0]), 'activities.tsv'),
+        'fprFile': (BytesIO(upload_bytes[1]), 'fpr.tsv')
+    }
+
+
+def _check(response):
+    assert response.status_code == 200, response.get_data(as_text=True)[:500]
+    return response
+
+
+# --- Individual stages ---
+
+def bench_process_activities_data(run_benchmark, matrices):
+    run_benchmark(process_activities_data, matrices[0])
+
+
+def bench_filter_significant_kinases(run_benchmark, log_results, matrices):
+    run_benchmark(filter_significant_kinases, log_results, matrices[1])
+
+
+def bench_handle_kinase_filtering(run_benchmark, log_results, matrices):
+    selected = list(log_results.index[::2])
+    form = {'kinaseEditMode': 'select', 'kinaseSelect': json.dumps(selected)}
+    run_benchmark(handle_kinase_filtering, log_results, matrices[1], None, form)
+
+
+def bench_handle_sample_filtering(run_benchmark, log_results, matrices):
+    samples = ','.join(log_results.columns[::2])
+    run_benchmark(handle_sample_filtering, log_results, matrices[1], None, samples)
+
+
+def bench_perform_clustering_rows(run_benchmark, log_results):
+    run_benchmark(perform_clustering, log_results, mode='row')
+
+
+def bench_perform_clustering_columns(run_benchmark, log_results):
+    run_benchmark(perform_clustering, log_results, mode='column')
+
+
+def bench_dotplot(run_benchmark, log_results, matrices):
+    def draw():
+        fig, ax = plt.subplots(figsize=(8, 20))
+        DotPlot(log_results, matrices[1]).dotplot(ax=ax)
+        plt.close(fig)
+    run_benchmark(draw)
+
+
+def bench_create_integrated_plot(run_benchmark, clustered):
+    log_df, fpr_df, row_linkage, col_linkage = clustered
+
+    def draw():
+        fig = create_integrated_plot(
+            log_df, fpr_df, row_linkage=row_linkage, col_linkage=col_linkage,
+            download=True, **SHOW_DENDROGRAMS
+        )
+        plt.close(fig)
+    run_benchmark(draw)
+
+
+def bench_figure_to_base64(run_benchmark, clustered):
+    log_df, fpr_df, row_linkage, col_linkage = clustered
+
+    def setup():
+        fig = create_integrated_plot(
+            log_df, fpr_df, row_linkage=row_linkage, col_linkage=col_linkage,
+            download=True, **SHOW_DENDROGRAMS
+        )
+        return (fig,), {}
+    run_benchmark(figure_to_base64, setup=setup)
+
+
+# --- End to end through the Flask test client ---
+
+def bench_endpoint_get_columns(run_benchmark, client, upload_bytes):
+    def request():
+        _check(client.post('/kstar/get_columns', data=_files(upload_bytes)))
+    run_benchmark(request)
+
+
+def bench_endpoint_plot_cold(run_benchmark, client, upload_bytes):
+    def setup():
+        session_cache.clear()
+        return (), {}
+
+    def request():
+        _check(client.post('/kstar/plot', data=dict(_files(upload_bytes), **CLUSTER_FORM)))
+    run_benchmark(request, setup=setup)
+
+
+def bench_endpoint_plot_cached(run_benchmark, client, upload_bytes):
+    token = _check(client.post('/kstar/plot', data=_files(upload_bytes))).get_json()['data_token']
+
+    def request():
+        _check(client.post('/kstar/plot', data=dict(CLUSTER_FORM, dataToken=token)))
+    run_benchmark(request)
+
+
+def bench_endpoint_update_plot(run_benchmark, client, upload_bytes):
+    data = _check(client.post('/kstar/plot', data=_files(upload_bytes))).get_json()
+    form = dict(CLUSTER_FORM, original_log_results=data['original_log_results'],
+                original_fpr_df=data['original_fpr_df'])
+
+    def request():
+        _check(client.post('/kstar/update_plot', data=form))
+    run_benchmark(request)
+
+
+def bench_endpoint_batch_export(run_benchmark, client, upload_bytes):
+    token = _check(client.post('/kstar/plot', data=_files(upload_bytes))).get_json()['data_token']
+    parameter_sets = [
+        dict(CLUSTER_FORM, name='clustered', formats=['png', 'pdf']),
+        {'name': 'significant', 'restrictKinases': True, 'formats': ['png', 'svg']},
+    ]
+    form = {'dataToken': token, 'parameterSets': json.dumps(parameter_sets), 'dpi': '100'}
+
+    def request():
+        _check(client.post('/kstar/plot/batch_export', data=form))
+    run_benchmark(request)
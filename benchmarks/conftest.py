@@ -0,0 +1,176 @@
+"""
+Shared fixtures for the ProteomeScout benchmark suites.
+
+Benchmarks require pytest-benchmark (pip install pytest-benchmark). They use
+its `benchmark` fixture and also record the
+peak Python/NumPy heap allocation of one call (via tracemalloc) in the
+benchmark's extra_info, which is included in --benchmark-json output.
+
+Run from the repository root, with the environment described in README.md:
+    python3 -m pytest -c benchmarks/pytest.ini benchmarks --benchmark-json=kstar.json
+    python3 -m pytest -c benchmarks/pytest.ini benchmarks --kstar-sizes=50x10,200x50 --bench-rounds=5
+    python3 -m pytest -c benchmarks/pytest.ini benchmarks/bench_endpoints.py --synthetic-scale=500x5x2000
+
+The endpoint benchmarks run against a synthetic database (synthetic_db.py),
+by default a temporary SQLite file. --bench-db points them at another empty
+database instead; the app is always configured with it, never with the
+DATABASE_URL of the environment.
+"""
+
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+DEFAULT_KSTAR_SIZES = '50x10,200x50,500x100,1000x500'
+DEFAULT_SYNTHETIC_SCALE = '2000x20x20000'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--kstar-sizes', default=DEFAULT_KSTAR_SIZES,
+                     help='Comma separated KINASESxSAMPLES matrix sizes for the KSTAR benchmarks')
+    parser.addoption('--bench-rounds', type=int, default=3,
+                     help='Rounds per benchmark (each round runs the function once)')
+    parser.addoption('--bench-db', default=None,
+                     help='URL of an empty database for the endpoint benchmarks (default: temporary SQLite file)')
+    parser.addoption('--synthetic-scale', default=DEFAULT_SYNTHETIC_SCALE,
+                     help='PROTEINSxEXPERIMENTSxMEASURED size of the synthetic database')
+    parser.addoption('--synthetic-seed', type=int, default=0,
+                     help='Random seed of the synthetic database')
+
+
+def pytest_configure(config):
+    # app reads DATABASE_URL when it is first imported, and its Celery tasks
+    # run in that app's context, so it is set before any benchmark imports it
+    url = config.getoption('bench_db')
+    if url is None:
+        config._bench_db_dir = tempfile.mkdtemp(prefix='ptmscout-bench-')
+        url = 'sqlite:///' + os.path.join(config._bench_db_dir, 'synthetic.db')
+    os.environ['DATABASE_URL'] = url
+    os.environ.pop('DATABASE_REPLICA_URL', None)
+    os.environ.pop('DATABASE_WORKER_URL', None)
+
+
+def pytest_unconfigure(config):
+    directory = getattr(config, '_bench_db_dir', None)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def pytest_generate_tests(metafunc):
+    if 'kstar_size' in metafunc.fixturenames:
+        sizes = [tuple(int(n) for n in size.split('x'))
+                 for size in metafunc.config.getoption('kstar_sizes').split(',') if size]
+        metafunc.parametrize('kstar_size', sizes, ids=[f'{k}x{s}' for k, s in sizes], scope='module')
+
+
+def make_kstar_matrices(n_kinases, n_samples, seed=0):
+    """
+    Build synthetic KSTAR activity and FPR matrices.
+
+    Activities are p-value like (some exact zeros, as KSTAR emits), FPRs are
+    skewed towards small values so roughly a fifth of cells are significant.
+    """
+    rng = np.random.default_rng(seed)
+    index = [f'KIN{i:04d}' for i in range(n_kinases)]
+    columns = [f'data:sample_{j:03d}' for j in range(n_samples)]
+    activities = rng.beta(0.5, 2.0, size=(n_kinases, n_samples))
+    activities[rng.random((n_kinases, n_samples)) < 0.02] = 0.0
+    fpr = rng.beta(0.7, 3.0, size=(n_kinases, n_samples))
+    return (pd.DataFrame(activities, index=index, columns=columns),
+            pd.DataFrame(fpr, index=index, columns=columns))
+
+
+def measure_peak_memory(func, *args, **kwargs):
+    """Return the peak traced allocation in MiB of a single call."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+@pytest.fixture
+def run_benchmark(benchmark, request):
+    """
+    Time func with pytest-benchmark after recording its peak memory.
+
+    setup, if given, is called before every round and must return the
+    (args, kwargs) to pass to func, for functions that consume their input.
+    """
+    rounds = request.config.getoption('bench_rounds')
+
+    def run(func, *args, setup=None, **kwargs):
+        if setup is None:
+            peak = measure_peak_memory(func, *args, **kwargs)
+            result = benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+        else:
+            setup_args, setup_kwargs = setup()
+            peak = measure_peak_memory(func, *setup_args, **setup_kwargs)
+            result = benchmark.pedantic(func, setup=setup, rounds=rounds)
+        benchmark.extra_info['peak_memory_mib'] = round(peak, 3)
+        return result
+    return run
+
+
+@pytest.fixture
+def standin_services():
+    """
+    Start a stand-in UniProt/NCBI/Pfam server (standin_server.StandinServer)
+    and point the fetch scheduler at it for the rest of the test.
+
+    Call the fixture with StandinServer options, e.g.
+    standin_services(latency={'*': 0.1}, error_rate={'uniprot': 0.05}).
+    """
+    from app.config import settings
+    from standin_server import StandinServer
+
+    servers = []
+    previous = settings.EXTERNAL_SERVICE_STANDIN
+
+    def start(**options):
+        server = StandinServer(**options)
+        server.start()
+        servers.append(server)
+        settings.EXTERNAL_SERVICE_STANDIN = server.url
+        return server
+
+    yield start
+
+    settings.EXTERNAL_SERVICE_STANDIN = previous
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture(scope='session')
+def synthetic_db(request):
+    """
+    Create the tables of the benchmark database and fill them with
+    synthetic_db.generate() once per session.
+
+    Returns the SyntheticDataset describing the rows.
+    """
+    from app import app as flask_app, db
+    from synthetic_db import generate, parse_scale
+
+    proteins, experiments, measured = parse_scale(request.config.getoption('synthetic_scale'))
+    with flask_app.app_context():
+        db.create_all()
+        try:
+            return generate(db.session, proteins, experiments, measured,
+                            seed=request.config.getoption('synthetic_seed'))
+        except ValueError as e:
+            raise pytest.UsageError(f'--bench-db: {e}')
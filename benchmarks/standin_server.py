@@ -0,0 +1,365 @@
+"""
+Local stand-in for the UniProt, NCBI eUtils and Pfam web services.
+
+The worker helpers reach these services through the fetch scheduler, which
+sends every request to this server when settings.EXTERNAL_SERVICE_STANDIN is
+set: https://<host>/<path> for a service is served at
+/<service>/<host>/<path> (see app.utils.fetch_scheduler.service_url).
+
+Modes:
+    replay  serve responses recorded in the fixture directory; requests
+            without a recording get a 404
+    record  forward each request to the real service over https, store the
+            response in the fixture directory and return it
+
+Recordings are keyed by method, host, path and parameters (query string and
+form body, ignoring the tool/email/api_key identification). UniProt batch
+queries are also stored entry by entry, so a replayed batch can combine any
+recorded accessions: accessions without a recording are left out of the
+response, as UniProt does for accessions it does not know.
+
+Latency (fixed delay plus uniform jitter) and error responses can be
+injected per service to exercise the scheduler's retries and concurrency
+limits. Request counts are served as JSON at /_standin/stats.
+
+Run standalone:
+    python standin_server.py --fixtures fixtures/services --port 8770
+    python standin_server.py --record --port 8770
+    python standin_server.py --latency 0.2 --latency uniprot=0.5 --error-rate ncbi=0.05
+
+or in process:
+    with StandinServer('fixtures/services', latency={'*': 0.1}) as server:
+        settings.EXTERNAL_SERVICE_STANDIN = server.url
+"""
+
+import argparse
+import email.parser
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+from proteomescout_worker.geeneus.backend import RecordCache
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'services')
+
+SERVICES = ('uniprot', 'ncbi', 'pfam')
+
+# parameters identifying the caller rather than the query
+IGNORED_PARAMETERS = {'tool', 'email', 'api_key'}
+
+# response headers kept in recordings (paging and result counts)
+RECORDED_HEADERS = ('Content-Type', 'Link', 'X-Total-Results', 'Retry-After')
+
+# UniProt batch query endpoint, whose responses are also stored per entry
+UNIPROT_BATCH_PATHS = {'/uploadlists/', '/uploadlists'}
+
+
+def request_parameters(query, content_type, body):
+    """Return the sorted (name, value) parameters of a request's query string and body."""
+    params = parse_qsl(query, keep_blank_values=True)
+    content_type = content_type or ''
+    if body and content_type.startswith('application/x-www-form-urlencoded'):
+        params += parse_qsl(body.decode('utf-8'), keep_blank_values=True)
+    elif body and content_type.startswith('multipart/form-data'):
+        # parts are keyed by content, since the boundary changes on every request
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode('latin1') + b'\r\n\r\n' + body)
+        for part in message.get_payload():
+            params.append((part.get_param('name', header='content-disposition') or '',
+                           part.get_payload(decode=True).decode('utf-8', 'replace')))
+    elif body:
+        params.append(('', hashlib.sha1(body).hexdigest()))
+    return sorted(p for p in params if p[0] not in IGNORED_PARAMETERS)
+
+
+def request_key(method, host, path, params):
+    description = json.dumps([method, host, path, params])
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+class FixtureStore(object):
+    """
+    Recorded responses, one <key>.json (request and status) and <key>.body
+    pair per response under <directory>/<service>/, plus single UniProt
+    entries under <directory>/uniprot/entries/<ACCESSION>.xml.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def _path(self, service, name):
+        return os.path.join(self.directory, service, name)
+
+    def load(self, service, key):
+        """Return (status, headers, body) for a recorded response, or None."""
+        meta_path = self._path(service, key + '.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        with open(self._path(service, key + '.body'), 'rb') as body_file:
+            body = body_file.read()
+        return meta['status'], meta['headers'], body
+
+    def save(self, service, key, request, status, headers, body):
+        with self.lock:
+            os.makedirs(self._path(service, ''), exist_ok=True)
+            with open(self._path(service, key + '.body'), 'wb') as body_file:
+                body_file.write(body)
+            with open(self._path(service, key + '.json'), 'w') as meta_file:
+                json.dump({'request': request, 'status': status, 'headers': headers}, meta_file, indent=1)
+
+    def load_uniprot_entries(self, accessions):
+        """Return the recorded entries of accessions, each entry once, in request order."""
+        entries = []
+        seen = set()
+        for acc in accessions:
+            path = self._path('uniprot', os.path.join('entries', acc.upper() + '.xml'))
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as entry_file:
+                entry = entry_file.read()
+            if entry not in seen:
+                seen.add(entry)
+                entries.append(entry)
+        return entries
+
+    def save_uniprot_entries(self, xml):
+        with self.lock:
+            os.makedirs(self._path('uniprot', 'entries'), exist_ok=True)
+            for accessions, entry in RecordCache.split_uniprot_entries(xml):
+                for acc in accessions:
+                    with open(self._path('uniprot', os.path.join('entries', acc + '.xml')), 'wb') as entry_file:
+                        entry_file.write(entry)
+
+
+def service_setting(values, service, default):
+    """Look up a per-service option given as {service: value}, with '*' for every service."""
+    if not values:
+        return default
+    return values.get(service, values.get('*', default))
+
+
+class StandinServer(object):
+    """
+    Parameters:
+        fixtures: fixture directory
+        mode: 'replay' or 'record'
+        latency: {service or '*': seconds} added before every response
+        jitter: {service or '*': seconds} of extra uniform random delay
+        error_rate: {service or '*': probability} of answering with error_status
+        error_status: HTTP status of injected errors
+        seed: seed for jitter and error injection, so runs are repeatable
+        host, port: address to listen on; port 0 picks a free port
+    """
+    def __init__(self, fixtures=DEFAULT_FIXTURES, mode='replay', latency=None, jitter=None,
+                 error_rate=None, error_status=503, seed=0, host='127.0.0.1', port=0):
+        if mode not in ('replay', 'record'):
+            raise ValueError("Unknown stand-in mode: %s" % (mode))
+
+        self.store = FixtureStore(fixtures)
+        self.mode = mode
+        self.latency = latency or {}
+        self.jitter = jitter or {}
+        self.error_rate = error_rate or {}
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.upstream = requests.Session()
+
+        self.stats_lock = threading.Lock()
+        self.stats = dict( (service, {'requests': 0, 'replayed': 0, 'recorded': 0, 'missing': 0, 'errors': 0})
+                           for service in SERVICES )
+
+        self.httpd = ThreadingHTTPServer((host, port), StandinRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='standin', daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, service, name):
+        with self.stats_lock:
+            self.stats[service][name] += 1
+
+    def delay(self, service):
+        seconds = service_setting(self.latency, service, 0.0)
+        jitter = service_setting(self.jitter, service, 0.0)
+        with self.random_lock:
+            if jitter:
+                seconds += self.random.uniform(0, jitter)
+            fail = self.random.random() < service_setting(self.error_rate, service, 0.0)
+        return seconds, fail
+
+    def respond(self, method, service, host, path, query, headers, body):
+        """Return (status, headers, body) for a request to service at https://host/path."""
+        self.count(service, 'requests')
+
+        seconds, fail = self.delay(service)
+        if seconds:
+            time.sleep(seconds)
+        if fail:
+            self.count(service, 'errors')
+            return self.error_status, {'Content-Type': 'text/plain'}, b'Injected stand-in error\n'
+
+        params = request_parameters(query, headers.get('Content-Type'), body)
+        key = request_key(method, host, path, params)
+
+        if self.mode == 'record':
+            return self.record(method, service, host, path, query, headers, body, params, key)
+
+        recorded = self.store.load(service, key)
+        if recorded is not None:
+            self.count(service, 'replayed')
+            return recorded
+
+        if service == 'uniprot' and path in UNIPROT_BATCH_PATHS and dict(params).get('query'):
+            self.count(service, 'replayed')
+            entries = self.store.load_uniprot_entries(dict(params)['query'].split())
+            return 200, {'Content-Type': 'application/xml'}, RecordCache.join_uniprot_entries(entries)
+
+        self.count(service, 'missing')
+        return 404, {'Content-Type': 'text/plain'}, \
+            ("No recorded response for %s https://%s%s %s\n" % (method, host, path, params)).encode('utf-8')
+
+    def record(self, method, service, host, path, query, headers, body, params, key):
+        url = "https://%s%s" % (host, path)
+        if query:
+            url += '?' + query
+        forwarded = dict( (name, value) for name, value in headers.items() if name.lower() in ('content-type', 'accept') )
+        response = self.upstream.request(method, url, data=body or None, headers=forwarded, timeout=300)
+
+        response_headers = dict( (name, response.headers[name]) for name in RECORDED_HEADERS if name in response.headers )
+        content = response.content
+        request = {'method': method, 'url': url, 'params': params}
+        self.store.save(service, key, request, response.status_code, response_headers, content)
+        if service == 'uniprot' and path in UNIPROT_BATCH_PATHS and response.ok:
+            self.store.save_uniprot_entries(content)
+
+        self.count(service, 'recorded')
+        return response.status_code, response_headers, content
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            if name == 'Link':
+                value = self.rewrite_link(value)
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def rewrite_link(self, value):
+        # paging links point back at the stand-in
+        service = self.path.split('/')[1]
+        return value.replace('<https://', '<%s/%s/' % (self.server.standin.url, service))
+
+    def handle_request(self):
+        standin = self.server.standin
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        parts = urlsplit(self.path)
+        if parts.path == '/_standin/stats':
+            with standin.stats_lock:
+                stats = json.dumps(standin.stats, indent=1).encode('utf-8')
+            return self.send(200, {'Content-Type': 'application/json'}, stats)
+
+        segments = parts.path.split('/', 3)
+        if len(segments) < 3 or segments[1] not in SERVICES or not segments[2]:
+            return self.send(404, {'Content-Type': 'text/plain'}, b'Expected /<service>/<host>/<path>\n')
+
+        service, host = segments[1], segments[2]
+        path = '/' + (segments[3] if len(segments) > 3 else '')
+        try:
+            status, headers, content = standin.respond(self.command, service, host, path, parts.query,
+                                                       self.headers, body)
+        except requests.RequestException as e:
+            status, headers, content = 502, {'Content-Type': 'text/plain'}, str(e).encode('utf-8')
+        self.send(status, headers, content)
+
+    do_GET = handle_request
+    do_POST = handle_request
+    do_HEAD = handle_request
+
+
+def parse_service_values(values, convert=float):
+    """Parse repeated '<value>' or '<service>=<value>' options into {service or '*': value}."""
+    parsed = {}
+    for value in values or []:
+        service, _, amount = value.rpartition('=')
+        if service and service not in SERVICES:
+            raise argparse.ArgumentTypeError("Unknown service: %s" % (service))
+        parsed[service or '*'] = convert(amount)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in server for the UniProt, NCBI and Pfam web services.')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES, help='recorded response directory')
+    parser.add_argument('--record', action='store_true', help='forward requests to the real services and record the responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8770)
+    parser.add_argument('--latency', action='append', metavar='[SERVICE=]SECONDS', help='delay added to every response')
+    parser.add_argument('--jitter', action='append', metavar='[SERVICE=]SECONDS', help='extra uniform random delay')
+    parser.add_argument('--error-rate', action='append', metavar='[SERVICE=]P', help='fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=0, help='random seed for jitter and errors')
+    args = parser.parse_args()
+
+    server = StandinServer(args.fixtures, mode='record' if args.record else 'replay',
+                           latency=parse_service_values(args.latency),
+                           jitter=parse_service_values(args.jitter),
+                           error_rate=parse_service_values(args.error_rate),
+                           error_status=args.error_status, seed=args.seed,
+                           host=args.host, port=args.port)
+
+    print("Stand-in %s server on %s (fixtures in %s)" % (server.mode, server.url, args.fixtures))
+    print("Set EXTERNAL_SERVICE_STANDIN = '%s' in app/config/settings.py" % (server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
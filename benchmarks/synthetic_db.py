@@ -0,0 +1,449 @@
+"""
+Synthetic ProteomeScout database for the endpoint benchmarks.
+
+generate() fills an empty database with N proteins, M public experiments and
+K measured peptides, plus the annotations the protein and experiment pages
+read, with roughly the fan-out of the production database:
+
+* 2-5 accessions, 0-12 GO terms, 0-4 Pfam domains, 0-8 UniProt regions and
+  0-10 mutations per protein, and gene expression for ~60% of human and mouse
+  proteins
+* protein popularity is skewed, so a few hub proteins are measured in most
+  experiments, and experiment sizes follow a Zipf-like distribution
+* each measured peptide has 1-3 modified sites of a phospho/acetyl/ubiquityl
+  PTM tree, sites are shared between experiments, every site has 0-3 Scansite
+  predictions, and each experiment has 1-2 runs of 4-8 data points
+
+Every row is given an explicit id and rows are written in batches with the
+upload BulkWriter, so the same seed always produces the same database, on
+SQLite or MySQL.
+
+Run on its own to build a database file once:
+    PYTHONPATH=. python3 benchmarks/synthetic_db.py sqlite:////tmp/ptmscout_bench.db --scale 2000x20x20000
+"""
+
+import datetime
+import math
+import random
+from dataclasses import dataclass, field
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+# rough residue frequencies of the human proteome
+AMINO_ACID_WEIGHTS = [7.0, 2.3, 4.7, 7.1, 3.7, 6.6, 2.6, 4.3, 5.7, 10.0,
+                      2.1, 3.6, 6.3, 4.8, 5.6, 8.3, 5.4, 6.0, 1.3, 2.7]
+
+SPECIES = [
+    # taxon id, name, share of proteins, has expression data
+    (9606, 'homo sapiens', 0.6, True),
+    (10090, 'mus musculus', 0.3, True),
+    (10116, 'rattus norvegicus', 0.1, False),
+]
+
+# name, parent
+PTMS = [
+    ('Phosphorylation', None),
+    ('Phosphoserine', 'Phosphorylation'),
+    ('Phosphothreonine', 'Phosphorylation'),
+    ('Phosphotyrosine', 'Phosphorylation'),
+    ('Acetylation', None),
+    ('N6-acetyllysine', 'Acetylation'),
+    ('Ubiquitination', None),
+]
+# share of modified sites per residue
+SITE_RESIDUES = [('S', 0.6), ('T', 0.2), ('Y', 0.1), ('K', 0.1)]
+
+REGION_TYPES = ['domain', 'Activation Loop', 'zinc finger region', 'coiled-coil region',
+                'transmembrane region', 'topological domain', 'helix', 'turn', 'strand']
+ACCESSION_TYPES = ['swissprot', 'refseq', 'gene_synonym', 'ipi', 'entrez_protein']
+SCANSITE_SOURCES = ['scansite_kinase', 'scansite_bind']
+KINASES = ['PKA_group', 'PKC_group', 'Akt_Kin', 'CDK1_Kin', 'Erk1_Kin', 'CK2_Kin',
+           'GSK3_Kin', 'Src_Kin', 'Abl_Kin', 'EGFR_Kin', '14-3-3', 'SH2_Grb2']
+TISSUES = ['liver', 'heart', 'brain', 'kidney', 'lung', 'spleen', 'muscle',
+           'pancreas', 'testis', 'thymus', 'skin', 'colon']
+COLLECTIONS = ['GNF human', 'GNF mouse']
+MUTATION_TYPES = ['missense', 'nonsense', 'deletion']
+CONDITION_TYPES = ['cell', 'tissue', 'drug', 'stimulus']
+
+
+@dataclass
+class SyntheticDataset:
+    """Sizes of a generated database and rows the benchmarks request."""
+    proteins: int
+    experiments: int
+    measured_peptides: int
+    seed: int
+    user_id: int = None
+    # protein and experiment ids by measurement count
+    typical_protein_id: int = None
+    busiest_protein_id: int = None
+    typical_experiment_id: int = None
+    largest_experiment_id: int = None
+    # gene names and accessions of measured proteins, for search and batch
+    genes: list = field(default_factory=list)
+    accessions: list = field(default_factory=list)
+    rows: dict = field(default_factory=dict)
+
+
+def parse_scale(scale):
+    """Parse a PROTEINSxEXPERIMENTSxMEASURED string, e.g. 2000x20x20000."""
+    parts = [int(n) for n in scale.lower().split('x')]
+    if len(parts) != 3 or min(parts) < 1:
+        raise ValueError(f'scale must be PROTEINSxEXPERIMENTSxMEASURED, not {scale!r}')
+    return tuple(parts)
+
+
+def zipf_weights(n, exponent):
+    return [1.0 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def split_counts(total, weights, minimum=1):
+    """Split total into len(weights) integer counts of at least minimum."""
+    scale = sum(weights)
+    counts = [max(minimum, int(total * w / scale)) for w in weights]
+    # hand the remainder to the largest parts
+    i = 0
+    while sum(counts) < total:
+        counts[i % len(counts)] += 1
+        i += 1
+    return counts
+
+
+class Ids(object):
+    """Explicit primary keys, one counter per table."""
+    def __init__(self):
+        self.last = {}
+
+    def next(self, model):
+        name = model.__tablename__
+        self.last[name] = self.last.get(name, 0) + 1
+        return self.last[name]
+
+
+class Generator(object):
+    def __init__(self, writer, rng, now):
+        from app.database import protein, modifications, experiment, gene_expression, \
+            mutations, taxonomies, jobs, user
+
+        self.writer = writer
+        self.rng = rng
+        self.now = now
+        self.ids = Ids()
+        self.protein = protein
+        self.modifications = modifications
+        self.experiment = experiment
+        self.gene_expression = gene_expression
+        self.mutations = mutations
+        self.taxonomies = taxonomies
+        self.jobs = jobs
+        self.user = user
+
+        # protein id -> (sequence, {residue: [positions]})
+        self.sites = {}
+        # (protein id, site pos) -> peptide id
+        self.peptides = {}
+        self.association_rows = {'protein_expression': [], 'experiment_PTM': []}
+
+    def add(self, model, **values):
+        values['id'] = self.ids.next(model)
+        self.writer.add(model, **values)
+        return values['id']
+
+    def reference_data(self, go_terms, pfam_families):
+        taxonomies = self.taxonomies
+        self.species = []
+        for taxon_id, name, share, has_expression in SPECIES:
+            self.writer.add(taxonomies.Taxonomy, node_id=taxon_id, kingdom='E', name=name.capitalize(), strain=None)
+            species_id = self.add(taxonomies.Species, name=name, taxon_id=taxon_id)
+            self.species.append((species_id, name, share, has_expression))
+
+        self.ptms = {}
+        for name, parent in PTMS:
+            self.ptms[name] = self.add(self.modifications.PTM, name=name, position='anywhere',
+                                       accession=f'PTM-{len(self.ptms):04d}',
+                                       parent_id=self.ptms.get(parent))
+        self.ptms_by_residue = {
+            'S': [self.ptms['Phosphoserine']],
+            'T': [self.ptms['Phosphothreonine']],
+            'Y': [self.ptms['Phosphotyrosine']],
+            'K': [self.ptms['N6-acetyllysine'], self.ptms['Ubiquitination']],
+        }
+
+        self.go_terms = []
+        for i in range(go_terms):
+            aspect = 'PFC'[i % 3]
+            self.go_terms.append(self.add(self.protein.GeneOntology, aspect=aspect, GO=f'GO:{i + 1:07d}',
+                                          term=f'synthetic {aspect} term {i}', version='1.2', date=self.now))
+        self.go_weights = zipf_weights(go_terms, 0.8)
+        self.pfam_families = [f'PF{i:05d}' for i in range(pfam_families)]
+        self.pfam_weights = zipf_weights(pfam_families, 0.9)
+
+        self.tissues = [self.add(self.gene_expression.ExpressionTissue, name=name) for name in TISSUES]
+        self.collections = [self.add(self.gene_expression.ExpressionCollection, name=name) for name in COLLECTIONS]
+
+        usr = self.user.User
+        self.user_id = self.add(usr, username='benchmark', name='Benchmark User', email='benchmark@example.com',
+                                institution='', active=1, access_level='researcher', date_created=self.now)
+
+    def sequence(self, length):
+        return ''.join(self.rng.choices(AMINO_ACIDS, weights=AMINO_ACID_WEIGHTS, k=length))
+
+    def proteins(self, count):
+        rng = self.rng
+        protein = self.protein
+        species_weights = [share for _, _, share, _ in self.species]
+        self.protein_ids = []
+        self.genes = {}
+        self.primary_accessions = {}
+
+        for i in range(count):
+            species_id, species_name, _, has_expression = rng.choices(self.species, weights=species_weights)[0]
+            # median ~450 residues with a long tail, as in UniProt
+            length = min(5000, max(60, int(rng.lognormvariate(6.1, 0.6))))
+            seq = self.sequence(length)
+            gene = f'GENE{i + 1}'
+            prot_id = self.add(protein.Protein, sequence=seq, sequence_sha1=protein.hash_sequence(seq),
+                               acc_gene=gene, locus=f'LOC{100000 + i}', name=f'Synthetic protein {i + 1}',
+                               species_id=species_id, date=self.now, current=True)
+            self.protein_ids.append(prot_id)
+            self.genes[prot_id] = gene
+
+            positions = {}
+            for pos, residue in enumerate(seq, start=1):
+                if residue in self.ptms_by_residue:
+                    positions.setdefault(residue, []).append(pos)
+            self.sites[prot_id] = (seq, positions)
+
+            self.accessions(prot_id, i, gene)
+            self.annotations(prot_id, length)
+            if has_expression and rng.random() < 0.6:
+                self.expression(prot_id, species_id, gene)
+
+    def accessions(self, prot_id, i, gene):
+        primary = f'Q{i + 1:05d}'
+        self.primary_accessions[prot_id] = primary
+        self.add(self.protein.ProteinAccession, type='swissprot', value=primary, protein_id=prot_id,
+                 primary_acc=True, date=self.now, out_of_date=False)
+        self.add(self.protein.ProteinAccession, type='gene_synonym', value=gene, protein_id=prot_id,
+                 primary_acc=False, date=self.now, out_of_date=False)
+        for j in range(self.rng.randint(0, 3)):
+            tp = self.rng.choice(ACCESSION_TYPES[1:])
+            self.add(self.protein.ProteinAccession, type=tp, value=f'{tp.upper()[:2]}_{i + 1}.{j}', protein_id=prot_id,
+                     primary_acc=False, date=self.now, out_of_date=False)
+
+    def span(self, length, size):
+        size = min(size, length)
+        start = self.rng.randint(1, length - size + 1)
+        return start, start + size - 1
+
+    def annotations(self, prot_id, length):
+        rng = self.rng
+        protein = self.protein
+
+        for go_id in set(rng.choices(self.go_terms, weights=self.go_weights, k=rng.randint(0, 12))):
+            self.add(protein.GeneOntologyEntry, protein_id=prot_id, GO_id=go_id, date=self.now)
+
+        for _ in range(rng.choice([0, 1, 1, 1, 2, 2, 3, 4])):
+            start, stop = self.span(length, rng.randint(40, 250))
+            self.add(protein.ProteinDomain, label=rng.choices(self.pfam_families, weights=self.pfam_weights)[0],
+                     start=start, stop=stop, p_value=10 ** -rng.uniform(5, 40), source='pfam',
+                     params='synthetic', protein_id=prot_id, version=1)
+
+        for _ in range(rng.randint(0, 8)):
+            start, stop = self.span(length, rng.randint(5, 120))
+            tp = rng.choice(REGION_TYPES)
+            self.add(protein.ProteinRegion, type=tp, label=tp, source='uniprot', start=start, stop=stop,
+                     protein_id=prot_id)
+
+        seq = self.sites[prot_id][0]
+        for _ in range(rng.choice([0, 0, 0, 1, 2, 3, 5, 10])):
+            location = rng.randint(1, length)
+            self.add(self.mutations.Mutation, protein_id=prot_id, acc_id=f'VAR_{prot_id:06d}',
+                     mutationType=rng.choice(MUTATION_TYPES), location=location, original=seq[location - 1],
+                     mutant=rng.choice(AMINO_ACIDS), date=self.now, annotation='synthetic variant', clinical='')
+
+    def expression(self, prot_id, species_id, gene):
+        gene_expression = self.gene_expression
+        for _ in range(self.rng.randint(1, 2)):
+            probeset_pk = self.ids.next(gene_expression.ExpressionProbeset)
+            # protein_expression refers to the probeset name, which is numeric here
+            probeset_name = str(100000 + probeset_pk)
+            self.writer.add(gene_expression.ExpressionProbeset, id=probeset_pk, probeset_id=probeset_name,
+                            genechip='gnf1h', species_id=species_id, name=gene)
+            self.add(gene_expression.ExpressionAccession, type=gene_expression.ExpressionTypeEnum.gene_symbol, value=gene, probeset_id=probeset_pk)
+            for collection_id in self.collections:
+                for tissue_id in self.rng.sample(self.tissues, 6):
+                    self.add(gene_expression.ExpressionSample, probeset_id=probeset_pk, collection_id=collection_id,
+                             tissue_id=tissue_id, value=round(self.rng.lognormvariate(5, 1.2), 2))
+            self.association_rows['protein_expression'].append({'protein_id': prot_id, 'probeset_id': int(probeset_name)})
+
+    def experiments(self, count, measured):
+        rng = self.rng
+        experiment = self.experiment
+        self.experiment_sizes = {}
+
+        sizes = split_counts(measured, zipf_weights(count, 0.7))
+        rng.shuffle(sizes)
+        protein_weights = zipf_weights(len(self.protein_ids), 0.6)
+
+        for i, size in enumerate(sizes):
+            job_id = self.add(self.jobs.Job, status='finished', failure_reason='', stage='finalize',
+                              progress=size, max_progress=size, name=f'Load synthetic experiment {i + 1}',
+                              type='load_experiment', user_id=self.user_id, created=self.now, finished=self.now)
+            exp_id = self.add(experiment.Experiment, name=f'Synthetic experiment {i + 1}', author='Benchmark',
+                              date=self.now, description='synthetic', contact='benchmark@example.com', PMID=0,
+                              URL='', published=1, ambiguity=0, dataset='', volume=1, page_start='1',
+                              page_end='10', journal='Synthetic J', publication_year=2020,
+                              publication_month='january', public=1, job_id=job_id, submitter_id=self.user_id,
+                              modified_residues='STYK', type='experiment', version_number=1)
+            for tp in rng.sample(CONDITION_TYPES, 2):
+                self.add(experiment.ExperimentCondition, type=tp, value=f'{tp} {rng.randint(1, 20)}',
+                         experiment_id=exp_id)
+
+            runs = ['average'] if rng.random() < 0.6 else ['run1', 'run2']
+            timepoints = [str(t) for t in sorted(rng.sample([0, 1, 2, 5, 10, 15, 30, 60, 120], rng.randint(4, 8)))]
+
+            # a protein is measured at most size times, mostly once or twice
+            chosen = rng.choices(self.protein_ids, weights=protein_weights, k=size)
+            ptm_ids = set()
+            for prot_id in chosen:
+                ptm_ids |= self.measured_peptide(exp_id, prot_id, runs, timepoints)
+            for ptm_id in sorted(ptm_ids):
+                self.association_rows['experiment_PTM'].append({'experiment_id': exp_id, 'PTM_id': ptm_id})
+            self.experiment_sizes[exp_id] = size
+
+    def site(self, prot_id):
+        seq, positions = self.sites[prot_id]
+        residues = [r for r, _ in SITE_RESIDUES if r in positions]
+        if not residues:
+            return None
+        weights = [w for r, w in SITE_RESIDUES if r in positions]
+        residue = self.rng.choices(residues, weights=weights)[0]
+        return residue, self.rng.choice(positions[residue])
+
+    def peptide(self, prot_id, residue, pos):
+        key = (prot_id, pos)
+        if key in self.peptides:
+            return self.peptides[key]
+
+        seq = self.sites[prot_id][0]
+        window = seq[max(0, pos - 8):pos - 1].rjust(7, ' ') + residue.lower() + seq[pos:pos + 7].ljust(7, ' ')
+        pep_id = self.add(self.modifications.Peptide, pep_aligned=window, site_pos=pos, site_type=residue,
+                          protein_id=prot_id, scansite_date=self.now)
+        self.peptides[key] = pep_id
+
+        for _ in range(self.rng.choice([0, 1, 1, 2, 3])):
+            self.add(self.protein.ProteinScansite, source=self.rng.choice(SCANSITE_SOURCES),
+                     value=self.rng.choice(KINASES), score=round(self.rng.uniform(0.2, 0.6), 4),
+                     percentile=round(self.rng.uniform(0.01, 5.0), 3), site_pos=pos, protein_id=prot_id)
+        return pep_id
+
+    def measured_peptide(self, exp_id, prot_id, runs, timepoints):
+        rng = self.rng
+        modifications = self.modifications
+        sites = {}
+        for _ in range(rng.choice([1, 1, 1, 2, 2, 3])):
+            site = self.site(prot_id)
+            if site is not None:
+                sites[site[1]] = site[0]
+        if not sites:
+            return set()
+
+        seq = self.sites[prot_id][0]
+        first, last = min(sites), max(sites)
+        start = max(1, first - rng.randint(2, 8))
+        stop = min(len(seq), last + rng.randint(2, 8))
+        peptide = ''.join(c.lower() if (start + i) in sites else c for i, c in enumerate(seq[start - 1:stop]))
+
+        ms_id = self.add(modifications.MeasuredPeptide, query_accession=self.primary_accessions[prot_id],
+                         experiment_id=exp_id, protein_id=prot_id, peptide=peptide)
+        ptm_ids = set()
+        for pos, residue in sorted(sites.items()):
+            ptm_id = rng.choice(self.ptms_by_residue[residue])
+            ptm_ids.add(ptm_id)
+            self.add(modifications.PeptideModification, MS_id=ms_id, peptide_id=self.peptide(prot_id, residue, pos),
+                     modification_id=ptm_id)
+
+        level = rng.lognormvariate(0, 0.5)
+        for run in runs:
+            for priority, label in enumerate(timepoints, start=1):
+                level *= rng.uniform(0.7, 1.4)
+                self.add(self.experiment.ExperimentData, type='data', units='time(min)', run=run, label=label,
+                         priority=priority, value=round(level, 4), MS_id=ms_id)
+        return ptm_ids
+
+
+def generate(session, proteins=2000, experiments=20, measured_peptides=20000, seed=0, batch_size=None):
+    """
+    Fill an empty database with a synthetic dataset and commit it.
+
+    Parameters:
+        session: session of the database, whose tables already exist
+        proteins, experiments, measured_peptides: dataset size
+        seed: random seed; the same seed gives the same rows
+
+    Returns:
+        SyntheticDataset
+    """
+    from app.database import protein, modifications, experiment
+    from proteomescout_worker.helpers.bulk_writer import BulkWriter
+    from sqlalchemy import func
+
+    if session.query(func.count(protein.Protein.id)).scalar():
+        raise ValueError('the benchmark database already contains proteins')
+
+    rng = random.Random(seed)
+    writer = BulkWriter(session=session, batch_size=batch_size)
+    gen = Generator(writer, rng, datetime.datetime(2020, 1, 1))
+
+    gen.reference_data(go_terms=max(60, proteins // 4), pfam_families=max(30, int(math.sqrt(proteins) * 4)))
+    gen.proteins(proteins)
+    gen.experiments(experiments, measured_peptides)
+    writer.flush()
+
+    for table, rows in gen.association_rows.items():
+        if rows:
+            session.execute(protein.db.Model.metadata.tables[table].insert(), rows)
+    session.commit()
+
+    dataset = SyntheticDataset(proteins, experiments, measured_peptides, seed, user_id=gen.user_id)
+    dataset.rows = dict((model.__tablename__, n) for model, n in writer.written.items())
+    dataset.rows.update((table, len(rows)) for table, rows in gen.association_rows.items())
+
+    by_experiment = sorted(gen.experiment_sizes.items(), key=lambda item: (item[1], item[0]))
+    dataset.typical_experiment_id = by_experiment[len(by_experiment) // 2][0]
+    dataset.largest_experiment_id = by_experiment[-1][0]
+
+    by_protein = session.query(modifications.MeasuredPeptide.protein_id, func.count(modifications.MeasuredPeptide.id)) \
+        .group_by(modifications.MeasuredPeptide.protein_id).all()
+    by_protein = sorted(by_protein, key=lambda item: (item[1], item[0]))
+    dataset.typical_protein_id = by_protein[len(by_protein) // 2][0]
+    dataset.busiest_protein_id = by_protein[-1][0]
+
+    measured = [prot_id for prot_id, _ in by_protein]
+    dataset.genes = [gen.genes[prot_id] for prot_id in measured]
+    dataset.accessions = [gen.primary_accessions[prot_id] for prot_id in measured]
+    return dataset
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Build a synthetic ProteomeScout database')
+    parser.add_argument('url', help='database URL, e.g. sqlite:////tmp/ptmscout_bench.db (must be empty)')
+    parser.add_argument('--scale', default='2000x20x20000', help='PROTEINSxEXPERIMENTSxMEASURED')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app import db
+
+    engine = create_engine(args.url)
+    db.Model.metadata.create_all(engine)
+    session = Session(bind=engine)
+
+    started = time.time()
+    dataset = generate(session, *parse_scale(args.scale), seed=args.seed)
+    print(f'Generated in {time.time() - started:.1f}s: ' +
+          ', '.join(f'{table}={n}' for table, n in sorted(dataset.rows.items())))
@@ -11,6 +11,12 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # read-only views (search, browse, protein pages) read from this replica when set
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_REPLICA_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': 10}
+    # Celery tasks and maintenance scripts use a separate pool on the primary
+    SQLALCHEMY_WORKER_URI = os.environ.get('DATABASE_WORKER_URL')
+    SQLALCHEMY_WORKER_ENGINE_OPTIONS = {'pool_size': 20, 'max_overflow': 30}
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
     MAIL_SERVER = os.environ.get('SMTP_HOST') #os.environ.get('MAIL_SERVER') #or "smtp.gmail.com" # setting up automated email to new google account for test 
     MAIL_PORT = int(os.environ.get('SMTP_PORT'))  # Default to 587 if SMTP_PORT is not set
@@ -0,0 +1,40 @@
+"""composite indexes for peptide, measurement and accession lookups
+
+Revision ID: 3c8a5d0e7f14
+Revises: 9e4f2b7c61d8
+Create Date: 2026-10-19 17:05:12.408331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8a5d0e7f14'
+down_revision = '9e4f2b7c61d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # modifications.get_measured_peptide, get_measured_peptides_by_experiment
+    op.create_index('ix_MS_experiment_id_protein_id', 'MS', ['experiment_id', 'protein_id'], unique=False)
+    # modifications.get_peptide_by_site, upload_helpers.get_known_peptides
+    op.create_index('ix_peptide_protein_id_site_pos_site_type', 'peptide', ['protein_id', 'site_pos', 'site_type'], unique=False)
+    # protein.get_proteins_by_accession(s)
+    op.create_index(op.f('ix_protein_acc_value'), 'protein_acc', ['value'], unique=False)
+    # MeasuredPeptide.data
+    op.create_index(op.f('ix_MS_data_MS_id'), 'MS_data', ['MS_id'], unique=False)
+    # modifications.get_experiments_reporting_modified_peptide, protein_data_update
+    op.create_index('ix_MS_modifications_peptide_id_modification_id', 'MS_modifications', ['peptide_id', 'modification_id'], unique=False)
+    # Peptide.predictions
+    op.create_index('ix_protein_scansite_protein_id_site_pos', 'protein_scansite', ['protein_id', 'site_pos'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_protein_scansite_protein_id_site_pos', table_name='protein_scansite')
+    op.drop_index('ix_MS_modifications_peptide_id_modification_id', table_name='MS_modifications')
+    op.drop_index(op.f('ix_MS_data_MS_id'), table_name='MS_data')
+    op.drop_index(op.f('ix_protein_acc_value'), table_name='protein_acc')
+    op.drop_index('ix_peptide_protein_id_site_pos_site_type', table_name='peptide')
+    op.drop_index('ix_MS_experiment_id_protein_id', table_name='MS')
@@ -0,0 +1,47 @@
+"""per-stage timings and counters of import jobs
+
+Revision ID: 4f8b1c6e2d93
+Revises: 7d2e9a4b5c30
+Create Date: 2026-10-19 20:02:13.518264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8b1c6e2d93'
+down_revision = '7d2e9a4b5c30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_stage_metrics',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=True),
+    sa.Column('stage', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.Enum('finished', 'error', name='stagestatusenum'), nullable=True),
+    sa.Column('started', sa.DateTime(), nullable=True),
+    sa.Column('seconds', sa.Float(), nullable=True),
+    sa.Column('items', sa.Integer(), nullable=True),
+    sa.Column('db_queries', sa.Integer(), nullable=True),
+    sa.Column('db_seconds', sa.Float(), nullable=True),
+    sa.Column('uniprot_calls', sa.Integer(), nullable=True),
+    sa.Column('uniprot_seconds', sa.Float(), nullable=True),
+    sa.Column('ncbi_calls', sa.Integer(), nullable=True),
+    sa.Column('ncbi_seconds', sa.Float(), nullable=True),
+    sa.Column('pfam_calls', sa.Integer(), nullable=True),
+    sa.Column('pfam_seconds', sa.Float(), nullable=True),
+    sa.Column('peak_memory_mb', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_job_stage_metrics_job_id'), 'job_stage_metrics', ['job_id'], unique=False)
+    op.create_index(op.f('ix_job_stage_metrics_started'), 'job_stage_metrics', ['started'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_stage_metrics_started'), table_name='job_stage_metrics')
+    op.drop_index(op.f('ix_job_stage_metrics_job_id'), table_name='job_stage_metrics')
+    op.drop_table('job_stage_metrics')
@@ -0,0 +1,50 @@
+"""protein sequence hash for indexed sequence lookups
+
+Revision ID: 7d2e9a4b5c30
+Revises: 3c8a5d0e7f14
+Create Date: 2026-10-19 18:21:47.930615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import hashlib
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e9a4b5c30'
+down_revision = '3c8a5d0e7f14'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_sequence_sha1(connection):
+    # matches protein.hash_sequence; MySQL computes the same digest itself
+    if connection.dialect.name == 'mysql':
+        connection.execute(sa.text("UPDATE protein SET sequence_sha1 = SHA1(sequence) WHERE sequence IS NOT NULL"))
+        return
+
+    protein = sa.table('protein', sa.column('id', sa.Integer), sa.column('sequence', sa.Text), sa.column('sequence_sha1', sa.CHAR(40)))
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select([protein.c.id, protein.c.sequence]).
+                                    where(sa.and_(protein.c.id > last_id, protein.c.sequence != None)).
+                                    order_by(protein.c.id).limit(BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        for prot_id, seq in rows:
+            connection.execute(protein.update().where(protein.c.id == prot_id).
+                                values(sequence_sha1=hashlib.sha1(seq.encode('utf-8')).hexdigest()))
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.add_column('protein', sa.Column('sequence_sha1', sa.CHAR(length=40), nullable=True))
+    backfill_sequence_sha1(op.get_bind())
+    op.create_index('ix_protein_species_id_sequence_sha1', 'protein', ['species_id', 'sequence_sha1'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_protein_species_id_sequence_sha1', table_name='protein')
+    op.drop_column('protein', 'sequence_sha1')
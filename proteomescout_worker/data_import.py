@@ -1,12 +1,13 @@
 import celery
 import logging
 from app.database import experiment, upload
-from proteomescout_worker.helpers import upload_helpers
+from proteomescout_worker.helpers import upload_helpers, stage_metrics
 from proteomescout_worker import notify_tasks, protein_tasks
 log = logging.getLogger('ptmscout')
 
 @celery.task
 @upload_helpers.notify_job_failed
+@stage_metrics.stage_task('initializing')
 @upload_helpers.dynamic_transaction_task
 def start_import(exp_id, session_id, job_id, nullmods=False):
     exp = experiment.get_experiment_by_id(exp_id, check_ready=False, secure=False)
@@ -16,6 +17,7 @@ def start_import(exp_id, session_id, job_id, nullmods=False):
     
     # log.info("Loading data file...")
     accessions, sites, site_type, mod_map, data_runs, errors, line_mapping = upload_helpers.parse_datafile(session, nullmods)
+    stage_metrics.add_items(len(line_mapping))
 
     if exp.loading_stage == 'in queue' or exp.status != 'error':
         exp.clearErrors()
@@ -8,7 +8,7 @@ from proteomescout_worker.geeneus import backend
 
 class ProteinManager:
     
-    def __init__(self, email, cache=True, retry=0, uniprotShortcut=True):
+    def __init__(self, email, cache=True, retry=0, uniprotShortcut=True, recordCache=None, fetchScheduler=None):
         """Returns a fully formed manager object which can be queried by the other 
         functions in this class. 
 
@@ -25,9 +25,17 @@ class ProteinManager:
         uniprotShortcut If True then for non NCBI supported UniProtKB/Swissprot accessions
                         we skip an NCBI lookup and go straight for UniProt. If False then we
                         always try NCBI first.
+
+        recordCache     Optional backend.RecordCache.RecordCache. If given, raw UniProt and
+                        NCBI records are read from and written to this persistent on-disk
+                        cache, so they are shared between processes and survive restarts.
+
+        fetchScheduler  Optional shared scheduler (see app.utils.fetch_scheduler). If given,
+                        NCBI, UniProt and Pfam requests take their rate limit tokens from
+                        its per-service buckets instead of the fixed per-object delay.
         """
 
-        self.datastore = backend.ProteinParser.ProteinRequestParser(email, cache, retry, shortcut=uniprotShortcut)
+        self.datastore = backend.ProteinParser.ProteinRequestParser(email, cache, retry, shortcut=uniprotShortcut, recordCache=recordCache, fetchScheduler=fetchScheduler)
         if self.datastore.error():
             self.error_status = True
         else:
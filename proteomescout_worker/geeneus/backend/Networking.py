@@ -3,23 +3,47 @@
 # Abstracts away any interaction with the eUtil tools from the user, and deals with network errors or other problems.
 #
 # NOTE:
-# timeout code based on code from http://pguides.net/python-tutorial/python-timeout-a-function/
+# All requests go through a pooled requests.Session and are bounded by a
+# per-call deadline (connect, every socket read and the overall download),
+# rather than SIGALRM, so a Networking object can be used from any thread.
+# Given a fetch scheduler, requests are made through it, so they share its
+# rate limits, concurrency slots, retries and per-service call statistics
 # -
 # Copyright 2012 - 2015 by Alex Holehouse - see LICENSE for more info
 # Contact at alex.holehouse@wustl.edu
 
 import datetime
 import sys
-import signal
+import threading
 import time
-import urllib.error
-import urllib.request
-from io import StringIO
+from io import BytesIO, StringIO
 import requests
+from requests.adapters import HTTPAdapter
 from proteomescout_worker.geeneus.backend import ProteinParser
-from http.client import BadStatusLine
+from proteomescout_worker.geeneus.backend import RecordCache
+from app.utils.fetch_scheduler import FetchError
 from Bio import Entrez
 
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+CONNECT_TIMEOUT = 10
+CHUNK_SIZE = 8 * 1024
+
+# Session shared by every Networking object in the process when no fetch
+# scheduler is provided (requests.Session is safe to share across threads
+# for plain requests like these)
+_session = None
+_session_lock = threading.Lock()
+
+def shared_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
 #--------------------------------------------------------
 # Global networking timeout limits are in ProteinParser
 # for fine tuning
@@ -40,45 +64,96 @@ class TimeoutException(Exception):
 class Networking:    
     
     TIMEOUT=20
-    def __init__(self, timeout):
+    def __init__(self, timeout, recordCache=None, fetchScheduler=None):
+        """ timeout         Seconds allowed for each call, from connecting to the
+                            end of the download (TIMEOUT if not set)
+            recordCache     Optional RecordCache for protein efetches
+            fetchScheduler  Optional FetchScheduler providing the rate limits
+                            and pooled sessions shared across the process
+        """
         self.lastDatabaseCall = datetime.datetime.now()
-        
+        self.deadline = timeout if timeout else self.TIMEOUT
+        self.recordCache = recordCache
+        self.fetchScheduler = fetchScheduler
+        self.cancelled = threading.Event()
+
+#--------------------------------------------------------
+# PUBLIC FUNCTION
 #--------------------------------------------------------
+# Abort any download in progress (from any thread) and fail any
+# further calls made through this object with -1
 #
+    def cancel(self):
+        self.cancelled.set()
+
 #--------------------------------------------------------
-# Function to decorate other functions with a timeout. If the timeout is reached, causes the
-# decorated function to return a -1 along with a printed warning
-#    
-    def timeout(timeout_time, default):
-        def timeout_function(f):
-            def f2(*args):
-
-                def timeout_handler(signum, frame):
-                    raise TimeoutException()
-
-                handler = signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(timeout_time)
-                            
-                try:
-                    retval = f(*args)
-                except TimeoutException:
-                    print("\nWarning: Timeout reached after {time} seconds\n".format(time=timeout_time))
-                    return default
-                finally:
-                    signal.signal(signal.SIGALRM, handler)
-                    signal.alarm(0)
-                return retval
-            return f2
-        return timeout_function
-    
+#
+#--------------------------------------------------------
+# Make a single HTTP request with a deadline of self.deadline seconds.
+#
+# The connect timeout and every socket read are bounded by the deadline,
+# and the body is read in CHUNK_SIZE chunks so the overall deadline and
+# cancellation are checked as it downloads. Returns a handle on the
+# complete body (text for text/plain responses, bytes otherwise, as
+# Entrez would have returned), or -1 after printing a warning
+#
+# With a fetch scheduler the request is made by FetchScheduler.request,
+# which waits for the service's rate limit token and concurrency slot
+# (held until the body has been read), retries 429/5xx responses and
+# records the call for the per-stage statistics
+#
+    def _send(self, service, method, url, **kwargs):
+        if self.fetchScheduler is not None:
+            return self.fetchScheduler.request(service, method, url, **kwargs)
+        return shared_session().request(method, url, **kwargs)
+
+    def _request(self, service, label, method, url, **kwargs):
+        if self.cancelled.is_set():
+            return -1
+
+        deadline = time.monotonic() + self.deadline
+        try:
+            response = self._send(service, method, url, stream=True,
+                timeout=(min(CONNECT_TIMEOUT, self.deadline), self.deadline), **kwargs)
+            with response:
+                response.raise_for_status()
+                chunks = []
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    if self.cancelled.is_set():
+                        print("\n{label}: Request cancelled\n".format(label=label))
+                        return -1
+                    if time.monotonic() > deadline:
+                        raise TimeoutException()
+
+                body = b''.join(chunks)
+                if response.headers.get('Content-Type', '').split(';')[0].strip() == 'text/plain':
+                    return StringIO(body.decode(response.encoding or 'utf-8'))
+                return BytesIO(body)
+
+        except (TimeoutException, requests.Timeout):
+            print("\nWarning: Timeout reached after {time} seconds\n".format(time=self.deadline))
+            return -1
+        except requests.HTTPError as err:
+            print("{label}: HTTP error({0}): {1}".format(err.response.status_code, err.response.reason, label=label))
+            return -1
+        except (requests.RequestException, FetchError) as err:
+            print("{label}: Connection error - {0}".format(err, label=label))
+            return -1
 
 #--------------------------------------------------------
 #
 #--------------------------------------------------------
 # function to ensure we stay with NCBI's query limit of no more than 3 per second
 #
+# If a shared fetch scheduler was provided, the request itself waits for
+# a token from the $service's bucket, which is shared with every other
+# caller in the process
 #
-    def stay_within_limits(self):
+    def stay_within_limits(self, service='ncbi'):
+        if self.fetchScheduler is not None:
+            return
+
         if (datetime.datetime.now() - self.lastDatabaseCall).seconds  < 1:
             if (datetime.datetime.now() - self.lastDatabaseCall).microseconds < 400000:
                 time.sleep(0.5)
@@ -96,13 +171,11 @@ class Networking:
 # conflicts
 #
 # A paired __internal_efNT() and efetchNucleotide() set of functions are used
-# to allow decoration of one with a timeout, where the efetchNucleotide() can 
-# print an error message on -1 return from EITHER the efetchGeneral function,
-# or from the timeout decorator itself
+# so efetchNucleotide() can print an error message on a -1 return from
+# eUtilsGeneral, whether from a network error or the deadline
 #
-    @timeout(TIMEOUT, -1)
     def __internal_efNT(self, GI, start, end, strand_val):
-        return self.eUtilsGeneral({'function':Entrez.efetch,'db':"nucleotide", 'id':GI, 'seq_start':start, 'seq_stop':end, 'rettype':"fasta", 'strand':strand_val})
+        return self.eUtilsGeneral({'utility':'efetch','db':"nucleotide", 'id':GI, 'seq_start':start, 'seq_stop':end, 'rettype':"fasta", 'strand':strand_val})
       
     def efetchNucleotide(self, GI, start, end, strand_val):
         self.stay_within_limits()
@@ -123,9 +196,8 @@ class Networking:
 # Decorator must decorate this function (not efetchGeneral) to avoid keyword
 # conflicts
 #
-    @timeout(TIMEOUT, -1)
     def __internal_efG(self, GeneID):
-        return self.eUtilsGeneral({'function':Entrez.efetch,'db':"gene", 'id':GeneID, 'rettype':"gene_table", 'retmode':"xml"})
+        return self.eUtilsGeneral({'utility':'efetch','db':"gene", 'id':GeneID, 'rettype':"gene_table", 'retmode':"xml"})
 
     def efetchGene(self, GeneID):
         self.stay_within_limits()
@@ -146,11 +218,13 @@ class Networking:
 # Decorator must decorate this function (not efetchGeneral) to avoid keyword
 # conflicts
 #
-    @timeout(TIMEOUT, -1)
     def __internal_efP(self, ProteinID):
-        return self.eUtilsGeneral({'function':Entrez.efetch,'db':"protein", 'id':ProteinID, 'retmode':"xml"})
+        return self.eUtilsGeneral({'utility':'efetch','db':"protein", 'id':ProteinID, 'retmode':"xml"})
        
     def efetchProtein(self, ProteinID):
+        if self.recordCache is not None:
+            return self._cachedEfetchProtein(ProteinID)
+
         self.stay_within_limits()
         handle = self.__internal_efP(ProteinID)
         if (handle == -1):
@@ -159,6 +233,48 @@ class Networking:
         else:
             return handle
 
+#--------------------------------------------------------
+#
+#--------------------------------------------------------
+# efetch protein records through the on-disk record cache
+#
+# Serves whichever of the requested IDs are cached, efetches the rest
+# in a single call and stores each returned GBSeq record under the ID
+# it was requested as (efetch returns records in request order). The
+# result is a handle on one GBSet document with the records in the
+# order requested, exactly as efetch would have returned it.
+#
+# If the number of records returned doesn't match the number requested
+# nothing is cached and the raw response is returned, so the caller's
+# usual length check and bisection still apply
+#
+    def _cachedEfetchProtein(self, ProteinID):
+        IDList = ProteinID if isinstance(ProteinID, list) else [ProteinID]
+        records = self.recordCache.get_many(RecordCache.NCBI, IDList)
+        missing = [ID for ID in IDList if ID not in records]
+
+        if missing:
+            self.stay_within_limits()
+            handle = self.__internal_efP(missing if len(missing) > 1 else missing[0])
+            if (handle == -1):
+                print("[NCBI]: Networking Error: Problem getting protein data for ID(s): {PID}".format(PID=missing))
+                return -1
+
+            try:
+                raw = RecordCache.to_bytes(handle.read())
+            except Exception:
+                return -1
+
+            fetched = RecordCache.split_gbseq_records(raw)
+            if len(fetched) != len(missing):
+                return BytesIO(raw)
+
+            fetched = dict(zip(missing, fetched))
+            self.recordCache.put_many(RecordCache.NCBI, fetched)
+            records.update(fetched)
+
+        return BytesIO(RecordCache.join_gbseq_records([records[ID] for ID in IDList]))
+
 #--------------------------------------------------------
 #
 #--------------------------------------------------------
@@ -170,9 +286,8 @@ class Networking:
 # not being used, but is kept in case we add asynchronous
 # epost based features in the future
 #
-    @timeout(TIMEOUT, -1)
     def __internal_epP(self, ProteinIDList):
-        return self.eUtilsGeneral({'function':Entrez.epost,'db':"protein", 'id':",".join(ProteinIDList)})
+        return self.eUtilsGeneral({'utility':'epost','db':"protein", 'id':",".join(ProteinIDList)})
 
     def epostProtein(self, ProteinIDList):
         self.stay_within_limits()
@@ -193,9 +308,8 @@ class Networking:
 # term 
 #
 
-    @timeout(TIMEOUT, -1)
     def __internal_esP(self, passedTerm):
-        return self.eUtilsGeneral({'function':Entrez.esearch,'db':"protein", 'term':passedTerm})
+        return self.eUtilsGeneral({'utility':'esearch','db':"protein", 'term':passedTerm})
 
     def esearchProtein(self, term):
         self.stay_within_limits()
@@ -212,38 +326,24 @@ class Networking:
 #--------------------------------------------------------
 # Generic function to make some connection to the NCBI database
 #
-# While it would make more sense to check we're staying within the
-# NCBI limits here (self.stay_within_limits()) this would mess up
-# the multithreading used for the timeout decorator, so we use
-# stay_within_limits() before we activate the timeout.
-#
-#
+# $inputDictionary holds the eUtil to call ('utility') and its parameters.
+# The tool/email/api_key identification Entrez would add is taken from
+# the Bio.Entrez module settings. Parameters are POSTed, which eUtils
+# accepts for every utility and which avoids URL length limits on long
+# ID lists.
 #
     def eUtilsGeneral(self, inputDictionary):
-        function = inputDictionary["function"]
-        
-        del inputDictionary["function"]
-        try:
-            handle = function(**inputDictionary)
-            
-        # Below we have error handlers for the various types of errors you might get
-        # Additional edge cases can be added here as necessary (think of this like
-        # an except switch/case statement
-        except (urllib.error.HTTPError) as err:
-            print("[NCBI]: HTTP error({0}): {1}".format(err.code, err.reason))
-            return -1 
-        except BadStatusLine as err:
-            print("[NCBI]: httplib error - " + str(err))
-            print("[NCBI]: This is a super rare error! Congratualtions?")
-            return -1
-        except urllib.error.URLError as err:
-            try:
-                print("[NCBI]: URLError error({0}): {1}".format(err.code, err.reason))
-            except AttributeError as err:
-                print("[NCBI]: Corrupted urllib.request.URLError raised")
-                return -1
-            return -1
-        return handle
+        utility = inputDictionary.pop("utility")
+
+        params = {'tool': Entrez.tool, 'email': Entrez.email}
+        if Entrez.api_key:
+            params['api_key'] = Entrez.api_key
+        for key, value in inputDictionary.items():
+            if isinstance(value, (list, tuple)):
+                value = ",".join(str(v) for v in value)
+            params[key] = value
+
+        return self._request('ncbi', '[NCBI]', 'POST', EUTILS_URL + utility + '.fcgi', data=params)
 
 
 
@@ -267,26 +367,13 @@ class Networking:
         queryString = baseURL+str(accessionID)+'.xml'
         
         # probably good to set some kind of limit
-        self.stay_within_limits()
+        self.stay_within_limits('uniprot')
         
         return self.__internal_UniprotNR(queryString)
     
 
-    @timeout(TIMEOUT, -1)
     def __internal_UniprotNR(self, queryString):
-        return self.__uniprotNetworkingCall(queryString)
-
-    def __uniprotNetworkingCall(self, queryString):
-        try:
-            handle = urllib.request.urlopen(queryString)
-        except urllib.error.URLError as err:
-            try:
-                print("[UniProt]: URLError error({0}): {1}".format(err.code, err.reason))
-            except AttributeError as err:
-                print("Corrupted urllib.error.URLError raised")
-                return -1
-            return -1
-        return handle
+        return self._request('uniprot', '[UniProt]', 'GET', queryString)
 
 
     def UniProtIsoformNetworkRequest(self, accessionID):
@@ -294,7 +381,7 @@ class Networking:
         queryString = baseURL+str(accessionID)+'.fasta'
         
         # probably good to set some kind of limit
-        self.stay_within_limits()
+        self.stay_within_limits('uniprot')
         
         return self.__internal_UniprotNR(queryString)
 
@@ -304,7 +391,7 @@ class Networking:
         # imitate a file and avoid fileIO bottle neck
 
         try:
-            r = requests.post('http://www.uniprot.org/batch/', files={'file':StringIO(' '.join(accessionList))}, params={'format':returnFormat})
+            r = self._send('uniprot', 'POST', 'http://www.uniprot.org/batch/', files={'file':StringIO(' '.join(accessionList))}, params={'format':returnFormat}, timeout=self.deadline)
         except:
             print("[UNIPROT]: Networking error when batch querying UniProt for isoforms")
             return -1
@@ -321,7 +408,11 @@ class Networking:
             t = int(r.headers['Retry-After'])
             print('[UNIPROT] Initial batch request failed. Waiting and retrying (' + str(retrycounter+1)+" of 3)") 
             time.sleep(t)
-            r = requests.get(r.url)
+            try:
+                r = self._send('uniprot', 'GET', r.url, timeout=self.deadline)
+            except (requests.RequestException, FetchError):
+                print("[UNIPROT]: Networking error when batch querying UniProt for isoforms")
+                return -1
             retrycounter = retrycounter+1
 
         return r.text
@@ -334,19 +425,8 @@ class Networking:
 ## PFAM NETWORKING FUNCTIONS
 ###############################################################################################
 
-    @timeout(TIMEOUT, -1)
     def __internal_PfamNR(self, queryString):
-        
-        try:
-            handle = urllib.request.urlopen(queryString)
-        except urllib.error.URLError as err:
-            try:
-                print("[Pfam]: URLError error({0}): {1}".format(err.code, err.reason))
-            except AttributeError as err:
-                print("Corrupted urllib.error.URLError raised")
-                return -1
-            return -1
-        return handle
+        return self._request('pfam', '[Pfam]', 'GET', queryString)
        
 
     def PfamNetworkRequest(self, accessionID, limit=True):
@@ -354,7 +434,7 @@ class Networking:
         queryString = baseURL+str(accessionID)
         
         # probably good to set some kind of limit
-        self.stay_within_limits()
+        self.stay_within_limits('pfam')
         
         return self.__internal_PfamNR(queryString)
 
@@ -23,10 +23,10 @@ class BadXMLException(Exception):
 
 class GeneralRequestParser:
     
-    def __init__(self, email, cache, retry=0, loud=True):
+    def __init__(self, email, cache, retry=0, loud=True, recordCache=None, fetchScheduler=None):
         try:
             Entrez.email = email
-            self.Networking = Networking.Networking(30)
+            self.Networking = Networking.Networking(30, recordCache, fetchScheduler)
             self.loud = loud
             self.retry = retry
             self.cache = cache
@@ -42,15 +42,15 @@ class ProteinRequestParser(GRP.GeneralRequestParser):
 # Initialization function, set Entrez.email for calls, an ensure key -1 is set
 # to a non-existant object
 #
-    def __init__(self, email, cache, retry=0, loud=True, shortcut=True):
+    def __init__(self, email, cache, retry=0, loud=True, shortcut=True, recordCache=None, fetchScheduler=None):
         """"Initializes an empty requestParser object, setting the Entrez.email field and defining how many times network errors should be retried"""
         try:
-            GRP.GeneralRequestParser.__init__(self, email, cache, retry, loud)
+            GRP.GeneralRequestParser.__init__(self, email, cache, retry, loud, recordCache, fetchScheduler)
         
             self.protein_datastore = {-1 : ProteinObject.ProteinObject(-1, [])}
             self.protein_translationMap = {-1: --1}
             self.batchableFunctions = [self.get_sequence, self.get_protein_name, self.get_variants, self.get_geneID, self.get_protein_sequence_length]
-            self.UniprotAPI = UniprotAPI.UniprotAPI()
+            self.UniprotAPI = UniprotAPI.UniprotAPI(recordCache, fetchScheduler)
             
             self.shortcut = shortcut
             self.error_status = False
@@ -0,0 +1,294 @@
+# Persistent on-disk cache of raw protein records  (private)
+#
+# Stores the raw XML of individual UniProt entries and NCBI GBSeq records
+# in a single SQLite file so that every worker process on a machine shares
+# the records any of them has already downloaded. Records are keyed by
+# (source, accession, release); bumping the release label configured for
+# a source invalidates everything fetched under the old label.
+#
+# SQLite runs in WAL mode so any number of readers proceed concurrently
+# with a single writer. Every cache operation is best effort - if the file
+# is locked, corrupt or unwritable the caller simply falls through to the
+# network as if the cache were empty.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger('ptmscout')
+
+UNIPROT = 'uniprot'
+UNIPROT_ISOFORMS = 'uniprot-isoforms'
+# accessions UniProt rejected or did not return, stored with empty data
+UNIPROT_MISSING = 'uniprot-missing'
+NCBI = 'ncbi'
+
+# Records never nest, so a non-greedy match over the raw bytes splits a
+# batch response into its records without building a DOM
+UNIPROT_ENTRY_RE = re.compile(rb'<entry[\s>].*?</entry>', re.DOTALL)
+UNIPROT_ACCESSION_RE = re.compile(rb'<accession>([^<]+)</accession>')
+GBSEQ_RE = re.compile(rb'<GBSeq>.*?</GBSeq>', re.DOTALL)
+
+UNIPROT_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n<uniprot xmlns="http://uniprot.org/uniprot">\n'
+UNIPROT_FOOTER = b'\n</uniprot>\n'
+GBSET_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n' \
+    b'<!DOCTYPE GBSet PUBLIC "-//NCBI//NCBI GBSeq/EN" "https://www.ncbi.nlm.nih.gov/dtd/NCBI_GBSeq.dtd">\n<GBSet>\n'
+GBSET_FOOTER = b'\n</GBSet>\n'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    source TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    release TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (source, accession, release)
+);
+CREATE INDEX IF NOT EXISTS records_accessed ON records (accessed);
+CREATE INDEX IF NOT EXISTS records_fetched ON records (fetched);
+"""
+
+# SQLite limits the number of host parameters in one statement
+MAX_QUERY_PARAMETERS = 500
+
+# besides every evict_interval seconds, a process evicts once it has written
+# this fraction of max_bytes since its last eviction
+EVICT_WRITE_FRACTION = 0.05
+
+
+
+#########################################################
+#########################################################
+# Helpers for splitting and re-assembling batch responses
+#
+
+def to_bytes(data):
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return data
+
+def split_uniprot_entries(xml):
+    """ Return a list of (accessions, entry_xml) tuples for every <entry>
+        in a UniProt XML document. accessions are upper case, primary first.
+    """
+    entries = []
+    for match in UNIPROT_ENTRY_RE.finditer(to_bytes(xml)):
+        entry = match.group(0)
+        accessions = [ a.decode('utf-8').strip().upper() for a in UNIPROT_ACCESSION_RE.findall(entry) ]
+        entries.append((accessions, entry))
+    return entries
+
+def split_gbseq_records(xml):
+    """ Return the raw <GBSeq> records of an NCBI GBSet document, in order """
+    return GBSEQ_RE.findall(to_bytes(xml))
+
+def join_uniprot_entries(entries):
+    return UNIPROT_HEADER + b'\n'.join(entries) + UNIPROT_FOOTER
+
+def join_gbseq_records(records):
+    return GBSET_HEADER + b'\n'.join(records) + GBSET_FOOTER
+
+
+
+#########################################################
+#########################################################
+# Main cache class
+#
+class RecordCache:
+
+    def __init__(self, path, ttl, max_bytes, releases=None, evict_interval=300):
+        """ path            SQLite file to use, created along with its directory if missing
+            ttl             Seconds a record is served before it is refetched
+            max_bytes       Total record size above which the least recently used
+                            records are evicted
+            releases        Optional {source: release label} map. Records are only
+                            served for the label currently configured for their source
+            evict_interval  Seconds between the evictions a process runs after
+                            its writes. Eviction scans the whole table, so it is
+                            not run on every put
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.releases = releases or {}
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._connections_pid = None
+        self._evict_lock = threading.Lock()
+        self._last_evict = None
+        self._written_since_evict = 0
+
+#--------------------------------------------------------
+# PRIVATE FUNCTION
+#--------------------------------------------------------
+# One connection per thread and per process; connections must not be
+# shared across a fork (Celery prefork workers), so the pid is checked
+#
+    def _connection(self):
+        pid = os.getpid()
+        if self._connections_pid != pid:
+            self._local = threading.local()
+            self._connections_pid = pid
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _release(self, source):
+        return str(self.releases.get(source, ''))
+
+#--------------------------------------------------------
+# PUBLIC FUNCTION
+#--------------------------------------------------------
+# Return {accession: raw record bytes} for those of $accessions
+# which are cached and have not expired. Accessions are matched
+# case insensitively and returned in the case they were given
+#
+    def get_many(self, source, accessions):
+        keys = {}
+        for acc in accessions:
+            keys.setdefault(str(acc).upper(), []).append(acc)
+        if not keys:
+            return {}
+
+        now = time.time()
+        release = self._release(source)
+        found = {}
+        try:
+            conn = self._connection()
+            upper = list(keys)
+            for i in range(0, len(upper), MAX_QUERY_PARAMETERS):
+                chunk = upper[i:i+MAX_QUERY_PARAMETERS]
+                rows = conn.execute(
+                    'SELECT accession, data FROM records WHERE source=? AND release=? AND fetched>? AND accession IN (%s)'
+                    % ','.join('?' * len(chunk)),
+                    [source, release, now - self.ttl] + chunk).fetchall()
+                for acc, data in rows:
+                    for requested in keys[acc]:
+                        found[requested] = bytes(data)
+
+            if found:
+                self._touch(conn, source, release, [ str(a).upper() for a in found ], now)
+        except sqlite3.Error as e:
+            log.warning("Record cache lookup failed (%s), falling back to network", e)
+            return {}
+
+        log.debug("Record cache: %d of %d %s records cached", len(found), len(keys), source)
+        return found
+
+    def _touch(self, conn, source, release, accessions, now):
+        # access times only drive eviction, so skip the update rather than
+        # wait if another process holds the write lock
+        try:
+            conn.execute('PRAGMA busy_timeout=0')
+            for i in range(0, len(accessions), MAX_QUERY_PARAMETERS):
+                chunk = accessions[i:i+MAX_QUERY_PARAMETERS]
+                conn.execute(
+                    'UPDATE records SET accessed=? WHERE source=? AND release=? AND accession IN (%s)'
+                    % ','.join('?' * len(chunk)),
+                    [now, source, release] + chunk)
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.execute('PRAGMA busy_timeout=30000')
+
+#--------------------------------------------------------
+# PUBLIC FUNCTION
+#--------------------------------------------------------
+# Store {accession: raw record bytes}. Least recently used
+# records are evicted if the cache has grown too large, at most
+# every evict_interval seconds or after writing a twentieth of
+# max_bytes, whichever comes first
+#
+    def put_many(self, source, records):
+        if not records:
+            return
+
+        now = time.time()
+        release = self._release(source)
+        rows = [ (source, str(acc).upper(), release, sqlite3.Binary(to_bytes(data)), len(data), now, now)
+                 for acc, data in records.items() ]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('INSERT OR REPLACE INTO records VALUES (?,?,?,?,?,?,?)', rows)
+        except sqlite3.Error as e:
+            log.warning("Record cache store failed (%s)", e)
+            return
+
+        if self._eviction_due(now, sum( row[4] for row in rows )):
+            self.evict()
+
+    def _eviction_due(self, now, written):
+        with self._evict_lock:
+            self._written_since_evict += written
+            due = self._last_evict is None \
+                or now - self._last_evict >= self.evict_interval \
+                or self._written_since_evict >= self.max_bytes * EVICT_WRITE_FRACTION
+            if due:
+                self._last_evict = now
+                self._written_since_evict = 0
+            return due
+
+    def get(self, source, accession):
+        return self.get_many(source, [accession]).get(accession)
+
+    def put(self, source, accession, data):
+        self.put_many(source, {accession: data})
+
+#--------------------------------------------------------
+# PUBLIC FUNCTION
+#--------------------------------------------------------
+# Drop expired records and records of a configured source from
+# other releases, then evict least recently used records down to
+# 90% of max_bytes
+#
+    def evict(self):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM records WHERE fetched<=?', (time.time() - self.ttl,))
+                for source, release in self.releases.items():
+                    conn.execute('DELETE FROM records WHERE source=? AND release!=?', (source, str(release)))
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM records').fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+
+                target = total - int(self.max_bytes * 0.9)
+                freed = 0
+                stale = []
+                for source, acc, release, size in conn.execute(
+                        'SELECT source, accession, release, size FROM records ORDER BY accessed'):
+                    stale.append((source, acc, release))
+                    freed += size
+                    if freed >= target:
+                        break
+                conn.executemany('DELETE FROM records WHERE source=? AND accession=? AND release=?', stale)
+                log.info("Record cache evicted %d records (%d bytes)", len(stale), freed)
+        except sqlite3.Error as e:
+            log.warning("Record cache eviction failed (%s)", e)
+
+    def stats(self):
+        """ Return (record count, total bytes) per source """
+        conn = self._connection()
+        rows = conn.execute('SELECT source, COUNT(*), COALESCE(SUM(size), 0) FROM records GROUP BY source')
+        return dict((source, (count, size)) for source, count, size in rows)
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM records')
@@ -10,6 +10,7 @@ from xml.dom.minidom import parseString
 from proteomescout_worker.geeneus.backend import ProteinObject
 from proteomescout_worker.geeneus.backend import Networking
 from proteomescout_worker.geeneus.backend import ProteinParser
+from proteomescout_worker.geeneus.backend import RecordCache
 from io import StringIO
 from Bio import SeqIO
 import re
@@ -32,8 +33,9 @@ class UniprotAPIException(Exception):
 #
 class UniprotAPI:
 
-    def __init__(self):   
-        self.Network = Networking.Networking(40)
+    def __init__(self, recordCache=None, fetchScheduler=None):
+        self.Network = Networking.Networking(40, recordCache, fetchScheduler)
+        self.recordCache = recordCache
     
 
 #--------------------------------------------------------
@@ -144,7 +146,10 @@ class UniprotAPI:
 #
 
     def batchFetch(self, IDLIST, datastore):
-        
+
+        if self.recordCache is not None:
+            return self._cachedBatchFetch(IDLIST, datastore)
+
         entryList = self._internal_batch_fetch(IDLIST)
         
         counter = 0
@@ -153,6 +158,46 @@ class UniprotAPI:
             counter = counter+1
 
 
+#--------------------------------------------------------
+# PRIVATE FUNCTION
+#--------------------------------------------------------
+# batchFetch through the on-disk record cache. Only IDs not
+# already cached go to UniProt, and a fetched entry is only
+# cached if the ID it was requested as is one of the entry's
+# accessions (isoform suffixes aside), so a misaligned batch
+# response can never be persisted under the wrong ID
+#
+    def _cachedBatchFetch(self, IDLIST, datastore):
+
+        cached = self.recordCache.get_many(RecordCache.UNIPROT, IDLIST)
+        toFetch = [ID for ID in IDLIST if ID not in cached]
+
+        entryList = self._internal_batch_fetch(toFetch)
+
+        toCache = {}
+        fetched = {}
+        for ID, dom in zip(toFetch, entryList):
+            fetched[ID] = dom
+            if dom == -1:
+                continue
+            accessions = [ a.firstChild.data.strip().upper() for a in dom.getElementsByTagName('accession') if a.firstChild ]
+            if str(ID).upper().split('-')[0] in accessions:
+                toCache[ID] = dom.toxml('utf-8')
+        self.recordCache.put_many(RecordCache.UNIPROT, toCache)
+
+        for ID in IDLIST:
+            if ID in cached:
+                try:
+                    dom = parseString(cached[ID]).documentElement
+                except Exception:
+                    continue
+            elif ID in fetched:
+                dom = fetched[ID]
+            else:
+                continue
+            self._build_and_complete(ID, dom, datastore)
+
+
     def _internal_batch_fetch(self, IDLIST):
         if len(IDLIST) == 0:
             return []
@@ -165,7 +210,7 @@ class UniprotAPI:
             if len(IDLIST) == 1:
                 return [-1]
 
-            split = len(IDLIST)/2
+            split = len(IDLIST)//2
             
             L1 = self._internal_batch_fetch(IDLIST[:split])
             L2 = self._internal_batch_fetch(IDLIST[split:])
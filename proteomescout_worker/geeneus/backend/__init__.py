@@ -7,3 +7,4 @@ from proteomescout_worker.geeneus.backend import GeneObject
 from proteomescout_worker.geeneus.backend import GeneParser
 from proteomescout_worker.geeneus.backend import ProteinObject
 from proteomescout_worker.geeneus.backend import ProteinParser
+from proteomescout_worker.geeneus.backend import RecordCache
@@ -0,0 +1,175 @@
+from app import db
+from app.config import settings
+from collections import defaultdict
+import logging
+
+log = logging.getLogger('ptmscout')
+
+# Bulk writer for the experiment tables (MS, MS_modifications, peptide and
+# MS_data) and anything else mapped on db.Model.
+#
+# Rows are accumulated per table as plain dicts and written with
+# bulk_insert_mappings in batches instead of being created one object at a
+# time through relationship appends. A row may refer to another pending row
+# through a PendingRow in place of a foreign key value; tables are written in
+# foreign key dependency order and references are replaced by the generated
+# ids before their rows are sent.
+#
+# Generated ids are taken from the database driver without per-row round
+# trips. A batch containing rows whose id is needed (because another row
+# refers to them, or the caller asked for it) is sent as one multi-row
+# INSERT per set of columns, and the ids of its rows follow from the
+# statement's lastrowid: MySQL reports the first id the statement generated,
+# SQLite the last. A multi-row INSERT is given consecutive auto-increment
+# values (InnoDB reserves them together for an insert of a known number of
+# rows), so rows get them in the order they were added. Batches where no id
+# is needed are written with bulk_insert_mappings.
+
+# bound parameters in one multi-row INSERT, below SQLite's limit of 32766
+MAX_PARAMETERS_PER_INSERT = 30000
+
+class BulkWriteError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+    def __repr__(self):
+        return self.msg
+    def __str__(self):
+        return self.msg
+
+class PendingRow(object):
+    def __init__(self, model, values):
+        self.model = model
+        self.values = values
+        self.id = None
+        self.needs_id = False
+
+    def __repr__(self):
+        return "%s:%s" % (self.model.__tablename__, self.id if self.id is not None else 'pending')
+
+class BulkWriter(object):
+    """
+    Parameters:
+        session: SQLAlchemy session rows are written with, by default db.session
+        batch_size: rows sent per INSERT; pending rows are written once any
+            table has more (settings.bulk_write_batch_size by default)
+    """
+    def __init__(self, session=None, batch_size=None):
+        self.session = session if session is not None else db.session
+        self.batch_size = batch_size or settings.bulk_write_batch_size
+        self.pending = defaultdict(list)
+        self.updates = defaultdict(list)
+        self.written = defaultdict(int)
+
+    def add(self, model, **values):
+        """
+        Queue a row for insertion.
+
+        Parameters:
+            model: mapped class of the row (e.g. modifications.MeasuredPeptide)
+            values: column values; foreign keys may be given as the PendingRow
+                of a row that has not been written yet
+
+        Returns:
+            PendingRow whose id is set once the row has been written, if it
+            was requested with require_id or the row is referenced by another
+        """
+        row = PendingRow(model, values)
+        for value in values.values():
+            if isinstance(value, PendingRow) and value.id is None:
+                value.needs_id = True
+
+        # full tables are written before the new row is queued, so it stays
+        # pending until the next flush and require_id can still be called
+        if len(self.pending[model]) >= self.batch_size:
+            self.flush()
+        self.pending[model].append(row)
+        return row
+
+    def update(self, model, id, **values):
+        """
+        Queue new column values for an existing row, written after the
+        pending inserts with bulk_update_mappings.
+        """
+        values['id'] = id
+        rows = self.updates[model]
+        rows.append(values)
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def require_id(self, row):
+        """
+        Mark a pending row so its generated id is read back when it is
+        written. Must be called before the next flush.
+        """
+        if row.id is None:
+            row.needs_id = True
+        return row
+
+    def flush(self):
+        """
+        Write all pending rows, parents before children, then the pending
+        updates. Does not commit.
+
+        Returns:
+            number of rows written
+        """
+        order = dict( (table, i) for i, table in enumerate(db.Model.metadata.sorted_tables) )
+        models = sorted(self.pending.keys(), key=lambda model: order.get(model.__table__, len(order)))
+
+        count = 0
+        for model in models:
+            rows = self.pending.pop(model)
+            for i in range(0, len(rows), self.batch_size):
+                self.write_batch(model, rows[i:i+self.batch_size])
+            self.written[model] += len(rows)
+            count += len(rows)
+
+        for model, rows in self.updates.items():
+            for i in range(0, len(rows), self.batch_size):
+                self.session.bulk_update_mappings(model, rows[i:i+self.batch_size])
+            count += len(rows)
+        self.updates.clear()
+
+        if count:
+            log.debug("Bulk wrote %d rows: %s", count, ", ".join( "%s=%d" % (m.__tablename__, n) for m, n in self.written.items() ))
+        return count
+
+    def write_batch(self, model, rows):
+        mappings = []
+        for row in rows:
+            mapping = {}
+            for name, value in row.values.items():
+                if isinstance(value, PendingRow):
+                    if value.id is None:
+                        raise BulkWriteError("%s refers to %s, which has not been written" % (model.__tablename__, repr(value)))
+                    value = value.id
+                mapping[name] = value
+            row.values = mapping
+            mappings.append(mapping)
+
+        if not any( row.needs_id for row in rows ):
+            self.session.bulk_insert_mappings(model, mappings)
+            return
+
+        # rows leaving out different columns cannot share a VALUES list
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(sorted(row.values.keys()))].append(row)
+        for columns, group in groups.items():
+            per_insert = max(1, MAX_PARAMETERS_PER_INSERT // max(1, len(columns)))
+            for i in range(0, len(group), per_insert):
+                self.insert_with_ids(model, group[i:i+per_insert])
+
+    def insert_with_ids(self, model, rows):
+        conn = self.session.connection(mapper=model.__mapper__)
+        result = conn.execute(model.__table__.insert().values([ row.values for row in rows ]))
+
+        if result.rowcount != len(rows) or not result.lastrowid:
+            raise BulkWriteError("Unable to resolve ids of %d new %s rows" % (len(rows), model.__tablename__))
+
+        if conn.dialect.name == 'sqlite':
+            first = result.lastrowid - len(rows) + 1
+        else:
+            first = result.lastrowid
+        for i, row in enumerate(rows):
+            row.id = first + i
@@ -1,15 +1,19 @@
 from Bio import Entrez, pairwise2
 from app.config import settings
+from app.utils import fetch_scheduler
 from Bio import Medline
-from proteomescout_worker.helpers import pfam_tools, upload_helpers
+from proteomescout_worker.helpers import pfam_tools, upload_helpers, record_cache
 from proteomescout_worker.geeneus import Proteome
 import logging
+import io
 import re
 #from Bio.SubsMat import MatrixInfo
 from Bio.Align import substitution_matrices
 
 log = logging.getLogger('ptmscout')
 
+EUTILS_URL = 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/'
+
 class EntrezError(Exception):
     def __init__(self):
         pass
@@ -19,9 +23,29 @@ class EntrezError(Exception):
 
 
 
+def eutils_request(utility, **params):
+    """
+    Call an NCBI eUtility (e.g. 'efetch') through the fetch scheduler, which
+    applies the NCBI rate limit and retries, rather than through Bio.Entrez.
+
+    Returns:
+        the requests.Response, checked for HTTP errors
+    """
+    params['tool'] = Entrez.tool
+    params['email'] = settings.adminEmail
+    if Entrez.api_key:
+        params['api_key'] = Entrez.api_key
+
+    response = fetch_scheduler.get_scheduler().post('ncbi', EUTILS_URL + utility + '.fcgi', data=params)
+    response.raise_for_status()
+    return response
+
+# parsed XML result of an eUtility call
+def eutils_read(utility, **params):
+    return Entrez.read(io.BytesIO(eutils_request(utility, **params).content))
+
 def get_pubmed_record_by_id(pmid):
-    Entrez.email = settings.adminEmail
-    handle = Entrez.efetch(db="pubmed",id=pmid,rettype="medline",retmode="text")
+    handle = io.StringIO(eutils_request('efetch', db="pubmed", id=pmid, rettype="medline", retmode="text").text)
     records = Medline.parse(handle)
     
     rec_arr = []
@@ -36,25 +60,61 @@ def get_pubmed_record_by_id(pmid):
     return rval
 
 
-def get_taxonomic_lineage(species):
-    Entrez.email = settings.adminEmail
-    query_species = species.replace(" ", "+").strip()
-    search = Entrez.esearch(term = query_species, db="taxonomy", retmode = "xml")
-    record = Entrez.read(search)
-
-    if len(record['IdList']) == 0:
-        raise upload_helpers.TaxonError(species)
+def fetch_taxonomy_records(taxids):
+    return eutils_read('efetch', id=",".join(str(t) for t in taxids), db="taxonomy", retmode="xml")
+
+def lineage_from_record(record):
+    lineage = [ ( item['ScientificName'], int(item['TaxId']) ) for item in record['LineageEx'] ]
+    return lineage + [ (record['ScientificName'], int(record['TaxId'])) ]
+
+def get_taxonomic_lineages(species_list):
+    """
+    Look up the lineages of several species with as few Entrez calls as
+    possible: one esearch and one efetch for all names that are NCBI
+    scientific names, then one esearch per remaining name (e.g. UniProt's
+    "Species (strain X)" form) and a single efetch for all of those.
+
+    Returns:
+        dict mapping each species found to its lineage, a list of
+        (scientific name, taxon id) tuples from the root down
+    """
+    species_list = list(dict.fromkeys(species_list))
+    if not species_list:
+        return {}
+
+    lineages = {}
+
+    term = " OR ".join( '"%s"[Scientific Name]' % (species.strip()) for species in species_list )
+    record = eutils_read('esearch', term=term, db="taxonomy", retmode="xml", retmax=len(species_list) * 2)
+    if record['IdList']:
+        by_name = dict( (r['ScientificName'].lower(), r) for r in fetch_taxonomy_records(record['IdList']) )
+        for species in species_list:
+            if species.strip().lower() in by_name:
+                lineages[species] = lineage_from_record(by_name[species.strip().lower()])
+
+    taxids = {}
+    for species in species_list:
+        if species in lineages:
+            continue
+        record = eutils_read('esearch', term=species.replace(" ", "+").strip(), db="taxonomy", retmode="xml")
+        if len(record['IdList']) > 0:
+            taxids[species] = record['IdList'][0]
+
+    if taxids:
+        by_id = dict( (r['TaxId'], r) for r in fetch_taxonomy_records(list(set(taxids.values()))) )
+        for species, taxid in taxids.items():
+            if taxid in by_id:
+                lineages[species] = lineage_from_record(by_id[taxid])
+
+    return lineages
 
-    taxid = record['IdList'][0]
-    search = Entrez.efetch(id = taxid, db="taxonomy", retmode = "xml")
-    records = Entrez.read(search)
+def get_taxonomic_lineage(species):
+    lineages = get_taxonomic_lineages([species])
 
-    if len(records) == 0:
+    if species not in lineages:
         raise upload_helpers.TaxonError(species)
 
-    lineage = [ ( item['ScientificName'], int(item['TaxId']) ) for item in records[0]['LineageEx'] ]
-
-    return lineage + [ (records[0]['ScientificName'], int(taxid)) ]
+    return lineages[species]
 
 def map_domain_to_sequence(seq1, domain, seq2):
     domain_seq = seq1[domain.start:domain.stop+1]
@@ -215,7 +275,9 @@ def get_alignment_scores(seq1, seq2):
     return aln_seq1.count("-"), aln_seq2.count("-") 
 
 def get_proteins_from_ncbi(accessions):
-    pm = Proteome.ProteinManager(settings.adminEmail, uniprotShortcut=False)
+    pm = Proteome.ProteinManager(settings.adminEmail, uniprotShortcut=False,
+                                 recordCache=record_cache.get_record_cache(),
+                                 fetchScheduler=fetch_scheduler.get_scheduler())
  
     query_accessions = accessions
     
@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import subprocess
+import tempfile
+
+log = logging.getLogger('ptmscout')
+
+# Local Pfam-A domain search with HMMER's hmmscan.
+#
+# Sequences are written to a FASTA file in batches and each batch is scanned
+# by its own hmmscan process against a pressed Pfam-A.hmm database; batches
+# run in parallel. Results are read from the per-domain table (--domtblout).
+#
+# Any object with a scan(sequences) method returning the same structure can
+# be used in place of HmmscanRunner (see pfam_tools.set_domain_runner).
+
+class HmmscanError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+    def __repr__(self):
+        return self.msg
+    def __str__(self):
+        return self.msg
+
+class DomainHit(object):
+    def __init__(self, accession, label, start, stop, evalue):
+        self.accession = accession
+        self.label = label
+        self.start = start
+        self.stop = stop
+        self.evalue = evalue
+
+def parse_domtblout(handle):
+    """
+    Parse an hmmscan --domtblout table.
+
+    Returns:
+        dict mapping query name to a list of DomainHit, using the envelope
+        coordinates and the independent E-value of each domain
+    """
+    hits = {}
+    for line in handle:
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = line.split()
+        hit = DomainHit(fields[1].split('.')[0], fields[0], int(fields[19]), int(fields[20]), float(fields[12]))
+        hits.setdefault(fields[3], []).append(hit)
+    return hits
+
+class HmmscanRunner(object):
+    """
+    Parameters:
+        database: pressed Pfam-A.hmm file
+        command: hmmscan executable
+        cpu: threads used by each hmmscan process
+        workers: hmmscan processes run at once
+        batch_size: sequences per hmmscan process
+        cut_ga: only report domains above the Pfam gathering threshold
+        timeout: seconds allowed for each hmmscan process
+    """
+    def __init__(self, database, command='hmmscan', cpu=1, workers=1, batch_size=50, cut_ga=True, timeout=None):
+        self.database = database
+        self.command = command
+        self.cpu = cpu
+        self.workers = workers
+        self.batch_size = batch_size
+        self.cut_ga = cut_ga
+        self.timeout = timeout
+
+    def scan(self, sequences):
+        """
+        Scan protein sequences for Pfam-A domains.
+
+        Parameters:
+            sequences: dict mapping an identifier to a protein sequence
+
+        Returns:
+            dict mapping each identifier to a list of DomainHit
+
+        Raises:
+            HmmscanError: if hmmscan could not be run or failed
+        """
+        ids = list(sequences.keys())
+        batches = [ ids[i:i+self.batch_size] for i in range(0, len(ids), self.batch_size) ]
+
+        results = dict( (seq_id, []) for seq_id in ids )
+        if not batches:
+            return results
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(batches)))) as executor:
+            for batch_hits in executor.map(lambda batch: self.scan_batch(batch, sequences), batches):
+                results.update(batch_hits)
+        return results
+
+    def scan_batch(self, batch, sequences):
+        # identifiers may contain characters hmmscan treats as separators, so
+        # sequences are named by their position in the batch
+        names = dict( ("s%d" % (i), seq_id) for i, seq_id in enumerate(batch) )
+
+        with tempfile.TemporaryDirectory(prefix='hmmscan') as tmp:
+            fasta_path = os.path.join(tmp, 'query.fasta')
+            table_path = os.path.join(tmp, 'domains.tbl')
+            with open(fasta_path, 'w') as fasta:
+                for name, seq_id in names.items():
+                    fasta.write(">%s\n%s\n" % (name, sequences[seq_id]))
+
+            args = [self.command, '--noali', '-o', os.devnull, '--domtblout', table_path, '--cpu', str(self.cpu)]
+            if self.cut_ga:
+                args.append('--cut_ga')
+            args.extend([self.database, fasta_path])
+
+            try:
+                subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=self.timeout)
+            except OSError as e:
+                raise HmmscanError("Unable to run %s: %s" % (self.command, str(e)))
+            except subprocess.TimeoutExpired:
+                raise HmmscanError("hmmscan timed out after %d seconds" % (self.timeout))
+            except subprocess.CalledProcessError as e:
+                raise HmmscanError("hmmscan failed: %s" % (e.stderr.decode('utf-8', 'replace').strip()))
+
+            with open(table_path) as table:
+                hits = parse_domtblout(table)
+
+        log.debug("hmmscan found domains in %d of %d sequences", len(hits), len(batch))
+        return dict( (names[name], hits.get(name, [])) for name in names )
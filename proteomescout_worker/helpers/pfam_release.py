@@ -0,0 +1,131 @@
+from app import db
+from app.database import pfam, uniprot
+import gzip
+import logging
+
+# returns a reference to the ptmscout logger object
+log = logging.getLogger('ptmscout')
+
+# Offline loader for Pfam-A releases. Reads the family descriptions from
+# Pfam-A.hmm.dat(.gz) and the UniProt domain assignments from
+# Pfam-A.regions.uniprot.tsv(.gz) (or Pfam-A.regions.tsv) into the pfam_family
+# and pfam_region tables so pfam_tools can annotate proteins without querying
+# the Pfam web service (see settings.PFAM_MODE).
+#
+# Input is streamed and written in batches, so memory use is bounded by the
+# batch size rather than the size of the release.
+
+DEFAULT_BATCH_SIZE = 10000
+
+# column order of the regions file when it has no header line
+REGION_COLUMNS = ['pfamseq_acc', 'seq_version', 'crc64', 'md5', 'pfamA_acc', 'seq_start', 'seq_end']
+
+class ReleaseFormatError(Exception):
+    pass
+
+def open_release_file(path, mode='rt'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def strip_version(accession):
+    return accession.split('.')[0]
+
+# yields (accession, label, class) for every family in a Pfam-A.hmm.dat file
+def iter_families(handle):
+    family = {}
+    for line in handle:
+        if line.startswith('//'):
+            if 'AC' in family:
+                yield strip_version(family['AC']), family.get('ID'), family.get('TP')
+            family = {}
+        elif line.startswith('#=GF '):
+            tag = line[5:7]
+            if tag in ('ID', 'AC', 'TP'):
+                family[tag] = line[7:].strip()
+
+# yields one dict per region line of a Pfam-A regions file, keyed by the
+# names in REGION_COLUMNS
+def iter_regions(handle):
+    columns = REGION_COLUMNS
+    for i, line in enumerate(handle):
+        fields = line.rstrip('\n').split('\t')
+        if i == 0 and fields[0] == 'pfamseq_acc':
+            columns = fields
+            continue
+        if len(fields) < len(columns):
+            continue
+        yield dict(zip(columns, fields))
+
+def load_families(path, release):
+    """
+    Replace the pfam_family table with the families in a Pfam-A.hmm.dat file.
+
+    Returns:
+        number of families loaded
+    """
+    db.session.query(pfam.PfamFamily).delete(synchronize_session=False)
+
+    rows = []
+    with open_release_file(path) as handle:
+        for accession, label, class_ in iter_families(handle):
+            rows.append( {'accession': accession, 'label': label, 'class_': class_, 'release': release} )
+
+    if not rows:
+        raise ReleaseFormatError("No Pfam families found in %s" % (path))
+
+    db.session.bulk_insert_mappings(pfam.PfamFamily, rows)
+    db.session.commit()
+    log.info("Loaded %d Pfam families from release %s", len(rows), release)
+    return len(rows)
+
+def get_swissprot_accessions():
+    return set( acc for acc, in db.session.query(uniprot.SwissprotAccession.accession) )
+
+def store_regions(regions):
+    db.session.bulk_insert_mappings(pfam.PfamRegion, regions)
+    db.session.commit()
+
+def load_regions(path, release, accessions=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Replace the pfam_region table with the regions in a Pfam-A regions file.
+
+    Parameters:
+        path: Pfam-A.regions.uniprot.tsv or Pfam-A.regions.tsv, optionally gzipped
+        release: Pfam release stored with every region (e.g. '35.0')
+        accessions: optional set of UniProt accessions; regions of other
+            proteins are skipped
+        batch_size: number of regions written per transaction
+
+    Returns:
+        number of regions loaded
+    """
+    db.session.query(pfam.PfamRegion).delete(synchronize_session=False)
+    db.session.commit()
+
+    count = 0
+    batch = []
+    with open_release_file(path) as handle:
+        for region in iter_regions(handle):
+            if accessions is not None and region['pfamseq_acc'] not in accessions:
+                continue
+
+            batch.append( {'accession': region['pfamseq_acc'],
+                           'seq_version': int(region['seq_version']),
+                           'md5': region['md5'].lower(),
+                           'family_accession': strip_version(region['pfamA_acc']),
+                           'start': int(region['seq_start']),
+                           'stop': int(region['seq_end']),
+                           'release': release} )
+            if len(batch) >= batch_size:
+                store_regions(batch)
+                count += len(batch)
+                batch = []
+                log.info("Loaded %d Pfam regions", count)
+
+    if batch:
+        store_regions(batch)
+        count += len(batch)
+
+    log.info("Loaded Pfam release %s: %d regions", release, count)
+    return count
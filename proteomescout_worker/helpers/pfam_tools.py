@@ -1,14 +1,16 @@
-import urllib.request, urllib.error, urllib.parse
 import xml.dom.minidom as xml 
 import time
 from app.config import settings
 import logging
-from app.database import protein
+from app.database import protein, pfam
 from xml.parsers.expat import ExpatError
-from app.utils.decorators import rate_limit
 from app.utils import protein_utils
+from app.utils.fetch_scheduler import get_scheduler, FetchError
+from proteomescout_worker.helpers import hmmscan
+import hashlib
 import pickle
 import os
+import requests
 
 log = logging.getLogger('ptmscout')
 PFAM_DEFAULT_CUTOFF = 0.00001
@@ -25,9 +27,9 @@ class PFamError(Exception):
 def get_pfam_class(family_id):
     global pfam_family_type_map
     if pfam_family_type_map == None:
-        pfam_file = open(os.path.join(settings.ptmscout_path, settings.pfam_map_file_path),'r')
-        pfam_family_type_map = pickle.load(pfam_file)
-        pfam_file.close()
+        # the map was pickled under python 2
+        with open(os.path.join(settings.ptmscout_path, settings.pfam_map_file_path), 'rb') as pfam_file:
+            pfam_family_type_map = pickle.load(pfam_file, encoding='latin1')
 
     if family_id in pfam_family_type_map:
         return pfam_family_type_map[family_id]
@@ -135,7 +137,8 @@ TIMEOUT=10
 
 def filter_domains(domains):
     domains = [domain for domain in domains if domain.significant==1 and domain.class_ == 'Domain']
-    domains = sorted(domains, key=lambda domain: domain.p_value)
+    # regions read from a local Pfam release carry no E-value
+    domains = sorted(domains, key=lambda domain: domain.p_value if domain.p_value is not None else 0.0)
     
     used_sites = set()
     chosen_domains = []
@@ -153,28 +156,28 @@ def filter_domains(domains):
 
 PFAM_MIRRORS = ["http://pfam.xfam.org"]
 
-def wait_for_result(jobrequest):
-    job_xml = jobrequest.read()
+def wait_for_result(job_xml):
     dom = xml.parseString(job_xml)
 
     try:
         result_url = dom.getElementsByTagName('result_url')[0].childNodes[0].nodeValue
-
-        code = 202
-        started = time.clock()
-        while(code == 202):
-            if time.clock() - started > TIMEOUT:
-                raise PFamError("Request Timed Out")
-            
-            resultquery = urllib.request.urlopen(result_url)
-            code = resultquery.getcode()
-            time.sleep(INTER_QUERY_INTERVAL)
-     
-        return code, resultquery
     except IndexError:
         raise PFamError("PFam Query Failed to Create Sequence Prediction Job")
 
-@rate_limit(rate=3)
+    scheduler = get_scheduler()
+    code = 202
+    started = time.monotonic()
+    while(code == 202):
+        if time.monotonic() - started > TIMEOUT:
+            raise PFamError("Request Timed Out")
+
+        resultquery = scheduler.get('pfam', result_url)
+        code = resultquery.status_code
+        if code == 202:
+            time.sleep(INTER_QUERY_INTERVAL)
+
+    return code, resultquery
+
 def get_computed_pfam_domains(prot_seq, cutoff):
     if settings.DISABLE_PFAM:
         return []
@@ -184,47 +187,46 @@ def get_computed_pfam_domains(prot_seq, cutoff):
 
     args = {'seq':prot_seq, 'output':'xml', 'evalue':cutoff}
 
+    scheduler = get_scheduler()
     i = 0
     while i < len(PFAM_MIRRORS):
         try:
             jobrequest_url = "%s/search/sequence" % (PFAM_MIRRORS[i])
-            form_encoded_args = urllib.parse.urlencode(args.items())
-
-            jobrequest_obj = urllib.request.Request(jobrequest_url, form_encoded_args, {'Expect':''})
-            jobrequest = urllib.request.urlopen(jobrequest_obj)
+            jobrequest = scheduler.post('pfam', jobrequest_url, data=args, headers={'Expect':''})
+            jobrequest.raise_for_status()
 
-            code, resultquery = wait_for_result(jobrequest)
+            code, resultquery = wait_for_result(jobrequest.content)
 
             if code != 200:
                 raise PFamError("Got unexpected response code: %d" % (code))
 
-            xmlresult = resultquery.read()
-            parsed_pfam = PFamParser(xmlresult)
+            parsed_pfam = PFamParser(resultquery.content)
 
             return filter_domains(parsed_pfam.domains)
         except ExpatError as e:
             i += 1
             log.warning("PFAM result parsing failed: %s... (%d / %d)", str(e), i, len(PFAM_MIRRORS))
-        except urllib.HTTPError as e:
+        except (requests.HTTPError, FetchError) as e:
             i += 1
             log.warning("PFAM query failed, %s... (%d / %d)", str(e), i, len(PFAM_MIRRORS))
 
     raise PFamError("Unable to query PFam")
 
-@rate_limit(rate=10)
 def get_stored_pfam_domains(uniprot_acc, prot_sequence):
     if settings.DISABLE_PFAM:
         return []
 
+    scheduler = get_scheduler()
     i = 0
     while i < len(PFAM_MIRRORS):
         try:
             query_url = "%s/protein/%s?output=xml" % (PFAM_MIRRORS[i], uniprot_acc)
-            result = urllib.request.urlopen(query_url)
+            result = scheduler.get('pfam', query_url)
+            result.raise_for_status()
 
-            xmlresult = result.read()
+            xmlresult = result.content
 
-            if xmlresult.find('There was a system error on your last request') > -1:
+            if xmlresult.find(b'There was a system error on your last request') > -1:
                 raise PFamError("Protein record not found")
 
             parsed_pfam = PFamParser(xmlresult)
@@ -237,12 +239,24 @@ def get_stored_pfam_domains(uniprot_acc, prot_sequence):
         except ExpatError as e:
             i += 1
             log.warning("PFAM result parsing failed: %s... (%d / %d)", str(e), i, len(PFAM_MIRRORS))
-        except urllib.error.HTTPError as e:
+        except (requests.HTTPError, FetchError) as e:
             i += 1
             log.warning("PFAM query failed, %s... (%d / %d)", str(e), i, len(PFAM_MIRRORS))
 
     raise PFamError("Unable to query PFam")
 
+def add_domains(prot, domains, source, params):
+    for domain in domains:
+        dbdomain = protein.ProteinDomain()
+        dbdomain.p_value = domain.p_value
+        dbdomain.start = domain.start
+        dbdomain.stop = domain.stop
+        dbdomain.source = source
+        dbdomain.version = domain.release
+        dbdomain.label = domain.label
+        dbdomain.params = params
+        prot.domains.append(dbdomain)
+
 def parse_or_query_domains(prot, query_accession):
     domains = []
 
@@ -260,13 +274,141 @@ def parse_or_query_domains(prot, query_accession):
         source = "COMPUTED PFAM"
         params = "pval=%f" % (PFAM_DEFAULT_CUTOFF)
 
-    for domain in domains:
-        dbdomain = protein.ProteinDomain()
-        dbdomain.p_value = domain.p_value
-        dbdomain.start = domain.start
-        dbdomain.stop = domain.stop
-        dbdomain.source = source
-        dbdomain.version = domain.release
-        dbdomain.label = domain.label
-        dbdomain.params = params
-        prot.domains.append(dbdomain)
+    add_domains(prot, domains, source, params)
+
+def annotate_new_proteins(proteins, cutoff=PFAM_DEFAULT_CUTOFF):
+    """
+    Add Pfam domains to a batch of new proteins as configured by
+    settings.PFAM_MODE. Call it once per batch rather than once per protein,
+    so a local annotation looks up regions and runs hmmscan once.
+
+    Parameters:
+        proteins: list of (Protein, query accession) tuples
+    """
+    if settings.PFAM_MODE == 'local':
+        annotate_domains(proteins, cutoff)
+        return
+
+    for prot, acc in proteins:
+        parse_or_query_domains(prot, acc)
+
+
+
+#########################################################
+# Local annotation (settings.PFAM_MODE == 'local')
+#
+# Domains are taken from the Pfam-A regions loaded by pfam_release when the
+# protein's UniProt accession has regions computed on the same sequence.
+# Every other sequence is scanned locally with hmmscan, or looked up in the
+# Pfam web service if the scan cannot be run.
+
+domain_runner = None
+
+def set_domain_runner(runner):
+    """Replace the local domain search, e.g. with a stub; None restores hmmscan"""
+    global domain_runner
+    domain_runner = runner
+
+def get_domain_runner():
+    global domain_runner
+    if domain_runner is None:
+        config = dict(settings.PFAM_HMMSCAN)
+        config['database'] = os.path.join(settings.ptmscout_path, config['database'])
+        domain_runner = hmmscan.HmmscanRunner(**config)
+    return domain_runner
+
+def make_domain(accession, label, class_, start, stop, p_value, release):
+    domain = PFamDomain()
+    domain.accession = accession
+    domain.label = label
+    domain.start = start
+    domain.stop = stop
+    domain.p_value = p_value
+    domain.significant = 1
+    domain.release = release
+    domain.class_ = class_ if class_ is not None else get_pfam_class(label)
+    return domain
+
+def get_region_domains(regions, prot_sequence):
+    """
+    Returns:
+        the domains of the regions computed on prot_sequence, or None if no
+        region was computed on it. The list is empty when all of its regions
+        are families, repeats or motifs rather than domains.
+    """
+    md5 = hashlib.md5(prot_sequence.upper().encode('utf-8')).hexdigest()
+    domains = []
+    matched = False
+    for region, family in regions:
+        if region.md5 != md5:
+            continue
+        matched = True
+        label = family.label if family is not None else region.family_accession
+        class_ = family.class_ if family is not None else None
+        domains.append( make_domain(region.family_accession, label, class_, region.start, region.stop, None, region.release) )
+    return filter_domains(domains) if matched else None
+
+def get_scanned_domains(sequences, cutoff):
+    try:
+        hits = get_domain_runner().scan(sequences)
+    except hmmscan.HmmscanError as e:
+        log.warning("Local Pfam scan failed: %s", str(e))
+        raise PFamError("Unable to scan sequences for Pfam domains")
+
+    families = pfam.get_families( hit.accession for seq_hits in hits.values() for hit in seq_hits )
+
+    result = {}
+    for seq_id, seq_hits in hits.items():
+        domains = []
+        for hit in seq_hits:
+            if hit.evalue > cutoff:
+                continue
+            family = families.get(hit.accession)
+            domains.append( make_domain(hit.accession, hit.label, family.class_ if family else None,
+                                        hit.start, hit.stop, hit.evalue, settings.PFAM_RELEASE) )
+        result[seq_id] = filter_domains(domains)
+    return result
+
+def annotate_domains(proteins, cutoff=PFAM_DEFAULT_CUTOFF):
+    """
+    Add Pfam-A domains to new proteins from the local Pfam release, scanning
+    the sequences of any without stored regions in one parallel hmmscan run.
+    If hmmscan or its database is not available, those proteins are looked
+    up in the Pfam web service instead.
+
+    Parameters:
+        proteins: list of (Protein, query accession) tuples
+    """
+    if settings.DISABLE_PFAM or not proteins:
+        return
+
+    uniprot_accs = [ acc for _, acc in proteins if protein_utils.get_accession_type(acc) == 'swissprot' ]
+    regions = pfam.get_regions_by_accessions(uniprot_accs) if uniprot_accs else {}
+
+    unmatched = []
+    for prot, acc in proteins:
+        domains = get_region_domains(regions.get(acc, []), prot.sequence)
+        if domains is not None:
+            add_domains(prot, domains, "PARSED PFAM", "ALL")
+        else:
+            unmatched.append((prot, acc))
+
+    if not unmatched:
+        return
+
+    # identical sequences are only scanned once
+    sequences = dict( (prot.sequence, prot.sequence) for prot, _ in unmatched )
+    log.info("Scanning %d sequences for Pfam domains", len(sequences))
+    try:
+        scanned = get_scanned_domains(sequences, cutoff)
+    except PFamError:
+        log.warning("Querying the Pfam web service for %d proteins instead", len(unmatched))
+        for prot, acc in unmatched:
+            try:
+                parse_or_query_domains(prot, acc)
+            except PFamError as e:
+                log.warning("No Pfam domains added for '%s': %s", acc, e.msg)
+        return
+
+    for prot, _ in unmatched:
+        add_domains(prot, scanned[prot.sequence], "COMPUTED PFAM", "pval=%f" % (cutoff))
@@ -0,0 +1,39 @@
+from app.config import settings
+from proteomescout_worker.geeneus.backend import RecordCache
+import logging
+import os
+import threading
+
+# returns a reference to the ptmscout logger object
+log = logging.getLogger('ptmscout')
+
+_record_cache = None
+_record_cache_lock = threading.Lock()
+
+# returns the process wide RecordCache configured in settings, or None
+# if the cache is disabled. The SQLite file lives in the shared cache
+# directory under settings.ptmscout_path, so the web app, every worker
+# process and the maintenance scripts reuse the same records wherever they
+# were started from
+def get_record_cache():
+    global _record_cache
+
+    if settings.DISABLE_RECORD_CACHE:
+        return None
+
+    with _record_cache_lock:
+        if _record_cache is None:
+            path = os.path.join(settings.ptmscout_path, settings.cache_storage_directory, settings.record_cache_file)
+            # isoform sequences and known missing accessions are invalidated
+            # along with the canonical records
+            releases = dict(settings.record_cache_releases)
+            for source in (RecordCache.UNIPROT_ISOFORMS, RecordCache.UNIPROT_MISSING):
+                releases.setdefault(source, releases.get(RecordCache.UNIPROT, ''))
+            _record_cache = RecordCache.RecordCache(path,
+                                    ttl=settings.record_cache_expiration_time,
+                                    max_bytes=settings.record_cache_max_bytes,
+                                    releases=releases,
+                                    evict_interval=settings.record_cache_evict_interval)
+            log.debug("Using record cache %s", path)
+
+    return _record_cache
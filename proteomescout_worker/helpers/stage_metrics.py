@@ -0,0 +1,160 @@
+from app import db, instrumentation
+from app.config import settings
+from app.database import jobs
+from app.utils import fetch_scheduler
+from sqlalchemy.exc import SQLAlchemyError
+from functools import wraps
+import contextvars
+import datetime
+import inspect
+import logging
+import resource
+import threading
+import time
+
+log = logging.getLogger('ptmscout')
+
+# Per-stage timings and counters of import jobs, stored in job_stage_metrics.
+#
+# A stage (one task of the import chain) is measured with the stage_task
+# decorator, or measure_stage around part of a task. When it ends, one row is
+# written with its wall time, the number of items it processed (reported with
+# add_items), the SQL statements executed and the requests made to UniProt,
+# NCBI and Pfam through the fetch scheduler, with the time spent in each, and
+# the peak resident memory of the worker process during the stage.
+#
+# Statements are counted by app.instrumentation's statement counter and
+# requests by the fetch scheduler. Both count for the whole process,
+# including the fetch scheduler's threads, so a worker should run one stage
+# at a time (the prefork pool's default) for the counts to belong to that
+# stage.
+
+MEBIBYTE = 1024.0 * 1024.0
+EXTERNAL_SERVICES = ('uniprot', 'ncbi', 'pfam')
+
+current_stage = contextvars.ContextVar('current_stage', default=None)
+
+def resident_memory_mb():
+    """
+    Returns:
+        current resident memory of this process, or its peak so far where
+        /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / MEBIBYTE
+    except (OSError, ValueError, IndexError):
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+class MemorySampler(threading.Thread):
+    def __init__(self, interval):
+        threading.Thread.__init__(self, name='stage-memory', daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.peak = resident_memory_mb()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, resident_memory_mb())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, resident_memory_mb())
+        return self.peak
+
+
+class Stage(object):
+    def __init__(self, job_id, stage):
+        self.job_id = job_id
+        self.stage = stage
+        self.items = 0
+
+    def start(self):
+        self.started = datetime.datetime.now()
+        self.clock = time.perf_counter()
+        instrumentation.statements.start()
+        self.db_start = instrumentation.statements.snapshot()
+        self.external_start = fetch_scheduler.get_scheduler().stats()
+        self.memory = MemorySampler(settings.stage_memory_sample_interval)
+        self.memory.start()
+
+    def finish(self, status):
+        seconds = time.perf_counter() - self.clock
+        queries, db_seconds = instrumentation.statements.snapshot()
+        instrumentation.statements.stop()
+        external = fetch_scheduler.get_scheduler().stats()
+
+        values = {'job_id': self.job_id, 'stage': self.stage, 'status': status,
+                  'started': self.started, 'seconds': seconds, 'items': self.items,
+                  'db_queries': queries - self.db_start[0], 'db_seconds': db_seconds - self.db_start[1],
+                  'peak_memory_mb': self.memory.stop()}
+        for name in EXTERNAL_SERVICES:
+            calls, service_seconds = external.get(name, (0, 0.0))
+            start_calls, start_seconds = self.external_start.get(name, (0, 0.0))
+            values[name + '_calls'] = calls - start_calls
+            values[name + '_seconds'] = service_seconds - start_seconds
+
+        log.info("Job %s stage '%s' %s in %.1fs: %d items, %d queries (%.1fs), %s, peak memory %.0f MB",
+                 self.job_id, self.stage, status, seconds, self.items, values['db_queries'], values['db_seconds'],
+                 ", ".join( "%s %d (%.1fs)" % (name, values[name + '_calls'], values[name + '_seconds']) for name in EXTERNAL_SERVICES ),
+                 values['peak_memory_mb'])
+        save_stage_metric(values)
+
+def save_stage_metric(values):
+    # written on its own connection, so the row is stored whether or not the
+    # task's session commits, and a failure here does not fail the task
+    try:
+        engine = db.session.get_bind(mapper=jobs.JobStageMetric.__mapper__)
+        with engine.begin() as conn:
+            conn.execute(jobs.JobStageMetric.__table__.insert(), values)
+    except SQLAlchemyError as e:
+        log.warning("Unable to save metrics of job %s stage '%s': %s", values['job_id'], values['stage'], str(e))
+
+
+class measure_stage(object):
+    """
+    Context manager measuring one stage of a job.
+
+    Parameters:
+        job_id: id of the job the stage belongs to
+        stage: stage name, as used for Job.stage (e.g. 'query')
+    """
+    def __init__(self, job_id, stage):
+        self.stage = Stage(job_id, stage)
+
+    def __enter__(self):
+        self.stage.start()
+        self.token = current_stage.set(self.stage)
+        return self.stage
+
+    def __exit__(self, exc_type, exc, tb):
+        current_stage.reset(self.token)
+        self.stage.finish('finished' if exc_type is None else 'error')
+        return False
+
+def stage_task(stage):
+    """
+    Decorator measuring a task as one stage of the job given by its job_id
+    argument. Place it outside transaction_task, so the commit is measured.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def ttask(*args, **kwargs):
+            job_id = signature.bind(*args, **kwargs).arguments['job_id']
+            with measure_stage(job_id, stage):
+                return fn(*args, **kwargs)
+        return ttask
+    return decorator
+
+def add_items(count):
+    """
+    Add to the number of items (accessions, rows, peptides...) processed by
+    the stage being measured, if any.
+    """
+    stage = current_stage.get()
+    if stage is not None:
+        stage.items += count
@@ -3,10 +3,13 @@ import re
 import time
 import json
 import zlib
-from xml.etree import ElementTree
+import gzip
 from urllib.parse import urlparse, parse_qs, urlencode
 import requests
 from requests.adapters import HTTPAdapter, Retry
+from app.utils.fetch_scheduler import service_url
+from proteomescout_worker.geeneus.backend import RecordCache
+from proteomescout_worker.helpers import uniprot_tools
 
 
 POLLING_INTERVAL = 3
@@ -18,6 +21,10 @@ session = requests.Session()
 session.mount("https://", HTTPAdapter(max_retries=retries))
 
 
+def get(url, **kwargs):
+    return session.get(service_url("uniprot", url), **kwargs)
+
+
 def check_response(response):
     try:
         response.raise_for_status()
@@ -28,7 +35,7 @@ def check_response(response):
 
 def submit_id_mapping(from_db, to_db, ids):
     request = requests.post(
-        f"{API_URL}/idmapping/run",
+        service_url("uniprot", f"{API_URL}/idmapping/run"),
         data={"from": from_db, "to": to_db, "ids": ",".join(ids)},
     )
     check_response(request)
@@ -45,7 +52,7 @@ def get_next_link(headers):
 
 def check_id_mapping_results_ready(job_id):
     while True:
-        request = session.get(f"{API_URL}/idmapping/status/{job_id}")
+        request = get(f"{API_URL}/idmapping/status/{job_id}")
         check_response(request)
         j = request.json()
         if "jobStatus" in j:
@@ -61,7 +68,7 @@ def check_id_mapping_results_ready(job_id):
 def get_batch(batch_response, file_format, compressed):
     batch_url = get_next_link(batch_response.headers)
     while batch_url:
-        batch_response = session.get(batch_url)
+        batch_response = get(batch_url)
         batch_response.raise_for_status()
         yield decode_results(batch_response, file_format, compressed)
         batch_url = get_next_link(batch_response.headers)
@@ -81,7 +88,7 @@ def combine_batches(all_results, batch_results, file_format):
 
 def get_id_mapping_results_link(job_id):
     url = f"{API_URL}/idmapping/details/{job_id}"
-    request = session.get(url)
+    request = get(url)
     check_response(request)
     return request.json()["redirectURL"]
 
@@ -111,19 +118,13 @@ def decode_results(response, file_format, compressed):
     return response.text
 
 
-def get_xml_namespace(element):
-    m = re.match(r"\{(.*)\}", element.tag)
-    return m.groups()[0] if m else ""
-
-
 def merge_xml_results(xml_results):
-    merged_root = ElementTree.fromstring(xml_results[0])
-    for result in xml_results[1:]:
-        root = ElementTree.fromstring(result)
-        for child in root.findall("{http://uniprot.org/uniprot}entry"):
-            merged_root.insert(-1, child)
-    ElementTree.register_namespace("", get_xml_namespace(merged_root[0]))
-    return ElementTree.tostring(merged_root, encoding="utf-8", xml_declaration=True)
+    # entries are spliced together as raw text rather than parsing every page
+    # into a tree, so only the merged document itself is held in memory
+    entries = []
+    for result in xml_results:
+        entries.extend(entry for _, entry in RecordCache.split_uniprot_entries(result))
+    return RecordCache.join_uniprot_entries(entries)
 
 
 def print_progress_batches(batch_index, size, total):
@@ -131,28 +132,64 @@ def print_progress_batches(batch_index, size, total):
     print(f"Fetched: {n_fetched} / {total}")
 
 
-def get_id_mapping_results_search(url):
+def parse_results_url(url, default_size=500):
     parsed = urlparse(url)
     query = parse_qs(parsed.query)
     file_format = query["format"][0] if "format" in query else "json"
     if "size" in query:
         size = int(query["size"][0])
     else:
-        size = 500
+        size = default_size
         query["size"] = size
     compressed = (
         query["compressed"][0].lower() == "true" if "compressed" in query else False
     )
     parsed = parsed._replace(query=urlencode(query, doseq=True))
-    url = parsed.geturl()
-    request = session.get(url)
+    return parsed.geturl(), file_format, size, compressed
+
+
+def iter_id_mapping_results_search(url):
+    """
+    Lazily yield the decoded pages of a paged result set, requesting each
+    Link: rel="next" page only once the previous one has been consumed.
+    """
+    url, file_format, size, compressed = parse_results_url(url)
+    request = get(url)
     check_response(request)
-    results = decode_results(request, file_format, compressed)
     total = int(request.headers["x-total-results"])
+    yield decode_results(request, file_format, compressed)
     print_progress_batches(0, size, total)
     for i, batch in enumerate(get_batch(request, file_format, compressed), 1):
-        results = combine_batches(results, batch, file_format)
+        yield batch
         print_progress_batches(i, size, total)
+
+
+def iter_id_mapping_records(url):
+    """
+    Yield (accession, ProteinRecord) pairs for an XML result set. Each page
+    is parsed as it is downloaded and the next page is only requested once
+    the previous one has been consumed, so memory stays at one entry.
+    """
+    url, file_format, size, compressed = parse_results_url(url)
+    if file_format != "xml":
+        raise ValueError("Records can only be streamed from xml results, not %s" % file_format)
+
+    while url:
+        with get(url, stream=True) as request:
+            check_response(request)
+            request.raw.decode_content = True
+            stream = gzip.GzipFile(fileobj=request.raw) if compressed else request.raw
+            for record in uniprot_tools.iter_uniprot_records(stream):
+                yield record
+            url = get_next_link(request.headers)
+
+
+def get_id_mapping_results_search(url):
+    pages = iter_id_mapping_results_search(url)
+    results = next(pages)
+    file_format = parse_results_url(url)[1]
+    for batch in pages:
+        results = combine_batches(results, batch, file_format)
     if file_format == "xml":
         return merge_xml_results(results)
     return results
@@ -161,7 +198,7 @@ def get_id_mapping_results_search(url):
 def get_id_mapping_results_stream(url):
     if "/stream/" not in url:
         url = url.replace("/results/", "/results/stream/")
-    request = session.get(url)
+    request = get(url)
     check_response(request)
     parsed = urlparse(url)
     query = parse_qs(parsed.query)
@@ -0,0 +1,299 @@
+from app import db
+from app.database import uniprot
+from proteomescout_worker.helpers import uniprot_tools
+from proteomescout_worker.geeneus.backend import RecordCache
+from Bio import SeqIO, SwissProt
+from Bio.SeqFeature import SeqFeature
+from io import BytesIO
+import gzip
+import json
+import logging
+import re
+
+# returns a reference to the ptmscout logger object
+log = logging.getLogger('ptmscout')
+
+# Offline loader for UniProt Swiss-Prot releases. Reads uniprot_sprot.xml(.gz)
+# or uniprot_sprot.dat(.gz), and optionally uniprot_sprot_varsplic.fasta(.gz),
+# into the uniprot_swissprot tables so get_uniprot_records can resolve
+# accessions without querying UniProt (see settings.UNIPROT_LOCAL_MODE).
+#
+# Input is streamed and written in batches, so memory use is bounded by the
+# batch size rather than the size of the release.
+
+DEFAULT_BATCH_SIZE = 1000
+READ_BLOCK_SIZE = 8 * 1024 * 1024
+
+# flat file feature keys and the names used for them in UniProt XML, which
+# is what parse_features and read_variants expect
+DAT_FEATURE_TYPES = {
+    'INIT_MET': 'initiator methionine', 'SIGNAL': 'signal peptide', 'PROPEP': 'propeptide',
+    'TRANSIT': 'transit peptide', 'CHAIN': 'chain', 'PEPTIDE': 'peptide',
+    'TOPO_DOM': 'topological domain', 'TRANSMEM': 'transmembrane region', 'INTRAMEM': 'intramembrane region',
+    'DOMAIN': 'domain', 'REPEAT': 'repeat', 'CA_BIND': 'calcium-binding region', 'ZN_FING': 'zinc finger region',
+    'DNA_BIND': 'DNA-binding region', 'NP_BIND': 'nucleotide phosphate-binding region', 'REGION': 'region of interest',
+    'COILED': 'coiled-coil region', 'MOTIF': 'short sequence motif', 'COMPBIAS': 'compositionally biased region',
+    'ACT_SITE': 'active site', 'METAL': 'metal ion-binding site', 'BINDING': 'binding site', 'SITE': 'site',
+    'NON_STD': 'non-standard amino acid', 'MOD_RES': 'modified residue', 'LIPID': 'lipid moiety-binding region',
+    'CARBOHYD': 'glycosylation site', 'DISULFID': 'disulfide bond', 'CROSSLNK': 'cross-link',
+    'VAR_SEQ': 'splice variant', 'VARIANT': 'sequence variant', 'MUTAGEN': 'mutagenesis site',
+    'UNSURE': 'unsure residue', 'CONFLICT': 'sequence conflict', 'NON_CONS': 'non-consecutive residues',
+    'NON_TER': 'non-terminal residue', 'HELIX': 'helix', 'STRAND': 'strand', 'TURN': 'turn',
+}
+
+class ReleaseFormatError(Exception):
+    pass
+
+def open_release_file(path, mode='rb'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def get_release_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.xml'):
+        return 'xml'
+    if name.endswith('.dat') or name.endswith('.txt'):
+        return 'dat'
+    raise ReleaseFormatError("Unrecognized Swiss-Prot release file: %s" % (path))
+
+# yields the raw bytes of each <entry> element, reading the file in blocks
+def iter_xml_entries(handle):
+    buf = b''
+    while True:
+        block = handle.read(READ_BLOCK_SIZE)
+        buf += block
+
+        pos = 0
+        for m in RecordCache.UNIPROT_ENTRY_RE.finditer(buf):
+            yield m.group(0)
+            pos = m.end()
+        buf = buf[pos:]
+
+        if not block:
+            break
+
+# parses UniProt XML in batches of entries; Biopython's uniprot-xml reader
+# iterparses each batch, so only batch_size entries are ever held in memory
+def iter_xml_release(handle, batch_size):
+    batch = []
+    for entry in iter_xml_entries(handle):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            for xml in SeqIO.parse(BytesIO(RecordCache.join_uniprot_entries(batch)), 'uniprot-xml'):
+                yield uniprot_tools.entry_from_xml(xml)
+            batch = []
+
+    if batch:
+        for xml in SeqIO.parse(BytesIO(RecordCache.join_uniprot_entries(batch)), 'uniprot-xml'):
+            yield uniprot_tools.entry_from_xml(xml)
+
+def parse_dat_name(description):
+    m = re.search(r"Full=([^;{]+)", description)
+    if m:
+        return m.group(1).strip()
+    return description.strip()
+
+# Biopython <= 1.79 keeps the GN line as a string, later versions parse it
+# into a list of dictionaries
+def parse_dat_gene_names(gene_name):
+    if not gene_name:
+        return None, []
+
+    if isinstance(gene_name, list):
+        if not gene_name:
+            return None, []
+        names = gene_name[0]
+        return names.get('Name'), list(names.get('Synonyms', []))
+
+    primary = re.search(r"Name=([^;{]+)", gene_name)
+    synonyms = re.search(r"Synonyms=([^;]+)", gene_name)
+    primary = primary.group(1).strip() if primary else None
+    synonyms = [ re.sub(r"\s*\{.*\}", "", s).strip() for s in synonyms.group(1).split(',') ] if synonyms else []
+    return primary, synonyms
+
+# rewrites a flat file feature with the type and qualifier names of the XML
+# format, e.g. /note="R -> H (in LFS)" becomes original R, variation H,
+# description "in LFS"
+def convert_dat_feature(feature):
+    qualifiers = dict(feature.qualifiers)
+    note = qualifiers.pop('note', qualifiers.get('description', ''))
+    note = re.sub(r"\s*\{ECO:.*\}\.?$", "", note).strip()
+
+    if feature.type in ('VARIANT', 'MUTAGEN', 'CONFLICT'):
+        m = re.match(r"^([A-Z]+) -> ([A-Z]+)(?: \((.*)\))?", note)
+        if m:
+            qualifiers['original'] = m.group(1)
+            qualifiers['variation'] = m.group(2)
+            note = m.group(3) or ''
+        elif note.startswith('Missing'):
+            m = re.match(r"^Missing(?: \((.*)\))?", note)
+            note = m.group(1) or ''
+
+    if feature.id:
+        qualifiers['id'] = feature.id
+    if note:
+        qualifiers['description'] = note
+
+    return SeqFeature(feature.location, type=DAT_FEATURE_TYPES.get(feature.type, feature.type.lower()), qualifiers=qualifiers)
+
+def entry_from_dat(record):
+    features = [ convert_dat_feature(f) for f in record.features ]
+    gene, synonyms = parse_dat_gene_names(record.gene_name)
+
+    accession = record.accessions[0]
+    other_accessions = [('swissprot', accession), ('swissprot', record.entry_name)]
+    for gene_name in synonyms:
+        other_accessions.append(('gene_synonym', gene_name))
+    for acc in record.accessions:
+        rec = ('swissprot', acc)
+        if rec not in other_accessions:
+            other_accessions.append(rec)
+
+    host_organism = None
+    if record.host_organism:
+        host_organism = record.host_organism[0].strip().rstrip('.')
+
+    return {'accession': accession,
+            'name': parse_dat_name(record.description),
+            'gene': gene,
+            'locus': record.entry_name,
+            'taxonomy': list(record.organism_classification),
+            'organism': record.organism.strip().rstrip('.'),
+            'other_accessions': other_accessions,
+            'features': [ (f.type, f.name, f.start, f.stop) for f in uniprot_tools.parse_features(features) ],
+            'variants': uniprot_tools.read_variants(features),
+            'host_organism': host_organism,
+            'sequence': record.sequence.strip().upper()}
+
+def iter_dat_release(handle):
+    for record in SwissProt.parse(handle):
+        yield entry_from_dat(record)
+
+def iter_release_entries(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream entry dictionaries (see uniprot_tools.entry_from_xml) from a
+    Swiss-Prot release file in XML or flat file format, optionally gzipped.
+    """
+    if get_release_format(path) == 'xml':
+        with open_release_file(path, 'rb') as handle:
+            for entry in iter_xml_release(handle, batch_size):
+                yield entry
+    else:
+        with open_release_file(path, 'rt') as handle:
+            for entry in iter_dat_release(handle):
+                yield entry
+
+# removes previously loaded records for these primary accessions, along with
+# their sidecar rows
+def delete_records(accessions):
+    record_ids = [ rid for rid, in db.session.query(uniprot.SwissprotRecord.id)
+                        .filter(uniprot.SwissprotRecord.accession.in_(accessions)) ]
+    if not record_ids:
+        return
+
+    for model in (uniprot.SwissprotAccession, uniprot.SwissprotAnnotation, uniprot.SwissprotIsoform):
+        db.session.query(model).filter(model.record_id.in_(record_ids)).delete(synchronize_session=False)
+    db.session.query(uniprot.SwissprotRecord).filter(uniprot.SwissprotRecord.id.in_(record_ids)).delete(synchronize_session=False)
+
+def store_entries(entries, release, record_ids):
+    delete_records([ e['accession'] for e in entries ])
+
+    species = [ uniprot_tools.get_scientific_name(e['organism']) for e in entries ]
+    records = [ uniprot.SwissprotRecord(e['name'][:150], e['accession'], e['locus'][:30], sp[:100], e['sequence'])
+                    for e, sp in zip(entries, species) ]
+    db.session.add_all(records)
+    db.session.flush()
+
+    accession_rows = []
+    annotation_rows = []
+    for entry, record in zip(entries, records):
+        record_ids[entry['accession']] = record.id
+        accessions = set([entry['accession']]) | set( acc for tp, acc in entry['other_accessions'] if tp == 'swissprot' and acc != entry['locus'] )
+        accession_rows.extend( {'record_id': record.id, 'accession': acc} for acc in accessions )
+        annotation_rows.append( {'record_id': record.id, 'release': release, 'data': json.dumps(entry)} )
+
+    db.session.bulk_insert_mappings(uniprot.SwissprotAccession, accession_rows)
+    db.session.bulk_insert_mappings(uniprot.SwissprotAnnotation, annotation_rows)
+    db.session.commit()
+    db.session.expunge_all()
+
+def store_isoforms(isoforms):
+    db.session.bulk_insert_mappings(uniprot.SwissprotIsoform, isoforms)
+    db.session.commit()
+
+def load_isoforms(path, record_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load isoform sequences from a uniprot_sprot_varsplic.fasta file. Isoforms
+    whose root accession was not loaded are skipped.
+
+    Parameters:
+        path: varsplic FASTA file, optionally gzipped
+        record_ids: dict mapping primary accession to uniprot_swissprot.id
+
+    Returns:
+        number of isoforms stored
+    """
+    count = 0
+    batch = []
+    with open_release_file(path, 'rt') as handle:
+        for record in SeqIO.parse(handle, 'fasta'):
+            full_acc = uniprot_tools.parse_name(record.id)
+            if not full_acc:
+                continue
+            root_acc, isoform_number = uniprot_tools.parse_isoform_number(full_acc)
+            if isoform_number == 0 or root_acc not in record_ids:
+                continue
+
+            name = uniprot_tools.parse_description(record.description)
+            batch.append( {'record_id': record_ids[root_acc], 'accession': full_acc, 'name': name,
+                           'number': isoform_number, 'sequence': str(record.seq).strip().upper()} )
+            if len(batch) >= batch_size:
+                store_isoforms(batch)
+                count += len(batch)
+                batch = []
+
+    if batch:
+        store_isoforms(batch)
+        count += len(batch)
+    return count
+
+def load_release(path, release, varsplic_path=None, species=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load a Swiss-Prot release into the uniprot_swissprot tables, replacing any
+    previously loaded version of the same entries.
+
+    Parameters:
+        path: uniprot_sprot.xml or uniprot_sprot.dat, optionally gzipped
+        release: release label stored with every record (e.g. '2024_01')
+        varsplic_path: optional uniprot_sprot_varsplic.fasta with isoform sequences
+        species: optional set of scientific names; other species are skipped
+        batch_size: number of entries written per transaction
+
+    Returns:
+        (number of entries loaded, number of isoforms loaded)
+    """
+    record_ids = {}
+    batch = []
+    count = 0
+    for entry in iter_release_entries(path, batch_size):
+        if species and uniprot_tools.get_scientific_name(entry['organism']) not in species:
+            continue
+
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            store_entries(batch, release, record_ids)
+            count += len(batch)
+            batch = []
+            log.info("Loaded %d Swiss-Prot entries", count)
+
+    if batch:
+        store_entries(batch, release, record_ids)
+        count += len(batch)
+
+    isoform_count = 0
+    if varsplic_path:
+        isoform_count = load_isoforms(varsplic_path, record_ids, batch_size)
+
+    log.info("Loaded Swiss-Prot release %s: %d entries, %d isoforms", release, count, isoform_count)
+    return count, isoform_count
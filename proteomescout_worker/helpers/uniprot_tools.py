@@ -1,14 +1,14 @@
 from app.config import settings
-from app.utils import crypto
-from proteomescout_worker.helpers import upload_helpers
-import urllib.parse
-import urllib.request
-import urllib.error
+from app.database import mutations, uniprot
+from app.utils.fetch_scheduler import get_scheduler, RETRY_STATUS_CODES
+from proteomescout_worker.helpers import upload_helpers, record_cache
+from proteomescout_worker.geeneus.backend import RecordCache
+import requests
 import re
 import logging
-import os
-import traceback
-import mmap
+import io
+from concurrent.futures import ThreadPoolExecutor
+import json
 from Bio import SeqIO, SeqFeature
 
 
@@ -38,24 +38,6 @@ def get_isoform_map(accs):
             
     return list(new_accs), isoform_map
 
-# invoked by get_uniprot_records
-def save_accessions(accs):
-    # os needs to be imported
-    # tmpfile = os.path.join(settings.ptmscout_scratch_space, crypto.randomString(10))
-    # ptmscout_scratch_space is a variable in settings.sample.py which we replace with its value "/tmp" here
-    # the randomString function originally located in the crypto.py file has been moved to this file, theerfore the suffix crypto is no longer needed
-    tmpfile = os.path.join(settings.ptmscout_scratch_space, crypto.randomString(10))
-    with open(tmpfile, 'w') as accfile:
-        accfile.write('\n'.join(accs))
-    return open(tmpfile)
-
-# invoked by __query_for_isoforms
-def save_fasta(fasta):
-    tmpfile = os.path.join(settings.ptmscout_scratch_space, crypto.randomString(10))
-    with open(tmpfile, 'w') as accfile:
-        accfile.write(fasta)
-    return open(tmpfile)    
-
 # invoked by __query_for_isoforms
 def parse_name(name):
     m = re.match('sp\|([A-Z0-9\-]+)\|(.*)', name)
@@ -79,17 +61,49 @@ def parse_description(desc):
 
 MAX_RECORD_PER_ISOFORM_QUERY = 20
 
-# invoked by get_protein_isoforms
-def __query_for_isoforms(root_accessions, result_map):
+# invoked by get_isoform_fasta
+# returns {root accession: FASTA text of its isoforms} for every requested
+# root, with an empty string for roots without isoforms
+def __query_for_isoforms(root_accessions):
     acc_q = '+OR+'.join([ 'accession:%s' % (k) for k in root_accessions ])
     query = uniprot_url + 'query=%s&format=fasta&include=yes' % (acc_q)
-    #result = urllib.request.urlopen(query)
-    with urllib.request.urlopen(query) as f:
-        response = f.read().decode('utf-8')
-    instream = save_fasta(response)
-    parsed_result = SeqIO.parse(instream, 'fasta')
+    result = get_scheduler().get('uniprot', query)
+    result.raise_for_status()
+
+    fasta = dict( (acc, []) for acc in root_accessions )
+    for record in re.split(r'\n(?=>)', result.text.strip()):
+        if not record.startswith('>'):
+            continue
+        # calls parse_name and parse_isoform_number
+        full_acc = parse_name(record[1:].split(None, 1)[0])
+        root_acc, isoform_number = parse_isoform_number(full_acc) if full_acc else (None, 0)
+        if isoform_number > 0 and root_acc in fasta:
+            fasta[root_acc].append(record)
+
+    return dict( (acc, '\n'.join(records)) for acc, records in fasta.items() )
+
+# invoked by get_protein_isoforms
+# isoform FASTA is kept in the record cache next to the canonical entries,
+# including the empty result for roots without isoforms
+def get_isoform_fasta(root_accessions):
+    cache = record_cache.get_record_cache()
+    fasta = {}
+    if cache:
+        fasta = dict( (acc, data.decode('utf-8')) for acc, data in cache.get_many(RecordCache.UNIPROT_ISOFORMS, root_accessions).items() )
+
+    missing = [ acc for acc in root_accessions if acc not in fasta ]
+    for i in range(0, len(missing), MAX_RECORD_PER_ISOFORM_QUERY):
+        # calls on __query_for_isoforms
+        result = __query_for_isoforms(missing[i:i+MAX_RECORD_PER_ISOFORM_QUERY])
+        fasta.update(result)
+        if cache:
+            cache.put_many(RecordCache.UNIPROT_ISOFORMS, result)
+
+    return fasta
 
-    for record in parsed_result:
+# invoked by get_protein_isoforms
+def parse_isoform_fasta(fasta, result_map):
+    for record in SeqIO.parse(io.StringIO(fasta), 'fasta'):
         # calls parse_description
         name = parse_description(record.description)
         # calls parse_name
@@ -102,23 +116,12 @@ def __query_for_isoforms(root_accessions, result_map):
 
 # invoked by get_uniprot_records
 def get_protein_isoforms(root_accessions):
-    # Toggle found in settings that is useless for troubleshooting
-    # if settings.DISABLE_UNIPROT_QUERY:
-    #     return {}
-
     result_map = {}
-
-    while len(root_accessions) > 0:
-        end = min(MAX_RECORD_PER_ISOFORM_QUERY, len(root_accessions))
-        query_items = root_accessions[0:end]
-        root_accessions = root_accessions[end:]
-
-        # calls on __query_for_isoforms
-        __query_for_isoforms(query_items, result_map)
-
+    for fasta in get_isoform_fasta(root_accessions).values():
+        parse_isoform_fasta(fasta, result_map)
     return result_map
 
-# invoked by parse_xml
+# invoked by record_from_entry
 def get_scientific_name(name):
     m = re.match("^(.*) \((.*)\)$", name)
     if m != None:
@@ -133,7 +136,7 @@ def get_scientific_name(name):
 
     return name.strip()
 
-# invoked by parse_xml
+# invoked by entry_from_xml
 # returns a list of dictionaries with information regarding mutations
 def read_variants(features):
     variant_list = []
@@ -180,7 +183,7 @@ def parse_location(location):
         return location.start.real + 1, location.end.real
 
 # VERY IMPORTANT
-# invoked by parse_xml
+# invoked by entry_from_xml
 def parse_features(features):
     ignored_features = set(['chain', 'modified residue', 'splice variant', 'mutagenesis site', 'sequence conflict', 'sequence variant', 'glycosylation site' ])
     parsed = []
@@ -201,25 +204,35 @@ def parse_features(features):
             parsed.append(f)
     return parsed
 
-# invoked by handle_result
-def parse_xml(xml):
-    name = xml.description
-    gene = None
+# invoked by record_from_entry
+# originally in upload_helpers; keeps single residue substitutions that
+# agree with the protein sequence
+def parse_variants(acc, prot_seq, variants):
+    new_mutations = []
+
+    for mutantDict in variants:
+        # for now we're only working with single mutants, but could expand
+        # to double mutants in the future...
+        if(mutantDict['type'] == "Substitution (single)"):
+            new_mutation = mutations.Mutation(mutantDict['type'],
+                    mutantDict['location'], mutantDict['original'],
+                    mutantDict['mutant'], acc, mutantDict['notes'], None)
+
+            if not new_mutation.consistent(prot_seq):
+                log.info( "Loaded mutation does not match protein sequence (%d %s) %s -> %s" % (new_mutation.location, prot_seq[new_mutation.location-1], new_mutation.original, new_mutation.mutant) )
+            else:
+                new_mutations.append(new_mutation)
 
-    # calls parse_features
-    features = parse_features(xml.features)
+    return new_mutations
 
+# invoked by parse_xml and uniprot_release
+# reduces a Biopython 'uniprot-xml' record to a plain, JSON serializable
+# dictionary holding everything needed to build a ProteinRecord
+def entry_from_xml(xml):
+    gene = None
     if 'gene_name_primary' in xml.annotations:
         gene = xml.annotations['gene_name_primary']
 
-    locus = xml.name
-    taxons = [ t.lower() for t in xml.annotations['taxonomy'] ]
-    # calls get_scientific_name
-    species = get_scientific_name(xml.annotations['organism'])
-#    taxon_id = None
-
-    taxons.append(species.lower())
-
     other_accessions = [('swissprot', xml.id), ('swissprot', xml.name)]
     if 'gene_name_synonym' in xml.annotations:
         for gene_name in xml.annotations['gene_name_synonym']:
@@ -231,53 +244,74 @@ def parse_xml(xml):
             if rec not in other_accessions:
                 other_accessions.append(rec)
 
-    seq = str(xml.seq).strip().upper()
-
-    # calls on parse_variants which was originally in upload_helpers
-    # also calls on read_variants which is native to the file
-    # check to see the result of read_variants as this is what is used to create the mutation record
-    # should be a list of dictionaries
-    variants = read_variants(xml.features)
-    # mutations = upload_helpers.parse_variants( xml.id, seq, read_variants(xml.features) )
-    mutations = parse_variants( xml.id, seq, variants )
-
     host_organism = None
-    host_organism_taxon_id = None
     if 'organism_host' in xml.annotations:
         host_organism = xml.annotations['organism_host'][0].strip()
-    
-    # calls on ProteinRecord class originally found in upload_helpers
-    pr = upload_helpers.ProteinRecord(name, gene, locus, taxons, species, None, xml.id,
-                       other_accessions, features, mutations, seq)
 
-    pr.set_host_organism(host_organism, host_organism_taxon_id)
+    # calls parse_features
+    features = [ (f.type, f.name, f.start, f.stop) for f in parse_features(xml.features) ]
+
+    return {'accession': xml.id,
+            'name': xml.description,
+            'gene': gene,
+            'locus': xml.name,
+            'taxonomy': list(xml.annotations['taxonomy']),
+            'organism': xml.annotations['organism'],
+            'other_accessions': other_accessions,
+            'features': features,
+            # calls read_variants
+            'variants': read_variants(xml.features),
+            'host_organism': host_organism,
+            'sequence': str(xml.seq).strip().upper()}
+
+# invoked by parse_xml and uniprot_release
+def record_from_entry(entry):
+    taxons = [ t.lower() for t in entry['taxonomy'] ]
+    # calls get_scientific_name
+    species = get_scientific_name(entry['organism'])
+    taxons.append(species.lower())
+
+    seq = entry['sequence']
+    features = [ upload_helpers.ProteinFeature( tp, name, start, stop, 'uniprot' ) for tp, name, start, stop in entry['features'] ]
+    other_accessions = [ tuple(acc) for acc in entry['other_accessions'] ]
 
-    return xml.id, pr
+    # calls on parse_variants, should be a list of Mutation objects
+    prot_mutations = parse_variants( entry['accession'], seq, entry['variants'] )
 
-# invoked by get_uniprot_records
-def handle_result(str_result):
-    # try:
-    #     str_result = result.read()
-    # except httplib.IncompleteRead, e:
-    #     str_result = e.partial
+    # calls on ProteinRecord class originally found in upload_helpers
+    pr = upload_helpers.ProteinRecord(entry['name'], entry['gene'], entry['locus'], taxons, species, None, entry['accession'],
+                       other_accessions, features, prot_mutations, seq)
 
-    handle = mmap.mmap(-1, len(str_result))
-    handle.write(str_result)
-    handle.seek(0)
+    pr.set_host_organism(entry['host_organism'], None)
 
-    parsed_result = SeqIO.parse(handle, 'uniprot-xml')
+    return pr
 
-    result_map = {}
-    i = 0
-    for xml in parsed_result:
+# invoked by iter_uniprot_records
+def parse_xml(xml):
+    entry = entry_from_xml(xml)
+    return entry['accession'], record_from_entry(entry)
+
+# reads a UniProt XML document from a binary file-like object one entry at a
+# time, yielding (accession, ProteinRecord) pairs as each entry is parsed.
+# The parser clears every entry element once it has been read, so memory
+# stays at one entry regardless of the size of the document
+def iter_uniprot_records(stream):
+    for xml in SeqIO.parse(stream, 'uniprot-xml'):
         try:
             # calls on parse_xml
-            acc, prot_info = parse_xml(xml)
-            result_map[acc] = prot_info
-        except Exception as e:
-            print(traceback.format_exc())
-            pass
-        i+=1
+            yield parse_xml(xml)
+        except Exception:
+            log.exception("Unable to parse UniProt entry")
+
+# invoked by query_uniprot_records
+# accepts either the raw bytes of a response or a stream to read it from
+def handle_result(result):
+    if isinstance(result, bytes):
+        result = io.BytesIO(result)
+
+    result_map = {}
+    for acc, prot_info in iter_uniprot_records(result):
+        result_map[acc] = prot_info
 
     return result_map
 
@@ -288,6 +322,10 @@ def map_isoform_results(result_map, isoform_map):
     for iso_acc in isoform_map:
         root_acc, isoform_name, iso_number, iso_seq = isoform_map[iso_acc]
 
+        # the root record itself may have failed to resolve
+        if root_acc not in result_map:
+            continue
+
         identified_isoforms = isoforms_by_root.get(root_acc, set())
         isoforms_by_root[root_acc] = identified_isoforms | set([iso_number])
 
@@ -321,65 +359,280 @@ def map_isoform_results(result_map, isoform_map):
             result_map[root] = isoform_pr
             result_map[new_isoform] = isoform_pr
 
+# file-like view of a binary stream which passes every complete raw <entry>
+# to $callback as the XML parser reads past it. Only the entry currently
+# being read is held, so responses can be cached while they are streamed
+class EntryTee(object):
+    def __init__(self, stream, callback):
+        self.stream = stream
+        self.callback = callback
+        self.buffer = b''
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if data:
+            self.buffer += data
+            end = 0
+            for match in RecordCache.UNIPROT_ENTRY_RE.finditer(self.buffer):
+                self.callback(match.group(0))
+                end = match.end()
+            self.buffer = self.buffer[end:]
+        return data
+
+CACHE_WRITE_BATCH_SIZE = 100
+
+# invoked by query_uniprot_records
+# stores streamed entries in the on-disk cache under the requested
+# accessions they list, writing every CACHE_WRITE_BATCH_SIZE entries
+class EntryCacheWriter(object):
+    def __init__(self, cache, accs):
+        self.cache = cache
+        self.requested = dict((acc.upper(), acc) for acc in accs)
+        self.pending = {}
+        self.count = 0
+
+    def __call__(self, entry):
+        for acc in RecordCache.UNIPROT_ACCESSION_RE.findall(entry):
+            acc = acc.decode('utf-8').strip().upper()
+            if acc in self.requested:
+                self.pending[self.requested[acc]] = entry
+        self.count += 1
+        if self.count % CACHE_WRITE_BATCH_SIZE == 0:
+            self.flush()
+
+    def flush(self):
+        self.cache.put_many(RecordCache.UNIPROT, self.pending)
+        self.pending = {}
+
 # invoked by get_uniprot_records
-def map_combine(r1, r2):
-    return dict(r1.items() + r2.items())
+# resolves accessions from the Swiss-Prot release loaded into the database by
+# uniprot_release.load_release, returning the same result map as a network
+# query along with the accessions that have no local record
+def get_local_records(accs):
+    root_accs, isoforms = get_isoform_map(accs)
+    records = uniprot.get_records_by_accessions(root_accs)
+
+    result_map = {}
+    isoform_map = {}
+    for acc, record in records.items():
+        if record.annotation is None:
+            continue
+        entry = json.loads(record.annotation.data)
+        result_map[entry['accession']] = record_from_entry(entry)
+
+        # isoforms are only reported for roots requested with an isoform suffix
+        if acc in isoforms:
+            for iso in record.isoforms:
+                isoform_map[iso.accession] = (entry['accession'], iso.name, iso.number, iso.sequence)
+
+    map_isoform_results(result_map, isoform_map)
+
+    found = set( acc for acc, record in records.items() if record.annotation is not None )
+    missing = [ acc for acc in accs if parse_isoform_number(acc)[0] not in found ]
+
+    log.debug("Resolved %d of %d accessions from local Swiss-Prot release", len(accs) - len(missing), len(accs))
+    return result_map, missing
+
+# parallel requests made while bisecting failed batches; the fetch scheduler's
+# UniProt concurrency limit still applies on top of this
+MAX_BISECT_WORKERS = 4
+
+# invoked by fetch_uniprot_batches
+# a single request for a batch of root accessions; streamed entries are
+# written to the record cache as they are parsed
+def fetch_uniprot_batch(query_accs, cache):
+    params = {
+    'from': 'ACC+ID',
+    'to': 'ACC',
+    'format': 'xml',
+    'query': '\n'.join(query_accs)
+    }
+
+    # the response body is parsed as it arrives rather than
+    # being read into memory first
+    with get_scheduler().post('uniprot', uniprot_batch_url, data=params, stream=True) as result:
+        result.raise_for_status()
+        result.raw.decode_content = True
+
+        stream = result.raw
+        if cache:
+            writer = EntryCacheWriter(cache, query_accs)
+            stream = EntryTee(stream, writer)
+
+        result_map = handle_result(stream)
+
+        if cache:
+            writer.flush()
+
+    return result_map
+
+# a 4xx response means something in the batch was rejected (typically a
+# malformed accession), so the batch is split. Timeouts and throttling (408,
+# and the statuses the fetch scheduler retries, such as 429) say nothing
+# about the accessions, so their batch fails instead
+def is_rejected_batch(error):
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    status = error.response.status_code
+    return 400 <= status < 500 and status != 408 and status not in RETRY_STATUS_CODES
+
+# invoked by fetch_uniprot_batches
+# returns ('ok', result_map), ('rejected', None) or ('failed', reason); the
+# fetch scheduler has already retried the request, so it is made once here
+def try_fetch_uniprot_batch(query_accs, cache):
+    try:
+        return 'ok', fetch_uniprot_batch(query_accs, cache)
+    except Exception as e:
+        if is_rejected_batch(e):
+            return 'rejected', None
+        log.warning("Uniprot query for %d accessions failed: %s", len(query_accs), str(e))
+        return 'failed', "UniProt query failed: %s" % (str(e))
+
+# invoked by query_uniprot_records
+def fetch_uniprot_batches(query_accs, cache):
+    """
+    Fetch root accessions from UniProt, isolating accessions that make UniProt
+    reject a batch by splitting rejected batches in half and fetching the
+    halves in parallel, level by level, until each rejected accession stands
+    alone.
+
+    Returns:
+        (result_map, rejected accessions, {accession: reason} for accessions
+        whose batch failed for any other reason)
+    """
+    result_map = {}
+    rejected = []
+    failed = {}
+
+    pending = [query_accs] if query_accs else []
+    # not the fetch scheduler's pool, whose workers may be running this query
+    with ThreadPoolExecutor(max_workers=MAX_BISECT_WORKERS) as executor:
+        while pending:
+            outcomes = list(executor.map(lambda batch: try_fetch_uniprot_batch(batch, cache), pending))
+
+            split = []
+            for batch, (status, value) in zip(pending, outcomes):
+                if status == 'ok':
+                    result_map.update(value)
+                elif status == 'failed':
+                    failed.update( (acc, value) for acc in batch )
+                elif len(batch) == 1:
+                    rejected.append(batch[0])
+                else:
+                    half = len(batch) // 2
+                    split.extend([batch[:half], batch[half:]])
+
+            if split:
+                log.info("Bisecting %d rejected Uniprot batches", len(split) // 2)
+            pending = split
 
-MAX_RETRIES = 5
+    return result_map, rejected, failed
+
+# keys records under every requested accession they list, so accessions
+# requested by a secondary accession resolve too
+def alias_requested_accessions(result_map, root_accs):
+    by_accession = {}
+    for pr in result_map.values():
+        for tp, acc in pr.other_accessions:
+            if tp == 'swissprot':
+                by_accession.setdefault(acc.upper(), pr)
+
+    for acc in root_accs:
+        if acc not in result_map and acc.upper() in by_accession:
+            result_map[acc] = by_accession[acc.upper()]
 
 # NEED to research what rate_limit does and whether it is necessary
 # @rate_limit(rate=3)
 def get_uniprot_records(accs):
+    result_map, _ = get_uniprot_records_with_errors(accs)
+    return result_map
+
+def get_uniprot_records_with_errors(accs):
+    """
+    Resolve UniProt accessions.
+
+    Returns:
+        (result_map, errors) where errors lists an (accession, reason) tuple
+        for every requested accession missing from result_map
+    """
     log.debug("Query: %s", str(accs))
-    if settings.DISABLE_UNIPROT_QUERY:
-        return []
+
+    # records loaded from a local Swiss-Prot release are used before querying UniProt
+    local_map = {}
+    remote_accs = accs
+    if settings.UNIPROT_LOCAL_MODE in ('first', 'only'):
+        local_map, remote_accs = get_local_records(accs)
+
+    result_map = {}
+    reasons = {}
+    if remote_accs and settings.UNIPROT_LOCAL_MODE != 'only' and not settings.DISABLE_UNIPROT_QUERY:
+        result_map, reasons = query_uniprot_records(remote_accs)
+    result_map.update(local_map)
+
+    errors = []
+    for acc in accs:
+        if acc not in result_map:
+            root_acc, _ = parse_isoform_number(acc)
+            errors.append( (acc, reasons.get(root_acc, "Accession not found in UniProt")) )
+
+    return result_map, errors
+
+# invoked by get_uniprot_records_with_errors
+# returns (result_map, {root accession: reason} for roots that could not be resolved)
+def query_uniprot_records(accs):
 
     # calls on get_isoform_map
     root_accs, isoforms = get_isoform_map(accs)
+    if not root_accs:
+        return {}, {}
 
-    i = 0
-    while i < MAX_RETRIES:
-        try:
-            try:
-                # calls on save_accessions
-                instream = save_accessions(root_accs)
-                accessions = instream.read()
-                
-                params = {
-                'from': 'ACC+ID',
-                'to': 'ACC',
-                'format': 'xml',
-                'query': accessions
-                }
-                
-                data = urllib.parse.urlencode(params)
-                data = data.encode('utf-8')
-
-                req = urllib.request.Request(uniprot_batch_url, data)
-
-                with urllib.request.urlopen(req) as f:
-                    response = f.read()
-                
-                result_map = handle_result(response)
-                # calls on get_protein_isoforms
-                isoform_map = get_protein_isoforms(list(isoforms.keys()))
-
-                # calls map_isoform_results
-                map_isoform_results(result_map, isoform_map)
-                return result_map
-            except urllib.error.HTTPError:
-                log.debug( "Failed query..." )
-                if len(accs) == 1:
-                    return {}
-                else:
-                    bisect = len(accs) / 2
-                    r1 = get_uniprot_records(accs[:bisect])
-                    r2 = get_uniprot_records(accs[bisect:])
+    reasons = {}
+    cache = record_cache.get_record_cache()
 
-                    # calls on map_combine
-                    return map_combine(r1, r2)
-        except Exception:
-            i+=1
-            log.info("Uniprot query failed (retry %d / %d)", i, MAX_RETRIES)
+    # accessions UniProt has rejected or not returned before are skipped
+    if cache:
+        for acc in cache.get_many(RecordCache.UNIPROT_MISSING, root_accs):
+            reasons[acc] = "Accession not found in UniProt"
+        root_accs = [ acc for acc in root_accs if acc not in reasons ]
+
+    # records already in the on-disk cache are not queried again
+    cached = cache.get_many(RecordCache.UNIPROT, root_accs) if cache else {}
+    query_accs = [ acc for acc in root_accs if acc not in cached ]
 
-    return {}
\ No newline at end of file
+    result_map = {}
+    if cached:
+        result_map = handle_result(RecordCache.join_uniprot_entries(list(dict.fromkeys(cached.values()))))
+
+    # isoform sequences are fetched while the main batch streams; they cannot
+    # come with it, since the XML batch (uploadlists) has no isoform option
+    # and UniProt only returns isoform sequences as FASTA
+    with ThreadPoolExecutor(max_workers=1) as isoform_executor:
+        # calls on get_protein_isoforms
+        isoform_future = isoform_executor.submit(get_protein_isoforms, [ acc for acc in isoforms if acc in root_accs ])
+
+        fetched, rejected, failed = fetch_uniprot_batches(query_accs, cache)
+        result_map.update(fetched)
+
+        try:
+            isoform_map = isoform_future.result()
+        except Exception as e:
+            log.warning("Uniprot isoform query failed: %s", str(e))
+            isoform_map = {}
+
+    alias_requested_accessions(result_map, root_accs)
+
+    # calls map_isoform_results
+    map_isoform_results(result_map, isoform_map)
+
+    # rejected accessions, and those missing from a successful response,
+    # will not resolve on a later attempt either
+    not_found = [ acc for acc in query_accs if acc not in result_map and acc not in failed ]
+    for acc in rejected:
+        reasons[acc] = "Accession rejected by UniProt"
+    for acc in not_found:
+        reasons.setdefault(acc, "Accession not found in UniProt")
+    reasons.update(failed)
+    if cache and not_found:
+        cache.put_many(RecordCache.UNIPROT_MISSING, dict( (acc, b'') for acc in not_found ))
+
+    return result_map, reasons
@@ -1,5 +1,7 @@
+from app import db
 from app.database import protein, taxonomies, modifications, experiment, gene_expression, mutations, uniprot
 from app.utils import uploadutils, protein_utils
+from proteomescout_worker.helpers import pfam_tools
 # from ptmscout.utils import uploadutils, protein_utils
 # from ptmscout.config import strings, settings
 # from ptmscout.database.modifications import NoSuchPeptide
@@ -234,53 +236,93 @@ def get_strain_or_isolate(species):
     return species, None
 
 
-def insert_taxonomic_lineage(species, strain):
+def format_species(species, strain):
+    if strain:
+        return "%s (%s)" % (species.strip(), strain.strip())
+    return species
+
+def insert_taxonomic_lineages(species_strains):
+    """
+    Add the lineages of several (species, strain) pairs to the taxonomy,
+    looking them up in one batch and inserting the missing nodes in bulk.
+
+    Returns:
+        dict mapping each (species, strain) found to its taxon node id
+    """
     from proteomescout_worker.helpers import entrez_tools
 
-    formatted_species = species
-    if strain:
-        formatted_species = "%s (%s)" % (species.strip(), strain.strip())
+    tree = taxonomies.get_taxonomy_tree()
+    formatted = dict( (format_species(species, strain), (species, strain)) for species, strain in species_strains )
+    lineages = entrez_tools.get_taxonomic_lineages(list(formatted.keys()))
+    tree.preload( txid for lineage in lineages.values() for _, txid in lineage )
+
+    node_ids = {}
+    new_nodes = {}
+    for formatted_species, lineage in lineages.items():
+        species, strain = formatted[formatted_species]
+
+        # walk up from the species until reaching a node already known
+        depth = len(lineage) - 1
+        while depth >= 0 and lineage[depth][1] not in new_nodes and not tree.is_loaded(lineage[depth][1]):
+            depth -= 1
+        if depth < 0:
+            continue
 
-    taxons = entrez_tools.get_taxonomic_lineage( formatted_species )
+        parent_id = lineage[depth][1]
+        kingdom = new_nodes[parent_id]['kingdom'] if parent_id in new_nodes else tree.kingdom(parent_id)
+        for tx, txid in lineage[depth+1:]:
+            if tx == formatted_species:
+                name, node_strain = species, strain
+            else:
+                name, node_strain = tx, None
 
-    parent_taxon = None
-    insert_taxons = []
-    while parent_taxon == None:
-        tx, txid = taxons.pop()
-        tx_node = taxonomies.getTaxonomyById(txid)
+            new_nodes[txid] = {'node_id': txid, 'parent_id': parent_id, 'name': name, 'strain': node_strain, 'kingdom': kingdom}
+            parent_id = txid
 
-        if tx_node:
-            parent_taxon = tx_node
-        else:
-            insert_taxons.insert(0, (tx, txid))
+        node_ids[(species, strain)] = parent_id
 
-    for tx, txid in insert_taxons:
-        tx_node = taxonomies.Taxonomy()
-        tx_node.parent_id = parent_taxon.node_id
-        tx_node.parent = parent_taxon
+    if new_nodes:
+        # parents are always listed before their children
+        db.session.bulk_insert_mappings(taxonomies.Taxonomy, list(new_nodes.values()))
+        db.session.flush()
+        tree.add_rows([ (n['node_id'], n['parent_id'], n['name'], n['strain'], n['kingdom']) for n in new_nodes.values() ])
+        log.info("Inserted %d taxonomy nodes for %d species", len(new_nodes), len(node_ids))
 
-        tx_node.kingdom = parent_taxon.kingdom
-        tx_node.node_id = txid
+    return node_ids
 
-        if tx == formatted_species:
-            tx_node.name = species
-            tx_node.strain = strain
+def insert_taxonomic_lineage(species, strain):
+    node_ids = insert_taxonomic_lineages([(species, strain)])
+    if (species, strain) not in node_ids:
+        raise TaxonError(format_species(species, strain))
+    return node_ids[(species, strain)]
+
+def find_taxons(species_strains):
+    """
+    Return a dict mapping each (species, strain) to its taxon node id, adding
+    the lineages of any not yet in the taxonomy. Pairs that could not be
+    found are omitted.
+    """
+    tree = taxonomies.get_taxonomy_tree()
+
+    node_ids = {}
+    missing = []
+    for species, strain in set(species_strains):
+        txid = tree.find(species, strain)
+        if txid is None:
+            missing.append((species, strain))
         else:
-            tx_node.name = tx
-            tx_node.strain = None
+            node_ids[(species, strain)] = txid
 
-        tx_node.save()
-        parent_taxon = tx_node
+    if missing:
+        node_ids.update(insert_taxonomic_lineages(missing))
 
-    return tx_node
+    return node_ids
 
 def find_taxon(species, strain):
-    tx = taxonomies.getTaxonByName(species, strain=strain)
-
-    if tx == None:
-        tx = insert_taxonomic_lineage(species, strain)
-
-#     return tx
+    node_ids = find_taxons([(species, strain)])
+    if (species, strain) not in node_ids:
+        raise TaxonError(format_species(species, strain))
+    return node_ids[(species, strain)]
 
 # def get_taxonomic_lineage(species):
 #     species, strain = get_strain_or_isolate(species)
@@ -299,22 +341,36 @@ def find_taxon(species, strain):
 
 #     return taxonomic_lineage
 
+def find_or_create_species_list(names):
+    """
+    Return a dict mapping each species name to its Species, creating any that
+    are missing with one lookup of all their lineages.
+
+    Raises:
+        ParseError: if a species does not match any taxon node
+    """
+    names = set(names)
+    species_map = taxonomies.get_species_by_names(names)
+
+    missing = [ name for name in names if name not in species_map ]
+    if missing:
+        roots = dict( (name, get_strain_or_isolate(name)) for name in missing )
+        node_ids = find_taxons(roots.values())
+
+        for name in missing:
+            if roots[name] not in node_ids:
+                raise uploadutils.ParseError(None, None, "Species: " + name + " does not match any taxon node")
+
+            sp = taxonomies.Species(name)
+            sp.taxon_id = node_ids[roots[name]]
+            db.session.add(sp)
+            species_map[name] = sp
+        db.session.flush()
+
+    return species_map
+
 def find_or_create_species(species):
-    sp = taxonomies.getSpeciesByName(species)
-    
-    if(sp == None):
-        species_root, strain = get_strain_or_isolate(species)
-        
-        try:
-            tx = find_taxon(species_root, strain)
-        except TaxonError:
-            raise uploadutils.ParseError(None, None, "Species: " + species + " does not match any taxon node")
-        
-        sp = taxonomies.Species(species)
-        sp.taxon_id = tx.node_id
-        sp.save()
-        
-    return sp
+    return find_or_create_species_list([species])[species]
 
 
 # def create_accession_for_protein(prot, other_accessions):
@@ -359,23 +415,187 @@ def create_new_protein(name, gene, locus, seq, species):
         % Need to figure out what this is %
     seq : str
         The sequence of the protein
-    species: str
-        The species of the protein
+    species: str or Species
+        The species of the protein, or its Species record
         
     Returns
     -------
     prot : Protein
         An instance of a Protein class as defined in protein.py"""
     
+    if not isinstance(species, taxonomies.Species):
+        species = find_or_create_species(species)
+
     prot = protein.Protein()
     prot.acc_gene = gene
     prot.locus = locus
     prot.name = name
     prot.sequence = seq
-    prot.species = find_or_create_species(species)
-    prot.species_id = prot.species.id
+    prot.species = species
+    prot.species_id = species.id
     return prot
 
+def find_or_create_proteins(records):
+    """
+    Finds or creates the proteins of many query results at once: existing
+    proteins are looked up by sequence and species in batches, records with
+    the same sequence and species share one new protein, and the Pfam domains
+    of all new proteins are annotated together.
+
+    Parameters
+    ----------
+    records : dict
+        Maps each query accession to its ProteinRecord
+
+    Returns
+    -------
+    proteins : dict
+        Maps each query accession to a (Protein, created) tuple
+    """
+    species_map = find_or_create_species_list( record.species for record in records.values() )
+    existing = protein.get_proteins_by_sequences( (record.sequence, record.species) for record in records.values() )
+
+    proteins = {}
+    new_proteins = []
+    created = set()
+    for acc, record in records.items():
+        key = (record.sequence, record.species)
+        if key in existing:
+            proteins[acc] = (existing[key], key in created)
+            continue
+
+        prot = create_new_protein(record.name, record.gene, record.locus, record.sequence, species_map[record.species])
+        db.session.add(prot)
+        existing[key] = prot
+        created.add(key)
+        new_proteins.append((prot, acc))
+        proteins[acc] = (prot, True)
+
+    pfam_tools.annotate_new_proteins(new_proteins)
+    db.session.flush()
+    log.info("Found or created proteins for %d accessions, %d new", len(proteins), len(new_proteins))
+    return proteins
+
+# Experiment data is written through a bulk_writer.BulkWriter: measured
+# peptides, peptides, modifications and data points are queued as rows and
+# sent in batches, and are not visible through the ORM relationships until
+# the writer has been flushed.
+
+MAX_IDS_PER_QUERY = 500
+
+def get_known_peptides(protein_ids):
+    """
+    Returns:
+        dict mapping (protein id, site position, site type) to the id of the
+        existing peptide row, for every peptide of the given proteins
+    """
+    known = {}
+    protein_ids = list(protein_ids)
+    for i in range(0, len(protein_ids), MAX_IDS_PER_QUERY):
+        query = db.session.query(modifications.Peptide.id, modifications.Peptide.protein_id, modifications.Peptide.site_pos, modifications.Peptide.site_type)\
+                    .filter(modifications.Peptide.protein_id.in_(protein_ids[i:i+MAX_IDS_PER_QUERY]))
+        for pep_id, prot_id, site_pos, site_type in query:
+            known[(prot_id, site_pos, site_type)] = pep_id
+    return known
+
+def get_peptide(writer, known, prot_id, pep_site, peptide_sequence):
+    """
+    Find or queue the peptide row for a modified site.
+
+    Parameters:
+        writer: BulkWriter new peptides are queued on
+        known: dict from get_known_peptides; queued peptides are added to it
+            so each site is only created once
+        prot_id: protein id
+        pep_site: 1-based site position
+        peptide_sequence: aligned 15-residue peptide centred on the site
+
+    Returns:
+        (peptide id or PendingRow, True if the peptide was created)
+    """
+    pep_type = peptide_sequence[7].upper()
+    key = (prot_id, pep_site, pep_type)
+
+    if key in known:
+        return known[key], False
+
+    pep = writer.add(modifications.Peptide, pep_aligned=peptide_sequence, site_pos=pep_site, site_type=pep_type, protein_id=prot_id)
+    known[key] = pep
+    return pep, True
+
+def get_experiment_modifications(exp_id):
+    """
+    Returns:
+        set of (MS id, peptide id, PTM id) for every existing peptide
+        modification of an experiment, so reloading a measured peptide does
+        not add its modifications again
+    """
+    query = db.session.query(modifications.PeptideModification.MS_id, modifications.PeptideModification.peptide_id,
+                             modifications.PeptideModification.modification_id)\
+                .join(modifications.MeasuredPeptide, modifications.MeasuredPeptide.id == modifications.PeptideModification.MS_id)\
+                .filter(modifications.MeasuredPeptide.experiment_id == exp_id)
+    return set( tuple(row) for row in query )
+
+def add_peptide_modification(writer, ms, peptide, ptm_id, known=None):
+    """
+    Queue a peptide modification of a measured peptide, unless it is in
+    known.
+
+    Parameters:
+        writer: BulkWriter the modification is queued on
+        ms: measured peptide id or PendingRow
+        peptide: peptide id or PendingRow of the same writer
+        ptm_id: PTM id
+        known: set from get_experiment_modifications; queued modifications
+            are added to it
+    """
+    key = (ms, peptide, ptm_id)
+    if known is not None:
+        if key in known:
+            return
+        known.add(key)
+    writer.add(modifications.PeptideModification, MS_id=ms, peptide_id=peptide, modification_id=ptm_id)
+
+def get_experiment_data_index(exp_id):
+    """
+    Returns:
+        dict mapping (MS id, run, type, label) to the id of every existing
+        data point of an experiment, so reloading a run updates its values
+        instead of adding new ones
+    """
+    query = db.session.query(experiment.ExperimentData.id, experiment.ExperimentData.MS_id, experiment.ExperimentData.run,
+                             experiment.ExperimentData.type, experiment.ExperimentData.label)\
+                .join(modifications.MeasuredPeptide, modifications.MeasuredPeptide.id == experiment.ExperimentData.MS_id)\
+                .filter(modifications.MeasuredPeptide.experiment_id == exp_id)
+    return dict( ((ms_id, run, tp, label), data_id) for data_id, ms_id, run, tp, label in query )
+
+def insert_run_data(writer, ms, units, series_header, run_name, series, data_index=None):
+    """
+    Queue the data points of one run of a measured peptide.
+
+    Parameters:
+        writer: BulkWriter the data points are queued on
+        ms: measured peptide id or PendingRow
+        units: units of the series labels (e.g. 'time')
+        series_header: list of (type, label) for every value in series
+        run_name: name of the run
+        series: list of values, None where no value was given
+        data_index: dict from get_experiment_data_index; points already
+            stored are updated instead of inserted
+    """
+    for i, (tp, x) in enumerate(series_header):
+        y = None
+        if series[i] != None:
+            y = float(series[i])
+
+        values = {'run': run_name, 'priority': i + 1, 'type': tp, 'units': units, 'label': x, 'value': y}
+
+        data_id = data_index.get((ms, run_name, tp, x)) if data_index else None
+        if data_id is None:
+            writer.add(experiment.ExperimentData, MS_id=ms, **values)
+        else:
+            writer.update(experiment.ExperimentData, data_id, **values)
+
 # def get_related_proteins(prot_accessions, species):
 #     related_proteins = []
 #     for p in protein.getProteinsByAccession(prot_accessions, species):
@@ -466,44 +686,6 @@ def create_new_protein(name, gene, locus, seq, species):
 #         if not prot.hasPrediction(pred.source, pred.value, pred.site_pos):
 #             prot.scansite.append(pred)
 
-# def get_peptide(prot_id, pep_site, peptide_sequence):
-#     upper_pep = peptide_sequence.upper()
-#     pep_type = upper_pep[7]
-    
-#     created = False
-#     try:
-#         pep = modifications.getPeptideBySite(pep_site, pep_type, prot_id)
-#     except NoSuchPeptide:
-#         pep = modifications.Peptide()
-#         pep.pep_aligned = peptide_sequence
-#         pep.site_pos = pep_site
-#         pep.site_type = pep_type
-#         pep.protein_id = prot_id
-#         created = True
-    
-#     return pep, created
-    
-
-# def insert_run_data(MSpeptide, line, units, series_header, run_name, series):
-#     for i in range(0, len(series_header)):
-#         tp, x = series_header[i]
-#         y = None
-#         if series[i] != None:
-#             y = float(series[i])
-
-#         data = MSpeptide.getDataElement(run_name, tp, x)
-
-#         if data == None:
-#             data = experiment.ExperimentData()
-#             MSpeptide.data.append(data)
-
-#         data.run = run_name
-#         data.priority = i + 1
-#         data.type = tp
-#         data.units = units
-#         data.label = x
-#         data.value = y
-
 # def get_series_headers(session):
 #     headers = []
 #     for col in session.get_columns('data'):
@@ -516,7 +698,8 @@ def create_new_protein(name, gene, locus, seq, species):
 
 
 
-def parse_datafile(session, nullmod=False):
+# progress, if given, is called as progress(line, total_lines) for every data row
+def parse_datafile(session, nullmod=False, progress=None):
     accessions = {}
     sites_map = {}
     mod_map = {}
@@ -557,6 +740,8 @@ def parse_datafile(session, nullmod=False):
     line=0
     for row in rows:
         line+=1
+        if progress:
+            progress(line, len(rows))
         line_errors = uploadutils.check_data_row(line, row, acc_col, pep_col, site_col, mod_col, run_col, data_cols, stddev_cols, keys, not nullmod)
 
         acc = None
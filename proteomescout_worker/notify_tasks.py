@@ -1,5 +1,5 @@
 from app import celery
-from proteomescout_worker.helpers import upload_helpers
+from proteomescout_worker.helpers import upload_helpers, stage_metrics
 from app.database import experiment, modifications, jobs
 from app.config import strings, settings
 # from app.utils import mail
@@ -45,12 +45,14 @@ def finalize_mcam_export_job(job_id):
 @upload_helpers.transaction_task
 def finalize_experiment_import(exp_id):
     exp = experiment.get_experiment_by_id(exp_id, check_ready=False, secure=False)
-    exp.job.finish()
-    exp.job.save()
+    with stage_metrics.measure_stage(exp.job_id, 'finalize'):
+        exp.job.finish()
+        exp.job.save()
 
-    peptides = modifications.countMeasuredPeptidesForExperiment(exp_id)
-    proteins = modifications.countProteinsForExperiment(exp_id)
-    exp_errors = experiment.countErrorsForExperiment(exp_id)
+        peptides = modifications.count_measured_peptides_for_experiment(exp_id)
+        proteins = modifications.count_proteins_for_experiment(exp_id)
+        exp_errors = experiment.count_errors_for_experiment(exp_id)
+        stage_metrics.add_items(peptides)
 
     error_log_url = "%s/errors" % (exp.job.result_url)
     
@@ -3,10 +3,12 @@ import logging
 from proteomescout_worker import notify_tasks
 # changed to see if celery works with the new line since we're currently not using the other modules
 # from proteomescout_worker.helpers import upload_helpers, entrez_tools, pfam_tools, picr_tools, uniprot_tools, dbsnp_tools
-from proteomescout_worker.helpers import upload_helpers, entrez_tools, uniprot_tools
+from proteomescout_worker.helpers import upload_helpers, entrez_tools, uniprot_tools, stage_metrics
 from app.database import protein, experiment
 from app.config import strings
-from app.utils import uploadutils
+from app.utils import uploadutils, fetch_scheduler
+from flask import current_app
+from concurrent.futures import as_completed
 import traceback
 from sqlalchemy.exc import DBAPIError, SQLAlchemyError
 
@@ -17,13 +19,13 @@ MAX_UNIPROT_BATCH_SIZE = 200
 
 def get_uniprot_proteins(protein_accessions):
     log.info("Getting uniprot records for %d accessions", len(protein_accessions))
-    prot_map = uniprot_tools.get_uniprot_records(protein_accessions)
+    prot_map, failures = uniprot_tools.get_uniprot_records_with_errors(protein_accessions)
 
     errors = []
-    for acc in protein_accessions:
-        if acc not in prot_map:
-            errors.append(entrez_tools.EntrezError())
-            errors[-1].acc = acc
+    for acc, reason in failures:
+        log.debug("Uniprot accession %s not loaded: %s", acc, reason)
+        errors.append(entrez_tools.EntrezError())
+        errors[-1].acc = acc
 
     return prot_map, errors
 
@@ -163,6 +165,15 @@ def log_errors(query_errors, exp_id, accessions, line_mappings):
 #     return create_missing_proteins(external_db_result, missing_proteins, accessions, line_mapping, exp_id, job_id)
 
 
+def run_in_app_context(fn, app):
+    def wrapped(*args):
+        with app.app_context():
+            return fn(*args)
+    return wrapped
+
+# UniProt and NCBI chunks are queried concurrently in the fetch scheduler's
+# threads, each service keeping to its own rate limit. Callbacks are always
+# invoked on the calling thread as chunks complete.
 def get_proteins_by_accession(accessions, start_callback, notify_callback):
     uniprot_ids, other_ids = upload_helpers.extract_uniprot_accessions(accessions.keys())
     uniprot_tasks = upload_helpers.create_chunked_tasks_preserve_groups(sorted(uniprot_ids), MAX_UNIPROT_BATCH_SIZE)
@@ -171,19 +182,24 @@ def get_proteins_by_accession(accessions, start_callback, notify_callback):
     
     start_callback(total_task_cnt)
 
-    i = 0
-    protein_map = {}
+    app = current_app._get_current_object()
+    scheduler = fetch_scheduler.get_scheduler()
+    query_uniprot = run_in_app_context(get_uniprot_proteins, app)
+    query_ncbi = run_in_app_context(entrez_tools.get_proteins_from_ncbi, app)
+
+    futures = []
     for ncbi_accessions in ncbi_tasks:
         log.info("Getting Geeneus records for %d accessions", len(ncbi_accessions))
-        result, errors = entrez_tools.get_proteins_from_ncbi(ncbi_accessions)
-        protein_map.update(result)
-
-        i+=1
-        notify_callback(i, total_task_cnt, errors)
+        futures.append(scheduler.submit(query_ncbi, ncbi_accessions))
 
     for uniprot_accessions in uniprot_tasks:
         log.info("Getting Uniprot records for %d accessions", len(uniprot_accessions))
-        result, errors = get_uniprot_proteins(uniprot_accessions)
+        futures.append(scheduler.submit(query_uniprot, uniprot_accessions))
+
+    i = 0
+    protein_map = {}
+    for future in as_completed(futures):
+        result, errors = future.result()
         protein_map.update(result)
 
         i+=1
@@ -194,8 +210,10 @@ def get_proteins_by_accession(accessions, start_callback, notify_callback):
 
 @celery.task
 @upload_helpers.notify_job_failed
+@stage_metrics.stage_task('query')
 @upload_helpers.transaction_task
 def get_proteins_from_external_databases(accessions, line_mapping, exp_id, job_id):
+    stage_metrics.add_items(len(accessions))
     def start_callback(total_task_cnt):
         notify_tasks.set_job_stage.apply_async((job_id, 'query', total_task_cnt))
     def notify_callback(i, total_task_cnt, errors):
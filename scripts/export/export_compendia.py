@@ -10,7 +10,7 @@ sys.path.append(SCRIPT_DIR)
 from scripts.app_setup import create_app
 from scripts.progressbar import ProgressBar
 from app.utils.export_proteins import *
-from app.database import protein, modifications, experiment
+from app.database import protein, modifications, experiment, taxonomies
 from app.utils.downloadutils import experiment_metadata_to_tsv, zip_package
 
 # directory variable to be imported
@@ -34,14 +34,8 @@ def check_species_filter(f, p):
     if f == p.species.name.lower():
         return True
 
-    t = p.species.taxon
-    while t != None:
-        if f == t.name.lower():
-            return True
-
-        t = t.parent
-
-    return False
+    # walks the in-memory taxonomy tree instead of loading each parent node
+    return taxonomies.get_taxonomy_tree().has_ancestor(p.species.taxon_id, f)
 
 # script
 species_filter = None
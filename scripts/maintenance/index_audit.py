@@ -0,0 +1,187 @@
+import sys
+import os
+import argparse
+import logging
+
+# Allows for the importing of modules from the proteomescout-3 app within the script
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(SCRIPT_DIR)
+
+from scripts.app_setup import create_app
+from app import db
+from app.database import modifications, protein, experiment
+from sqlalchemy import event
+
+# Runs the lookups in app/database that the import and the protein and
+# experiment pages depend on against sample rows of the configured database,
+# captures every SELECT they issue and prints its EXPLAIN plan, flagging
+# tables that are read with a full table or full index scan.
+#
+# Exits with status 1 if any scan was flagged, so it can be run after schema
+# changes. Small tables (PTM, species...) are only flagged when the estimated
+# number of rows examined reaches --min-rows.
+#
+# Example:
+#   python scripts/maintenance/index_audit.py --min-rows 1000 --verbose
+
+# MySQL access types that read a whole table or index
+FULL_SCAN_TYPES = set(['ALL', 'index'])
+
+# subquery results (MySQL <derivedN>, SQLAlchemy anon_N aliases) are scanned
+# by design; the tables they are built from are reported separately
+def is_derived_table(table):
+    return table is None or table.startswith('<') or table.startswith('anon_')
+
+class Sample(object):
+    """
+    Existing rows the audited queries are given as arguments, so the plans
+    reflect real values.
+    """
+    def __init__(self):
+        self.ms = db.session.query(modifications.MeasuredPeptide).first()
+        self.peptide = db.session.query(modifications.Peptide).first()
+        self.peptide_mod = db.session.query(modifications.PeptideModification).first()
+        self.accession = db.session.query(protein.ProteinAccession).first()
+        self.protein = db.session.query(protein.Protein).filter(protein.Protein.species_id != None).first()
+
+        if None in (self.ms, self.peptide, self.peptide_mod, self.accession, self.protein):
+            raise SystemExit("The database has no experiment data to audit")
+
+# name, function(sample)
+AUDITED_QUERIES = [
+    ('modifications.get_measured_peptide',
+        lambda s: modifications.get_measured_peptide(s.ms.experiment_id, s.ms.peptide, s.ms.protein_id)),
+    ('modifications.get_measured_peptides_by_experiment',
+        lambda s: modifications.get_measured_peptides_by_experiment(s.ms.experiment_id, secure=False, check_ready=False)),
+    ('modifications.get_measured_peptides_by_protein',
+        lambda s: modifications.get_measured_peptides_by_protein(s.ms.protein_id)),
+    ('modifications.count_measured_peptides_for_experiment',
+        lambda s: modifications.count_measured_peptides_for_experiment(s.ms.experiment_id)),
+    ('modifications.count_proteins_for_experiment',
+        lambda s: modifications.count_proteins_for_experiment(s.ms.experiment_id)),
+    ('modifications.get_peptide_by_site',
+        lambda s: modifications.get_peptide_by_site(s.peptide.site_pos, s.peptide.site_type, s.peptide.protein_id)),
+    ('modifications.get_peptide_by_id',
+        lambda s: modifications.get_peptide_by_id(s.peptide.id)),
+    ('modifications.get_experiments_reporting_modified_peptide',
+        lambda s: modifications.get_experiments_reporting_modified_peptide(s.peptide_mod, [])),
+    ('protein.get_protein_by_sequence',
+        lambda s: protein.get_protein_by_sequence(s.protein.sequence, s.protein.species.name)),
+    ('protein.get_proteins_by_sequences',
+        lambda s: protein.get_proteins_by_sequences([(s.protein.sequence, s.protein.species.name)])),
+    ('protein.get_proteins_by_accession',
+        lambda s: protein.get_proteins_by_accession(s.accession.value)),
+    ('protein.get_proteins_by_accessions',
+        lambda s: protein.get_proteins_by_accessions([s.accession.value])),
+    ('protein.get_protein_domain',
+        lambda s: protein.get_protein_domain(s.peptide.protein_id, s.peptide.site_pos)),
+    ('protein.get_proteins_by_experiment',
+        lambda s: protein.get_proteins_by_experiment(s.ms.experiment_id)),
+    ('experiment.get_experiment_by_id',
+        lambda s: experiment.get_experiment_by_id(s.ms.experiment_id, check_ready=False, secure=False)),
+    ('experiment.count_errors_for_experiment',
+        lambda s: experiment.count_errors_for_experiment(s.ms.experiment_id)),
+]
+
+def capture_statements(fn, *args):
+    """
+    Returns:
+        list of (statement, parameters) of the SELECTs executed by fn(*args)
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        fn(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+def explain(statement, parameters):
+    """
+    Returns:
+        list of (table, access type, key, estimated rows, full scan) for each
+        table read by the statement
+    """
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if db.engine.dialect.name == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            plan = []
+            for row in cursor.fetchall():
+                # e.g. "SCAN MS" or "SEARCH peptide USING INDEX ix_... (protein_id=?)"
+                words = row[-1].replace(' TABLE ', ' ').split()
+                if words[0] in ('SCAN', 'SEARCH'):
+                    plan.append((words[1], words[0], " ".join(words[2:]) or None, None, words[0] == 'SCAN'))
+            return plan
+
+        cursor.execute("EXPLAIN " + statement, parameters)
+        columns = [ c[0] for c in cursor.description ]
+        plan = []
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            plan.append((row['table'], row['type'], row['key'], row['rows'], row['type'] in FULL_SCAN_TYPES))
+        return plan
+    finally:
+        raw.close()
+
+def audit(min_rows, verbose=False):
+    """
+    Returns:
+        number of full scans flagged
+    """
+    sample = Sample()
+
+    flagged = 0
+    for name, fn in AUDITED_QUERIES:
+        try:
+            statements = capture_statements(fn, sample)
+        except Exception as e:
+            print("%s: could not be run (%s)" % (name, str(e)))
+            db.session.rollback()
+            continue
+
+        scans = []
+        for statement, parameters in statements:
+            for table, access, key, rows, full_scan in explain(statement, parameters):
+                if is_derived_table(table):
+                    continue
+                if full_scan and (rows is None or rows >= min_rows):
+                    scans.append((table, access, rows, statement))
+                elif verbose:
+                    print("%s: %s %s key=%s rows=%s" % (name, table, access, key, rows))
+
+        if not scans:
+            print("%s: ok (%d queries)" % (name, len(statements)))
+        for table, access, rows, statement in scans:
+            flagged += 1
+            print("%s: FULL SCAN of %s (type=%s, rows=%s)" % (name, table, access, rows))
+            if verbose:
+                print("    " + " ".join(statement.split()))
+
+    return flagged
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="EXPLAIN the hot lookups in app/database and flag full table scans")
+    parser.add_argument('--min-rows', type=int, default=1000,
+                        help="only flag scans estimated to examine at least this many rows (MySQL)")
+    parser.add_argument('--verbose', action='store_true', help="print every plan row and the flagged statements")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # application created within which the script can be run
+    app = create_app()
+    db.init_app(app)
+
+    with app.app_context():
+        flagged = audit(args.min_rows, args.verbose)
+        print("%d full scans flagged" % (flagged))
+        sys.exit(1 if flagged else 0)
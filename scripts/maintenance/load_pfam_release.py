@@ -0,0 +1,47 @@
+import sys
+import os
+import argparse
+import logging
+
+# Allows for the importing of modules from the proteomescout-3 app within the script
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(SCRIPT_DIR)
+
+from scripts.app_setup import create_app
+from app import db, db_routing
+from proteomescout_worker.helpers import pfam_release
+
+# Loads a downloaded Pfam-A release into the pfam_family and pfam_region tables
+# so new proteins can be annotated locally (settings.PFAM_MODE = 'local').
+# Sequences without stored regions are scanned with hmmscan against the
+# Pfam-A.hmm configured in settings.PFAM_HMMSCAN.
+#
+# Example:
+#   python scripts/maintenance/load_pfam_release.py Pfam-A.hmm.dat.gz Pfam-A.regions.uniprot.tsv.gz 35.0 --swissprot
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load a Pfam-A release for local domain annotation")
+    parser.add_argument('families_file', help="Pfam-A.hmm.dat, optionally gzipped")
+    parser.add_argument('regions_file', help="Pfam-A.regions.uniprot.tsv or Pfam-A.regions.tsv, optionally gzipped")
+    parser.add_argument('release', help="Pfam release stored with the regions, e.g. 35.0")
+    parser.add_argument('--swissprot', action='store_true',
+                        help="only load regions for accessions in the loaded Swiss-Prot release")
+    parser.add_argument('--batch-size', type=int, default=pfam_release.DEFAULT_BATCH_SIZE,
+                        help="regions written per transaction")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # application created within which the script can be run
+    app = create_app()
+    db.init_app(app)
+
+    with app.app_context():
+        db_routing.use_route(db_routing.WORKER)
+        families = pfam_release.load_families(args.families_file, args.release)
+        accessions = pfam_release.get_swissprot_accessions() if args.swissprot else None
+        regions = pfam_release.load_regions(args.regions_file, args.release,
+                                    accessions=accessions, batch_size=args.batch_size)
+        print("Loaded %d families and %d regions from Pfam release %s" % (families, regions, args.release))
@@ -0,0 +1,45 @@
+import sys
+import os
+import argparse
+import logging
+
+# Allows for the importing of modules from the proteomescout-3 app within the script
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(SCRIPT_DIR)
+
+from scripts.app_setup import create_app
+from app import db, db_routing
+from proteomescout_worker.helpers import uniprot_release
+
+# Loads a downloaded UniProt Swiss-Prot release into the uniprot_swissprot tables
+# so protein imports can resolve accessions locally (settings.UNIPROT_LOCAL_MODE).
+#
+# Example:
+#   python scripts/maintenance/load_uniprot_release.py uniprot_sprot.xml.gz 2024_01 \
+#       --varsplic uniprot_sprot_varsplic.fasta.gz --species "Homo sapiens" --species "Mus musculus"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load a UniProt Swiss-Prot release for offline protein resolution")
+    parser.add_argument('release_file', help="uniprot_sprot.xml or uniprot_sprot.dat, optionally gzipped")
+    parser.add_argument('release', help="release label stored with the records, e.g. 2024_01")
+    parser.add_argument('--varsplic', help="uniprot_sprot_varsplic.fasta with isoform sequences, optionally gzipped")
+    parser.add_argument('--species', action='append', help="only load entries for this species (repeatable)")
+    parser.add_argument('--batch-size', type=int, default=uniprot_release.DEFAULT_BATCH_SIZE,
+                        help="entries written per transaction")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # application created within which the script can be run
+    app = create_app()
+    db.init_app(app)
+
+    with app.app_context():
+        db_routing.use_route(db_routing.WORKER)
+        entries, isoforms = uniprot_release.load_release(args.release_file, args.release,
+                                    varsplic_path=args.varsplic,
+                                    species=set(args.species) if args.species else None,
+                                    batch_size=args.batch_size)
+        print("Loaded %d entries and %d isoforms from release %s" % (entries, isoforms, args.release))
@@ -20,8 +20,9 @@ sys.path.append(SCRIPT_DIR)
 from scripts.app_setup import create_app
 from scripts.progressbar import ProgressBar
 #from app.utils.export_proteins import *
-from app.database import protein, modifications, experiment
+from app.database import protein, modifications, experiment, taxonomies
 from app.utils.downloadutils import experiment_metadata_to_tsv, zip_package
+from proteomescout_worker.helpers import bulk_writer
 
 # directory variable to be imported
 OUTPUT_DIR = "scripts/output"
@@ -266,6 +267,7 @@ def update_protein_status(df, commit=True):
 
 # Processing of proteins with uniprot sequences that do not match the database sequence.
 # Function will find these, retain old protein_id to query other items, and commit with new records 
+# A protein already stored with the new sequence and species is reused rather than duplicated
 # Needs to be fed failures_df from find_peptide_alignments
 def process_sequence_changes_and_commit(df, commit=True):
     df = df.dropna()
@@ -273,7 +275,18 @@ def process_sequence_changes_and_commit(df, commit=True):
     new_protein_records = []
     df['current'] = 1 # setting the current status of the protein to 1
 
-    for index, row in df.iterrows():
+    # existing proteins with the new sequences, looked up in batches
+    species_ids = set(int(species_id) for species_id in df['species_id'])
+    species_names = dict(db.session.query(taxonomies.Species.id, taxonomies.Species.name).\
+                         filter(taxonomies.Species.id.in_(species_ids)))
+    keys = [ (row.canonical_seq, species_names[int(row.species_id)]) for row in df.itertuples(index=False) ]
+    existing = protein.get_proteins_by_sequences(keys)
+
+    for key, (index, row) in zip(keys, df.iterrows()):
+        if key in existing:
+            new_protein_records.append(existing[key])
+            continue
+
         # Step 1: Instantiate the Protein object without arguments
         new_protein = protein.Protein()
         # Step 2: Set attributes individually
@@ -289,6 +302,8 @@ def process_sequence_changes_and_commit(df, commit=True):
         # Step 3: Add the new Protein to the session
         db.session.add(new_protein)
         new_protein_records.append(new_protein)
+        # later rows with the same sequence and species share it
+        existing[key] = new_protein
 
     # Flush the session to get the new IDs assigned
     db.session.flush()
@@ -335,28 +350,24 @@ def process_and_commit_new_peptides(df, new_prot_df, commit = True):
     df['new_protein_id'] = df['protein_id'].map(protein_id_mapping)
     new_peptide_records = [] 
 
-    for index, row in df.iterrows():
-        # Step 1: Instantiate the Protein object without arguments
-        new_peptide = modifications.Peptide()
-
-        # Step 2: Set attributes individually
-        new_peptide.pep_aligned = row['pep_aligned']
-        new_peptide.site_pos = row['site_pos']
-        new_peptide.site_type = row['site_type']
-        new_peptide.protein_id = row['new_protein_id']
-  
-        db.session.add(new_peptide)
-        new_peptide_records.append(new_peptide)
+    writer = bulk_writer.BulkWriter(session=db.session)
+    for row in df.itertuples(index=False):
+        new_peptide = writer.add(modifications.Peptide,
+                                 pep_aligned=row.pep_aligned,
+                                 site_pos=int(row.site_pos),
+                                 site_type=row.site_type,
+                                 protein_id=int(row.new_protein_id) if pd.notna(row.new_protein_id) else None)
+        new_peptide_records.append(writer.require_id(new_peptide))
 
-    db.session.flush()
+    writer.flush()
     
     updated_pep_data = [
         {
             'new_pep_id': peptide.id,  # Fetch the new ID assigned by the database
-            'pep_aligned': peptide.pep_aligned,
-            'site_pos': peptide.site_pos,
-            'site_type': peptide.site_type,
-            'protein_id': peptide.protein_id
+            'pep_aligned': peptide.values['pep_aligned'],
+            'site_pos': peptide.values['site_pos'],
+            'site_type': peptide.values['site_type'],
+            'protein_id': peptide.values['protein_id']
         }
         for peptide in new_peptide_records
     ]
@@ -401,26 +412,22 @@ def create_new_MS_mods_for_peptides(df_mods, new_pep_df, commit=True):
     new_mod_records = []
     
 
-    for index, row in df_mods.iterrows():
-        # Step 1: Instantiate the Protein object without arguments
-        new_mod = modifications.PeptideModification()
+    writer = bulk_writer.BulkWriter(session=db.session)
+    for row in df_mods.itertuples(index=False):
+        new_mod = writer.add(modifications.PeptideModification,
+                             MS_id=int(row.MS_id),
+                             modification_id=int(row.modificiation_id),
+                             peptide_id=int(row.new_pep_id) if pd.notna(row.new_pep_id) else None)
+        new_mod_records.append(writer.require_id(new_mod))
 
-        # Step 2: Set attributes individually
-        new_mod.MS_id = row['MS_id']
-        new_mod.modification_id = row['modificiation_id']
-        new_mod.peptide_id = row['new_pep_id']
-  
-        db.session.add(new_mod)
-        new_mod_records.append(new_mod)
-
-    db.session.flush()
+    writer.flush()
 
     updated_mod_data = [
         {
             'new_mod_id': mod.id,  # Fetch the new ID assigned by the database
-            'MS_id': mod.MS_id,
-            'modification_id': mod.modification_id,
-            'pep_id': mod.peptide_id
+            'MS_id': mod.values['MS_id'],
+            'modification_id': mod.values['modification_id'],
+            'pep_id': mod.values['peptide_id']
         }
         for mod in new_mod_records
     ]
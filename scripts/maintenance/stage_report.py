@@ -0,0 +1,111 @@
+import sys
+import os
+import argparse
+import datetime
+import logging
+
+# Allows for the importing of modules from the proteomescout-3 app within the script
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(SCRIPT_DIR)
+
+from scripts.app_setup import create_app
+from app import db
+from app.database import jobs
+
+# Summarizes the per-stage metrics recorded by import jobs (job_stage_metrics)
+# over the last --days days: for each stage, how long it takes (median, 90th
+# percentile, max), its throughput over all runs, the SQL statements and
+# external requests it makes per run with the share of its time they take,
+# and the highest peak memory seen. Stages that dominate an import, and
+# whether they are waiting on the database or on UniProt/NCBI/Pfam, show up
+# here first. External requests run concurrently in the fetch scheduler's
+# pool, so their share of a stage's time can exceed 100%.
+#
+# Example:
+#   python scripts/maintenance/stage_report.py --days 7 --type load_experiment
+
+# name, calls column, seconds column
+COUNTERS = [
+    ('DB', 'db_queries', 'db_seconds'),
+    ('UniProt', 'uniprot_calls', 'uniprot_seconds'),
+    ('NCBI', 'ncbi_calls', 'ncbi_seconds'),
+    ('Pfam', 'pfam_calls', 'pfam_seconds'),
+]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted, non-empty list."""
+    rank = max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(rank, len(values) - 1)]
+
+def summarize(metrics):
+    """
+    Parameters:
+        metrics: JobStageMetrics of one stage
+
+    Returns:
+        dict of the stage's report columns
+    """
+    seconds = sorted( m.seconds or 0.0 for m in metrics )
+    total_seconds = sum(seconds)
+    total_items = sum( m.items or 0 for m in metrics )
+
+    summary = {'runs': len(metrics),
+               'errors': len([ m for m in metrics if m.status == 'error' ]),
+               'median': percentile(seconds, 50),
+               'p90': percentile(seconds, 90),
+               'max': seconds[-1],
+               'rate': total_items / total_seconds if total_items and total_seconds else None,
+               'memory': max( m.peak_memory_mb or 0.0 for m in metrics )}
+
+    for name, calls, spent in COUNTERS:
+        summary[name] = float(sum( getattr(m, calls) or 0 for m in metrics )) / len(metrics)
+        time_spent = sum( getattr(m, spent) or 0.0 for m in metrics )
+        summary[name + ' share'] = 100.0 * time_spent / total_seconds if total_seconds else 0.0
+    return summary
+
+def report(days, job_type):
+    since = datetime.datetime.now() - datetime.timedelta(days=days)
+    by_stage = {}
+    order = []
+    for metric, _tp in jobs.get_recent_stage_metrics(since, job_type):
+        if metric.stage not in by_stage:
+            by_stage[metric.stage] = []
+            order.append(metric.stage)
+        by_stage[metric.stage].append(metric)
+
+    if not order:
+        print("No stage metrics recorded in the last %d days" % (days))
+        return
+
+    header = "%-14s %5s %5s %9s %9s %9s %10s" % ('stage', 'runs', 'errs', 'median s', 'p90 s', 'max s', 'items/s')
+    for name, _calls, _spent in COUNTERS:
+        header += " %15s" % (name + ' /run (%)')
+    header += " %8s" % ('peak MB')
+    print(header)
+
+    for stage in order:
+        s = summarize(by_stage[stage])
+        line = "%-14s %5d %5d %9.1f %9.1f %9.1f %10s" % (stage, s['runs'], s['errors'], s['median'], s['p90'], s['max'],
+                                                       '-' if s['rate'] is None else "%.1f" % (s['rate']))
+        for name, _calls, _spent in COUNTERS:
+            line += " %15s" % ("%.0f (%.0f%%)" % (s[name], s[name + ' share']))
+        line += " %8.0f" % (s['memory'])
+        print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report per-stage timings and throughput of recent import jobs")
+    parser.add_argument('--days', type=int, default=30, help="report stages started in the last DAYS days")
+    parser.add_argument('--type', dest='job_type', default=None, choices=[ tp.value for tp in jobs.JobTypeEnum ],
+                        help="only report jobs of this type")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    # application created within which the script can be run
+    app = create_app()
+    db.init_app(app)
+
+    with app.app_context():
+        report(args.days, args.job_type)
@@ -0,0 +1,39 @@
+"""
+Shared setup for the unit tests.
+
+Run from the repository root (the app writes its log to logs/ there):
+    python3 -m pytest tests
+
+config.py requires a few environment variables when app is first imported;
+they are given placeholder values here, since the tests never send mail or
+reach Celery's broker. The app database is a temporary SQLite file.
+"""
+
+import os
+import shutil
+import tempfile
+
+REQUIRED_ENVIRONMENT = {
+    'SMTP_PORT': '25',
+    'CELERY_RESULT_BACKEND': 'cache+memory://',
+    'QUEUE_URL': 'unused',
+    'CELERY_ACCESS_KEY': 'unused',
+    'CELERY_SECRET_ACCESS_KEY': 'unused',
+}
+
+
+def pytest_configure(config):
+    for key, value in REQUIRED_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    os.makedirs('logs', exist_ok=True)
+
+    config._test_db_dir = tempfile.mkdtemp(prefix='ptmscout-tests-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(config._test_db_dir, 'tests.db')
+    os.environ.pop('DATABASE_REPLICA_URL', None)
+    os.environ.pop('DATABASE_WORKER_URL', None)
+
+
+def pytest_unconfigure(config):
+    directory = getattr(config, '_test_db_dir', None)
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,88 @@
+import pytest
+
+from app import app, db
+from app.database.protein import Protein
+from app.database.taxonomies import Species
+from proteomescout_worker.helpers import bulk_writer
+from proteomescout_worker.helpers.bulk_writer import BulkWriter
+
+
+@pytest.fixture
+def tables():
+    with app.app_context():
+        for model in (Species, Protein):
+            model.__table__.create(db.engine)
+        # ids of earlier rows, so generated ids do not start at 1
+        db.session.execute(Species.__table__.insert(), [ dict(name='existing %d' % i) for i in range(5) ])
+        try:
+            yield db.session
+        finally:
+            db.session.rollback()
+            for model in (Protein, Species):
+                model.__table__.drop(db.engine)
+
+
+def stored(session, model, *columns):
+    return dict( (row[0], tuple(row[1:])) for row in session.query(model.id, *columns) )
+
+
+def test_referenced_rows_get_the_ids_they_were_stored_with(tables):
+    writer = BulkWriter(session=tables)
+    human = writer.add(Species, name='homo sapiens')
+    mouse = writer.add(Species, name='mus musculus')
+    proteins = [ writer.add(Protein, name='P%d' % i, sequence='MK', species_id=sp) for i, sp in enumerate([human, mouse, human]) ]
+    for prot in proteins:
+        writer.require_id(prot)
+
+    assert writer.flush() == 5
+
+    species = stored(tables, Species, Species.name)
+    assert species[human.id] == ('homo sapiens',)
+    assert species[mouse.id] == ('mus musculus',)
+    assert human.id > 5
+
+    rows = stored(tables, Protein, Protein.name, Protein.species_id)
+    assert [ rows[prot.id] for prot in proteins ] == [('P0', human.id), ('P1', mouse.id), ('P2', human.id)]
+
+
+def test_identical_rows_get_distinct_ids_in_order(tables):
+    writer = BulkWriter(session=tables)
+    rows = [ writer.require_id(writer.add(Protein, name='same', sequence='MK')) for _ in range(4) ]
+    writer.flush()
+
+    ids = [ row.id for row in rows ]
+    assert ids == sorted(ids) and len(set(ids)) == 4
+    assert set(ids) == set(stored(tables, Protein).keys())
+
+
+def test_rows_with_different_columns_and_small_inserts(tables, monkeypatch):
+    monkeypatch.setattr(bulk_writer, 'MAX_PARAMETERS_PER_INSERT', 4)
+    writer = BulkWriter(session=tables, batch_size=3)
+    rows = []
+    for i in range(7):
+        values = {'name': 'P%d' % i}
+        if i % 2:
+            values['locus'] = 'L%d' % i
+        rows.append(writer.require_id(writer.add(Protein, **values)))
+    writer.flush()
+
+    stored_rows = stored(tables, Protein, Protein.name, Protein.locus)
+    assert [ stored_rows[row.id] for row in rows ] == [ ('P%d' % i, 'L%d' % i if i % 2 else None) for i in range(7) ]
+
+
+def test_rows_without_requested_ids_are_still_written(tables):
+    writer = BulkWriter(session=tables)
+    row = writer.add(Protein, name='P0')
+    writer.flush()
+
+    assert row.id is None
+    assert list(stored(tables, Protein, Protein.name).values()) == [('P0',)]
+
+
+def test_reference_to_an_unwritten_row_fails(tables):
+    writer = BulkWriter(session=tables)
+    species = bulk_writer.PendingRow(Species, {'name': 'never added'})
+    writer.add(Protein, name='P0', species_id=species)
+
+    with pytest.raises(bulk_writer.BulkWriteError):
+        writer.flush()
@@ -0,0 +1,156 @@
+import pytest
+import requests
+
+from app.utils import fetch_scheduler
+from app.utils.fetch_scheduler import FetchError, FetchScheduler, ServiceLimits, TokenBucket
+
+
+class FakeClock(object):
+    """Stands in for time.monotonic and time.sleep in fetch_scheduler."""
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fetch_scheduler.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(fetch_scheduler.time, 'sleep', clock.sleep)
+    # the jitter is exercised through its upper bound only
+    monkeypatch.setattr(fetch_scheduler.random, 'uniform', lambda low, high: high)
+    return clock
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeSession(object):
+    """Returns (or raises) the given outcomes in order, recording each call."""
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_scheduler(outcomes, **limits):
+    options = dict(rate=1000, burst=1000, concurrency=2, retries=3, backoff=1.0, max_backoff=30.0)
+    options.update(limits)
+    scheduler = FetchScheduler({'uniprot': ServiceLimits(**options)})
+    session = FakeSession(outcomes)
+    scheduler.service('uniprot').session = session
+    return scheduler, session
+
+
+def test_token_bucket_allows_burst_then_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+    # tokens refill over time, up to the capacity
+    clock.now += 10
+    for _ in range(3):
+        bucket.acquire()
+    assert len(clock.sleeps) == 1
+
+
+def test_request_retries_server_errors_with_backoff(clock, monkeypatch):
+    monkeypatch.setattr(fetch_scheduler.settings, 'EXTERNAL_SERVICE_STANDIN', None)
+    failures = [FakeResponse(503), FakeResponse(502)]
+    scheduler, session = make_scheduler(failures + [FakeResponse(200)])
+
+    response = scheduler.get('uniprot', 'https://rest.uniprot.org/uniprotkb/P12345')
+
+    assert response.status_code == 200
+    assert len(session.calls) == 3
+    assert clock.sleeps == [1.0, 2.0]
+    assert all(failure.closed for failure in failures)
+    assert session.calls[0][2]['timeout'] == 30
+    assert scheduler.stats()['uniprot'][0] == 3
+
+
+def test_request_honours_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(fetch_scheduler.settings, 'EXTERNAL_SERVICE_STANDIN', None)
+    scheduler, session = make_scheduler([FakeResponse(429, {'Retry-After': '7'}), FakeResponse(200)])
+
+    assert scheduler.get('uniprot', 'https://rest.uniprot.org/').status_code == 200
+    assert clock.sleeps == [7.0]
+
+
+def test_request_returns_last_error_response_or_raises(clock, monkeypatch):
+    monkeypatch.setattr(fetch_scheduler.settings, 'EXTERNAL_SERVICE_STANDIN', None)
+    scheduler, session = make_scheduler([FakeResponse(500)] * 3, retries=2)
+    assert scheduler.get('uniprot', 'https://rest.uniprot.org/').status_code == 500
+    assert len(session.calls) == 3
+
+    scheduler, session = make_scheduler([requests.ConnectionError('refused')] * 2, retries=1)
+    with pytest.raises(FetchError):
+        scheduler.get('uniprot', 'https://rest.uniprot.org/')
+
+    # other client errors are returned without retrying
+    scheduler, session = make_scheduler([FakeResponse(404)])
+    assert scheduler.get('uniprot', 'https://rest.uniprot.org/').status_code == 404
+    assert len(session.calls) == 1
+
+
+def test_streamed_response_holds_its_slot_until_closed(clock, monkeypatch):
+    monkeypatch.setattr(fetch_scheduler.settings, 'EXTERNAL_SERVICE_STANDIN', None)
+    scheduler, session = make_scheduler([FakeResponse(200), FakeResponse(200)], concurrency=1)
+    slots = scheduler.service('uniprot').slots
+
+    with scheduler.get('uniprot', 'https://rest.uniprot.org/', stream=True) as response:
+        assert not slots.acquire(blocking=False)
+    assert response.closed
+    assert slots.acquire(blocking=False)
+    slots.release()
+
+    # without stream the slot is released before returning
+    scheduler.get('uniprot', 'https://rest.uniprot.org/')
+    assert slots.acquire(blocking=False)
+
+
+def test_call_with_retry(clock):
+    scheduler, _ = make_scheduler([], retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise IOError('reset')
+        return 'ok'
+
+    assert scheduler.call_with_retry('uniprot', flaky) == 'ok'
+    assert clock.sleeps == [1.0, 2.0]
+
+    with pytest.raises(FetchError):
+        scheduler.call('unknown', flaky)
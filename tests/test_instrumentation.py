@@ -0,0 +1,62 @@
+import json
+import os
+import time
+
+import pytest
+
+from app import app, instrumentation
+from app.config import settings
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = instrumentation.MetricsRegistry()
+    monkeypatch.setattr(instrumentation, 'registry', registry)
+    return registry
+
+
+def measured(registry, name, queries):
+    measurement = instrumentation.Measurement('request', name)
+    measurement.queries = queries
+    registry.record(measurement, 0.5)
+
+
+def write_file(directory, filename, name, queries, age=0):
+    path = directory / filename
+    path.write_text(json.dumps([['request', name, dict(samples=1, db_queries=queries)]]))
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_processes_with_the_same_pid_write_separate_files(registry, tmp_path):
+    earlier = write_file(tmp_path, '%d-0123456789ab.json' % (os.getpid()), 'search', 3)
+    measured(registry, 'search', 4)
+
+    registry.write(str(tmp_path))
+
+    assert earlier.exists()
+    assert registry.get_filename().startswith('%d-' % (os.getpid()))
+    assert sorted(os.listdir(tmp_path)) == sorted([earlier.name, registry.get_filename()])
+    assert instrumentation.read_all_totals(str(tmp_path))[('request', 'search')].db_queries == 7
+
+
+def test_files_of_exited_processes_expire(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'metrics_file_expiration', 60)
+    write_file(tmp_path, '101-aaaaaaaaaaaa.json', 'search', 3, age=10)
+    stale = write_file(tmp_path, '102-bbbbbbbbbbbb.json', 'search', 5, age=120)
+
+    totals = instrumentation.read_all_totals(str(tmp_path))
+
+    assert totals[('request', 'search')].db_queries == 3
+    assert not stale.exists()
+
+
+@pytest.mark.parametrize('remote_addr, status', [('127.0.0.1', 200), ('192.0.2.10', 404)])
+def test_metrics_answers_allowed_addresses(registry, monkeypatch, remote_addr, status):
+    monkeypatch.setattr(settings, 'metrics_directory', None)
+    monkeypatch.setattr(settings, 'metrics_sample_rate', 0)
+
+    response = app.test_client().get('/metrics', environ_base={'REMOTE_ADDR': remote_addr})
+
+    assert response.status_code == status
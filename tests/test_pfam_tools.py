@@ -0,0 +1,116 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from proteomescout_worker.helpers import hmmscan, pfam_tools
+from proteomescout_worker.helpers.hmmscan import DomainHit
+
+KINASE = SimpleNamespace(accession='PF00069', label='Pkinase', class_='Domain')
+REPEAT = SimpleNamespace(accession='PF00400', label='WD40', class_='Repeat')
+FAMILIES = {family.accession: family for family in (KINASE, REPEAT)}
+
+
+class FakeProtein(object):
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.domains = []
+
+
+class FakeRunner(object):
+    """Stands in for hmmscan.HmmscanRunner, recording the sequences scanned."""
+    def __init__(self, hits=None, error=None):
+        self.hits = hits or {}
+        self.error = error
+        self.scanned = []
+
+    def scan(self, sequences):
+        self.scanned.append(dict(sequences))
+        if self.error:
+            raise self.error
+        return dict( (seq_id, self.hits.get(seq, [])) for seq_id, seq in sequences.items() )
+
+
+def region(sequence, family, start, stop):
+    md5 = hashlib.md5(sequence.encode('utf-8')).hexdigest()
+    return (SimpleNamespace(md5=md5, family_accession=family.accession, start=start, stop=stop, release='35.0'), family)
+
+
+@pytest.fixture
+def local_pfam(monkeypatch):
+    monkeypatch.setattr(pfam_tools.settings, 'DISABLE_PFAM', False)
+    monkeypatch.setattr(pfam_tools.settings, 'PFAM_MODE', 'local')
+    monkeypatch.setattr(pfam_tools.pfam, 'get_families', lambda accessions: FAMILIES)
+    regions = {}
+    monkeypatch.setattr(pfam_tools.pfam, 'get_regions_by_accessions',
+                        lambda accessions: dict( (acc, regions[acc]) for acc in accessions if acc in regions ))
+    yield regions
+    pfam_tools.set_domain_runner(None)
+
+
+def test_stored_regions_are_used_and_the_rest_scanned_once(local_pfam):
+    stored, scanned, duplicate = FakeProtein('MKSTORED'), FakeProtein('MKSCANNED'), FakeProtein('MKSCANNED')
+    local_pfam['P00001'] = [region('MKSTORED', KINASE, 2, 6)]
+    runner = FakeRunner(hits={'MKSCANNED': [DomainHit('PF00069', 'Pkinase', 1, 8, 1e-10)]})
+    pfam_tools.set_domain_runner(runner)
+
+    pfam_tools.annotate_new_proteins([(stored, 'P00001'), (scanned, 'P00002'), (duplicate, 'Q00003')])
+
+    assert runner.scanned == [{'MKSCANNED': 'MKSCANNED'}]
+    assert [(d.label, d.start, d.stop, d.source) for d in stored.domains] == [('Pkinase', 2, 6, 'PARSED PFAM')]
+    for prot in (scanned, duplicate):
+        assert [(d.label, d.start, d.stop, d.source) for d in prot.domains] == [('Pkinase', 1, 8, 'COMPUTED PFAM')]
+
+
+def test_sequences_matched_by_non_domain_regions_are_not_scanned(local_pfam):
+    prot = FakeProtein('MKREPEAT')
+    local_pfam['P00001'] = [region('MKREPEAT', REPEAT, 1, 8)]
+    runner = FakeRunner()
+    pfam_tools.set_domain_runner(runner)
+
+    pfam_tools.annotate_new_proteins([(prot, 'P00001')])
+
+    assert runner.scanned == []
+    assert prot.domains == []
+
+
+def test_regions_of_another_sequence_are_ignored(local_pfam):
+    prot = FakeProtein('MKCHANGED')
+    local_pfam['P00001'] = [region('MKORIGINAL', KINASE, 1, 8)]
+    runner = FakeRunner()
+    pfam_tools.set_domain_runner(runner)
+
+    pfam_tools.annotate_new_proteins([(prot, 'P00001')])
+
+    assert runner.scanned == [{'MKCHANGED': 'MKCHANGED'}]
+
+
+def test_failed_scan_falls_back_to_the_web_service(local_pfam, monkeypatch):
+    stored, unmatched, failing = FakeProtein('MKSTORED'), FakeProtein('MKOTHER'), FakeProtein('MKFAIL')
+    local_pfam['P00001'] = [region('MKSTORED', KINASE, 2, 6)]
+    pfam_tools.set_domain_runner(FakeRunner(error=hmmscan.HmmscanError("Unable to run hmmscan")))
+
+    queried = []
+    def query(prot, acc):
+        queried.append(acc)
+        if acc == 'P00003':
+            raise pfam_tools.PFamError("Unable to query PFam")
+    monkeypatch.setattr(pfam_tools, 'parse_or_query_domains', query)
+
+    pfam_tools.annotate_new_proteins([(stored, 'P00001'), (unmatched, 'P00002'), (failing, 'P00003')])
+
+    assert queried == ['P00002', 'P00003']
+    assert [d.source for d in stored.domains] == ['PARSED PFAM']
+
+
+def test_remote_mode_queries_each_protein(local_pfam, monkeypatch):
+    monkeypatch.setattr(pfam_tools.settings, 'PFAM_MODE', 'remote')
+    runner = FakeRunner()
+    pfam_tools.set_domain_runner(runner)
+    queried = []
+    monkeypatch.setattr(pfam_tools, 'parse_or_query_domains', lambda prot, acc: queried.append(acc))
+
+    pfam_tools.annotate_new_proteins([(FakeProtein('MKA'), 'P00001'), (FakeProtein('MKB'), 'P00002')])
+
+    assert queried == ['P00001', 'P00002']
+    assert runner.scanned == []
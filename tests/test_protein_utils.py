@@ -0,0 +1,83 @@
+import random
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.utils import protein_utils
+
+
+def sequential_accession_type(acc):
+    """The classifier get_accession_type replaced: each pattern tried in turn."""
+    if re.search(r'^gi', acc) is not None:
+        return 'gi'
+    elif re.search(r'^[NXZ]P_\d+', acc) is not None:
+        return 'refseq'
+    elif re.search(r'^[O|P|Q]\d...\d([\.\-]\d+)?$', acc) is not None:
+        return 'swissprot'
+    elif re.search(r'^[A-N|R-Z]\d[A-Z]..\d([\.\-]\d+)?$', acc) is not None:
+        return 'swissprot'
+    elif re.search(r'^[A-Z]{3}\d{5}$', acc) is not None:
+        return 'genbank'
+    elif re.search(r'^IPI\d+(\.\d+)?$', acc) is not None:
+        return 'ipi'
+    elif re.search(r'^ENS', acc) is not None:
+        return 'ensembl'
+    return None
+
+
+EXAMPLES = [
+    ('gi|4502171', 'gi'),
+    ('NP_000537', 'refseq'),
+    ('XP_005249.1', 'refseq'),
+    ('P04637', 'swissprot'),
+    ('Q9Y6K9-2', 'swissprot'),
+    ('O15530.3', 'swissprot'),
+    ('A0A024R161', None),
+    ('A2BC19', 'swissprot'),
+    ('P|1234', None),
+    ('AAH12345', 'genbank'),
+    ('AB1234', None),
+    ('AAB1234', None),
+    ('IPI00000001.2', 'ipi'),
+    ('ENSP00000269305', 'ensembl'),
+    ('p04637', None),
+    ('', None),
+    ('P04637 ', None),
+]
+
+
+@pytest.mark.parametrize('acc, expected', EXAMPLES)
+def test_get_accession_type(acc, expected):
+    assert protein_utils.get_accession_type(acc) == expected
+    assert sequential_accession_type(acc) == expected
+
+
+def random_accessions(n, seed=20261019):
+    rnd = random.Random(seed)
+    alphabet = 'ABEGIJNOPQRSXZgi0123456789_.-|'
+    prefixes = ['', 'gi', 'NP_', 'XP_', 'IPI', 'ENS', 'P', 'Q', 'O', 'A']
+    return [ rnd.choice(prefixes) + ''.join( rnd.choice(alphabet) for _ in range(rnd.randint(0, 9)) ) for _ in range(n) ]
+
+
+def test_get_accession_type_matches_the_sequential_checks():
+    for acc in random_accessions(20000):
+        assert protein_utils.get_accession_type(acc) == sequential_accession_type(acc), acc
+
+
+def test_get_accession_types_matches_get_accession_type():
+    accessions = random_accessions(5000) + [ acc for acc, _ in EXAMPLES ] * 3
+
+    types = protein_utils.get_accession_types(accessions)
+
+    assert isinstance(types, np.ndarray)
+    assert list(types) == [ protein_utils.get_accession_type(acc) for acc in accessions ]
+
+
+def test_get_accession_types_accepts_columns_with_missing_values():
+    column = pd.Series(['P04637', None, 'NP_000537', np.nan, 'P04637'], index=[10, 11, 12, 13, 14])
+
+    assert list(protein_utils.get_accession_types(column)) == ['swissprot', None, 'refseq', None, 'swissprot']
+    assert list(protein_utils.get_accession_types(column.values)) == ['swissprot', None, 'refseq', None, 'swissprot']
+    assert list(protein_utils.get_accession_types([])) == []
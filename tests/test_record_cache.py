@@ -0,0 +1,108 @@
+import pytest
+
+from proteomescout_worker.geeneus.backend import RecordCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the time RecordCache sees."""
+    now = [1000000.0]
+    monkeypatch.setattr(RecordCache.time, 'time', lambda: now[0])
+    return now
+
+
+def make_cache(tmp_path, **kwargs):
+    options = dict(ttl=100, max_bytes=1000, evict_interval=0)
+    options.update(kwargs)
+    return RecordCache.RecordCache(str(tmp_path / 'records.sqlite'), **options)
+
+
+def test_get_many_matches_case_insensitively(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.put_many(RecordCache.UNIPROT, {'p12345': b'<entry>a</entry>', 'Q99999': b'<entry>b</entry>'})
+
+    assert cache.get_many(RecordCache.UNIPROT, ['P12345', 'q99999', 'O00000']) == \
+        {'P12345': b'<entry>a</entry>', 'q99999': b'<entry>b</entry>'}
+    assert cache.get(RecordCache.NCBI, 'P12345') is None
+
+
+def test_records_expire_after_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.put(RecordCache.UNIPROT, 'P12345', b'record')
+
+    clock[0] += 99
+    assert cache.get(RecordCache.UNIPROT, 'P12345') == b'record'
+    clock[0] += 2
+    assert cache.get(RecordCache.UNIPROT, 'P12345') is None
+
+    # expired rows are deleted by the next eviction
+    cache.put(RecordCache.UNIPROT, 'Q99999', b'other')
+    assert cache.stats() == {RecordCache.UNIPROT: (1, 5)}
+
+
+def test_release_label_invalidates_records(tmp_path, clock):
+    cache = make_cache(tmp_path, releases={RecordCache.UNIPROT: '2024_01'})
+    cache.put(RecordCache.UNIPROT, 'P12345', b'record')
+
+    cache.releases = {RecordCache.UNIPROT: '2024_02'}
+    assert cache.get(RecordCache.UNIPROT, 'P12345') is None
+
+
+def test_eviction_drops_records_of_other_releases(tmp_path, clock):
+    cache = make_cache(tmp_path, releases={RecordCache.UNIPROT: '2024_01'})
+    cache.put(RecordCache.UNIPROT, 'P12345', b'old')
+    cache.put(RecordCache.NCBI, 'NP_000537', b'ncbi')
+
+    # the next put runs an eviction (evict_interval=0) under the new label
+    cache.releases = {RecordCache.UNIPROT: '2024_02'}
+    cache.put(RecordCache.UNIPROT, 'Q99999', b'new')
+
+    assert cache.stats() == {RecordCache.UNIPROT: (1, 3), RecordCache.NCBI: (1, 4)}
+
+
+def test_least_recently_used_records_are_evicted(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    for i in range(3):
+        clock[0] += 1
+        cache.put(RecordCache.UNIPROT, 'P%05d' % i, b'x' * 300)
+
+    # reading the oldest record makes the second the least recently used
+    clock[0] += 1
+    assert cache.get(RecordCache.UNIPROT, 'P00000') is not None
+    clock[0] += 1
+    cache.put(RecordCache.UNIPROT, 'P00003', b'x' * 300)
+
+    cached = cache.get_many(RecordCache.UNIPROT, ['P%05d' % i for i in range(4)])
+    assert sorted(cached) == ['P00000', 'P00002', 'P00003']
+    assert cache.stats() == {RecordCache.UNIPROT: (3, 900)}
+
+
+def test_eviction_is_not_run_on_every_put(tmp_path, clock, monkeypatch):
+    cache = make_cache(tmp_path, max_bytes=10 ** 6, evict_interval=60)
+    evictions = []
+    original = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: evictions.append(clock[0]) or original())
+
+    cache.put(RecordCache.UNIPROT, 'P00000', b'x')
+    for i in range(1, 10):
+        clock[0] += 1
+        cache.put(RecordCache.UNIPROT, 'P%05d' % i, b'x')
+    assert len(evictions) == 1
+
+    clock[0] += 60
+    cache.put(RecordCache.UNIPROT, 'P00010', b'x')
+    assert len(evictions) == 2
+
+    # writing a twentieth of max_bytes triggers one before the interval
+    clock[0] += 1
+    cache.put(RecordCache.UNIPROT, 'P00011', b'x' * (10 ** 6 // 20))
+    assert len(evictions) == 3
+
+
+def test_split_and_join_uniprot_entries():
+    xml = RecordCache.join_uniprot_entries([
+        b'<entry dataset="Swiss-Prot"><accession>P12345</accession><accession>q0</accession></entry>',
+        b'<entry><accession>O00001</accession></entry>',
+    ])
+    entries = RecordCache.split_uniprot_entries(xml)
+    assert [accessions for accessions, _ in entries] == [['P12345', 'Q0'], ['O00001']]
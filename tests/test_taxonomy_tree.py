@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import event
+
+from app import app, db
+from app.database import taxonomies
+from app.database.taxonomies import Taxonomy, TaxonomyTree
+
+# node id, parent id, name, strain, kingdom
+LINEAGE = [
+    (1, None, 'root', None, None),
+    (2759, 1, 'Eukaryota', None, 'E'),
+    (40674, 2759, 'Mammalia', None, 'E'),
+    (9606, 40674, 'Homo sapiens', None, 'E'),
+    (4932, 2759, 'Saccharomyces cerevisiae', 'S288C', 'E'),
+]
+
+
+def test_has_ancestor_walks_to_the_root():
+    tree = TaxonomyTree()
+    tree.add_rows(LINEAGE)
+
+    assert tree.has_ancestor(9606, 'mammalia')
+    assert tree.has_ancestor(9606, ' Eukaryota ')
+    assert tree.has_ancestor(9606, 'homo sapiens')
+    assert not tree.has_ancestor(4932, 'Mammalia')
+    assert tree.lineage(4932) == ['root', 'eukaryota', 'saccharomyces cerevisiae (s288c)']
+
+
+def test_children_added_before_their_parents_are_linked():
+    tree = TaxonomyTree()
+    tree.add_rows(LINEAGE[3:])
+    tree.add_rows(LINEAGE[:3])
+
+    assert tree.has_ancestor(9606, 'Eukaryota')
+    assert [ tree.node_ids[i] for i in tree.ancestors(9606) ] == [9606, 40674, 2759, 1]
+
+
+@pytest.fixture
+def taxonomy_table():
+    with app.app_context():
+        Taxonomy.__table__.create(db.engine)
+        db.session.execute(Taxonomy.__table__.insert(),
+                           [ dict(node_id=n, parent_id=p, name=name, strain=strain, kingdom=k) for n, p, name, strain, k in LINEAGE ])
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if 'FROM taxonomy' in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+            db.session.rollback()
+            Taxonomy.__table__.drop(db.engine)
+
+
+def test_missing_ancestors_are_read_one_level_at_a_time(taxonomy_table):
+    tree = TaxonomyTree()
+    tree.add_rows(LINEAGE[:1])
+
+    assert tree.has_ancestor(9606, 'Eukaryota')
+    assert len(taxonomy_table) == 3
+    assert [ tree.node_ids[i] for i in tree.ancestors(9606) ] == [9606, 40674, 2759, 1]
+
+
+def test_preload_reads_shared_ancestors_once(taxonomy_table):
+    tree = TaxonomyTree()
+
+    tree.preload([9606, 4932, 12345])
+
+    # the nodes, then {40674, 2759}, then the root; the unknown node is skipped
+    assert len(taxonomy_table) == 3
+    assert tree.has_ancestor(4932, 'root')
+    assert tree.is_loaded(40674)
+    assert not tree.is_loaded(12345)
+
+
+def test_large_levels_are_read_in_chunks(taxonomy_table, monkeypatch):
+    monkeypatch.setattr(taxonomies, 'MAX_NODES_PER_QUERY', 2)
+    tree = TaxonomyTree()
+
+    tree.preload([9606, 4932, 40674])
+
+    # two queries for the three nodes, one for 2759, one for the root
+    assert len(taxonomy_table) == 4
+    assert tree.has_ancestor(9606, 'root')
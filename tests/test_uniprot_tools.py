@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+import requests
+
+from proteomescout_worker.geeneus.backend import RecordCache
+from proteomescout_worker.helpers import uniprot_tools
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError("%d error" % (self.status_code), response=self)
+
+
+class FakeScheduler(object):
+    """Answers every UniProt batch with the same status, as the fetch
+    scheduler does once its own retries are spent."""
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def post(self, service, url, data=None, **kwargs):
+        with self.lock:
+            self.batches.append(data['query'].split('\n'))
+        return FakeResponse(self.status_code)
+
+
+class FakeCache(object):
+    def __init__(self):
+        self.puts = []
+
+    def get_many(self, source, keys):
+        return {}
+
+    def put_many(self, source, values):
+        self.puts.append((source, dict(values)))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = FakeCache()
+    monkeypatch.setattr(uniprot_tools.record_cache, 'get_record_cache', lambda: cache)
+    return cache
+
+def use_scheduler(monkeypatch, status_code):
+    scheduler = FakeScheduler(status_code)
+    monkeypatch.setattr(uniprot_tools, 'get_scheduler', lambda: scheduler)
+    return scheduler
+
+
+@pytest.mark.parametrize('status_code', [429, 408, 503])
+def test_throttled_batches_fail_without_bisecting(cache, monkeypatch, status_code):
+    scheduler = use_scheduler(monkeypatch, status_code)
+
+    result_map, reasons = uniprot_tools.query_uniprot_records(['P04637', 'Q9Y6K9', 'O15530'])
+
+    assert result_map == {}
+    assert len(scheduler.batches) == 1
+    assert set(reasons) == {'P04637', 'Q9Y6K9', 'O15530'}
+    assert all( reason.startswith("UniProt query failed") for reason in reasons.values() )
+    assert [ source for source, _ in cache.puts if source == RecordCache.UNIPROT_MISSING ] == []
+
+
+def test_rejected_batches_are_bisected_down_to_the_accessions(cache, monkeypatch):
+    scheduler = use_scheduler(monkeypatch, 400)
+
+    result_map, reasons = uniprot_tools.query_uniprot_records(['P04637', 'Q9Y6K9'])
+
+    assert sorted( tuple(sorted(batch)) for batch in scheduler.batches ) == [('P04637',), ('P04637', 'Q9Y6K9'), ('Q9Y6K9',)]
+    assert reasons == {'P04637': "Accession rejected by UniProt", 'Q9Y6K9': "Accession rejected by UniProt"}
+    assert cache.puts == [(RecordCache.UNIPROT_MISSING, {'P04637': b'', 'Q9Y6K9': b''})]
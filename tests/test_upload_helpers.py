@@ -0,0 +1,140 @@
+import pytest
+
+from app import app, db
+from app.database import experiment, modifications, protein, taxonomies
+from proteomescout_worker.helpers import upload_helpers
+from proteomescout_worker.helpers.bulk_writer import BulkWriter
+
+SERIES_HEADER = [('data', '0'), ('data', '10'), ('stddev', '0')]
+
+
+@pytest.fixture
+def stored():
+    """
+    Two proteins of one experiment, a PTM, and one existing peptide at S3 of
+    the first protein. Yields the ids of the stored rows.
+    """
+    with app.app_context():
+        db.create_all()
+        session = db.session
+        session.execute(taxonomies.Species.__table__.insert(), [dict(id=1, name='homo sapiens')])
+        session.execute(protein.Protein.__table__.insert(),
+                        [ dict(id=i, name='P%d' % i, sequence=seq, sequence_sha1=protein.hash_sequence(seq), species_id=1)
+                          for i, seq in [(1, 'MKSPKSLLK'), (2, 'MASSY')] ])
+        session.execute(experiment.Experiment.__table__.insert(), [dict(id=1, name='exp'), dict(id=2, name='other')])
+        session.execute(modifications.PTM.__table__.insert(), [dict(id=1, name='Phosphoserine', target='S', position='anywhere')])
+        session.execute(modifications.Peptide.__table__.insert(),
+                        [dict(id=1, pep_aligned='     MKsPKSLLK ', site_pos=3, site_type='S', protein_id=1)])
+        try:
+            yield dict(experiment=1, other_experiment=2, proteins=(1, 2), ptm=1, peptide=1)
+        finally:
+            session.rollback()
+            session.remove()
+            db.drop_all()
+
+
+def rows(model, *columns):
+    return sorted( tuple(row) for row in db.session.query(*[ getattr(model, c) for c in columns ]) )
+
+
+def import_run(ids, values, data_index=None, known_mods=None, ms=None):
+    """Write one measured peptide of protein 1 with sites S3 and S6, as a
+    data file import does, and return its id."""
+    writer = BulkWriter()
+    known = upload_helpers.get_known_peptides([ids['proteins'][0]])
+    if ms is None:
+        ms = writer.add(modifications.MeasuredPeptide, experiment_id=ids['experiment'], protein_id=ids['proteins'][0],
+                        query_accession='P04637', peptide='sPKsL')
+
+    for site, aligned in [(3, '     MKsPKSLLK '), (6, '  MKSPKsLLK    ')]:
+        pep, _ = upload_helpers.get_peptide(writer, known, ids['proteins'][0], site, aligned)
+        upload_helpers.add_peptide_modification(writer, ms, pep, ids['ptm'], known_mods)
+    upload_helpers.insert_run_data(writer, ms, 'time', SERIES_HEADER, 'average', values, data_index)
+
+    writer.flush()
+    return ms if isinstance(ms, int) else ms.id
+
+
+def test_get_known_peptides_reads_every_protein(stored, monkeypatch):
+    monkeypatch.setattr(upload_helpers, 'MAX_IDS_PER_QUERY', 1)
+    db.session.execute(modifications.Peptide.__table__.insert(), [dict(id=2, pep_aligned='    MASsY      ', site_pos=4, site_type='S', protein_id=2)])
+
+    assert upload_helpers.get_known_peptides(stored['proteins']) == {(1, 3, 'S'): 1, (2, 4, 'S'): 2}
+
+
+def test_get_peptide_creates_each_site_once(stored):
+    writer = BulkWriter()
+    known = upload_helpers.get_known_peptides([1])
+
+    assert upload_helpers.get_peptide(writer, known, 1, 3, '     MKsPKSLLK ') == (1, False)
+    new, created = upload_helpers.get_peptide(writer, known, 1, 6, '  MKSPKsLLK    ')
+    assert created
+    assert upload_helpers.get_peptide(writer, known, 1, 6, '  MKSPKsLLK    ') == (new, False)
+
+    writer.require_id(new)
+    writer.flush()
+    assert rows(modifications.Peptide, 'id', 'site_pos', 'site_type', 'protein_id') == [(1, 3, 'S', 1), (new.id, 6, 'S', 1)]
+
+
+def test_new_run_is_written_with_its_references(stored):
+    ms_id = import_run(stored, ['1.5', None, '0.25'])
+
+    assert rows(modifications.MeasuredPeptide, 'id', 'experiment_id', 'protein_id') == [(ms_id, 1, 1)]
+    peptides = dict( ((pos, tp), pep_id) for pep_id, pos, tp in rows(modifications.Peptide, 'id', 'site_pos', 'site_type') )
+    assert len(peptides) == 2 and peptides[(3, 'S')] == 1
+    assert rows(modifications.PeptideModification, 'MS_id', 'peptide_id', 'modification_id') == \
+        sorted([(ms_id, 1, 1), (ms_id, peptides[(6, 'S')], 1)])
+    assert rows(experiment.ExperimentData, 'MS_id', 'run', 'type', 'label', 'priority', 'value') == \
+        [(ms_id, 'average', 'data', '0', 1, 1.5), (ms_id, 'average', 'data', '10', 2, None), (ms_id, 'average', 'stddev', '0', 3, 0.25)]
+
+
+def test_experiment_data_index_covers_only_the_experiment(stored):
+    ms_id = import_run(stored, ['1.5', '2', '0.25'])
+    other = dict(stored, experiment=stored['other_experiment'])
+    import_run(other, ['7', '8', '9'])
+
+    index = upload_helpers.get_experiment_data_index(stored['experiment'])
+
+    data_ids = dict( ((ms, run, tp, label), data_id) for data_id, ms, run, tp, label in rows(experiment.ExperimentData, 'id', 'MS_id', 'run', 'type', 'label') if ms == ms_id )
+    assert index == data_ids
+    assert sorted(key[2:] for key in index) == [('data', '0'), ('data', '10'), ('stddev', '0')]
+
+
+def test_reimported_run_updates_in_place_without_duplicates(stored):
+    ms_id = import_run(stored, ['1.5', '2', '0.25'])
+    db.session.commit()
+    before = rows(experiment.ExperimentData, 'id', 'MS_id', 'label', 'type')
+    peptides_before = rows(modifications.Peptide, 'id', 'site_pos')
+    mods_before = rows(modifications.PeptideModification, 'id', 'MS_id', 'peptide_id', 'modification_id')
+    assert len(mods_before) == 2
+
+    index = upload_helpers.get_experiment_data_index(stored['experiment'])
+    known_mods = upload_helpers.get_experiment_modifications(stored['experiment'])
+    assert known_mods == set( row[1:] for row in mods_before )
+    import_run(stored, ['3', None, '0.5'], data_index=index, known_mods=known_mods, ms=ms_id)
+
+    assert rows(modifications.Peptide, 'id', 'site_pos') == peptides_before
+    assert rows(modifications.PeptideModification, 'id', 'MS_id', 'peptide_id', 'modification_id') == mods_before
+    assert rows(experiment.ExperimentData, 'id', 'MS_id', 'label', 'type') == before
+    values = dict( ((label, tp), value) for label, tp, value in rows(experiment.ExperimentData, 'label', 'type', 'value') )
+    assert values == {('0', 'data'): 3.0, ('10', 'data'): None, ('0', 'stddev'): 0.5}
+
+
+def record(acc, sequence, species='homo sapiens'):
+    return upload_helpers.ProteinRecord('protein ' + acc, 'GENE', acc, [], species, 9606, acc, [], [], [], sequence)
+
+
+def test_find_or_create_proteins_shares_new_proteins(stored, monkeypatch):
+    annotated = []
+    monkeypatch.setattr(upload_helpers.pfam_tools, 'annotate_new_proteins', annotated.append)
+    records = dict( (r.query_accession, r) for r in [record('Q1', 'MNEWSEQ'), record('P04637', 'MKSPKSLLK'), record('Q2', 'MNEWSEQ')] )
+
+    proteins = upload_helpers.find_or_create_proteins(records)
+
+    new, created = proteins['Q1']
+    assert created and proteins['Q2'] == (new, True)
+    assert proteins['P04637'][0].id == 1 and not proteins['P04637'][1]
+    assert new.id is not None and new.species_id == 1
+    assert new.sequence_sha1 == protein.hash_sequence('MNEWSEQ')
+    assert rows(protein.Protein, 'sequence') == [('MASSY',), ('MKSPKSLLK',), ('MNEWSEQ',)]
+    assert annotated == [[(new, 'Q1')]]
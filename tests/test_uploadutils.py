@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import app, db
+from app.config import strings
+from app.database import modifications
+from app.utils import uploadutils
+
+HEADER = "accession\tpeptide\tmodification\tdata:time:0\n"
+ACC, PEP, MOD, DATA = [ SimpleNamespace(column_number=i) for i in range(4) ]
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    with app.app_context():
+        db.create_all()
+        ptm = modifications.PTM()
+        ptm.name = 'Phosphoserine'
+        ptm.accession = 'PTM-0253'
+        ptm.target = 'S'
+        ptm.position = 'anywhere'
+        db.session.add(ptm)
+        db.session.commit()
+
+        folder = app.config.get('UPLOAD_FOLDER')
+        app.config['UPLOAD_FOLDER'] = str(tmp_path)
+        try:
+            yield tmp_path
+        finally:
+            app.config['UPLOAD_FOLDER'] = folder
+            db.session.remove()
+            db.drop_all()
+
+
+def check(folder, text):
+    (folder / 'data.tsv').write_text(HEADER + text, encoding='utf-8')
+    errors = uploadutils.check_data_file(SimpleNamespace(data_file='data.tsv'), ACC, PEP, None, MOD, None, [DATA], [])
+    return [ (e.row, e.msg) for e in errors ]
+
+
+def test_valid_rows_have_no_errors(upload_folder):
+    assert check(upload_folder, "P04637\tAKsPK\tPhosphoserine\t1.5\nQ9Y6K9\tGGsLL\tPhosphoserine\t2\n") == []
+
+
+def test_rows_are_numbered_across_blocks(upload_folder, monkeypatch):
+    monkeypatch.setattr(uploadutils, 'VALIDATION_BLOCK_ROWS', 2)
+    rows = "P04637\tAKsPK\tPhosphoserine\t1.5\n" \
+           "Q9Y6K9\tGGsLL\tPhosphoserine\t2\n" \
+           "bad accession\tAKsPK\tPhosphoserine\t1\n" \
+           "P04637\tAKsPK\tPhosphoserine\t3\n"
+
+    assert check(upload_folder, rows) == [
+        (3, strings.experiment_upload_warning_acc_column_contains_bad_accessions),
+        (4, strings.experiment_upload_warning_no_run_column),
+    ]
+
+
+def test_quoted_fields_may_span_lines(upload_folder, monkeypatch):
+    monkeypatch.setattr(uploadutils, 'VALIDATION_BLOCK_ROWS', 1)
+    rows = "P04637\tAKsPK\tPhosphoserine\t\"1.5\n\"\nQ9Y6K9\tGGsLL\tPhosphoserine\t2\n"
+
+    assert check(upload_folder, rows) == []